@@ -1,16 +1,36 @@
 import datetime
+import io
 import json
 import os
+import secrets
+import sys
+import time
+import weakref
 from dotenv import load_dotenv
 load_dotenv()
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_from_directory
+from flask import Flask, Response, g, has_request_context, render_template, request, redirect, url_for, session, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
-from apscheduler.schedulers.background import BackgroundScheduler
 import enviar_alertas
 import auth_remote
+import auth_pool
+import assets
+import calendario_alertas
+import cambios
+import estado_flota
+import exportar
+import storage
+import cache_http
+import backups
+import coordinador
+import historial
+import lecturas
+import medidores
+import metricas
+import tenants
+from werkzeug.local import LocalProxy
 
-app = Flask(__name__)
+app = Flask(__name__, static_folder=None)  # static/ lo sirve assets.py
 # Fail-loud: sin secret la cookie de sesión es forjable. Antes había un default
 # público ('cambiar-en-produccion') que permitía entrar como admin sin la clave.
 _secret = os.environ.get('FLASK_SECRET_KEY')
@@ -21,59 +41,92 @@ if not _secret or len(_secret) < 16:
 app.secret_key = _secret
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_FILE = os.path.join(BASE_DIR, "data", "flota_data.json")
-CONFIG_FILE = os.path.join(BASE_DIR, "data", "config.json")
-USERS_FILE = os.path.join(BASE_DIR, "data", "users.json")
-AUDIT_FILE = os.path.join(BASE_DIR, "data", "audit_log.json")
+DATA_DIR = os.environ.get("DATA_DIR") or os.path.join(BASE_DIR, "data")
+# --- TENANTS ---
+# Cada pedido trabaja sobre los datos del tenant de la sesión (ver tenants.py;
+# sin MULTI_TENANT es siempre el principal, en DATA_DIR). Se resuelve una vez
+# por pedido y queda en g.
+def _tenant():
+    if not has_request_context():
+        return tenants.REGISTRO.obtener()
+    t = g.get('tenant')
+    if t is None:
+        t = g.tenant = tenants.REGISTRO.obtener(session.get('tenant') if tenants.HABILITADO else None)
+    return t
+
+# Flota, config, usuarios y auditoría: .json con journal o SQLite según
+# STORAGE_BACKEND (ver storage.py / storage_sqlite.py).
+ALMACEN = LocalProxy(lambda: _tenant().almacen)
+# Historia de km/horas por unidad, fuera de la flota (ver medidores.py).
+MEDIDORES = LocalProxy(lambda: _tenant().medidores)
+# Historial de cada unidad, fuera de la flota (ver historial.py).
+HISTORIAL = LocalProxy(lambda: _tenant().historial)
+# Latencia por ruta y demás métricas para /metrics (ver metricas.py). Se
+# registra antes que comprimir_html para que la compresión entre en la medición.
+metricas.configurar(os.path.join(DATA_DIR, "metricas"))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+@app.before_request
+def _inicio_pedido():
+    g.inicio_pedido = time.perf_counter()
+
+@app.after_request
+def _medir_pedido(resp):
+    inicio = g.pop('inicio_pedido', None)
+    if inicio is not None:
+        metricas.observar('flota_http_request_duration_seconds', time.perf_counter() - inicio,
+                          ruta=request.url_rule.rule if request.url_rule else 'sin_ruta',
+                          metodo=request.method, status=str(resp.status_code))
+        metricas.volcar()
+    return resp
+
+# JS/CSS/imágenes con huella en la URL y precomprimidos (ver assets.py).
+ASSETS = assets.Assets(os.path.join(BASE_DIR, "static"))
+app.jinja_env.globals['asset'] = ASSETS.url
+app.after_request(assets.comprimir_html)
+# Carga el principal al arrancar (incluye la migración del historial embebido)
+# y crea las carpetas de los demás tenants configurados.
+tenants.REGISTRO.obtener()
+tenants.REGISTRO.preparar()
+
+CONFIG_DEFAULT = {"diasAviso": 30, "emailAlertas": "datos@semilleroelmanantial.com"}
 
 # --- HELPERS ---
-def cargar_json(archivo):
-    if not os.path.exists(archivo):
-        os.makedirs(os.path.dirname(archivo), exist_ok=True)
-        return [] if archivo in (DATA_FILE, AUDIT_FILE) else {}
-    try:
-        with open(archivo, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except:
-        return [] if archivo in (DATA_FILE, AUDIT_FILE) else {}
+# `doc` es ALMACEN.flota / .config / .usuarios. Flota y usuarios se indexan por
+# su clave para que cada guardado escriba solo los registros que cambiaron.
+def cargar_json(doc):
+    # Datos corruptos levantan ErrorAlmacenamiento (500) en vez de devolver []
+    # y que el próximo guardado pise lo que había.
+    return doc.datos()
 
-def guardar_json(archivo, datos):
+def guardar_json(doc, datos):
     try:
-        os.makedirs(os.path.dirname(archivo), exist_ok=True)
-        with open(archivo, 'w', encoding='utf-8') as f:
-            json.dump(datos, f, indent=4, ensure_ascii=False)
+        doc.guardar(datos)
         return True
-    except:
+    except (OSError, storage.ErrorAlmacenamiento) as e:
+        print(f"Error guardando {type(doc).__name__}: {e}")
         return False
 
 # --- AUDIT LOG ---
+# Append-only (JSON Lines rotado en auditoria.py, o tabla indexada en SQLite).
 def log_audit(user, action, details=""):
-    logs = cargar_json(AUDIT_FILE)
-    if not isinstance(logs, list):
-        logs = []
-    logs.insert(0, {
-        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "user": user,
-        "action": action,
-        "details": details
-    })
-    if len(logs) > 500:
-        logs = logs[:500]
-    guardar_json(AUDIT_FILE, logs)
+    try:
+        ALMACEN.auditoria.registrar(user, action, details)
+    except (OSError, storage.ErrorAlmacenamiento) as e:
+        print(f"Error audit log: {e}")
 
 # --- USER MANAGEMENT ---
-def cargar_usuarios():
-    if os.path.exists(USERS_FILE):
-        try:
-            with open(USERS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            pass
+def cargar_usuarios(tenant=None):
+    tenant = tenant or _tenant()
+    usuarios = tenant.almacen.usuarios
+    if usuarios.existe():
+        return cargar_json(usuarios)
     # Bootstrap en primer arranque: SOLO admin, con password OBLIGATORIO por env.
     # Antes se creaban admin/admin123 e invitado/invitado por defecto → cualquiera
     # con el repo sabía las claves. Sin ADMIN_PASSWORD no se crea ningún usuario.
+    # Solo en el tenant principal: ADMIN_PASSWORD no abre los demás tenants.
     admin_pass = os.environ.get('ADMIN_PASSWORD')
-    if not admin_pass:
+    if not admin_pass or tenant.id != tenants.PRINCIPAL:
         return []
     users = [
         {
@@ -82,19 +135,54 @@ def cargar_usuarios():
             "role": "admin"
         }
     ]
-    guardar_json(USERS_FILE, users)
+    guardar_json(usuarios, users)
     return users
 
-def buscar_usuario(username):
-    for u in cargar_usuarios():
-        if u['username'] == username:
-            return u
+# Índice en memoria username -> usuario para el login, uno por store de
+# usuarios (uno por tenant). Se reconstruye cuando cambia la versión del store
+# (cualquier escritura de /api/users, de este u otro worker); mientras tanto
+# un login no toca disco más allá de un stat.
+_usuarios_idx = weakref.WeakKeyDictionary()  # doc -> (versión, índice)
+
+def _indice_usuarios(tenant):
+    doc = tenant.almacen.usuarios
+    if not doc.existe():
+        cargar_usuarios(tenant)  # bootstrap del admin
+    version = doc.version()
+    idx = _usuarios_idx.get(doc)
+    if idx is None or idx[0] != version:
+        idx = _usuarios_idx[doc] = doc.leer(lambda us: {u['username']: dict(u) for u in us})
+    return idx[1]
+
+def buscar_usuario(username, tenant=None):
+    return _indice_usuarios(tenant or _tenant()).get(username)
+
+def _validar_local(username, password, tenant_id=None):
+    # Corre en el pool de auth_pool (sin contexto de pedido): el tenant va
+    # explícito. Los usuarios locales son del tenant del host, o del principal.
+    try:
+        tenant = tenants.REGISTRO.obtener(tenant_id)
+    except tenants.TenantDesconocido:
+        return None
+    # Como en auth_remote.validar: si el store local o el hash fallan (users.json
+    # ilegible, hash corrupto o de un método desconocido) el ingreso no vale, no es un 500.
+    try:
+        u = buscar_usuario(username, tenant)
+        if u and check_password_hash(u['password_hash'], password):
+            return {"username": username, "role": u['role'], "tenant": tenant.id}
+    except (OSError, storage.ErrorAlmacenamiento, KeyError, TypeError, ValueError, AttributeError) as e:
+        print(f"Login local de {username} en {tenant.id}: {type(e).__name__}: {e}")
     return None
 
 # --- DECORADORES DE SEGURIDAD ---
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
+        if 'usuario_actual' in session:
+            try:
+                _tenant()
+            except tenants.TenantDesconocido:
+                session.clear()  # el tenant de la sesión ya no tiene datos
         if 'usuario_actual' not in session:
             if request.path.startswith('/api/'):
                 return jsonify({"error": "No autorizado"}), 401
@@ -118,18 +206,30 @@ def login():
         user = request.form['username']
         pwd = request.form['password']
         # 1) Tabla `usuarios` compartida de Semillero (estándar del ecosistema).
-        remoto = auth_remote.validar(user, pwd)
-        if remoto:
-            session['usuario_actual'] = remoto['username']
-            session['rol_usuario'] = remoto['role']
-            log_audit(remoto['username'], "login", "Inicio de sesión (Supabase)")
-            return redirect(url_for('dashboard'))
         # 2) Fallback: store local users.json (transición / standalone sin Supabase).
-        u = buscar_usuario(user)
-        if u and check_password_hash(u['password_hash'], pwd):
-            session['usuario_actual'] = user
-            session['rol_usuario'] = u['role']
-            log_audit(user, "login", "Inicio de sesión (local)")
+        # Los dos hashes corren en paralelo en el pool de auth_pool; gana el remoto.
+        # Con MULTI_TENANT el tenant sale de la fila de Supabase, acotada a los
+        # tenants configurados para el host (tenants.candidatos); los usuarios
+        # locales son del tenant del host, o del principal.
+        candidatos = tenants.candidatos(request.host)
+        host_tenant = candidatos[0] if len(candidatos) == 1 else None
+        try:
+            validado, origen = auth_pool.verificar(lambda: auth_remote.validar(user, pwd, candidatos),
+                                                   lambda: _validar_local(user, pwd, host_tenant))
+        except auth_pool.Saturado:
+            resp = app.make_response((render_template('login.html', error='Demasiados ingresos a la vez, probá de nuevo en unos segundos'), 503))
+            resp.headers['Retry-After'] = '2'
+            return resp
+        if validado:
+            try:
+                # Sin crear nada: un tenant configurado ya tiene su carpeta (tenants.preparar).
+                g.tenant = tenants.REGISTRO.obtener(validado['tenant'] if tenants.HABILITADO else None)
+            except tenants.TenantDesconocido:
+                return render_template('login.html', error='Usuario o contraseña incorrectos')
+            session['usuario_actual'] = validado['username']
+            session['rol_usuario'] = validado['role']
+            session['tenant'] = g.tenant.id
+            log_audit(validado['username'], "login", "Inicio de sesión (Supabase)" if origen == "remoto" else "Inicio de sesión (local)")
             return redirect(url_for('dashboard'))
         error = 'Usuario o contraseña incorrectos'
     return render_template('login.html', error=error)
@@ -142,22 +242,20 @@ def logout():
     return redirect(url_for('login'))
 
 # --- SCHEDULER ---
-# Solo iniciar en el worker principal de gunicorn (evita emails duplicados)
-def iniciar_programador():
-    try:
-        s = BackgroundScheduler()
-        if hasattr(enviar_alertas, 'tarea_diaria'):
-            s.add_job(enviar_alertas.tarea_diaria, 'cron', hour=8, minute=0, id='alerta_diaria', replace_existing=True)
-        if hasattr(enviar_alertas, 'enviar_copia_seguridad'):
-            s.add_job(enviar_alertas.enviar_copia_seguridad, 'cron', day_of_week='fri', hour=9, minute=0, id='backup_semanal', replace_existing=True)
-        s.start()
-    except:
-        pass
-
-# Solo iniciar scheduler si es el proceso principal (no en workers forkeados de gunicorn)
-import multiprocessing
+# Todos los workers arrancan el coordinador, pero solo el que gana el lock de
+# data/scheduler corre los jobs (y el remitente de emails); si muere, otro
+# worker toma la posta y recupera lo que no se corrió (ver coordinador.py).
+TRABAJOS = [
+    ('alerta_diaria', enviar_alertas.tarea_diaria, {'hour': 8, 'minute': 0}),
+    ('backup_semanal', enviar_alertas.enviar_copia_seguridad, {'day_of_week': 'fri', 'hour': 9, 'minute': 0}),
+    # Backup local diario (dedup: solo escribe lo que cambió); el viernes además sale por mail.
+    ('backup_diario', enviar_alertas.respaldo_diario, {'hour': 2, 'minute': 30}),
+]
+COORDINADOR = coordinador.Coordinador(os.path.join(DATA_DIR, "scheduler"), TRABAJOS,
+                                      al_asumir=enviar_alertas.OUTBOX.iniciar)
+
 if os.environ.get('SCHEDULER_ENABLED', 'true') == 'true':
-    iniciar_programador()
+    COORDINADOR.iniciar()
 
 # --- RUTAS ---
 @app.route('/')
@@ -168,7 +266,46 @@ def dashboard():
 @app.route('/api/flota', methods=['GET'])
 @login_required
 def api_get_flota():
-    return jsonify(cargar_json(DATA_FILE))
+    # El cursor va antes de leer: lo que el feed repita después es idempotente.
+    cursor = ALMACEN.flota.cursor_cambios()
+    resp = cache_http.respuesta_json('flota', ALMACEN.flota)
+    resp.headers['X-Cambios-Cursor'] = cursor
+    return resp
+
+@app.route('/api/changes', methods=['GET'])
+@login_required
+def api_changes():
+    """Unidades que cambiaron después de `since` (ver cambios.py): SSE con
+    Accept: text/event-stream, si no long-poll JSON."""
+    flota = ALMACEN.flota
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        if 'text/event-stream' in request.headers.get('Accept', ''):
+            return Response(cambios.eventos(flota, cursor), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        return jsonify(cambios.esperar_cambios(flota, cursor))
+    except cambios.Ocupado:
+        resp = jsonify({"status": "error", "message": "Demasiadas conexiones abiertas, reintentá en unos segundos"})
+        resp.status_code = 503
+        resp.headers['Retry-After'] = '30'
+        return resp
+
+# --- CONCURRENCIA OPTIMISTA ---
+# Toda escritura sobre algo que ya existe manda If-Match con la versión que el
+# cliente editó: el ETag de GET /api/flota o /api/config para los documentos
+# enteros, o el campo `version` del registro para una unidad o un usuario. La
+# comparación y la escritura van dentro de doc.escritura() (lock entre workers),
+# así que entre chequear y guardar nadie más puede escribir.
+def _precondicion(actual, **extra):
+    """None si If-Match coincide con `actual`; si no, la respuesta 428/409."""
+    cabecera = request.headers.get('If-Match')
+    if not cabecera:
+        return jsonify({"status": "error", "message": "Falta If-Match con la versión editada"}), 428
+    etags = cache_http.normalizar_etags(cabecera)
+    if '*' in etags or str(actual) in etags:
+        return None
+    return jsonify({"status": "error", "message": "Otro usuario modificó estos datos; recargá y volvé a intentar",
+                    "version": actual, **extra}), 409
 
 @app.route('/api/guardar_flota', methods=['POST'])
 @login_required
@@ -182,19 +319,41 @@ def api_save_flota():
     else:
         flota = body
         audit = {}
-    if guardar_json(DATA_FILE, flota):
-        if audit:
-            log_audit(session.get('usuario_actual', '?'), audit.get('action', ''), audit.get('details', ''))
-        return jsonify({"status": "success"})
-    return jsonify({"status": "error"}), 500
+    # Un cliente viejo puede mandar unidades con `historial` embebido: se separa
+    # antes de guardar (la unidad no cambia por eso) y se suma al historial después.
+    embebidos = []
+    for u in flota if isinstance(flota, list) else []:
+        if isinstance(u, dict) and 'historial' in u:
+            eventos = u.pop('historial')
+            if not isinstance(eventos, list):
+                return jsonify({"status": "error", "message": f"Flota inválida: historial de {u.get('id')!r} no es una lista"}), 400
+            embebidos.append((u.get('id'), eventos))
+    with ALMACEN.flota.escritura():
+        error = _precondicion(cache_http.etag_actual('flota', ALMACEN.flota))
+        if error:
+            return error
+        try:
+            if not guardar_json(ALMACEN.flota, flota):
+                return jsonify({"status": "error"}), 500
+        except storage.DatosInvalidos as e:
+            # Sin ids válidos y únicos no se guarda nada, en ningún backend.
+            return jsonify({"status": "error", "message": f"Flota inválida: {e}"}), 400
+        try:
+            for uid, eventos in embebidos:
+                HISTORIAL.importar(uid, eventos)
+            HISTORIAL.conservar(ALMACEN.flota.claves())
+        except (OSError, storage.ErrorAlmacenamiento) as e:
+            print(f"Error guardando historial: {e}")
+            return jsonify({"status": "error", "message": "La flota se guardó pero el historial no"}), 500
+        etag = cache_http.etag_actual('flota', ALMACEN.flota)
+    if audit:
+        log_audit(session.get('usuario_actual', '?'), audit.get('action', ''), audit.get('details', ''))
+    return jsonify({"status": "success", "etag": etag})
 
 @app.route('/api/config', methods=['GET'])
 @login_required
 def api_get_config():
-    c = cargar_json(CONFIG_FILE)
-    if not c:
-        c = {"diasAviso": 30, "emailAlertas": "datos@semilleroelmanantial.com"}
-    return jsonify(c)
+    return cache_http.respuesta_json('config', ALMACEN.config, lambda c: c or CONFIG_DEFAULT)
 
 @app.route('/api/cleanup', methods=['POST'])
 @login_required
@@ -205,12 +364,12 @@ def api_cleanup():
     patentes_validas = [p.strip().upper() for p in body.get('patentes', [])]
     if not patentes_validas:
         return jsonify({"status": "error", "message": "Enviar lista de patentes válidas"}), 400
-    flota = cargar_json(DATA_FILE)
-    antes = len(flota)
-    flota = [c for c in flota if c.get('patente', '').upper() in patentes_validas]
-    despues = len(flota)
-    guardar_json(DATA_FILE, flota)
-    eliminados = antes - despues
+    with ALMACEN.flota.escritura():
+        error = _precondicion(cache_http.etag_actual('flota', ALMACEN.flota))
+        if error:
+            return error
+        eliminados, despues = ALMACEN.flota.conservar_patentes(patentes_validas)
+        HISTORIAL.conservar(ALMACEN.flota.claves())
     log_audit(session.get('usuario_actual', '?'), "cleanup", f"Limpieza: {eliminados} unidades eliminadas, {despues} conservadas")
     return jsonify({"status": "success", "eliminados": eliminados, "conservados": despues})
 
@@ -219,39 +378,469 @@ def api_cleanup():
 @admin_required
 def api_toggle_activo(truck_id):
     """Activa/desactiva un camión (no genera alertas si está inactivo)"""
-    flota = cargar_json(DATA_FILE)
-    truck = next((c for c in flota if c.get('id') == truck_id), None)
+    def cambiar(truck):
+        truck['activo'] = not truck.get('activo', True)
+        return f"{truck.get('patente','')} {'activada' if truck['activo'] else 'desactivada'}"
+    return _editar_unidad(truck_id, cambiar, "toggle_activo", extra=lambda t: {"activo": t.get('activo', True)})
+
+# --- FLOTA: operaciones por unidad ---
+# Cada acción de la UI toca una sola unidad: en vez de re-postear toda la flota,
+# el browser manda solo el cambio y el server devuelve la unidad actualizada.
+def _merge_patch(destino, parche):
+    """JSON Merge Patch (RFC 7386): los dicts se combinan y null borra la clave."""
+    for k, v in parche.items():
+        if v is None:
+            destino.pop(k, None)
+        elif isinstance(v, dict):
+            actual = destino.get(k)
+            destino[k] = _merge_patch(actual if isinstance(actual, dict) else {}, v)
+        else:
+            destino[k] = v
+    return destino
+
+def _base_medidor(truck):
+    """Lo que usa el pronóstico del service: medidor, último service e intervalo."""
+    service = truck.get('service') if truck else None
+    service = service if isinstance(service, dict) else {}
+    return (truck or {}).get('km_actual'), service.get('ultimo_km'), service.get('intervalo_km')
+
+def _guardar_unidad(truck, action, details, borrar=False, extra=None, medidor_antes=None, despues=None):
+    """Guarda (o borra) la unidad; `despues(truck)` corre solo si eso salió bien.
+
+    `medidor_antes` es _base_medidor() de la unidad antes del cambio (None si es nueva).
+    """
+    puntos = []
+    try:
+        if borrar:
+            ALMACEN.flota.borrar(truck['id'])
+            MEDIDORES.borrar(truck['id'])
+            HISTORIAL.borrar_unidad(truck['id'])
+        else:
+            # El pronóstico se recalcula solo si cambió algo de lo que depende; la
+            # lectura nueva entra a la serie recién con la unidad guardada.
+            base_antes = medidor_antes or (None, None, None)
+            base = _base_medidor(truck)
+            if base != base_antes:
+                km = base[0]
+                if isinstance(km, (int, float)) and not isinstance(km, bool) and km != base_antes[0]:
+                    puntos = [(time.time(), km)]
+                    # Como en la carga masiva: cuándo se leyó km_actual (ver lecturas.py).
+                    truck['km_fecha'] = lecturas.fecha_iso(puntos[0][0])
+                MEDIDORES.proyectar(truck, puntos)
+            truck = ALMACEN.flota.poner(truck)
+    except (OSError, storage.ErrorAlmacenamiento) as e:
+        print(f"Error guardando unidad {truck.get('id')}: {e}")
+        return jsonify({"status": "error"}), 500
+    pendientes = [lambda t: MEDIDORES.agregar(t['id'], puntos)] if puntos else []
+    if despues:
+        pendientes.append(despues)
+    for fn in pendientes:
+        try:
+            fn(truck)
+        except (OSError, storage.ErrorAlmacenamiento) as e:
+            # La unidad ya quedó guardada: no se la informa como fallida.
+            print(f"Error completando {action} de la unidad {truck.get('id')}: {e}")
+    log_audit(session.get('usuario_actual', '?'), action, details)
+    resp = jsonify({"status": "success", "unidad": truck, **(extra(truck) if extra else {})})
+    resp.headers['ETag'] = f'"{truck.get("version", 0)}"'
+    return resp
+
+def _editar_unidad(truck_id, cambiar, action, borrar=False, extra=None, despues=None):
+    """Lectura-modificación-escritura de una unidad con If-Match contra su `version`.
+
+    `cambiar(truck)` modifica la unidad y devuelve el detalle para la auditoría,
+    o una respuesta de error. Lo que dependa de que la unidad se haya guardado
+    (p. ej. el historial) va en `despues(truck)`.
+    """
+    with ALMACEN.flota.escritura():
+        truck = ALMACEN.flota.obtener(truck_id)
+        if not truck:
+            return _no_encontrada()
+        error = _precondicion(truck.get('version', 0), unidad=truck)
+        if error:
+            return error
+        medidor_antes = _base_medidor(truck)
+        detalle = cambiar(truck)
+        if not isinstance(detalle, str):
+            return detalle
+        return _guardar_unidad(truck, action, detalle, borrar, extra, medidor_antes, despues)
+
+def _no_encontrada():
+    return jsonify({"status": "error", "message": "Unidad no encontrada"}), 404
+
+def _fecha_valida(fecha):
+    if not fecha:
+        return True
+    try:
+        datetime.datetime.strptime(fecha, "%Y-%m-%d")
+        return True
+    except (TypeError, ValueError):
+        return False
+
+@app.route('/api/flota', methods=['POST'])
+@login_required
+@admin_required
+def api_create_unidad():
+    body = request.json
+    if not isinstance(body, dict) or not str(body.get('patente', '')).strip():
+        return jsonify({"status": "error", "message": "Patente o nombre requerido"}), 400
+    truck = dict(body)
+    truck.pop('version', None)
+    truck.pop('historial', None)
+    truck.setdefault('activo', True)
+    with ALMACEN.flota.escritura():
+        # El id lo asigna el server (bajo el lock): dos admins creando a la vez no pisan el mismo número
+        truck['id'] = max((int(k) for k in ALMACEN.flota.claves() if k is not None), default=0) + 1
+        return _guardar_unidad(truck, "create_truck", truck['patente'])
+
+@app.route('/api/flota/<int:truck_id>', methods=['PATCH'])
+@login_required
+@admin_required
+def api_patch_unidad(truck_id):
+    """Aplica un merge patch a una unidad (campos, service y vencimientos)."""
+    parche = request.json
+    if not isinstance(parche, dict):
+        return jsonify({"status": "error", "message": "Se espera un objeto JSON"}), 400
+    parche.pop('id', None)
+    parche.pop('version', None)
+    parche.pop('historial', None)  # el historial tiene sus propios endpoints
+    def cambiar(truck):
+        _merge_patch(truck, parche)
+        return truck.get('patente', '')
+    return _editar_unidad(truck_id, cambiar, "update_truck")
+
+@app.route('/api/flota/<int:truck_id>', methods=['DELETE'])
+@login_required
+@admin_required
+def api_delete_unidad(truck_id):
+    return _editar_unidad(truck_id, lambda truck: truck.get('patente', ''), "delete_truck", borrar=True)
+
+@app.route('/api/flota/<int:truck_id>/service', methods=['POST'])
+@login_required
+@admin_required
+def api_registrar_service(truck_id):
+    """Registra un service: actualiza medidor y último service, y lo anota en el historial."""
+    body = request.json or {}
+    try:
+        km = int(body.get('km'))
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "Medidor inválido"}), 400
+    fecha = body.get('fecha', '')
+    if not _fecha_valida(fecha):
+        return jsonify({"status": "error", "message": "Fecha inválida"}), 400
+    def km_fmt(truck):
+        unidad = "hs" if truck.get('tipo_medidor') == "horas" else "km"
+        return f"{km:,}".replace(',', '.') + f" {unidad}"
+    def cambiar(truck):
+        if km > lecturas.medidor_actual(truck):
+            truck['km_actual'] = km
+        truck.setdefault('service', {})['ultimo_km'] = km
+        return f"{truck.get('patente', '')} - {km_fmt(truck)}"
+    def anotar(truck):
+        # Recién con la unidad guardada: un 409 o un error de disco no deja un service fantasma.
+        HISTORIAL.agregar(truck['id'], {"fecha": fecha, "tipo": "Service", "detalle": f"Service a {km_fmt(truck)}"})
+    return _editar_unidad(truck_id, cambiar, "register_service", despues=anotar)
+
+@app.route('/api/flota/<int:truck_id>/vencimientos/<tipo>', methods=['PUT'])
+@login_required
+@admin_required
+def api_put_vencimiento(truck_id, tipo):
+    fecha = (request.json or {}).get('fecha', '')
+    if not _fecha_valida(fecha):
+        return jsonify({"status": "error", "message": "Fecha inválida"}), 400
+    def cambiar(truck):
+        truck.setdefault('vencimientos', {})[tipo] = fecha
+        return f"{truck.get('patente', '')} - {tipo}"
+    return _editar_unidad(truck_id, cambiar, "add_expiration")
+
+@app.route('/api/flota/<int:truck_id>/vencimientos/<tipo>', methods=['DELETE'])
+@login_required
+@admin_required
+def api_delete_vencimiento(truck_id, tipo):
+    def cambiar(truck):
+        if tipo not in truck.get('vencimientos', {}):
+            return jsonify({"status": "error", "message": "Vencimiento no encontrado"}), 404
+        del truck['vencimientos'][tipo]
+        return f"{truck.get('patente', '')} - {tipo}"
+    return _editar_unidad(truck_id, cambiar, "delete_expiration")
+
+def _evento_historial(body):
+    body = body or {}
+    item = {"fecha": body.get('fecha', ''), "tipo": body.get('tipo', ''), "detalle": body.get('detalle', '')}
+    return item if item['tipo'] and _fecha_valida(item['fecha']) else None
+
+# El historial no es parte de la unidad: escribir un evento no toca la flota
+# ni su versión, y como cada evento tiene un eid estable no hace falta If-Match.
+@app.route('/api/flota/<int:truck_id>/historial', methods=['GET'])
+@login_required
+def api_get_historial(truck_id):
+    """Historial paginado, del evento más nuevo al más viejo: `limit` y `cursor` (eid del último recibido)."""
+    if ALMACEN.flota.obtener(truck_id) is None:
+        return _no_encontrada()
+    try:
+        limite = min(max(int(request.args.get('limit', historial.LIMITE)), 1), 500)
+        cursor = int(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "Parámetros inválidos"}), 400
+    return jsonify(HISTORIAL.listar(truck_id, limite, cursor))
+
+def _guardar_evento(truck_id, action, guardar):
+    truck = ALMACEN.flota.obtener(truck_id)
+    if truck is None:
+        return _no_encontrada()
+    try:
+        evento = guardar()
+    except (OSError, storage.ErrorAlmacenamiento) as e:
+        print(f"Error guardando historial de {truck_id}: {e}")
+        return jsonify({"status": "error"}), 500
+    if not evento:
+        return jsonify({"status": "error", "message": "Evento no encontrado"}), 404
+    detalle = truck.get('patente', '') + (f" - {evento['tipo']}" if isinstance(evento, dict) else "")
+    log_audit(session.get('usuario_actual', '?'), action, detalle)
+    return jsonify({"status": "success", **({"evento": evento} if isinstance(evento, dict) else {})})
+
+@app.route('/api/flota/<int:truck_id>/historial', methods=['POST'])
+@login_required
+@admin_required
+def api_add_historial(truck_id):
+    item = _evento_historial(request.json)
+    if not item:
+        return jsonify({"status": "error", "message": "Evento inválido"}), 400
+    return _guardar_evento(truck_id, "update_history", lambda: HISTORIAL.agregar(truck_id, item))
+
+@app.route('/api/flota/<int:truck_id>/historial/<int:eid>', methods=['PUT'])
+@login_required
+@admin_required
+def api_update_historial(truck_id, eid):
+    item = _evento_historial(request.json)
+    if not item:
+        return jsonify({"status": "error", "message": "Evento inválido"}), 400
+    return _guardar_evento(truck_id, "update_history", lambda: HISTORIAL.reemplazar(truck_id, eid, item))
+
+@app.route('/api/flota/<int:truck_id>/historial/<int:eid>', methods=['DELETE'])
+@login_required
+@admin_required
+def api_delete_historial(truck_id, eid):
+    return _guardar_evento(truck_id, "delete_history", lambda: HISTORIAL.borrar(truck_id, eid))
+
+@app.route('/api/flota/<int:truck_id>/lecturas', methods=['GET'])
+@login_required
+def api_get_lecturas(truck_id):
+    """Serie del medidor de una unidad (últimos `dias`, 365 por defecto) y su pronóstico de service."""
+    truck = ALMACEN.flota.obtener(truck_id)
     if not truck:
-        return jsonify({"status": "error", "message": "Unidad no encontrada"}), 404
-    truck['activo'] = not truck.get('activo', True)
-    guardar_json(DATA_FILE, flota)
-    estado = "activada" if truck['activo'] else "desactivada"
-    log_audit(session.get('usuario_actual', '?'), "toggle_activo", f"{truck.get('patente','')} {estado}")
-    return jsonify({"status": "success", "activo": truck['activo']})
+        return _no_encontrada()
+    try:
+        dias = max(int(request.args.get('dias', 365)), 1)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Parámetro dias inválido"}), 400
+    ts, val = MEDIDORES.leer(truck_id, time.time() - dias * 86400)
+    tasa = MEDIDORES.tasa(truck_id)
+    return jsonify({
+        "id": truck_id,
+        "puntos": [[int(t), int(v) if v.is_integer() else v] for t, v in zip(ts, val)],
+        "tasa_dia": round(tasa, 1) if tasa is not None else None,
+        "pronostico": MEDIDORES.pronostico(truck),
+    })
+
+@app.route('/api/flota/lecturas', methods=['POST'])
+@login_required
+@admin_required
+def api_ingerir_lecturas():
+    """Carga masiva de odómetros/horómetros (NDJSON o CSV, en streaming); ver lecturas.py.
+
+    No lleva If-Match: la validación de que el medidor no retroceda se hace
+    contra lo guardado, dentro del lock de escritura.
+    """
+    formato = request.args.get('formato') or ('csv' if 'csv' in request.mimetype else 'ndjson')
+    if formato not in ('csv', 'ndjson'):
+        return jsonify({"status": "error", "message": "Formato inválido (csv o ndjson)"}), 400
+    simular = request.args.get('simular') in ('1', 'true')
+    cuerpo = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    try:
+        resultado = lecturas.ingerir(ALMACEN.flota, cuerpo, formato, simular, MEDIDORES)
+    except lecturas.ErrorIngesta as e:
+        return jsonify({"status": "error", "message": str(e)}), 413
+    except UnicodeDecodeError:
+        return jsonify({"status": "error", "message": "El cuerpo debe ser UTF-8"}), 400
+    except (OSError, storage.ErrorAlmacenamiento) as e:
+        print(f"Error ingiriendo lecturas: {e}")
+        return jsonify({"status": "error"}), 500
+    if resultado['unidades'] and not simular:
+        log_audit(session.get('usuario_actual', '?'), "bulk_readings", lecturas.detalle_auditoria(resultado))
+    return jsonify({"status": "success", **resultado})
 
 @app.route('/api/guardar_config', methods=['POST'])
 @login_required
 @admin_required
 def api_save_config():
-    if guardar_json(CONFIG_FILE, request.json):
-        log_audit(session.get('usuario_actual', '?'), "update_config", "Configuración actualizada")
-        return jsonify({"status": "success"})
-    return jsonify({"status": "error"}), 500
+    transformar = lambda c: c or CONFIG_DEFAULT
+    with ALMACEN.config.escritura():
+        error = _precondicion(cache_http.etag_actual('config', ALMACEN.config, transformar))
+        if error:
+            return error
+        if not guardar_json(ALMACEN.config, request.json):
+            return jsonify({"status": "error"}), 500
+        etag = cache_http.etag_actual('config', ALMACEN.config, transformar)
+    log_audit(session.get('usuario_actual', '?'), "update_config", "Configuración actualizada")
+    return jsonify({"status": "success", "etag": etag})
 
 # --- AUDIT API ---
 @app.route('/api/audit_log', methods=['GET'])
 @login_required
 @admin_required
 def api_get_audit():
-    return jsonify(cargar_json(AUDIT_FILE))
+    """Paginado por cursor, del más nuevo al más viejo. Filtros: user, action, desde, hasta."""
+    a = request.args
+    try:
+        limite = min(max(int(a.get('limit', 100)), 1), 1000)
+    except ValueError:
+        return jsonify({"status": "error", "message": "limit inválido"}), 400
+    items, cursor = ALMACEN.auditoria.consultar(limite, a.get('cursor'), a.get('user'), a.get('action'), a.get('desde'), a.get('hasta'))
+    return jsonify({"items": items, "next_cursor": cursor})
+
+# --- EXPORTACIÓN ---
+@app.route('/api/export/<tipo>', methods=['GET'])
+@login_required
+def api_export(tipo):
+    """CSV o XLSX de flota, vencimientos, historial o auditoría, en streaming; ver exportar.py.
+
+    Filtros: desde, hasta, activo, tipo_medidor. La auditoría es solo para admins.
+    """
+    if tipo == 'audit' and session.get('rol_usuario') != 'admin':
+        return jsonify({"status": "error", "message": "Permisos insuficientes (Modo Lectura)"}), 403
+    a = request.args
+    formato = a.get('formato', 'csv')
+    try:
+        filtros = exportar.Filtros(tipo, a.get('desde'), a.get('hasta'), a.get('activo'), a.get('tipo_medidor'))
+        # Almacén e historial del tenant resueltos acá: el generador corre
+        # después de que termina la vista, fuera del contexto del pedido.
+        t = _tenant()
+        config = cargar_json(t.almacen.config) or CONFIG_DEFAULT
+        bloques = exportar.exportar(t.almacen, filtros, formato, historial=t.historial,
+                                    dias_aviso=int(config.get('diasAviso', 30)))
+    except exportar.ErrorExportacion as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    log_audit(session.get('usuario_actual', '?'), "export", f"{tipo} ({formato})")
+    return Response(bloques, content_type=exportar.FORMATOS[formato], headers={
+        "Content-Disposition": f'attachment; filename="{exportar.nombre_archivo(tipo, formato)}"',
+        "Cache-Control": "no-store",
+        # Que un proxy (nginx) no junte la respuesta entera antes de mandarla.
+        "X-Accel-Buffering": "no",
+    })
+
+# --- ALERTAS ---
+@app.route('/api/alertas/proximas', methods=['GET'])
+@login_required
+def api_alertas_proximas():
+    """Avisos pendientes en los próximos N días, desde el calendario precalculado."""
+    try:
+        n = min(max(int(request.args.get('dias', 30)), 0), 366)
+    except ValueError:
+        return jsonify({"status": "error", "message": "dias inválido"}), 400
+    config = cargar_json(ALMACEN.config) or CONFIG_DEFAULT
+    dias_aviso = int(config.get('diasAviso', 30))
+    return jsonify(calendario_alertas.obtener(ALMACEN).proximas(dias_aviso, n))
+
+# --- MONITOREO ---
+@app.route('/api/flota/status', methods=['GET'])
+@login_required
+def api_flota_status():
+    """Estado por unidad, contadores y vencimientos a 90 días, calculados en el server.
+
+    Filtros: estado=danger,warning,ok · tipo_medidor=km|horas · q=texto · ids=1,2,3
+    (solo esas unidades: lo que usa el navegador después de un cambio puntual).
+    Paginación: offset / limit (sin limit vienen todas).
+    """
+    nombres = {n.lower(): c for c, n in estado_flota.NOMBRES.items() if c != estado_flota.ERROR}
+    pedidos = [e.strip().lower() for e in request.args.get('estado', '').split(',') if e.strip() and e.strip().lower() != 'all']
+    if any(e not in nombres for e in pedidos):
+        return jsonify({"status": "error", "message": "estado inválido"}), 400
+    tipo = request.args.get('tipo_medidor') or None
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = request.args.get('limit')
+        limit = max(int(limit), 0) if limit is not None else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "offset/limit inválidos"}), 400
+    ids = request.args.get('ids')
+    if ids is not None:
+        try:
+            ids = {int(i) for i in ids.split(',') if i.strip()}
+        except ValueError:
+            return jsonify({"status": "error", "message": "ids inválidos"}), 400
+
+    config = cargar_json(ALMACEN.config) or CONFIG_DEFAULT
+    est = estado_flota.calcular(ALMACEN.flota, int(config.get('diasAviso', 30)))
+    indices = est.indices({nombres[e] for e in pedidos}, tipo, request.args.get('q'), ids)
+    pagina = indices[offset:] if limit is None else indices[offset:offset + limit]
+    histograma, por_vencer = est.por_vencer(tipo)
+    return jsonify({
+        "fecha": est.hoy.isoformat(),
+        "dias_aviso": est.dias_aviso,
+        "total": len(indices),
+        "offset": offset,
+        "items": est.items(pagina),
+        "contadores": est.contadores,
+        "alertas": est.alertas,
+        "histograma": histograma,
+        "vencimientos_90": por_vencer,
+    })
+
+@app.route('/api/auth/estado', methods=['GET'])
+@login_required
+@admin_required
+def api_auth_estado():
+    """Caché y circuit breaker del login contra Supabase, y cupos del pool de hashes."""
+    return jsonify({**auth_remote.estadisticas(), "pool": auth_pool.estadisticas()})
+
+@app.route('/api/tenants/estado', methods=['GET'])
+@login_required
+@admin_required
+def api_tenants_estado():
+    """Tenants cargados en este worker (LRU de tenants.py) y el de la sesión."""
+    return jsonify({**tenants.REGISTRO.estadisticas(), "actual": _tenant().id})
+
+@app.route('/api/servidor/estado', methods=['GET'])
+@login_required
+@admin_required
+def api_servidor_estado():
+    """Modo de servicio; en ASGI, la ocupación de cada carril (asgi.py), y el feed de cambios."""
+    # asgi.py importa esta app, no al revés: si no está cargado, es WSGI (gunicorn gthread).
+    modo = sys.modules.get("asgi")
+    return jsonify({"modo": "asgi" if modo else "wsgi",
+                    "carriles": modo.estadisticas() if modo else None,
+                    "feed": cambios.VIGIA.estadisticas()})
 
 # --- USER API ---
+@app.route('/api/scheduler/estado', methods=['GET'])
+@login_required
+@admin_required
+def api_scheduler_estado():
+    """Quién es el líder, próximos disparos (si este worker lo es) y últimas corridas."""
+    return jsonify(COORDINADOR.estado())
+
+@app.route('/api/outbox/estado', methods=['GET'])
+@login_required
+@admin_required
+def api_outbox_estado():
+    """Profundidad de la cola de emails, descartados y latencia de envío."""
+    return jsonify(enviar_alertas.OUTBOX.estadisticas())
+
+@app.route('/api/outbox/reintentar', methods=['POST'])
+@login_required
+@admin_required
+def api_outbox_reintentar():
+    cantidad = enviar_alertas.OUTBOX.reintentar_muertos()
+    log_audit(session.get('usuario_actual', '?'), "outbox_reintentar", f"{cantidad} emails devueltos a la cola")
+    return jsonify({"status": "success", "reintentados": cantidad})
+
 @app.route('/api/users', methods=['GET'])
 @login_required
 @admin_required
 def api_get_users():
     users = cargar_usuarios()
-    return jsonify([{"username": u["username"], "role": u["role"]} for u in users])
+    return jsonify([{"username": u["username"], "role": u["role"], "version": u.get("version", 0)} for u in users])
 
 @app.route('/api/users', methods=['POST'])
 @login_required
@@ -265,15 +854,15 @@ def api_create_user():
         return jsonify({"status": "error", "message": "Usuario y contraseña requeridos"}), 400
     if role not in ('admin', 'lector'):
         return jsonify({"status": "error", "message": "Rol inválido"}), 400
-    users = cargar_usuarios()
-    if any(u['username'] == username for u in users):
-        return jsonify({"status": "error", "message": "El usuario ya existe"}), 400
-    users.append({
-        "username": username,
-        "password_hash": generate_password_hash(password),
-        "role": role
-    })
-    guardar_json(USERS_FILE, users)
+    cargar_usuarios()  # bootstrap del admin si hace falta
+    with ALMACEN.usuarios.escritura():
+        if ALMACEN.usuarios.obtener(username):
+            return jsonify({"status": "error", "message": "El usuario ya existe"}), 400
+        ALMACEN.usuarios.poner({
+            "username": username,
+            "password_hash": generate_password_hash(password),
+            "role": role
+        })
     log_audit(session.get('usuario_actual', '?'), "create_user", f"Usuario creado: {username} ({role})")
     return jsonify({"status": "success"})
 
@@ -282,17 +871,21 @@ def api_create_user():
 @admin_required
 def api_update_user(username):
     body = request.json
-    users = cargar_usuarios()
-    user = next((u for u in users if u['username'] == username), None)
-    if not user:
-        return jsonify({"status": "error", "message": "Usuario no encontrado"}), 404
-    if body.get('role') and body['role'] in ('admin', 'lector'):
-        user['role'] = body['role']
-    if body.get('password'):
-        user['password_hash'] = generate_password_hash(body['password'])
-    guardar_json(USERS_FILE, users)
+    password_hash = generate_password_hash(body['password']) if body.get('password') else None
+    with ALMACEN.usuarios.escritura():
+        user = ALMACEN.usuarios.obtener(username)
+        if not user:
+            return jsonify({"status": "error", "message": "Usuario no encontrado"}), 404
+        error = _precondicion(user.get('version', 0))
+        if error:
+            return error
+        if body.get('role') and body['role'] in ('admin', 'lector'):
+            user['role'] = body['role']
+        if password_hash:
+            user['password_hash'] = password_hash
+        user = ALMACEN.usuarios.poner(user)
     log_audit(session.get('usuario_actual', '?'), "update_user", f"Usuario actualizado: {username}")
-    return jsonify({"status": "success"})
+    return jsonify({"status": "success", "version": user.get('version', 0)})
 
 @app.route('/api/users/<username>', methods=['DELETE'])
 @login_required
@@ -300,17 +893,67 @@ def api_update_user(username):
 def api_delete_user(username):
     if username == session.get('usuario_actual'):
         return jsonify({"status": "error", "message": "No podés eliminar tu propio usuario"}), 400
-    users = cargar_usuarios()
-    users = [u for u in users if u['username'] != username]
-    guardar_json(USERS_FILE, users)
+    with ALMACEN.usuarios.escritura():
+        user = ALMACEN.usuarios.obtener(username)
+        if user:
+            error = _precondicion(user.get('version', 0))
+            if error:
+                return error
+            ALMACEN.usuarios.borrar(username)
     log_audit(session.get('usuario_actual', '?'), "delete_user", f"Usuario eliminado: {username}")
     return jsonify({"status": "success"})
 
+# --- MÉTRICAS ---
+def _tamanio(ruta):
+    if not os.path.isdir(ruta):
+        return os.path.getsize(ruta)
+    total = 0
+    for raiz, _, nombres in os.walk(ruta):
+        for n in nombres:
+            try:
+                total += os.path.getsize(os.path.join(raiz, n))
+            except OSError:
+                pass
+    return total
+
+def _metricas_instantaneas():
+    archivos = []
+    for n in sorted(os.listdir(DATA_DIR)):
+        try:
+            archivos.append(({"archivo": n}, _tamanio(os.path.join(DATA_DIR, n))))
+        except OSError:
+            pass
+    # Con MULTI_TENANT, una serie por tenant cargado en este worker.
+    cargados = tenants.REGISTRO.cargados()
+    etiqueta = (lambda t: {"tenant": t.id}) if tenants.HABILITADO else (lambda t: {})
+    instantaneas = [
+        ("flota_data_file_bytes", "Tamaño de cada archivo (o carpeta) de data/.", archivos),
+        ("flota_audit_entries", "Eventos en el log de auditoría.",
+         [(etiqueta(t), t.almacen.auditoria.contar()) for t in cargados]),
+        ("flota_units", "Unidades en la flota.", [(etiqueta(t), len(t.almacen.flota.claves())) for t in cargados]),
+    ]
+    if tenants.HABILITADO:
+        instantaneas.append(("flota_tenants_loaded", "Tenants cargados en memoria en este worker.", [({}, len(cargados))]))
+    return instantaneas
+
+@app.route('/metrics')
+def metrics():
+    """Formato de texto de Prometheus: admin logueado o `Authorization: Bearer <METRICS_TOKEN>`."""
+    autorizacion = request.headers.get('Authorization', '')
+    por_token = bool(METRICS_TOKEN) and secrets.compare_digest(autorizacion.encode(), f"Bearer {METRICS_TOKEN}".encode())
+    # Las métricas cruzan tenants: por sesión, solo un admin del principal.
+    por_sesion = session.get('rol_usuario') == 'admin' and \
+        (not tenants.HABILITADO or session.get('tenant') == tenants.PRINCIPAL)
+    if not por_token and not por_sesion:
+        return jsonify({"error": "No autorizado"}), 401
+    cuerpo = metricas.texto(metricas.agregado(), _metricas_instantaneas())
+    return Response(cuerpo, mimetype='text/plain; version=0.0.4')
+
 # --- STATIC ---
-@app.route('/<path:path>')
-@login_required
-def serve_static(path):
-    return send_from_directory('.', path)
+# Sin login: el logo y el CSS también los usa la pantalla de ingreso.
+@app.route('/static/<path:ruta>')
+def serve_static(ruta):
+    return ASSETS.servir(ruta)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
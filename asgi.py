@@ -0,0 +1,321 @@
+"""Modo ASGI: la misma app Flask detrás de uvicorn, con carriles de hilos.
+
+Con gunicorn gthread todos los pedidos de un worker comparten sus hilos: unos
+cientos de pedidos lentos a la vez (logins esperando a Supabase, uploads de
+lecturas, escrituras que esperan el lock del journal, feeds de /api/changes)
+se quedan con todos y un GET /api/flota, que se resuelve en milisegundos,
+espera en la cola detrás de ellos.
+
+Acá el event loop de uvicorn atiende las conexiones (miles abiertas no cuestan
+un hilo cada una) y cada pedido se corre en el pool de su carril:
+
+- rapido: GET/HEAD comunes (flota, config, estado, assets). ASGI_HILOS_RAPIDO.
+- lento: escrituras, login, uploads, exports y /metrics. ASGI_HILOS_LENTO.
+- feed: GET /api/changes; la conexión queda abierta pero duerme en su carril.
+
+Un carril lleno no frena a los otros. Si además tiene más de
+ASGI_COLA_FACTOR veces sus hilos esperando, el pedido se rechaza enseguida
+con 503 y Retry-After en vez de encolarse sin límite.
+
+La app, las rutas, la sesión y los decoradores (login_required,
+admin_required) son los mismos: el adaptador arma el environ WSGI, lee el
+cuerpo a medida que la vista lo pide (los uploads no se juntan en memoria)
+y manda la respuesta de a pedazos, así SSE y los exports salen en streaming.
+El trabajo bloqueante de la vista (Supabase, bcrypt en auth_pool, disco)
+sigue siendo sincrónico, pero se hace en el hilo de su carril y no en el loop.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 80 --workers 3
+
+o con gunicorn como supervisor:
+
+    gunicorn -k uvicorn.workers.UvicornWorker --workers 3 asgi:app
+
+Igual que con gthread, sin --preload (ver coordinador.py).
+"""
+
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cambios
+from app import app as app_wsgi
+
+HILOS_RAPIDO = int(os.environ.get("ASGI_HILOS_RAPIDO", 16))
+HILOS_LENTO = int(os.environ.get("ASGI_HILOS_LENTO", 32))
+# El feed ya se limita en cambios.py; unos hilos más para contestar los 503.
+HILOS_FEED = int(os.environ.get("ASGI_HILOS_FEED", cambios.MAX_CONEXIONES + 4))
+COLA_FACTOR = int(os.environ.get("ASGI_COLA_FACTOR", 8))
+
+RUTAS_FEED = ("/api/changes",)
+RUTAS_LENTAS = ("/api/export/", "/metrics", "/login", "/logout")
+
+
+class Carril:
+    def __init__(self, nombre, hilos):
+        self.nombre = nombre
+        self.hilos = hilos
+        self.max_pendientes = hilos * (1 + COLA_FACTOR)
+        self.pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix=f"asgi-{nombre}")
+        # Solo se tocan desde el event loop: no hace falta lock.
+        self.pendientes = 0
+        self.rechazados = 0
+
+    def admitir(self):
+        if self.pendientes >= self.max_pendientes:
+            self.rechazados += 1
+            return False
+        self.pendientes += 1
+        return True
+
+    def liberar(self):
+        self.pendientes -= 1
+
+    def estadisticas(self):
+        return {"hilos": self.hilos, "pendientes": self.pendientes,
+                "max_pendientes": self.max_pendientes, "rechazados": self.rechazados}
+
+
+CARRILES = {
+    "rapido": Carril("rapido", HILOS_RAPIDO),
+    "lento": Carril("lento", HILOS_LENTO),
+    "feed": Carril("feed", HILOS_FEED),
+}
+
+
+def carril(metodo, ruta):
+    """Nombre del carril para un pedido."""
+    if ruta in RUTAS_FEED:
+        return "feed"
+    if metodo not in ("GET", "HEAD") or ruta.startswith(RUTAS_LENTAS):
+        return "lento"
+    return "rapido"
+
+
+def estadisticas():
+    return {nombre: c.estadisticas() for nombre, c in CARRILES.items()}
+
+
+class _Pedido:
+    """Un pedido en curso: puente entre el hilo del carril y el event loop."""
+
+    def __init__(self, scope, receive, send, loop):
+        self.scope = scope
+        self._receive = receive
+        self._send = send
+        self.loop = loop
+        self.cortado = threading.Event()      # el cliente se desconectó
+        self.cuerpo_leido = False
+        self.vigilando = False
+        self.terminado = False                 # solo desde el loop
+        self._vigilancia = None
+
+    # --- desde el hilo del carril ---
+    def recibir(self):
+        return asyncio.run_coroutine_threadsafe(self._receive(), self.loop).result()
+
+    def enviar(self, mensaje):
+        asyncio.run_coroutine_threadsafe(self._send(mensaje), self.loop).result()
+
+    def vigilar(self):
+        """A partir de acá receive() es del loop: solo queda esperar el corte."""
+        self.vigilando = True
+        self.loop.call_soon_threadsafe(self._empezar_vigilancia)
+
+    # --- desde el loop ---
+    def _empezar_vigilancia(self):
+        if not self.terminado and self._vigilancia is None:
+            self._vigilancia = self.loop.create_task(self._esperar_corte())
+
+    async def _esperar_corte(self):
+        while True:
+            mensaje = await self._receive()
+            if mensaje["type"] == "http.disconnect":
+                self.cortado.set()
+                return
+
+    def terminar(self):
+        self.terminado = True
+        if self._vigilancia is not None:
+            self._vigilancia.cancel()
+
+
+class _Entrada(io.RawIOBase):
+    """wsgi.input: trae el cuerpo del loop de a un mensaje, cuando la vista lo lee.
+
+    Con Content-Length no se lee más allá: un read() sin tamaño termina ahí y
+    no se queda esperando otro mensaje del cliente."""
+
+    def __init__(self, pedido, largo=None):
+        self._pedido = pedido
+        self._buffer = b""
+        self._restante = largo  # bytes que faltan según Content-Length (None: hasta more_body=False)
+        if largo == 0:
+            pedido.cuerpo_leido = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        # Lo que la vista no leyó antes de responder ya no se puede leer.
+        while not self._buffer and not self._pedido.cuerpo_leido and not self._pedido.vigilando:
+            mensaje = self._pedido.recibir()
+            if mensaje["type"] == "http.disconnect":
+                self._pedido.cortado.set()
+                self._pedido.cuerpo_leido = True
+                break
+            self._buffer = mensaje.get("body", b"")
+            if self._restante is not None:
+                self._buffer = self._buffer[:self._restante]
+                self._restante -= len(self._buffer)
+            if not mensaje.get("more_body", False) or self._restante == 0:
+                self._pedido.cuerpo_leido = True
+        n = min(len(destino), len(self._buffer))
+        destino[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+def _largo(scope):
+    """Content-Length del pedido, o None si no viene (o no es un número)."""
+    for nombre, valor in scope.get("headers", []):
+        if nombre.lower() == b"content-length":
+            try:
+                return max(int(valor), 0)
+            except ValueError:
+                return None
+    return None
+
+
+def _environ(scope, entrada):
+    servidor = scope.get("server") or ("localhost", 80)
+    cliente = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        # WSGI quiere los bytes del path como latin-1.
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": servidor[0],
+        "SERVER_PORT": str(servidor[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": cliente[0],
+        "REMOTE_PORT": str(cliente[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BufferedReader(entrada),
+        # Sin Content-Length (chunked) el cuerpo termina cuando se acaba el stream.
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for nombre, valor in scope.get("headers", []):
+        nombre, valor = nombre.decode("latin-1").lower(), valor.decode("latin-1")
+        if nombre == "content-type":
+            clave = "CONTENT_TYPE"
+        elif nombre == "content-length":
+            clave = "CONTENT_LENGTH"
+        else:
+            clave = "HTTP_" + nombre.upper().replace("-", "_")
+        environ[clave] = f"{environ[clave]},{valor}" if clave in environ else valor
+    return environ
+
+
+def _atender(pedido):
+    """Corre en el hilo del carril: la app WSGI de punta a punta.
+
+    Si la app o el generador de la respuesta fallan antes de empezar a
+    responder, el cliente recibe un 500; si ya se mandó el comienzo, la
+    excepción sigue hasta el servidor, que corta la conexión (el cliente ve
+    una respuesta incompleta y no una que parece terminada)."""
+    respuesta = {}
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and respuesta.get("enviada"):
+            raise exc_info[1].with_traceback(exc_info[2])
+        respuesta["status"] = int(status.split(" ", 1)[0])
+        respuesta["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+    def empezar():
+        if not respuesta.get("enviada"):
+            if "status" not in respuesta:
+                raise RuntimeError("la app no llamó a start_response")
+            respuesta["enviada"] = True
+            pedido.enviar({"type": "http.response.start", "status": respuesta["status"],
+                           "headers": respuesta["headers"]})
+
+    iterable = None
+    try:
+        iterable = app_wsgi(_environ(pedido.scope, _Entrada(pedido, _largo(pedido.scope))), start_response)
+        pedido.vigilar()
+        for pedazo in iterable:
+            if pedido.cortado.is_set():
+                return
+            if not pedazo:
+                continue
+            empezar()
+            pedido.enviar({"type": "http.response.body", "body": pedazo, "more_body": True})
+        empezar()
+        pedido.enviar({"type": "http.response.body", "body": b"", "more_body": False})
+    except Exception as e:
+        if pedido.cortado.is_set():
+            return  # el cliente ya no está: no hay a quién avisarle
+        if respuesta.get("enviada"):
+            raise
+        print(f"Error atendiendo {pedido.scope['method']} {pedido.scope['path']}: {type(e).__name__}: {e}")
+        _error_interno(pedido)
+    finally:
+        # close() suelta lo que tenga tomado la respuesta (p. ej. el cupo del feed).
+        if hasattr(iterable, "close"):
+            iterable.close()
+
+
+def _error_interno(pedido):
+    cuerpo = json.dumps({"status": "error", "message": "Error interno"}).encode("utf-8")
+    pedido.enviar({"type": "http.response.start", "status": 500, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(cuerpo)).encode())]})
+    pedido.enviar({"type": "http.response.body", "body": cuerpo})
+
+
+async def _ocupado(send, nombre):
+    cuerpo = json.dumps({"status": "error", "message": "Servidor ocupado, reintentá en unos segundos"},
+                        ensure_ascii=False).encode("utf-8")
+    await send({"type": "http.response.start", "status": 503, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(cuerpo)).encode()),
+        (b"retry-after", b"2"), (b"x-carril", nombre.encode())]})
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+async def _lifespan(receive, send):
+    while True:
+        mensaje = await receive()
+        if mensaje["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif mensaje["type"] == "lifespan.shutdown":
+            for c in CARRILES.values():
+                c.pool.shutdown(wait=False, cancel_futures=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        raise RuntimeError(f"Tipo de conexión no soportado: {scope['type']}")
+    nombre = carril(scope["method"], scope["path"])
+    c = CARRILES[nombre]
+    if not c.admitir():
+        return await _ocupado(send, nombre)
+    loop = asyncio.get_running_loop()
+    pedido = _Pedido(scope, receive, send, loop)
+    try:
+        await loop.run_in_executor(c.pool, _atender, pedido)
+    finally:
+        pedido.terminar()
+        c.liberar()
@@ -0,0 +1,191 @@
+"""Archivos de static/ con huella en el nombre, precomprimidos y con caché larga.
+
+Antes el JS y el CSS del dashboard iban inline en index.html (se re-enviaban
+enteros en cada carga) y static/ se servía con un catch-all sin compresión ni
+Cache-Control. Ahora:
+
+- Las plantillas piden `{{ asset('app.js') }}`, que devuelve
+  `/static/app.<huella>.js`: la huella sale del contenido, así que un deploy
+  que cambia el archivo cambia la URL y el navegador puede guardar la anterior
+  para siempre (`Cache-Control: immutable`, un año).
+- Los archivos de texto se comprimen una sola vez por proceso (gzip y, si está
+  instalado el paquete `brotli`, br). Si junto al archivo hay un `.gz` / `.br`
+  más nuevo (los deja `python assets.py` en el build de Docker) se usa ese.
+- Pedidos por su nombre sin huella (`/static/logo.png`) se sirven igual, con
+  `no-cache`: el navegador revalida con el ETag y recibe 304.
+- comprimir_html() (after_request) comprime con gzip las páginas HTML, que se
+  renderizan en cada pedido porque dependen del usuario.
+
+Con `debug` (app.run local) se vuelve a escanear static/ si cambió algún archivo.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import sys
+import threading
+
+from flask import Response, abort, current_app, request
+
+try:
+    import brotli
+except ImportError:  # opcional: sin el paquete se sirve solo gzip
+    brotli = None
+
+CARPETA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+HTML_MIN_BYTES = int(os.environ.get("HTML_GZIP_MIN_BYTES", 1024))
+HTML_NIVEL = int(os.environ.get("HTML_GZIP_NIVEL", 6))
+
+INMUTABLE = "public, max-age=31536000, immutable"
+_COMPRIMIBLES = {".js", ".css", ".svg", ".json", ".txt", ".html", ".map"}
+_PRECOMPRIMIDOS = (".gz", ".br")
+
+
+class _Archivo:
+    __slots__ = ("huella", "tipo", "cuerpo", "gz", "br", "firma")
+
+    def __init__(self, ruta, firma):
+        with open(ruta, "rb") as f:
+            self.cuerpo = f.read()
+        self.firma = firma
+        self.huella = hashlib.blake2b(self.cuerpo, digest_size=5).hexdigest()
+        self.tipo = mimetypes.guess_type(ruta)[0] or "application/octet-stream"
+        self.gz = self.br = None
+        if os.path.splitext(ruta)[1].lower() in _COMPRIMIBLES:
+            self.gz = _menor(self.cuerpo, _precomprimido(ruta, ".gz", firma) or _gzip(self.cuerpo))
+            if brotli is not None:
+                self.br = _menor(self.cuerpo, _precomprimido(ruta, ".br", firma) or _brotli(self.cuerpo))
+
+
+def _gzip(cuerpo):
+    return gzip.compress(cuerpo, 9, mtime=0)
+
+
+def _brotli(cuerpo):
+    return brotli.compress(cuerpo, quality=11)
+
+
+def _menor(cuerpo, comprimido):
+    return comprimido if comprimido is not None and len(comprimido) < len(cuerpo) else None
+
+
+def _precomprimido(ruta, ext, firma):
+    """El `.gz` / `.br` del build, si es al menos tan nuevo como el original."""
+    try:
+        if os.stat(ruta + ext).st_mtime_ns >= firma[0]:
+            with open(ruta + ext, "rb") as f:
+                return f.read()
+    except OSError:
+        pass
+    return None
+
+
+def con_huella(nombre, huella):
+    base, ext = os.path.splitext(nombre)
+    return f"{base}.{huella}{ext}"
+
+
+class Assets:
+    def __init__(self, carpeta=CARPETA):
+        self.carpeta = carpeta
+        self._lock = threading.Lock()
+        self._archivos = {}    # nombre relativo -> _Archivo
+        self._por_huella = {}  # nombre con huella -> _Archivo
+        self._escaneado = False
+
+    def _escanear(self):
+        archivos = {}
+        for raiz, dirs, nombres in os.walk(self.carpeta):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for n in nombres:
+                if n.startswith(".") or n.endswith(_PRECOMPRIMIDOS):
+                    continue
+                ruta = os.path.join(raiz, n)
+                st = os.stat(ruta)
+                rel = os.path.relpath(ruta, self.carpeta).replace(os.sep, "/")
+                firma = (st.st_mtime_ns, st.st_size)
+                previo = self._archivos.get(rel)
+                archivos[rel] = previo if previo is not None and previo.firma == firma else _Archivo(ruta, firma)
+        self._archivos = archivos
+        self._por_huella = {con_huella(n, a.huella): a for n, a in archivos.items()}
+        self._escaneado = True
+
+    def _vigente(self):
+        if not self._escaneado or current_app.debug:
+            with self._lock:
+                if not self._escaneado or current_app.debug:
+                    self._escanear()
+
+    def url(self, nombre):
+        """URL con huella de `nombre` (relativo a static/), para las plantillas."""
+        self._vigente()
+        a = self._archivos.get(nombre)
+        return f"/static/{con_huella(nombre, a.huella) if a else nombre}"
+
+    def servir(self, ruta):
+        self._vigente()
+        a = self._por_huella.get(ruta)
+        inmutable = a is not None
+        if a is None:
+            a = self._archivos.get(ruta)
+        if a is None:
+            abort(404)
+        cuerpo, codificacion = a.cuerpo, None
+        if a.br is not None and request.accept_encodings["br"]:
+            cuerpo, codificacion = a.br, "br"
+        elif a.gz is not None and request.accept_encodings["gzip"]:
+            cuerpo, codificacion = a.gz, "gzip"
+        # Un ETag fuerte por representación, como en cache_http.
+        headers = {
+            "ETag": f'"{a.huella}{"-" + codificacion if codificacion else ""}"',
+            "Cache-Control": INMUTABLE if inmutable else "public, no-cache",
+        }
+        if a.gz is not None or a.br is not None:
+            headers["Vary"] = "Accept-Encoding"
+        vistos = {t.strip().removeprefix("W/").strip('"').split("-")[0]
+                  for t in request.headers.get("If-None-Match", "").split(",")}
+        if a.huella in vistos:
+            return Response(status=304, headers=headers)
+        if codificacion:
+            headers["Content-Encoding"] = codificacion
+        return Response(cuerpo, mimetype=a.tipo, headers=headers)
+
+
+def comprimir_html(respuesta):
+    """after_request: las páginas HTML no se cachean (llevan el rol) y van con gzip."""
+    if respuesta.mimetype != "text/html" or respuesta.status_code != 200 or respuesta.direct_passthrough:
+        return respuesta
+    respuesta.headers.setdefault("Cache-Control", "private, no-cache")
+    if "Content-Encoding" in respuesta.headers or not request.accept_encodings["gzip"]:
+        return respuesta
+    cuerpo = respuesta.get_data()
+    if len(cuerpo) < HTML_MIN_BYTES:
+        return respuesta
+    respuesta.set_data(gzip.compress(cuerpo, HTML_NIVEL))
+    respuesta.headers["Content-Encoding"] = "gzip"
+    respuesta.vary.add("Accept-Encoding")
+    return respuesta
+
+
+def precomprimir(carpeta=CARPETA):
+    """Deja `.gz` (y `.br` si hay brotli) junto a cada archivo de texto; para el build."""
+    hechos = []
+    for raiz, _, nombres in os.walk(carpeta):
+        for n in nombres:
+            if os.path.splitext(n)[1].lower() not in _COMPRIMIBLES:
+                continue
+            ruta = os.path.join(raiz, n)
+            with open(ruta, "rb") as f:
+                cuerpo = f.read()
+            salidas = [(".gz", _gzip)] + ([(".br", _brotli)] if brotli is not None else [])
+            for ext, fn in salidas:
+                with open(ruta + ext, "wb") as f:
+                    f.write(fn(cuerpo))
+                hechos.append(os.path.relpath(ruta + ext, carpeta))
+    return hechos
+
+
+if __name__ == "__main__":
+    for h in precomprimir(sys.argv[1] if len(sys.argv) > 1 else CARPETA):
+        print(h)
@@ -0,0 +1,282 @@
+"""Registro de auditoría append-only en JSON Lines, con rotación por tamaño/edad.
+
+Cada evento es una línea agregada al segmento activo de `data/audit/`
+(`audit-<creación>.jsonl`): un login ya no lee ni reescribe el log entero, y
+no se descarta historia. Cuando el segmento supera AUDIT_ROTAR_BYTES o
+AUDIT_ROTAR_DIAS se abre uno nuevo; con AUDIT_GZIP=true el anterior se
+comprime (`.jsonl.gz`). Las consultas leen de atrás para adelante desde el
+segmento más nuevo y cortan apenas juntan la página o salen del rango de
+fechas, así que no cargan todo el historial.
+
+El cursor de paginación es `<segmento>:<offset>` (offset de la línea en el
+segmento sin comprimir); como el nombre de un segmento no cambia al rotar ni
+al comprimir, un cursor sigue valiendo aunque entre páginas haya rotación.
+"""
+
+import datetime
+import gzip
+import json
+import os
+import threading
+import time
+
+ROTAR_BYTES = int(os.environ.get("AUDIT_ROTAR_BYTES", 1024 * 1024))
+ROTAR_DIAS = int(os.environ.get("AUDIT_ROTAR_DIAS", 30))
+COMPRIMIR = os.environ.get("AUDIT_GZIP", "false") == "true"
+
+_BLOQUE = 64 * 1024
+_FMT_SEGMENTO = "%Y%m%d%H%M%S"
+
+
+class AuditLog:
+    def __init__(self, carpeta, legado=None):
+        self.carpeta = carpeta
+        self.legado = legado  # audit_log.json viejo (lista, más nuevo primero)
+        self._lock = threading.Lock()
+        self._activo = None
+        self._revisado = 0.0
+        self._conteos = {}  # segmento -> ((ruta, tamaño, mtime), líneas)
+
+    # --- segmentos ---
+    def _segmentos(self):
+        """Nombres base de los segmentos, del más nuevo al más viejo."""
+        try:
+            nombres = os.listdir(self.carpeta)
+        except FileNotFoundError:
+            return []
+        stems = {n.split(".", 1)[0] for n in nombres if n.startswith("audit-") and (n.endswith(".jsonl") or n.endswith(".jsonl.gz"))}
+        return sorted(stems, reverse=True)
+
+    def _ruta(self, stem):
+        plano = os.path.join(self.carpeta, stem + ".jsonl")
+        return plano if os.path.exists(plano) else plano + ".gz"
+
+    def _migrar_legado(self):
+        if not self.legado or not os.path.exists(self.legado) or self._segmentos():
+            return
+        try:
+            with open(self.legado, "r", encoding="utf-8") as f:
+                viejos = json.load(f)
+        except ValueError:
+            return
+        os.makedirs(self.carpeta, exist_ok=True)
+        with open(os.path.join(self.carpeta, "audit-00000000000000.jsonl"), "w", encoding="utf-8") as f:
+            for e in reversed(viejos if isinstance(viejos, list) else []):
+                f.write(json.dumps(e, ensure_ascii=False) + "\n")
+        os.replace(self.legado, self.legado + ".migrado")
+
+    def _segmento_activo(self):
+        ahora = time.time()
+        if self._activo is None or ahora - self._revisado > 5:
+            # Otro worker puede haber rotado: se relista cada tanto, no en cada evento.
+            self._migrar_legado()
+            segs = self._segmentos()
+            self._activo = segs[0] if segs else None
+            self._revisado = ahora
+        if self._activo is not None:
+            ruta = os.path.join(self.carpeta, self._activo + ".jsonl")
+            try:
+                tam = os.path.getsize(ruta)
+            except FileNotFoundError:
+                tam = None  # se comprimió en otro proceso
+            creado = self._creacion(self._activo)
+            viejo = creado is not None and (datetime.datetime.now() - creado).days >= ROTAR_DIAS
+            if tam is not None and tam < ROTAR_BYTES and not viejo:
+                return ruta
+            self._rotar(self._activo)
+        self._activo = "audit-" + datetime.datetime.now().strftime(_FMT_SEGMENTO)
+        return os.path.join(self.carpeta, self._activo + ".jsonl")
+
+    @staticmethod
+    def _creacion(stem):
+        try:
+            return datetime.datetime.strptime(stem[len("audit-"):], _FMT_SEGMENTO)
+        except ValueError:
+            return None  # segmento migrado del log viejo
+
+    def _rotar(self, stem):
+        if not COMPRIMIR:
+            return
+        plano = os.path.join(self.carpeta, stem + ".jsonl")
+        try:
+            with open(plano, "rb") as src, gzip.open(plano + ".gz.tmp", "wb") as dst:
+                while True:
+                    bloque = src.read(_BLOQUE)
+                    if not bloque:
+                        break
+                    dst.write(bloque)
+            os.replace(plano + ".gz.tmp", plano + ".gz")
+            os.unlink(plano)
+        except FileNotFoundError:
+            pass  # ya lo rotó otro worker
+
+    # --- escritura ---
+    def registrar(self, user, action, details=""):
+        entrada = {
+            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "user": user,
+            "action": action,
+            "details": details,
+        }
+        linea = (json.dumps(entrada, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            os.makedirs(self.carpeta, exist_ok=True)
+            ruta = self._segmento_activo()
+            # Una sola write() con O_APPEND: las líneas de distintos workers no se mezclan.
+            fd = os.open(ruta, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, linea)
+            finally:
+                os.close(fd)
+        return entrada
+
+    def importar(self, eventos):
+        """Carga eventos ya existentes (restore/migración) conservando su timestamp.
+
+        Van a un segmento sin fecha de creación, como el del log viejo migrado,
+        para que las consultas por rango no lo salteen. Devuelve cuántos cargó.
+        """
+        n = 0
+        with self._lock:
+            os.makedirs(self.carpeta, exist_ok=True)
+            with open(os.path.join(self.carpeta, "audit-00000000000000.jsonl"), "a", encoding="utf-8") as f:
+                for e in eventos:
+                    f.write(json.dumps(e, ensure_ascii=False) + "\n")
+                    n += 1
+                f.flush()
+                os.fsync(f.fileno())
+            self._activo = None
+        return n
+
+    # --- lectura ---
+    @staticmethod
+    def _hacia_atras(ruta, fin=None):
+        """Genera (offset, línea) del final hacia el principio del segmento."""
+        if ruta.endswith(".gz"):
+            with gzip.open(ruta, "rb") as f:
+                datos = f.read()
+            if fin is not None:
+                datos = datos[:fin]
+            lineas, pos = [], 0
+            for linea in datos.splitlines(keepends=True):
+                lineas.append((pos, linea))
+                pos += len(linea)
+            yield from reversed(lineas)
+            return
+        with open(ruta, "rb") as f:
+            pos = f.seek(0, os.SEEK_END) if fin is None else fin
+            resto = b""
+            while pos > 0:
+                leer = min(_BLOQUE, pos)
+                pos -= leer
+                f.seek(pos)
+                bloque = f.read(leer) + resto
+                partes = bloque.split(b"\n")
+                resto = partes[0]
+                offset = pos + len(resto) + 1
+                trozos = []
+                for parte in partes[1:]:
+                    trozos.append((offset, parte))
+                    offset += len(parte) + 1
+                yield from reversed(trozos)
+            if resto:
+                yield 0, resto
+
+    def consultar(self, limite=100, cursor=None, usuario=None, accion=None, desde=None, hasta=None):
+        """Devuelve (eventos del más nuevo al más viejo, cursor siguiente o None).
+
+        `desde`/`hasta` son strings comparables con el timestamp
+        ('YYYY-MM-DD' o 'YYYY-MM-DD HH:MM:SS'); `hasta` con solo fecha incluye ese día.
+        """
+        if hasta and len(hasta) == 10:
+            hasta += " 23:59:59"
+        self._migrar_legado()
+        segs = self._segmentos()
+        fin = None
+        if cursor:
+            stem, _, off = cursor.rpartition(":")
+            segs = [s for s in segs if s <= stem]
+            fin = int(off) if off.isdigit() and segs and segs[0] == stem else None
+        items = []
+        for i, stem in enumerate(segs):
+            creado = self._creacion(stem)
+            if hasta and creado and creado.strftime("%Y-%m-%d %H:%M:%S") > hasta:
+                continue  # todo el segmento es posterior al rango
+            try:
+                lineas = self._hacia_atras(self._ruta(stem), fin if i == 0 else None)
+                for offset, linea in lineas:
+                    if not linea.strip():
+                        continue
+                    try:
+                        e = json.loads(linea)
+                    except ValueError:
+                        continue
+                    ts = e.get("timestamp", "")
+                    if desde and ts < desde:
+                        return items, None  # todo lo que sigue es más viejo
+                    if hasta and ts > hasta:
+                        continue
+                    if usuario and e.get("user") != usuario:
+                        continue
+                    if accion and e.get("action") != accion:
+                        continue
+                    items.append(e)
+                    if len(items) >= limite:
+                        return items, f"{stem}:{offset}"
+            except FileNotFoundError:
+                continue
+        return items, None
+
+    def iterar(self, desde=None, hasta=None):
+        """Los eventos del más viejo al más nuevo, leyendo en streaming.
+
+        Con `desde`/`hasta` (como en consultar) se saltean los segmentos que
+        quedan enteros fuera del rango, según la creación del siguiente.
+        """
+        if hasta and len(hasta) == 10:
+            hasta += " 23:59:59"
+        self._migrar_legado()
+        segs = list(reversed(self._segmentos()))
+        for i, stem in enumerate(segs):
+            creado = self._creacion(stem)
+            if hasta and creado and creado.strftime("%Y-%m-%d %H:%M:%S") > hasta:
+                return  # este y los que siguen son posteriores al rango
+            siguiente = self._creacion(segs[i + 1]) if i + 1 < len(segs) else None
+            if desde and creado and siguiente and siguiente.strftime("%Y-%m-%d %H:%M:%S") < desde:
+                continue  # todo el segmento es anterior al rango
+            ruta = self._ruta(stem)
+            opener = gzip.open if ruta.endswith(".gz") else open
+            try:
+                with opener(ruta, "rb") as f:
+                    for linea in f:
+                        try:
+                            e = json.loads(linea)
+                        except ValueError:
+                            continue
+                        ts = e.get("timestamp", "")
+                        if (desde and ts < desde) or (hasta and ts > hasta):
+                            continue
+                        yield e
+            except FileNotFoundError:
+                continue
+
+    def contar(self):
+        """Cantidad de eventos; los segmentos que no cambiaron no se vuelven a leer."""
+        self._migrar_legado()
+        conteos, total = {}, 0
+        for stem in self._segmentos():
+            ruta = self._ruta(stem)
+            try:
+                st = os.stat(ruta)
+                firma = (ruta, st.st_size, st.st_mtime_ns)
+                previo = self._conteos.get(stem)
+                if previo is None or previo[0] != firma:
+                    opener = gzip.open if ruta.endswith(".gz") else open
+                    with opener(ruta, "rb") as f:
+                        previo = (firma, sum(b.count(b"\n") for b in iter(lambda: f.read(_BLOQUE), b"")))
+            except FileNotFoundError:
+                continue  # se comprimió en otro proceso
+            conteos[stem] = previo
+            total += previo[1]
+        self._conteos = conteos
+        return total
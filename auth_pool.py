@@ -0,0 +1,60 @@
+"""Verificación de passwords fuera del hilo del request, con control de admisión.
+
+bcrypt (Supabase) y scrypt/pbkdf2 (users.json) son caros a propósito. En vez de
+correrlos en serie en el hilo del request, se mandan a un pool acotado de
+hilos (ambas librerías sueltan el GIL mientras hashean), así el chequeo remoto
+y el local corren a la vez. Si ya hay LOGIN_MAX_EN_CURSO logins en vuelo, el
+siguiente espera como mucho LOGIN_ESPERA segundos y si no entra se rechaza
+(503): una ráfaga de logins al cambio de turno no congela el dashboard para
+los que ya están adentro.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+HILOS = int(os.environ.get("LOGIN_HASH_WORKERS", 4))
+MAX_EN_CURSO = int(os.environ.get("LOGIN_MAX_EN_CURSO", HILOS * 2))
+ESPERA = float(os.environ.get("LOGIN_ESPERA", 0.5))
+
+_pool = ThreadPoolExecutor(max_workers=HILOS, thread_name_prefix="login-hash")
+_cupos = threading.BoundedSemaphore(MAX_EN_CURSO)
+_lock = threading.Lock()
+_stats = {"aceptados": 0, "rechazados": 0, "en_curso": 0}
+
+
+class Saturado(Exception):
+    """No hay cupo para otro login en este momento."""
+
+
+def verificar(remoto, local):
+    """Corre `remoto()` y `local()` en paralelo; devuelve (resultado, origen) o (None, None).
+
+    Gana el remoto (es el que trae el rol del ecosistema); el local solo se usa
+    si el remoto no validó. Levanta Saturado si no hay cupo.
+    """
+    if not _cupos.acquire(timeout=ESPERA):
+        with _lock:
+            _stats["rechazados"] += 1
+        raise Saturado()
+    with _lock:
+        _stats["aceptados"] += 1
+        _stats["en_curso"] += 1
+    try:
+        f_remoto = _pool.submit(remoto)
+        f_local = _pool.submit(local)
+        r = f_remoto.result()
+        if r:
+            f_local.cancel()
+            return r, "remoto"
+        l = f_local.result()
+        return (l, "local") if l else (None, None)
+    finally:
+        with _lock:
+            _stats["en_curso"] -= 1
+        _cupos.release()
+
+
+def estadisticas():
+    with _lock:
+        return dict(_stats, hilos=HILOS, max_en_curso=MAX_EN_CURSO)
@@ -5,13 +5,32 @@ Supabase configurado, el login valida contra la MISMA tabla `usuarios` (bcrypt,
 gate `puede_flota`). Si NO hay Supabase, cae al store local users.json (modo
 transición / standalone). El rol del gestor se deriva del rol del ecosistema:
 admin/gerente -> 'admin' (edita), resto con puede_flota -> 'lector'.
+
+La consulta a Supabase usa una sesión HTTP persistente (keep-alive, sin
+handshake TLS por login), cachea unos segundos las filas ya vistas (y los
+emails inexistentes) y pasa por un circuit breaker: si Supabase se pone lento
+o empieza a fallar, `validar` devuelve None al instante y el login cae al
+store local en vez de colgar el único worker hasta el timeout. La password se
+verifica siempre contra el hash; la caché solo evita el viaje de red, con la
+contra de que un cambio de clave en Supabase tarda hasta SUPABASE_CACHE_TTL
+segundos en verse.
+
+Con varios tenants (tenants.py) la búsqueda se acota a los tenants a los que
+se puede entrar desde el host (uno o varios): el login entra al tenant de la
+fila que validó, y validar() lo devuelve.
 """
 
 import hashlib
 import os
 import secrets
+import threading
+import time
+from collections import OrderedDict, deque
 
 import requests
+from requests.adapters import HTTPAdapter
+
+import metricas
 
 try:
     import bcrypt
@@ -19,11 +38,150 @@ try:
 except ImportError:  # pragma: no cover
     _HAS_BCRYPT = False
 
-SUPABASE_URL = (os.getenv("SUPABASE_URL") or "").rstrip("/")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY") or ""
 TENANT_ID = os.getenv("TENANT_ID") or "00000000-0000-0000-0000-000000000001"
 
-SUPABASE_ON = bool(SUPABASE_URL and SUPABASE_SERVICE_KEY)
+TIMEOUT = (3, float(os.getenv("SUPABASE_TIMEOUT", "5")))  # (conexión, lectura)
+CACHE_TTL = float(os.getenv("SUPABASE_CACHE_TTL", "60"))
+CACHE_NEGATIVO_TTL = float(os.getenv("SUPABASE_CACHE_NEGATIVO_TTL", "30"))
+CACHE_MAX = 1024
+# Circuit breaker: se abre con >= 50% de fallos en las últimas 20 llamadas
+# (mínimo 5) o con 3 respuestas seguidas más lentas que SUPABASE_LENTO.
+LENTO = float(os.getenv("SUPABASE_LENTO", "2"))
+VENTANA, MIN_LLAMADAS, TASA_FALLOS, LENTAS_SEGUIDAS = 20, 5, 0.5, 3
+ABIERTO_SEGUNDOS = float(os.getenv("SUPABASE_CIRCUITO_ABIERTO", "30"))
+
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=8, max_retries=0))
+_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=8, max_retries=0))
+_session.headers.update({"Accept": "application/json"})
+
+
+def configuracion():
+    """(URL, service key) de Supabase, leídas del entorno al usarse y no al
+    importar: quien importa este módulo antes de cargar el .env o de fijar
+    las variables (p. ej. el benchmark con su Supabase de mentira) igual las ve."""
+    return (os.getenv("SUPABASE_URL") or "").rstrip("/"), os.getenv("SUPABASE_SERVICE_KEY") or ""
+
+
+def habilitado():
+    return all(configuracion())
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # (email, tenant) -> (expira, [filas]); [] = no existe
+_stats = {"cache_hits": 0, "cache_misses": 0, "cache_negativos": 0,
+          "llamadas": 0, "errores": 0, "lentas": 0, "rechazadas_circuito": 0}
+
+
+class _Circuito:
+    """closed -> open (fallos/latencia) -> half_open (1 prueba) -> closed|open."""
+
+    def __init__(self):
+        self.estado = "closed"
+        self.abierto_hasta = 0.0
+        self.resultados = deque(maxlen=VENTANA)  # True = fallo
+        self.lentas = 0
+        self.prueba_en_curso = False
+
+    def permitir(self):
+        if self.estado == "closed":
+            return True
+        if self.estado == "open" and time.monotonic() >= self.abierto_hasta:
+            self.estado = "half_open"
+        if self.estado == "half_open" and not self.prueba_en_curso:
+            self.prueba_en_curso = True
+            return True
+        return False
+
+    def registrar(self, fallo, segundos):
+        self.prueba_en_curso = False
+        lenta = segundos > LENTO
+        self.lentas = self.lentas + 1 if lenta else 0
+        self.resultados.append(fallo)
+        if self.estado == "half_open":
+            self._abrir() if (fallo or lenta) else self._cerrar()
+            return
+        fallos = sum(self.resultados)
+        if (len(self.resultados) >= MIN_LLAMADAS and fallos / len(self.resultados) >= TASA_FALLOS) \
+                or self.lentas >= LENTAS_SEGUIDAS:
+            self._abrir()
+
+    def _abrir(self):
+        self.estado = "open"
+        self.abierto_hasta = time.monotonic() + ABIERTO_SEGUNDOS
+
+    def _cerrar(self):
+        self.estado = "closed"
+        self.resultados.clear()
+        self.lentas = 0
+
+
+_circuito = _Circuito()
+
+
+def estadisticas():
+    """Contadores de caché/llamadas y estado del circuito, para monitoreo."""
+    with _lock:
+        return dict(_stats, circuito=_circuito.estado, cache_entradas=len(_cache), supabase=habilitado())
+
+
+def _cache_get(clave):
+    with _lock:
+        entrada = _cache.get(clave)
+        if entrada and entrada[0] > time.monotonic():
+            _stats["cache_hits" if entrada[1] else "cache_negativos"] += 1
+            return True, entrada[1]
+        _stats["cache_misses"] += 1
+        return False, None
+
+
+def _cache_put(clave, filas):
+    ttl = CACHE_TTL if filas else CACHE_NEGATIVO_TTL
+    with _lock:
+        _cache[clave] = (time.monotonic() + ttl, filas)
+        _cache.move_to_end(clave)
+        while len(_cache) > CACHE_MAX:
+            _cache.popitem(last=False)
+
+
+def _buscar_filas(email, tenant):
+    """Filas de `usuarios` para el email en `tenant` (un id o una tupla de ids);
+    [] si no existe; levanta si Supabase falla."""
+    hit, filas = _cache_get((email, tenant))
+    if hit:
+        return filas
+    with _lock:
+        if not _circuito.permitir():
+            _stats["rechazadas_circuito"] += 1
+            raise requests.ConnectionError("circuito abierto")
+        _stats["llamadas"] += 1
+    inicio = time.monotonic()
+    fallo = True
+    params = {
+        "email": f"ilike.{email}",
+        "activo": "eq.true",
+        "select": "email,rol,password_hash,puede_flota,tenant_id",
+        "order": "tenant_id",
+    }
+    if isinstance(tenant, tuple) and len(tenant) > 1:
+        params["tenant_id"] = f"in.({','.join(tenant)})"
+    else:
+        params["tenant_id"] = f"eq.{tenant[0] if isinstance(tenant, tuple) else tenant}"
+    try:
+        url, clave = configuracion()
+        r = _session.get(f"{url}/rest/v1/usuarios", params=params, timeout=TIMEOUT,
+                         headers={"apikey": clave, "Authorization": f"Bearer {clave}"})
+        if r.status_code != 200:
+            raise requests.HTTPError(f"Supabase respondió {r.status_code}")
+        rows = r.json()
+        fallo = False
+    finally:
+        segundos = time.monotonic() - inicio
+        with _lock:
+            _circuito.registrar(fallo, segundos)
+            _stats["errores"] += fallo
+            _stats["lentas"] += segundos > LENTO
+    _cache_put((email, tenant), rows)
+    return rows
 
 
 def _password_ok(plain, hash_):
@@ -41,43 +199,48 @@ def _password_ok(plain, hash_):
     return secrets.compare_digest(computed, hash_)
 
 
-def validar(email, password):
-    """Devuelve {'username': email, 'role': 'admin'|'lector'} si las credenciales
-    son válidas y el usuario puede entrar a flota; si no, None."""
-    if not SUPABASE_ON or not email or not password:
+def _rol_flota(row):
+    if row.get("rol", "") in ("admin", "gerente"):
+        return "admin"
+    return "lector" if row.get("puede_flota") else None
+
+
+def _tenant_fila(row, tenant):
+    # Una fila sin tenant_id es del tenant buscado (o del principal si se buscó en varios).
+    return row.get("tenant_id") or (tenant if isinstance(tenant, str) else TENANT_ID)
+
+
+def validar(email, password, tenant=TENANT_ID):
+    """Devuelve {'username': email, 'role': 'admin'|'lector', 'tenant': id} si las
+    credenciales son válidas y el usuario puede entrar a flota; si no, None.
+
+    `tenant` puede ser una tupla de ids: busca el email en esos tenants (el
+    primero cuya password coincide, en orden de tenant_id)."""
+    if not habilitado() or not email or not password or not tenant:
         return None
-    email = email.strip().lower()
-    try:
-        r = requests.get(
-            f"{SUPABASE_URL}/rest/v1/usuarios",
-            params={
-                "tenant_id": f"eq.{TENANT_ID}",
-                "email": f"ilike.{email}",
-                "activo": "eq.true",
-                "select": "email,rol,password_hash,puede_flota",
-            },
-            headers={
-                "apikey": SUPABASE_SERVICE_KEY,
-                "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                "Accept": "application/json",
-            },
-            timeout=10,
-        )
-        if r.status_code != 200:
+    with metricas.cronometro("flota_supabase_validar_duration_seconds", resultado="error") as m:
+        email = email.strip().lower()
+        try:
+            rows = _buscar_filas(email, tenant)
+        except (requests.RequestException, ValueError):
             return None
-        rows = r.json()
-    except (requests.RequestException, ValueError):
-        return None
-    if not rows:
-        return None
-    row = rows[0]
-    if not _password_ok(password, row.get("password_hash", "")):
-        return None
-    rol = row.get("rol", "")
-    if rol in ("admin", "gerente"):
-        role = "admin"
-    elif row.get("puede_flota"):
-        role = "lector"
-    else:
-        return None  # no habilitado para flota
-    return {"username": row.get("email", email), "role": role}
+        # No se confía solo en el filtro remoto: una fila de otro tenant no entra.
+        permitidos = (tenant,) if isinstance(tenant, str) else tenant
+        rows = [f for f in rows if _tenant_fila(f, tenant) in permitidos]
+        if not rows:
+            m["resultado"] = "no_existe"
+            return None
+        validas = [f for f in rows if _password_ok(password, f.get("password_hash", ""))]
+        if not validas:
+            m["resultado"] = "invalido"
+            return None
+        for row in validas:
+            role = _rol_flota(row)
+            if role:
+                break
+        else:
+            m["resultado"] = "no_habilitado"
+            return None  # no habilitado para flota
+        m["resultado"] = "valido"
+        m["resultado"] = "valido"
+        return {"username": row.get("email", email), "role": role, "tenant": _tenant_fila(row, tenant)}
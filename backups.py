@@ -0,0 +1,385 @@
+"""Copias de seguridad locales: comprimidas, deduplicadas e incrementales.
+
+Antes el backup era mandar flota_data.json entero por mail (base64, en
+memoria) una vez por semana; usuarios, config y auditoría no se copiaban.
+Ahora respaldar() recorre el almacén activo (JSON o SQLite) y escribe cada
+parte en `data/backups/` en streaming, pasando por gzip:
+
+- flota, config, usuarios e historial: un snapshot consistente de cada
+  documento (se serializa dentro de `leer`, sin copiar el estado).
+- auditoría: un objeto por mes. Los meses cerrados no cambian: si el último
+  manifiesto ya tiene el objeto de un mes que estaba cerrado se reusa su
+  entrada tal cual y el log se lee recién desde el mes siguiente, así que
+  en régimen solo se lee y se escribe el mes en curso.
+
+Cada objeto se guarda por el sha256 de su contenido (`objetos/ab/abcd….gz`):
+si ya existe no se escribe de nuevo. Cada backup deja un manifiesto con todas
+las partes (sirve solo para restaurar) y la lista de las que cambiaron desde
+el último backup completo (el delta). Cada BACKUP_COMPLETO_DIAS se marca un
+completo nuevo; se conservan los últimos BACKUP_RETENER completos con sus
+incrementales y los objetos que ya nadie referencia se borran. Todo eso
+corre bajo un flock en la carpeta de backups (storage.BloqueoArchivo), así que
+dos procesos no se pisan los temporales ni la rotación.
+
+Línea de comandos:
+
+    python backups.py respaldar
+    python backups.py listar
+    python backups.py verificar [manifiesto]
+    python backups.py restaurar [manifiesto] [carpeta_destino]
+
+restaurar verifica todos los hashes antes de escribir nada y arma el almacén
+en una carpeta nueva (por defecto data/restaurado-<fecha>); después se
+reemplaza data/ a mano con el servicio parado.
+"""
+
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import storage
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.environ.get("DATA_DIR") or os.path.join(BASE_DIR, "data")
+CARPETA = os.environ.get("BACKUP_DIR") or os.path.join(DATA_DIR, "backups")
+COMPLETO_DIAS = int(os.environ.get("BACKUP_COMPLETO_DIAS", 7))
+RETENER = int(os.environ.get("BACKUP_RETENER", 4))
+
+_BLOQUE = 64 * 1024
+_DOCUMENTOS = ("flota", "config", "usuarios", "historial")
+_SIN_FECHA = "sin-fecha"
+_lock = threading.Lock()
+_bloqueos = {}  # carpeta -> BloqueoArchivo (uno por carpeta y proceso)
+
+
+class ErrorBackup(Exception):
+    pass
+
+
+class _Objeto:
+    """Archivo de salida que comprime y hashea el contenido sin comprimir a medida que llega."""
+
+    def __init__(self, carpeta):
+        os.makedirs(os.path.join(carpeta, "tmp"), exist_ok=True)
+        self.carpeta = carpeta
+        fd, self.tmp = tempfile.mkstemp(suffix=".gz", dir=os.path.join(carpeta, "tmp"))
+        self._f = os.fdopen(fd, "wb")
+        self._gz = gzip.GzipFile(fileobj=self._f, mode="wb", compresslevel=6, mtime=0)
+        self._sha = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, datos):
+        if isinstance(datos, str):
+            datos = datos.encode("utf-8")
+        self._sha.update(datos)
+        self._gz.write(datos)
+        self.bytes += len(datos)
+
+    def cerrar(self):
+        """Devuelve (hash, nuevo): si el contenido ya estaba guardado se descarta la copia."""
+        self._gz.close()
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        h = self._sha.hexdigest()
+        destino = _ruta_objeto(self.carpeta, h)
+        if os.path.exists(destino):
+            os.unlink(self.tmp)
+            return h, False
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        os.replace(self.tmp, destino)
+        return h, True
+
+    def descartar(self):
+        for cerrar in (self._gz.close, self._f.close):
+            try:
+                cerrar()
+            except (OSError, ValueError):
+                pass
+        try:
+            os.unlink(self.tmp)
+        except FileNotFoundError:
+            pass
+
+
+def _ruta_objeto(carpeta, h):
+    return os.path.join(carpeta, "objetos", h[:2], h + ".gz")
+
+
+def _volcar_json(carpeta, doc):
+    """Serializa el estado actual de `doc` directo al objeto, dentro del snapshot de `leer`."""
+    obj = _Objeto(carpeta)
+    try:
+        def escribir(estado):
+            for trozo in json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).iterencode(estado):
+                obj.write(trozo)
+        doc.leer(escribir)
+    except BaseException:
+        obj.descartar()
+        raise
+    return obj
+
+
+def _meses_cerrados(carpeta, anterior):
+    """Entradas de auditoría del manifiesto `anterior` que se pueden reusar sin leer el log.
+
+    Son las de meses que ya estaban cerrados cuando se hizo ese backup (un mes
+    que estaba en curso pudo sumar eventos después), más la de eventos sin
+    fecha, que ya no se agregan; siempre que el objeto siga en la carpeta."""
+    if anterior is None:
+        return {}
+    mes_actual = anterior["fecha"][:7]
+    reusables = {}
+    for nombre, entrada in anterior["entradas"].items():
+        mes = nombre.partition("auditoria/")[2]
+        if mes and (mes < mes_actual or mes == _SIN_FECHA) and os.path.exists(_ruta_objeto(carpeta, entrada["sha256"])):
+            reusables[nombre] = entrada
+    return reusables
+
+
+def _volcar_auditoria(carpeta, auditoria, cerrados=()):
+    """Un objeto JSON Lines por mes (clave 'auditoria/AAAA-MM'), en streaming.
+
+    Los meses de `cerrados` no se escriben; el log se lee desde el mes siguiente al último."""
+    objetos = {}
+    mes, obj = None, None
+    meses = [n.partition("/")[2] for n in cerrados if n != f"auditoria/{_SIN_FECHA}"]
+    desde = _mes_siguiente(max(meses)) if meses else None
+    try:
+        for e in auditoria.iterar(desde=desde):
+            m = str(e.get("timestamp", ""))[:7] or _SIN_FECHA
+            if f"auditoria/{m}" in cerrados:
+                continue
+            if m != mes:
+                if obj is not None:
+                    objetos[f"auditoria/{mes}"] = obj
+                mes, obj = m, objetos.pop(f"auditoria/{m}", None) or _Objeto(carpeta)
+            obj.write(json.dumps(e, ensure_ascii=False) + "\n")
+        if obj is not None:
+            objetos[f"auditoria/{mes}"] = obj
+    except BaseException:
+        for o in list(objetos.values()) + ([obj] if obj is not None else []):
+            o.descartar()
+        raise
+    return objetos
+
+
+def _mes_siguiente(mes):
+    """'2026-12' -> '2027-01' (sirve de `desde` para iterar: '2027-01-05 …' >= '2027-01')."""
+    anio, m = int(mes[:4]), int(mes[5:7])
+    return f"{anio + m // 12:04d}-{m % 12 + 1:02d}"
+
+
+def _bloqueo(carpeta):
+    with _lock:
+        b = _bloqueos.get(carpeta)
+        if b is None:
+            b = _bloqueos[carpeta] = storage.BloqueoArchivo(os.path.join(carpeta, ".lock"))
+        return b
+
+
+# --- manifiestos ---
+def _manifiestos(carpeta=CARPETA):
+    """Ids de los manifiestos, del más viejo al más nuevo."""
+    try:
+        return sorted(n[:-5] for n in os.listdir(os.path.join(carpeta, "manifiestos")) if n.endswith(".json"))
+    except FileNotFoundError:
+        return []
+
+
+def leer_manifiesto(id_=None, carpeta=CARPETA):
+    ids = _manifiestos(carpeta)
+    if not ids:
+        raise ErrorBackup(f"No hay backups en {carpeta}")
+    id_ = id_ or ids[-1]
+    try:
+        with open(os.path.join(carpeta, "manifiestos", id_ + ".json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise ErrorBackup(f"No existe el backup {id_}")
+
+
+def respaldar(almacen=None, carpeta=CARPETA, ahora=None):
+    """Hace un backup del almacén y devuelve su manifiesto."""
+    almacen = almacen or storage.obtener_almacen(DATA_DIR)
+    ahora = ahora or datetime.datetime.now()
+    # Entre procesos (el job de un worker y la línea de comandos, por ejemplo): los temporales,
+    # el manifiesto y la rotación son de toda la carpeta.
+    with _bloqueo(carpeta):
+        # Temporales de un backup que se cortó a mitad.
+        shutil.rmtree(os.path.join(carpeta, "tmp"), ignore_errors=True)
+        anteriores = [leer_manifiesto(i, carpeta) for i in _manifiestos(carpeta)]
+        cerrados = _meses_cerrados(carpeta, anteriores[-1] if anteriores else None)
+        objetos = {}
+        try:
+            for nombre in _DOCUMENTOS:
+                objetos[nombre] = _volcar_json(carpeta, getattr(almacen, nombre))
+            objetos.update(_volcar_auditoria(carpeta, almacen.auditoria, cerrados))
+        except BaseException:
+            for o in objetos.values():
+                o.descartar()
+            raise
+        entradas, escritos = dict(cerrados), 0
+        for nombre, obj in objetos.items():
+            h, nuevo = obj.cerrar()
+            escritos += nuevo
+            entradas[nombre] = {"sha256": h, "bytes": obj.bytes,
+                                "gz_bytes": os.path.getsize(_ruta_objeto(carpeta, h))}
+
+        base = next((m for m in reversed(anteriores) if m["tipo"] == "completo"), None)
+        completo = base is None or ahora - datetime.datetime.fromisoformat(base["fecha"]) >= datetime.timedelta(days=COMPLETO_DIAS)
+        manifiesto = {
+            "id": ahora.strftime("%Y%m%d-%H%M%S") + ("-completo" if completo else "-incremental"),
+            "fecha": ahora.isoformat(timespec="seconds"),
+            "tipo": "completo" if completo else "incremental",
+            "base": None if completo else base["id"],
+            "entradas": entradas,
+            # Delta: lo que cambió desde el último completo (en un completo, todo).
+            "delta": sorted(entradas) if completo else sorted(
+                n for n, e in entradas.items() if base["entradas"].get(n, {}).get("sha256") != e["sha256"]),
+            "objetos_nuevos": escritos,
+        }
+        storage.escribir_atomico(os.path.join(carpeta, "manifiestos", manifiesto["id"] + ".json"), manifiesto, indent=1)
+        _rotar(carpeta, anteriores + [manifiesto])
+        return manifiesto
+
+
+def _rotar(carpeta, manifiestos):
+    """Conserva los últimos RETENER completos (con sus incrementales) y borra objetos huérfanos."""
+    completos = [m["id"] for m in manifiestos if m["tipo"] == "completo"]
+    if len(completos) <= RETENER:
+        return
+    corte = completos[-RETENER]
+    for m in manifiestos:
+        if m["id"] < corte:
+            os.unlink(os.path.join(carpeta, "manifiestos", m["id"] + ".json"))
+    vivos = {e["sha256"] for m in manifiestos if m["id"] >= corte for e in m["entradas"].values()}
+    raiz = os.path.join(carpeta, "objetos")
+    for sub in os.listdir(raiz):
+        for n in os.listdir(os.path.join(raiz, sub)):
+            if n[:-3] not in vivos:
+                os.unlink(os.path.join(raiz, sub, n))
+
+
+# --- verificación y restore ---
+def _leer_objeto(carpeta, entrada):
+    """Generador de bloques descomprimidos; al terminar controla tamaño y sha256."""
+    sha, total = hashlib.sha256(), 0
+    try:
+        with gzip.open(_ruta_objeto(carpeta, entrada["sha256"]), "rb") as f:
+            while True:
+                bloque = f.read(_BLOQUE)
+                if not bloque:
+                    break
+                sha.update(bloque)
+                total += len(bloque)
+                yield bloque
+    except (OSError, EOFError) as e:
+        raise ErrorBackup(f"Objeto {entrada['sha256'][:12]} ilegible: {e}")
+    if sha.hexdigest() != entrada["sha256"] or total != entrada["bytes"]:
+        raise ErrorBackup(f"Objeto {entrada['sha256'][:12]} corrupto")
+
+
+def verificar(id_=None, carpeta=CARPETA):
+    """Descomprime y controla el hash de cada parte (en paralelo). Devuelve el manifiesto."""
+    manifiesto = leer_manifiesto(id_, carpeta)
+
+    def controlar(entrada):
+        for _ in _leer_objeto(carpeta, entrada):
+            pass
+
+    with ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1)) as pool:
+        list(pool.map(controlar, manifiesto["entradas"].values()))
+    return manifiesto
+
+
+def _cargar_json(carpeta, entrada):
+    return json.loads(b"".join(_leer_objeto(carpeta, entrada)).decode("utf-8"))
+
+
+def _eventos(carpeta, entradas):
+    resto = b""
+    for e in entradas:
+        for bloque in _leer_objeto(carpeta, e):
+            *lineas, resto = (resto + bloque).split(b"\n")
+            for linea in lineas:
+                if linea.strip():
+                    yield json.loads(linea)
+
+
+def restaurar(id_=None, destino=None, carpeta=CARPETA, backend=None):
+    """Verifica el backup y lo vuelca en un almacén nuevo en `destino`. Devuelve un resumen."""
+    manifiesto = verificar(id_, carpeta)
+    destino = destino or os.path.join(DATA_DIR, "restaurado-" + datetime.datetime.now().strftime("%Y%m%d-%H%M%S"))
+    if os.path.isdir(destino) and os.listdir(destino):
+        raise ErrorBackup(f"{destino} no está vacía; se restaura siempre en una carpeta nueva")
+    entradas = manifiesto["entradas"]
+    almacen = storage.obtener_almacen(destino, backend)
+    resumen = {"backup": manifiesto["id"], "destino": destino}
+    for nombre in _DOCUMENTOS:
+        if nombre in entradas:
+            datos = _cargar_json(carpeta, entradas[nombre])
+            if datos or nombre == "flota":
+                try:
+                    getattr(almacen, nombre).guardar(datos)
+                except storage.DatosInvalidos as e:
+                    raise ErrorBackup(f"{nombre} del backup inválido: {e}") from e
+            resumen[nombre] = len(datos) if isinstance(datos, list) else bool(datos)
+    meses = sorted(n for n in entradas if n.startswith("auditoria/"))
+    resumen["auditoria"] = almacen.auditoria.importar(_eventos(carpeta, [entradas[m] for m in meses]))
+    return resumen
+
+
+# --- sinks ---
+def paquete_delta(manifiesto, carpeta=CARPETA):
+    """tar (sin recomprimir) con el manifiesto y los objetos del delta, como bytes."""
+    buf = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        datos = json.dumps(manifiesto, ensure_ascii=False, indent=1).encode("utf-8")
+        info = tarfile.TarInfo(f"{manifiesto['id']}/manifiesto.json")
+        info.size = len(datos)
+        tar.addfile(info, fileobj=io.BytesIO(datos))
+        for nombre in manifiesto["delta"]:
+            h = manifiesto["entradas"][nombre]["sha256"]
+            tar.add(_ruta_objeto(carpeta, h), arcname=f"{manifiesto['id']}/objetos/{h[:2]}/{h}.gz")
+    buf.seek(0)
+    return buf.read()
+
+
+def resumen_texto(manifiesto):
+    total = sum(e["bytes"] for e in manifiesto["entradas"].values())
+    gz = sum(e["gz_bytes"] for e in manifiesto["entradas"].values())
+    lineas = [f"Backup {manifiesto['id']} ({manifiesto['tipo']})",
+              f"Partes: {len(manifiesto['entradas'])} · {total // 1024} KB sin comprimir · {gz // 1024} KB gzip",
+              f"Cambiaron desde el último completo: {', '.join(manifiesto['delta']) or 'nada'}"]
+    return "\n".join(lineas)
+
+
+if __name__ == "__main__":
+    comando = sys.argv[1] if len(sys.argv) > 1 else ""
+    args = sys.argv[2:]
+    try:
+        if comando == "respaldar":
+            print(resumen_texto(respaldar()))
+        elif comando == "listar":
+            for i in _manifiestos():
+                print(i)
+        elif comando == "verificar":
+            print(f"OK {verificar(args[0] if args else None)['id']}")
+        elif comando == "restaurar":
+            print(restaurar(args[0] if args else None, args[1] if len(args) > 1 else None))
+        else:
+            print(__doc__)
+            sys.exit(1)
+    except (ErrorBackup, storage.ErrorAlmacenamiento) as e:
+        print(f"Error: {e}")
+        sys.exit(2)
@@ -0,0 +1 @@
+"""Benchmarks de carga (ver __main__.py): python -m bench."""
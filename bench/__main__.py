@@ -0,0 +1,344 @@
+"""Benchmarks de carga con flotas sintéticas; resultados en JSON para comparar versiones.
+
+    python -m bench                                  # 1.000 y 10.000 unidades, test client y gunicorn
+    python -m bench --unidades 1000,10000,100000 --historial 200 --backend sqlite
+    python -m bench --modos gunicorn --workers 3 --hilos 8 --escenarios get_flota,login_local
+    python -m bench comparar bench/resultados/A.json bench/resultados/B.json [--umbral 15]
+
+Por cada tamaño se genera un juego de datos (bench/sinteticos.py) y, por cada
+modo, una copia aparte: los escenarios que escriben no contaminan al otro.
+Cada corrida va en un proceso nuevo con DATA_DIR apuntando a la copia:
+
+- test_client: la app en proceso con el test client de Flask (sin red).
+- gunicorn: `gunicorn app:app` en 127.0.0.1 con --workers N y H hilos cliente.
+
+El login remoto va contra un Supabase de mentira en localhost (carga.py) con
+hash bcrypt y --supabase-ms de latencia; el local, contra los usuarios
+sintéticos (scrypt de werkzeug). reporte_alertas llama directo a
+enviar_alertas.generar_reporte_alertas en el proceso del benchmark.
+
+`comparar` muestra p50/p99/rps de los escenarios en común y sale con código 1
+si alguno empeoró más que --umbral por ciento (p99 o rps).
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from bench import carga, sinteticos  # noqa: E402
+
+RESULTADOS = os.path.join(RAIZ, "bench", "resultados")
+MODOS = ("test_client", "gunicorn")
+GZ = {"Accept-Encoding": "gzip"}
+
+
+# --- escenarios ---
+# Cada uno recibe `nuevo()` (cliente sin sesión) y los parámetros, y devuelve
+# (fábrica de operaciones, hilos, iteraciones).
+def _sesion(nuevo, usuario="bench0"):
+    c = nuevo()
+    estado, _, _ = c.pedir("POST", "/login", data={"username": usuario, "password": sinteticos.PASSWORD})
+    if estado != 302:
+        raise RuntimeError(f"login de {usuario}: {estado}")
+    return c
+
+
+def esc_get_flota(nuevo, p):
+    def fabrica():
+        c = _sesion(nuevo)
+        return lambda i: c.pedir("GET", "/api/flota", headers=GZ)[0] == 200
+    return fabrica, p["hilos"], p["iteraciones"]
+
+
+def esc_get_flota_304(nuevo, p):
+    def fabrica():
+        c = _sesion(nuevo)
+        etag = c.pedir("GET", "/api/flota", headers=GZ)[1]["ETag"]
+        return lambda i: c.pedir("GET", "/api/flota", headers={**GZ, "If-None-Match": etag})[0] == 304
+    return fabrica, p["hilos"], p["iteraciones"]
+
+
+def esc_login_local(nuevo, p):
+    def fabrica():
+        c = nuevo()
+        return lambda i: c.pedir("POST", "/login", data={"username": f"bench{i % p['usuarios']}",
+                                                         "password": sinteticos.PASSWORD})[0] == 302
+    return fabrica, p["hilos"], min(p["iteraciones"], 100)
+
+
+def esc_login_supabase(nuevo, p):
+    def fabrica():
+        c = nuevo()
+        return lambda i: c.pedir("POST", "/login", data={"username": f"remoto{i % 50}@bench.local",
+                                                         "password": sinteticos.PASSWORD})[0] == 302
+    return fabrica, p["hilos"], min(p["iteraciones"], 100)
+
+
+def esc_reporte_alertas(nuevo, p):
+    import enviar_alertas
+
+    def fabrica():
+        return lambda i: enviar_alertas.generar_reporte_alertas(30) is not None
+    return fabrica, 1, min(p["iteraciones"], 50)
+
+
+def esc_guardar_flota(nuevo, p):
+    """POST de la flota entera con If-Match; alterna dos cuerpos ya serializados
+    (cambia el km de una unidad) para no medir el json.dumps del cliente."""
+    def fabrica():
+        c = _sesion(nuevo)
+        _, cabeceras, cuerpo = c.pedir("GET", "/api/flota")
+        flota = json.loads(cuerpo)
+        estado = {"etag": cabeceras["ETag"].strip('"')}
+        km = flota[0]["km_actual"]
+        cuerpos = []
+        for delta in (1, 2):
+            flota[0]["km_actual"] = km + delta
+            cuerpos.append(json.dumps({"flota": flota}).encode())
+
+        def op(i):
+            st, _, datos = c.pedir("POST", "/api/guardar_flota", data=cuerpos[i % 2],
+                                   headers={"Content-Type": "application/json", "If-Match": f'"{estado["etag"]}"'})
+            if st == 200:
+                estado["etag"] = json.loads(datos)["etag"]
+            return st == 200
+        return op
+    return fabrica, 1, min(p["iteraciones"], 20)
+
+
+def esc_cleanup(nuevo, p):
+    """Cada llamada manda todas las patentes menos una más: elimina una unidad por vez."""
+    def fabrica():
+        c = _sesion(nuevo)
+        flota = json.loads(c.pedir("GET", "/api/flota")[2])
+        patentes = sorted({u["patente"] for u in flota}, key=lambda x: not x.startswith("SN"))
+        estado = {"k": 0}
+
+        def op(i):
+            estado["k"] += 1
+            st, _, datos = c.pedir("POST", "/api/cleanup", json={"patentes": patentes[estado["k"]:]},
+                                   headers={"If-Match": "*"})
+            return st == 200 and json.loads(datos)["eliminados"] == 1
+        return op
+    return fabrica, 1, min(p["iteraciones"], 20)
+
+
+# En este orden: los que escriben al final.
+ESCENARIOS = {
+    "get_flota": esc_get_flota,
+    "get_flota_304": esc_get_flota_304,
+    "login_local": esc_login_local,
+    "login_supabase": esc_login_supabase,
+    "reporte_alertas": esc_reporte_alertas,
+    "guardar_flota": esc_guardar_flota,
+    "cleanup": esc_cleanup,
+}
+
+
+# --- una corrida (proceso hijo) ---
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _gunicorn(workers, log):
+    puerto = _puerto_libre()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--workers", str(workers), "--timeout", "300",
+         "--bind", f"127.0.0.1:{puerto}", "app:app"],
+        cwd=RAIZ, stdout=log, stderr=log)
+    base = f"http://127.0.0.1:{puerto}"
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"gunicorn terminó con código {proceso.returncode}")
+        try:
+            if carga.ClienteHTTP(base).pedir("GET", "/login")[0] == 200:
+                return proceso, base
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proceso.terminate()
+    raise RuntimeError("gunicorn no respondió en 60 s")
+
+
+def corrida(p):
+    """Corre los escenarios contra DATA_DIR (ya en el entorno); devuelve {escenario: métricas}."""
+    stub = carga.StubSupabase(sinteticos.PASSWORD, p["supabase_ms"])
+    os.environ["SUPABASE_URL"] = stub.url
+    os.environ["SUPABASE_SERVICE_KEY"] = "bench"
+    gunicorn = None
+    try:
+        if p["modo"] == "gunicorn":
+            log = open(os.path.join(os.environ["DATA_DIR"], "gunicorn.log"), "ab")
+            gunicorn, base = _gunicorn(p["workers"], log)
+            nuevo = lambda: carga.ClienteHTTP(base)  # noqa: E731
+        else:
+            import app
+            nuevo = lambda: carga.ClienteTest(app.app)  # noqa: E731
+        resultados = {}
+        for nombre in p["escenarios"]:
+            fabrica, hilos, iteraciones = ESCENARIOS[nombre](nuevo, p)
+            print(f"  {p['modo']} {p['unidades']} {nombre}...", file=sys.stderr, flush=True)
+            try:
+                resultados[nombre] = carga.medir(fabrica, iteraciones, hilos)
+            except Exception as e:
+                resultados[nombre] = {"error": f"{type(e).__name__}: {e}"}
+        return resultados
+    finally:
+        if gunicorn is not None:
+            gunicorn.terminate()
+            gunicorn.wait(30)
+        stub.cerrar()
+
+
+# --- orquestación ---
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def correr(args):
+    escenarios = [e.strip() for e in args.escenarios.split(",") if e.strip()]
+    modos = [m.strip() for m in args.modos.split(",") if m.strip()]
+    for nombre in escenarios:
+        if nombre not in ESCENARIOS:
+            sys.exit(f"Escenario desconocido: {nombre} (hay: {', '.join(ESCENARIOS)})")
+    for modo in modos:
+        if modo not in MODOS:
+            sys.exit(f"Modo desconocido: {modo} (hay: {', '.join(MODOS)})")
+    informe = {
+        "fecha": datetime.datetime.now().astimezone().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "corridas": [],
+    }
+    temporal = tempfile.mkdtemp(prefix="bench-")
+    try:
+        for n in [int(x) for x in args.unidades.split(",")]:
+            origen = os.path.join(temporal, f"{n}-datos")
+            t0 = time.perf_counter()
+            dataset = sinteticos.generar(origen, args.backend, n, args.historial, args.vencimientos,
+                                         args.auditoria, args.usuarios)
+            print(f"{n} unidades generadas en {time.perf_counter() - t0:.1f} s", file=sys.stderr, flush=True)
+            for modo in modos:
+                carpeta = os.path.join(temporal, f"{n}-{modo}")
+                shutil.copytree(origen, carpeta)
+                p = {"modo": modo, "unidades": n, "escenarios": escenarios, "hilos": args.hilos,
+                     "iteraciones": args.iteraciones, "usuarios": args.usuarios, "workers": args.workers,
+                     "supabase_ms": args.supabase_ms}
+                entorno = dict(os.environ, DATA_DIR=carpeta, STORAGE_BACKEND=args.backend,
+                               FLASK_SECRET_KEY="bench-" + "x" * 32, SCHEDULER_ENABLED="false")
+                r = subprocess.run([sys.executable, "-m", "bench", "_corrida", json.dumps(p)],
+                                   cwd=RAIZ, env=entorno, stdout=subprocess.PIPE, text=True)
+                if r.returncode != 0:
+                    sys.exit(f"Falló la corrida {modo} con {n} unidades (código {r.returncode})")
+                informe["corridas"].append({
+                    "modo": modo, "dataset": dataset, "hilos": args.hilos,
+                    "workers": args.workers if modo == "gunicorn" else None,
+                    "supabase_ms": args.supabase_ms, "escenarios": json.loads(r.stdout.strip().splitlines()[-1])})
+                shutil.rmtree(carpeta, ignore_errors=True)
+            shutil.rmtree(origen, ignore_errors=True)
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+
+    salida = args.salida or os.path.join(
+        RESULTADOS, f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{informe['commit'] or 'sin-commit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, ensure_ascii=False, indent=2)
+    _tabla(informe)
+    print(f"\nResultados: {salida}")
+
+
+def _filas(informe):
+    for c in informe["corridas"]:
+        for nombre, m in c["escenarios"].items():
+            yield (c["modo"], c["dataset"]["backend"], c["dataset"]["unidades"], nombre), m
+
+
+def _tabla(informe):
+    print(f"\n{'modo':<12} {'backend':<7} {'unidades':>8} {'escenario':<16} {'rps':>9} {'p50 ms':>9} {'p99 ms':>9} {'err':>4}")
+    for (modo, backend, n, nombre), m in _filas(informe):
+        if "error" in m:
+            print(f"{modo:<12} {backend:<7} {n:>8} {nombre:<16} {m['error']}")
+        else:
+            print(f"{modo:<12} {backend:<7} {n:>8} {nombre:<16} {m['rps']:>9} {m['p50_ms']:>9} {m['p99_ms']:>9} {m['errores']:>4}")
+
+
+def _variacion(antes, despues):
+    if not antes or despues is None:
+        return None
+    return (despues - antes) / antes * 100
+
+
+def comparar(args):
+    with open(args.antes, encoding="utf-8") as f:
+        antes = dict(_filas(json.load(f)))
+    with open(args.despues, encoding="utf-8") as f:
+        despues = dict(_filas(json.load(f)))
+    regresiones = 0
+    print(f"{'modo':<12} {'backend':<7} {'unidades':>8} {'escenario':<16} {'p50 ms':>19} {'p99 ms':>19} {'rps':>19}")
+    for clave in [k for k in despues if k in antes]:
+        a, d = antes[clave], despues[clave]
+        if "error" in a or "error" in d:
+            continue
+        p99, rps = _variacion(a["p99_ms"], d["p99_ms"]), _variacion(a["rps"], d["rps"])
+        peor = (p99 is not None and p99 > args.umbral) or (rps is not None and rps < -args.umbral)
+        regresiones += peor
+        celdas = [f"{a[k]}→{d[k]}" for k in ("p50_ms", "p99_ms", "rps")]
+        print(f"{clave[0]:<12} {clave[1]:<7} {clave[2]:>8} {clave[3]:<16} " + " ".join(f"{c:>19}" for c in celdas)
+              + ("  REGRESIÓN" if peor else ""))
+    print(f"\n{regresiones} escenario(s) empeoraron más de {args.umbral:g}%")
+    sys.exit(1 if regresiones else 0)
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "_corrida":
+        print(json.dumps(corrida(json.loads(sys.argv[2]))))
+        return
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmarks de gestor-flota")
+    sub = parser.add_subparsers(dest="comando")
+    c = sub.add_parser("comparar", help="compara dos resultados JSON")
+    c.add_argument("antes")
+    c.add_argument("despues")
+    c.add_argument("--umbral", type=float, default=10.0, help="porcentaje de empeoramiento tolerado")
+    parser.add_argument("--unidades", default="1000,10000", help="tamaños de flota, separados por coma")
+    parser.add_argument("--historial", type=int, default=20, help="eventos de historial por unidad")
+    parser.add_argument("--vencimientos", type=int, default=6, help="vencimientos por unidad")
+    parser.add_argument("--auditoria", type=int, default=100_000, help="entradas de auditoría")
+    parser.add_argument("--usuarios", type=int, default=200, help="usuarios locales")
+    parser.add_argument("--backend", default="json", choices=("json", "sqlite"))
+    parser.add_argument("--modos", default=",".join(MODOS))
+    parser.add_argument("--escenarios", default=",".join(ESCENARIOS))
+    parser.add_argument("--iteraciones", type=int, default=200)
+    parser.add_argument("--hilos", type=int, default=4, help="hilos cliente en los escenarios de lectura y login")
+    parser.add_argument("--workers", type=int, default=3, help="workers de gunicorn")
+    parser.add_argument("--supabase-ms", type=float, default=20, help="latencia simulada de Supabase")
+    parser.add_argument("--salida", help="archivo JSON de resultados (por defecto bench/resultados/)")
+    args = parser.parse_args()
+    if args.comando == "comparar":
+        comparar(args)
+    else:
+        correr(args)
+
+
+if __name__ == "__main__":
+    main()
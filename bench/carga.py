@@ -0,0 +1,163 @@
+"""Medición de latencias y clientes para los escenarios del benchmark.
+
+medir() corre una operación con H hilos hasta completar N iteraciones y
+resume las latencias (p50/p90/p99, máximo y pedidos por segundo). Cada hilo
+arma su propio cliente con `fabrica()`: el test client de Flask (en proceso)
+o una sesión HTTP contra gunicorn, los dos con la misma interfaz `pedir()`.
+
+StubSupabase imita el endpoint REST de la tabla `usuarios` en localhost, para
+medir el login remoto sin depender de la red (con una latencia fija opcional).
+"""
+
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+
+def percentil(ordenadas, p):
+    if not ordenadas:
+        return None
+    return ordenadas[max(math.ceil(p / 100 * len(ordenadas)) - 1, 0)]
+
+
+def medir(fabrica, iteraciones=200, hilos=1, calentamiento=3):
+    """Corre `op(i)` (de `op = fabrica()`, uno por hilo) `iteraciones` veces en total.
+
+    `op` devuelve True si el pedido salió como se esperaba. Las primeras
+    `calentamiento` iteraciones de cada hilo no cuentan; la primera de todas
+    se informa aparte (`primera_ms`: caché fría).
+    """
+    siguiente = iter(range(iteraciones))
+    lock = threading.Lock()
+    latencias, errores, primera, fallas = [], [0], [], []
+    listos = threading.Barrier(hilos + 1)
+
+    def trabajar():
+        try:
+            op = fabrica()
+            for k in range(calentamiento):
+                t0 = time.perf_counter()
+                op(-1 - k)
+                with lock:
+                    if not primera:
+                        primera.append(time.perf_counter() - t0)
+        except Exception as e:
+            fallas.append(e)
+        finally:
+            listos.wait()
+        if fallas:
+            return
+        propias = []
+        while True:
+            with lock:
+                i = next(siguiente, None)
+            if i is None:
+                break
+            t0 = time.perf_counter()
+            try:
+                ok = op(i)
+            except Exception:
+                ok = False
+            propias.append(time.perf_counter() - t0)
+            if not ok:
+                with lock:
+                    errores[0] += 1
+        with lock:
+            latencias.extend(propias)
+
+    trabajadores = [threading.Thread(target=trabajar, daemon=True) for _ in range(hilos)]
+    for t in trabajadores:
+        t.start()
+    listos.wait()
+    inicio = time.perf_counter()
+    for t in trabajadores:
+        t.join()
+    total = time.perf_counter() - inicio
+    if fallas:
+        raise fallas[0]
+    latencias.sort()
+
+    def ms(s):
+        return round(s * 1000, 3) if s is not None else None
+
+    return {
+        "iteraciones": len(latencias),
+        "hilos": hilos,
+        "segundos": round(total, 3),
+        "rps": round(len(latencias) / total, 1) if total else None,
+        "p50_ms": ms(percentil(latencias, 50)),
+        "p90_ms": ms(percentil(latencias, 90)),
+        "p99_ms": ms(percentil(latencias, 99)),
+        "max_ms": ms(latencias[-1] if latencias else None),
+        "primera_ms": ms(primera[0] if primera else None),
+        "errores": errores[0],
+    }
+
+
+# --- clientes ---
+class ClienteTest:
+    """Test client de Flask: mide la app sin red ni servidor."""
+
+    def __init__(self, app):
+        self.c = app.test_client()
+
+    def pedir(self, metodo, ruta, **kw):
+        r = self.c.open(ruta, method=metodo, **kw)
+        return r.status_code, r.headers, r.data
+
+
+class ClienteHTTP:
+    """Sesión HTTP keep-alive (cookies incluidas) contra un servidor real."""
+
+    def __init__(self, base):
+        self.base = base
+        self.s = requests.Session()
+
+    def pedir(self, metodo, ruta, **kw):
+        r = self.s.request(metodo, self.base + ruta, allow_redirects=False, timeout=300, **kw)
+        return r.status_code, r.headers, r.content
+
+
+# --- Supabase de mentira ---
+class StubSupabase:
+    """GET /rest/v1/usuarios?email=ilike.<email>: los emails `remoto*` existen, el resto no."""
+
+    def __init__(self, password, latencia_ms=0, rondas_bcrypt=10):
+        import bcrypt
+        self.hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt(rondas_bcrypt)).decode()
+        self.latencia = latencia_ms / 1000
+        self.pedidos = 0
+        stub = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub.pedidos += 1
+                if stub.latencia:
+                    time.sleep(stub.latencia)
+                email = parse_qs(urlparse(self.path).query).get("email", [""])[0].removeprefix("ilike.")
+                filas = [{"email": email, "rol": "admin", "password_hash": stub.hash, "puede_flota": True}] \
+                    if email.startswith("remoto") else []
+                cuerpo = json.dumps(filas).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+        self.servidor.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.servidor.server_address[1]}"
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def cerrar(self):
+        self.servidor.shutdown()
@@ -0,0 +1,94 @@
+"""Datos sintéticos para los benchmarks: flota, historial, usuarios y auditoría.
+
+generar() llena una carpeta de datos nueva (mismo formato que data/, con el
+backend que se pida) con una flota de `unidades` unidades parecidas a las
+reales: camiones con patente y máquinas por horas, service, vencimientos
+repartidos en los próximos meses (algunos vencidos) e historial largo. La
+semilla es fija: dos corridas con los mismos parámetros generan lo mismo.
+
+Usuarios locales: `bench0`..`benchN` con password PASSWORD (el hash se
+calcula una vez y se reutiliza; verificarlo cuesta lo mismo).
+"""
+
+import datetime
+import os
+import random
+
+from werkzeug.security import generate_password_hash
+
+import enviar_alertas
+import storage
+
+PASSWORD = "bench-password"
+VENCIMIENTOS = ("vtv", "seguro", "ruta", "senasa", "matafuegos", "patente", "filtro_comanry",
+                "habilitacion", "licencia", "tacografo", "extintor", "poliza_carga")
+TIPOS_EVENTO = ("Service", "Reparación", "Documentación", "Neumáticos")
+
+
+def _patente(i):
+    return f"SN{i:06d}"
+
+
+def unidades(n, vencimientos=6, semilla=1):
+    rnd = random.Random(semilla)
+    hoy = datetime.date.today()
+    reales = sorted(enviar_alertas.PATENTES_VALIDAS)
+    for i in range(n):
+        maquina = rnd.random() < 0.3
+        intervalo = 500 if maquina else 10000
+        km = rnd.randint(0, 400_000 if not maquina else 20_000)
+        u = {
+            "id": i + 1,
+            # Algunas patentes de la lista blanca, para que haya camiones alertables.
+            "patente": reales[i % len(reales)] if i < len(reales) * 5 else _patente(i),
+            "descripcion": f"{'Autoelevador' if maquina else 'Camión'} sintético {i + 1}",
+            "tipo_medidor": "horas" if maquina else "km",
+            "km_actual": km,
+            "activo": rnd.random() > 0.05,
+            "service": {"ultimo_fecha": (hoy - datetime.timedelta(days=rnd.randint(0, 365))).isoformat(),
+                        "ultimo_km": max(km - rnd.randint(0, int(intervalo * 1.2)), 0),
+                        "intervalo_km": intervalo},
+            "vencimientos": {},
+        }
+        for tipo in rnd.sample(VENCIMIENTOS, min(vencimientos, len(VENCIMIENTOS))):
+            u["vencimientos"][tipo] = (hoy + datetime.timedelta(days=rnd.randint(-20, 400))).isoformat()
+        yield u
+
+
+def eventos(uid, n, semilla=1):
+    """Historial de una unidad, del más nuevo al más viejo, ya con eid."""
+    rnd = random.Random(semilla * 1_000_003 + uid)
+    hoy = datetime.date.today()
+    return [{"eid": n - k, "fecha": (hoy - datetime.timedelta(days=k * 7)).isoformat(),
+             "tipo": rnd.choice(TIPOS_EVENTO), "detalle": f"Evento sintético {n - k} de la unidad {uid}"}
+            for k in range(n)]
+
+
+def auditoria(n, semilla=1):
+    rnd = random.Random(semilla)
+    inicio = datetime.datetime.now() - datetime.timedelta(days=365)
+    paso = 365 * 86400 / max(n, 1)
+    acciones = ("login", "update_truck", "register_service", "update_history", "logout")
+    for k in range(n):
+        yield {"timestamp": (inicio + datetime.timedelta(seconds=k * paso)).strftime("%Y-%m-%d %H:%M:%S"),
+               "user": f"bench{rnd.randrange(50)}", "action": rnd.choice(acciones),
+               "details": f"Evento de auditoría sintético {k}"}
+
+
+def generar(carpeta, backend="json", unidades_=1000, historial=20, vencimientos=6,
+            auditoria_=100_000, usuarios=200, semilla=1):
+    """Llena `carpeta` (que no debe existir) y devuelve el resumen de lo generado."""
+    os.makedirs(carpeta)
+    almacen = storage.obtener_almacen(carpeta, backend)
+    flota = list(unidades(unidades_, vencimientos, semilla))
+    almacen.flota.guardar(flota)
+    almacen.historial.poner_varios([{"id": u["id"], "seq": historial, "eventos": eventos(u["id"], historial, semilla)}
+                                    for u in flota if historial])
+    almacen.config.guardar({"diasAviso": 30, "emailAlertas": ""})
+    hash_ = generate_password_hash(PASSWORD)
+    almacen.usuarios.guardar([{"username": f"bench{k}", "password_hash": hash_, "role": "admin" if k == 0 else "lector"}
+                              for k in range(usuarios)])
+    almacen.auditoria.importar(list(auditoria(auditoria_, semilla)))
+    return {"backend": backend, "unidades": unidades_, "historial_por_unidad": historial,
+            "vencimientos_por_unidad": vencimientos, "auditoria": auditoria_, "usuarios": usuarios,
+            "semilla": semilla}
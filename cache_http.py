@@ -0,0 +1,94 @@
+"""Respuestas JSON cacheadas por versión del documento, con ETag y gzip.
+
+El dashboard pide /api/flota y /api/config en cada carga. En vez de copiar,
+serializar y comprimir el documento en cada GET, se guarda por proceso el
+cuerpo ya serializado (y su versión gzip) junto con la versión del Documento
+de storage que lo generó. Como toda escritura pasa por storage (y la versión
+incluye identidad del snapshot + posición del journal), cualquier cambio, de
+este proceso o de otro, invalida la entrada sin registrar nada a mano.
+
+La entrada es por (clave, documento): con varios tenants (tenants.py) cada uno
+tiene su 'flota' y su 'config'. olvidar() suelta las de un documento descargado.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+
+from flask import Response, request
+
+_cache = {}  # (clave, id(doc)) -> _Entrada
+_lock = threading.Lock()
+
+
+class _Entrada:
+    __slots__ = ("version", "etag", "cuerpo", "cuerpo_gz")
+
+    def __init__(self, version, cuerpo):
+        self.version = version
+        self.cuerpo = cuerpo
+        self.etag = hashlib.blake2b(cuerpo, digest_size=12).hexdigest()
+        self.cuerpo_gz = gzip.compress(cuerpo, 6) if len(cuerpo) > 1024 else None
+
+
+def _serializar(transformar):
+    def fn(estado):
+        datos = transformar(estado) if transformar else estado
+        return json.dumps(datos, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return fn
+
+
+def _entrada(clave, doc, transformar):
+    clave = (clave, id(doc))
+    version = doc.version()
+    entrada = _cache.get(clave)
+    if entrada is not None and entrada.version == version:
+        return entrada
+    version, cuerpo = doc.leer(_serializar(transformar))
+    entrada = _Entrada(version, cuerpo)
+    with _lock:
+        _cache[clave] = entrada
+    return entrada
+
+
+def olvidar(doc):
+    """Suelta las respuestas cacheadas de `doc` (tenant descargado)."""
+    with _lock:
+        for k in [k for k in _cache if k[1] == id(doc)]:
+            del _cache[k]
+
+
+def etag_actual(clave, doc, transformar=None):
+    """ETag (sin comillas ni sufijo) que un GET de `doc` serviría ahora: la versión
+    del documento entero para If-Match en escrituras que lo reemplazan."""
+    return _entrada(clave, doc, transformar).etag
+
+
+def normalizar_etags(cabecera):
+    """Conjunto de ETags de un If-Match / If-None-Match, sin comillas, W/ ni '-gz'."""
+    return {t.strip().removeprefix("W/").strip('"').removesuffix("-gz") for t in cabecera.split(",") if t.strip()}
+
+
+def respuesta_json(clave, doc, transformar=None):
+    """Respuesta para un GET de `doc`: 304 si el cliente ya tiene esta versión.
+
+    `transformar` recibe el estado interno (no debe mutarlo) y devuelve lo que se
+    serializa; su resultado se cachea bajo `clave` junto con la versión.
+    """
+    entrada = _entrada(clave, doc, transformar)
+    usar_gz = entrada.cuerpo_gz is not None and "gzip" in request.headers.get("Accept-Encoding", "")
+    # Cada representación lleva su propio ETag fuerte (la gzip no es byte a byte igual).
+    etag = entrada.etag + ("-gz" if usar_gz else "")
+    vistos = normalizar_etags(request.headers.get("If-None-Match", ""))
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if entrada.etag in vistos:
+        return Response(status=304, headers=headers)
+    if usar_gz:
+        headers["Content-Encoding"] = "gzip"
+        return Response(entrada.cuerpo_gz, mimetype="application/json", headers=headers)
+    return Response(entrada.cuerpo, mimetype="application/json", headers=headers)
@@ -0,0 +1,269 @@
+"""Calendario precalculado de alertas: qué unidad avisa qué y cuándo.
+
+En vez de recorrer toda la flota cada mañana llamando a strptime y
+es_momento_de_avisar por cada vencimiento, se mantiene un índice ordenado por
+fecha con el *próximo* día en que cada vencimiento (o service) va a disparar
+un aviso: el día de cada hito (diasAviso, 15, 7) y todos los días desde 3
+días antes de vencer. El índice se actualiza solo con las unidades que
+cambian (storage avisa cada put/del, incluidos los que escribió otro
+proceso), así que la tarea diaria solo toma el prefijo que vence hoy y
+"qué alertas hay en los próximos N días" es un corte del índice.
+
+Hasta qué día ya se avisó queda en el documento `estado` del almacén
+(`alertas_avisadas_hasta`), que se escribe al confirmar, después de encolar
+el mail: otro worker, o el mismo proceso después de reiniciar, no vuelve a
+mandar lo de ese día. Sin suscripción a la flota (SQLite) el índice se pone
+al día con el log de cambios de la flota (el de /api/changes), unidad por
+unidad, y solo se reconstruye entero si el log se recortó o cambió de época.
+
+Las reglas son las de enviar_alertas (es_momento_de_avisar, verificar_service,
+es_unidad_alertable): el calendario solo decide a quién evaluar y cuándo. La
+fecha proyectada del service (`service.proyectado`, medidores.py) se agenda
+como un vencimiento más, "service_proyectado", mientras el service no avise
+ya por km.
+"""
+
+import bisect
+import datetime
+import threading
+from collections import deque
+
+import enviar_alertas
+
+SERVICE = "service"
+SERVICE_PROYECTADO = "service_proyectado"
+AVISADO_HASTA = "alertas_avisadas_hasta"  # clave en el documento `estado` del almacén
+
+
+def proximo_aviso(venc, dias_config, desde):
+    """Primer día (ordinal) >= desde en que un vencimiento el día `venc` avisa."""
+    if desde >= venc - 3:
+        return desde  # zona roja o vencido: avisa todos los días
+    hitos = [venc - d for d in (dias_config, 15, 7) if venc - d >= desde]
+    return min(hitos + [venc - 3])
+
+
+def _ordinal(fecha_str):
+    try:
+        return datetime.datetime.strptime(fecha_str, "%Y-%m-%d").date().toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+class Calendario:
+    def __init__(self, flota, estado=None):
+        self.flota = flota
+        self.estado = estado     # documento compartido con AVISADO_HASTA (None: solo en memoria)
+        self._lock = threading.Lock()
+        self._cambios = deque()  # avisos de storage; se aplican al consultar
+        self._reset = True
+        self._indice = []        # ordenado: (día, orden_unidad, unidad_id, tipo)
+        self._proximo = {}       # (unidad_id, tipo) -> día en _indice
+        self._unidades = {}      # unidad_id -> {orden, resumen, vencs, service}
+        self._ordenes = {}       # unidad_id -> posición en la flota (estable aunque deje de alertar)
+        self._orden = 0
+        self._dias = None
+        self._desde = None       # primer día que todavía no se avisó
+        self._cursor = None      # posición en el log de cambios de la flota (sin suscripción)
+        self._incremental = hasattr(flota, "suscribir")
+        if self._incremental:
+            flota.suscribir(self._avisar_cambio)
+
+    def _avisar_cambio(self, evento, clave, item):
+        # Corre con el lock del documento: solo encola (sin tomar self._lock).
+        if evento == "reset":
+            self._reset = True
+        else:
+            self._cambios.append((clave, item))
+
+    # --- índice ---
+    def _sacar(self, k):
+        u = self._unidades.pop(k, None)
+        if not u:
+            return
+        for tipo in list(u["vencs"]) + ([SERVICE] if u["service"] else []):
+            dia = self._proximo.pop((k, tipo), None)
+            if dia is not None:
+                i = bisect.bisect_left(self._indice, (dia, u["orden"], k, tipo))
+                del self._indice[i]
+
+    def _programar(self, k, u, tipo, dia):
+        self._proximo[(k, tipo)] = dia
+        bisect.insort(self._indice, (dia, u["orden"], k, tipo))
+
+    def _indexar(self, k, c):
+        self._sacar(k)
+        if c is None:
+            self._ordenes.pop(k, None)
+            return
+        orden = self._ordenes.get(k)
+        if orden is None:
+            self._orden += 1
+            orden = self._ordenes[k] = self._orden
+        if not enviar_alertas.es_unidad_alertable(c):
+            return
+        avisar, msg = enviar_alertas.verificar_service(c)
+        vencs = {}
+        raw = c.get("vencimientos", {})
+        for tipo, fecha in (raw.items() if isinstance(raw, dict) else []):
+            if not fecha or tipo == "filtro_comanry":
+                continue
+            dia = _ordinal(fecha)
+            if dia is not None:
+                vencs[tipo] = (fecha, dia)
+        service = c.get("service")
+        proyectado = service.get("proyectado") if isinstance(service, dict) and not avisar else None
+        if _ordinal(proyectado) is not None:
+            vencs[SERVICE_PROYECTADO] = (proyectado, _ordinal(proyectado))
+        u = self._unidades[k] = {
+            "orden": orden,
+            "resumen": {"id": k, "patente": c.get("patente", "Unidad"), "descripcion": c.get("descripcion", "")},
+            "vencs": vencs,
+            "service": msg if avisar else None,
+        }
+        if avisar:
+            self._programar(k, u, SERVICE, self._desde)
+        for tipo, (_, dia) in vencs.items():
+            self._programar(k, u, tipo, proximo_aviso(dia, self._dias, self._desde))
+
+    def _reconstruir(self):
+        self._reset = False
+        self._cambios.clear()
+        self._indice, self._proximo, self._unidades, self._ordenes, self._orden = [], {}, {}, {}, 0
+        if not self._incremental:
+            # Antes de leer: lo que se escriba mientras tanto se vuelve a aplicar (es idempotente).
+            self._cursor = self.flota.cursor_cambios()
+
+        def indexar_todo(unidades):
+            for c in unidades:
+                self._indexar(c.get("id"), c)
+        self.flota.leer(indexar_todo)
+
+    def _leer_log(self):
+        """Aplica las unidades que cambiaron según el log de la flota; False si hay que reconstruir."""
+        while True:
+            r = self.flota.cambios_desde(self._cursor)
+            if r.get("reset"):
+                return False
+            for cambio in r["cambios"]:
+                self._indexar(cambio["id"], cambio["unidad"])
+            self._cursor = r["cursor"]
+            if not r["mas"]:
+                return True
+
+    def _avisado_hasta(self):
+        """Último día ya avisado (ordinal), el mismo para todos los procesos; 0 si nunca."""
+        if self.estado is None:
+            return 0
+        return _ordinal(self.estado.datos().get(AVISADO_HASTA)) or 0
+
+    def _reprogramar(self, hasta, desde):
+        """Mueve a `desde` en adelante las entradas programadas hasta el día `hasta`."""
+        i = bisect.bisect_right(self._indice, (hasta, float("inf")))
+        vencidas, self._indice = self._indice[:i], self._indice[i:]
+        for _, _, k, tipo in vencidas:
+            u = self._unidades[k]
+            dia = desde if tipo == SERVICE else proximo_aviso(u["vencs"][tipo][1], self._dias, desde)
+            self._programar(k, u, tipo, dia)
+
+    def _sincronizar(self, dias, hoy):
+        # Lo ya avisado (acá o en otro proceso) no vuelve a salir.
+        desde = max(hoy.toordinal(), self._avisado_hasta() + 1)
+        if self._desde is None or self._desde < desde:
+            if self._desde is not None and not self._reset and dias == self._dias:
+                self._reprogramar(desde - 1, desde)
+            self._desde = desde
+        if self._incremental:
+            self.flota.version()  # en JSON esto reproduce el journal ajeno -> avisos
+        if self._reset or dias != self._dias or (not self._incremental and not self._leer_log()):
+            self._dias = dias
+            self._reconstruir()
+            return
+        while self._cambios:
+            k, c = self._cambios.popleft()
+            self._indexar(k, c)
+
+    def _entrada(self, k, tipo, dia):
+        u = self._unidades[k]
+        if tipo == SERVICE:
+            return u["resumen"], SERVICE, u["service"], True
+        fecha, venc = u["vencs"][tipo]
+        _, msg = enviar_alertas.es_momento_de_avisar(fecha, self._dias, datetime.date.fromordinal(dia))
+        return u["resumen"], tipo, msg, dia >= venc - 3
+
+    # --- API ---
+    def pendientes(self, dias, hoy=None):
+        """Alertas de hoy que todavía no se confirmaron, agrupadas por unidad en orden de flota."""
+        hoy = hoy or datetime.date.today()
+        with self._lock:
+            self._sincronizar(dias, hoy)
+            fin = bisect.bisect_right(self._indice, (hoy.toordinal(), float("inf")))
+            por_unidad = {}
+            for dia, orden, k, tipo in self._indice[:fin]:
+                resumen, tipo, msg, _ = self._entrada(k, tipo, dia)
+                por_unidad.setdefault(orden, (resumen, []))[1].append((tipo, msg))
+            resultado = []
+            for orden in sorted(por_unidad):
+                resumen, items = por_unidad[orden]
+                # Mismo orden que el informe de siempre: primero el service, después los vencimientos.
+                items.sort(key=lambda t: t[0] != SERVICE)
+                resultado.append((resumen, items))
+            return resultado
+
+    def confirmar(self, hoy=None):
+        """Marca como avisado todo lo de hoy y lo reprograma para su próximo día.
+
+        Se llama después de encolar el mail: primero queda guardado en `estado`
+        (para todos los procesos) y después se mueve el índice de este."""
+        hoy = (hoy or datetime.date.today()).toordinal()
+        with self._lock:
+            if self.estado is not None:
+                with self.estado.escritura():
+                    datos = self.estado.datos()
+                    if (_ordinal(datos.get(AVISADO_HASTA)) or 0) < hoy:
+                        datos[AVISADO_HASTA] = datetime.date.fromordinal(hoy).isoformat()
+                        self.estado.guardar(datos)
+            self._reprogramar(hoy, hoy + 1)
+            self._desde = max(self._desde or 0, hoy + 1)
+
+    def proximas(self, dias, n_dias, hoy=None):
+        """Alertas pendientes en los próximos `n_dias` (sin recorrer la flota).
+
+        Un vencimiento aparece en cada hito que cae en el rango; cuando entra en
+        zona roja avisa todos los días, así que se lista una vez con diario=True.
+        """
+        hoy = hoy or datetime.date.today()
+        horizonte = hoy.toordinal() + n_dias
+        with self._lock:
+            self._sincronizar(dias, hoy)
+            fin = bisect.bisect_right(self._indice, (horizonte, float("inf")))
+            salida = []
+            for dia, _, k, tipo in self._indice[:fin]:
+                while dia <= horizonte:
+                    resumen, tipo_, msg, diario = self._entrada(k, tipo, dia)
+                    salida.append({"fecha": datetime.date.fromordinal(dia).isoformat(), "unidad_id": k,
+                                   "patente": resumen["patente"], "tipo": tipo_, "mensaje": msg, "diario": diario})
+                    if diario:
+                        break
+                    dia = proximo_aviso(self._unidades[k]["vencs"][tipo][1], self._dias, dia + 1)
+            salida.sort(key=lambda a: a["fecha"])
+            return salida
+
+
+_calendarios = {}
+_calendarios_lock = threading.Lock()
+
+
+def obtener(almacen):
+    """El calendario de la flota de `almacen` (uno por proceso)."""
+    with _calendarios_lock:
+        cal = _calendarios.get(id(almacen.flota))
+        if cal is None:
+            cal = _calendarios[id(almacen.flota)] = Calendario(almacen.flota, almacen.estado)
+        return cal
+
+
+def olvidar(almacen):
+    """Suelta el calendario de `almacen` (tenant descargado, ver tenants.py)."""
+    with _calendarios_lock:
+        _calendarios.pop(id(almacen.flota), None)
@@ -0,0 +1,192 @@
+"""Feed de cambios de la flota para dashboards abiertos (GET /api/changes).
+
+Un dashboard abierto no se enteraba de lo que cambiaba otro admin hasta
+recargar /api/flota entera, y mientras tanto editaba sobre una copia vieja.
+Ahora storage numera cada unidad escrita (RegistroCambios en JSON, tabla
+`cambios` en SQLite) y el cliente pide solo lo posterior a su cursor:
+
+- GET /api/flota devuelve el cursor en `X-Cambios-Cursor` (tomado antes de
+  leer la flota: lo que se repita después es idempotente).
+- GET /api/changes?since=<cursor> responde como long-poll (JSON, espera hasta
+  CAMBIOS_ESPERA segundos a que haya algo) o, con `Accept: text/event-stream`,
+  como Server-Sent Events durante CAMBIOS_SSE_SEGUNDOS; EventSource reconecta
+  solo y manda el último cursor en Last-Event-ID.
+- Si el cursor ya no sirve (otra época del log, o cambios recortados) la
+  respuesta es `reset` y el cliente recarga la flota entera.
+
+Conexiones baratas: los que esperan no consultan el almacén cada uno. Un solo
+hilo por proceso (el vigía) mira el cursor de cada flota con clientes cada
+CAMBIOS_SONDEO segundos (un stat en JSON, un SELECT en SQLite) y los despierta
+cuando cambia. Cada conexión abierta ocupa un hilo dormido del worker
+(gunicorn con --threads, ver Dockerfile); más de CAMBIOS_MAX_CONEXIONES por
+proceso reciben 503 con Retry-After, así el feed nunca se queda con todos los
+hilos y los pedidos normales siguen entrando.
+"""
+
+import json
+import os
+import threading
+import time
+
+ESPERA = float(os.environ.get("CAMBIOS_ESPERA", 25))
+SSE_SEGUNDOS = float(os.environ.get("CAMBIOS_SSE_SEGUNDOS", 300))
+SONDEO = float(os.environ.get("CAMBIOS_SONDEO", 0.5))
+LATIDO = 15  # comentario SSE para que proxies y el navegador no corten la conexión
+MAX_CONEXIONES = int(os.environ.get("CAMBIOS_MAX_CONEXIONES", 32))
+
+
+class Ocupado(Exception):
+    """No hay cupo para otra conexión abierta en este proceso."""
+
+
+class _Vigia:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._generacion = 0
+        self._flotas = {}   # id(flota) -> [flota, conexiones, último cursor visto]
+        self._conexiones = 0
+        self._hilo = None
+
+    def entrar(self, flota):
+        with self._cond:
+            if self._conexiones >= MAX_CONEXIONES:
+                raise Ocupado()
+            self._conexiones += 1
+            f = self._flotas.get(id(flota))
+            if f is None:
+                f = self._flotas[id(flota)] = [flota, 0, None]
+            f[1] += 1
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._vigilar, name="vigia-cambios", daemon=True)
+                self._hilo.start()
+
+    def salir(self, flota):
+        with self._cond:
+            self._conexiones -= 1
+            f = self._flotas.get(id(flota))
+            if f is not None:
+                f[1] -= 1
+                if f[1] <= 0:
+                    del self._flotas[id(flota)]
+
+    def generacion(self):
+        with self._cond:
+            return self._generacion
+
+    def esperar(self, generacion, segundos):
+        """Duerme hasta que cambie alguna flota vigilada (o pasen `segundos`)."""
+        fin = time.monotonic() + segundos
+        with self._cond:
+            while self._generacion == generacion:
+                resto = fin - time.monotonic()
+                if resto <= 0:
+                    return
+                self._cond.wait(resto)
+
+    def _vigilar(self):
+        while True:
+            with self._cond:
+                if not self._flotas:
+                    self._hilo = None
+                    return
+                flotas = list(self._flotas.values())
+            cambio = False
+            for f in flotas:
+                try:
+                    cursor = f[0].cursor_cambios()
+                except Exception as e:  # el vigía no se cae por un almacén con problemas
+                    print(f"Error vigilando cambios: {e}")
+                    continue
+                # Una flota recién vigilada también despierta: pudo cambiar
+                # entre que su cliente la consultó y empezó a esperar.
+                if cursor != f[2]:
+                    cambio = True
+                    f[2] = cursor
+            if cambio:
+                with self._cond:
+                    self._generacion += 1
+                    self._cond.notify_all()
+            time.sleep(SONDEO)
+
+    def estadisticas(self):
+        with self._cond:
+            return {"conexiones": self._conexiones, "flotas": len(self._flotas), "max_conexiones": MAX_CONEXIONES}
+
+
+VIGIA = _Vigia()
+
+
+def esperar_cambios(flota, cursor, segundos=ESPERA):
+    """Long-poll: los cambios posteriores a `cursor`, esperando hasta `segundos` si no hay."""
+    VIGIA.entrar(flota)
+    try:
+        fin = time.monotonic() + segundos
+        while True:
+            generacion = VIGIA.generacion()
+            r = flota.cambios_desde(cursor)
+            if r.get("reset") or r["cambios"] or cursor is None:
+                return r
+            resto = fin - time.monotonic()
+            if resto <= 0:
+                return r
+            VIGIA.esperar(generacion, resto)
+    finally:
+        VIGIA.salir(flota)
+
+
+def _evento(nombre, cursor, datos):
+    return f"event: {nombre}\nid: {cursor}\ndata: {json.dumps(datos, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+class _Flujo:
+    """Iterable de la respuesta SSE: libera el cupo en close(), que el servidor
+    llama al terminar o cuando el cliente corta (aunque no se haya empezado)."""
+
+    def __init__(self, flota, generador):
+        self._flota = flota
+        self._generador = generador
+        self._abierto = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._generador)
+
+    def close(self):
+        self._generador.close()
+        if self._abierto:
+            self._abierto = False
+            VIGIA.salir(self._flota)
+
+
+def eventos(flota, cursor, segundos=SSE_SEGUNDOS):
+    """Respuesta SSE. El cupo se toma acá (Ocupado -> 503) y se libera al cerrarla."""
+    VIGIA.entrar(flota)
+
+    def generar(actual):
+        fin = time.monotonic() + segundos
+        # Reintento sugerido a EventSource si el servidor corta (p. ej. un deploy).
+        yield "retry: 3000\n\n"
+        enviado = time.monotonic()
+        while True:
+            generacion = VIGIA.generacion()
+            r = flota.cambios_desde(actual)
+            if r.get("reset"):
+                yield _evento("reset", r["cursor"], {})
+            elif r["cambios"] or actual is None:
+                yield _evento("cambios", r["cursor"], {"cambios": r["cambios"]})
+            else:
+                r = None
+            if r is not None:
+                actual, enviado = r["cursor"], time.monotonic()
+                if r.get("mas"):
+                    continue
+            ahora = time.monotonic()
+            if ahora >= fin:
+                return
+            if ahora - enviado >= LATIDO:
+                yield ": latido\n\n"
+                enviado = ahora
+            VIGIA.esperar(generacion, min(fin - ahora, LATIDO - (ahora - enviado)))
+    return _Flujo(flota, generar(cursor))
@@ -0,0 +1,176 @@
+"""Elección de líder entre workers para los jobs programados.
+
+Cada worker de gunicorn importa app.py; si todos arrancaran su propio
+APScheduler, el aviso diario y el backup del viernes saldrían N veces (por eso
+el Dockerfile estaba fijo en `--workers 1`). Ahora todos arrancan un
+Coordinador, pero solo el que toma el lock exclusivo de
+`data/scheduler/lider.lock` (flock, no bloqueante) corre el scheduler y el
+remitente de emails. Los demás reintentan cada SCHEDULER_REINTENTO segundos:
+si el líder muere, el sistema operativo suelta el lock y otro worker lo toma.
+
+Cada corrida queda en `data/scheduler/corridas.json` (inicio, fin, resultado).
+Al asumir, el líder compara esa marca con el cron de cada job y, si en el
+medio debió dispararse alguna vez (worker caído, deploy, reinicio del
+contenedor), lo corre una vez apenas arranca.
+
+El lock se toma en un hilo después de importar: no usar `gunicorn --preload`
+(el fd heredado del master haría líderes a todos los workers a la vez).
+"""
+
+import datetime
+import json
+import os
+import socket
+import threading
+import time
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+import metricas
+import storage
+
+try:
+    import fcntl
+except ImportError:  # Windows (desarrollo local): un solo proceso, siempre líder
+    fcntl = None
+
+REINTENTO = float(os.environ.get("SCHEDULER_REINTENTO", 15))
+HISTORIAL = 20
+
+
+def _ahora():
+    return datetime.datetime.now().astimezone()
+
+
+class Coordinador:
+    def __init__(self, carpeta, trabajos, al_asumir=None):
+        """`trabajos`: lista de (id, función, kwargs del cron)."""
+        self.carpeta = carpeta
+        self.trabajos = [(id_, fn, CronTrigger(**cron)) for id_, fn, cron in trabajos]
+        self.al_asumir = al_asumir
+        self._lock = threading.Lock()
+        self._fd = None
+        self._scheduler = None
+        self._hilo = None
+
+    # --- lease ---
+    def _tomar_lock(self):
+        os.makedirs(self.carpeta, exist_ok=True)
+        if fcntl is None:
+            return True
+        fd = os.open(os.path.join(self.carpeta, "lider.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd  # queda abierto mientras viva el proceso: eso es el lease
+        return True
+
+    def es_lider(self):
+        return self._scheduler is not None
+
+    def _bucle(self):
+        while not self.es_lider():
+            try:
+                if self._tomar_lock():
+                    self._asumir()
+                    return
+            except Exception as e:
+                print(f"Error coordinador: {e}")
+            time.sleep(REINTENTO)
+
+    def iniciar(self):
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name="coordinador", daemon=True)
+                self._hilo.start()
+
+    # --- líder ---
+    def _asumir(self):
+        storage.escribir_atomico(os.path.join(self.carpeta, "lider.json"), {
+            "pid": os.getpid(), "host": socket.gethostname(), "desde": _ahora().isoformat(timespec="seconds")})
+        s = BackgroundScheduler()
+        for id_, fn, trigger in self.trabajos:
+            s.add_job(self._envolver(id_, fn), trigger, id=id_, replace_existing=True, coalesce=True)
+        s.start()
+        self._scheduler = s
+        print(f"Scheduler: líder pid {os.getpid()}")
+        if self.al_asumir:
+            self.al_asumir()
+        self._recuperar(s)
+
+    def _recuperar(self, s):
+        """Corre una vez los jobs que debieron dispararse mientras no había líder."""
+        with self._lock:
+            registro = self.registro()
+        ahora = _ahora()
+        cambios = False
+        for id_, fn, trigger in self.trabajos:
+            r = registro.get(id_)
+            if r is None:
+                # Primera vez que se ve este job: la referencia es ahora, no se recupera nada.
+                registro[id_] = {"referencia": ahora.isoformat(timespec="seconds"), "corridas": []}
+                cambios = True
+                continue
+            ultima = r["corridas"][-1]["inicio"] if r["corridas"] else r["referencia"]
+            debido = trigger.get_next_fire_time(None, datetime.datetime.fromisoformat(ultima) + datetime.timedelta(seconds=1))
+            if debido is not None and debido <= ahora:
+                print(f"Scheduler: {id_} no corrió el {debido:%Y-%m-%d %H:%M}, se recupera ahora")
+                s.add_job(self._envolver(id_, fn, recuperado=debido), id=f"{id_}-recuperacion", replace_existing=True)
+        if cambios:
+            with self._lock:
+                actual = self.registro()
+                for id_, r in registro.items():
+                    actual.setdefault(id_, r)
+                self._guardar(actual)
+
+    def _envolver(self, id_, fn, recuperado=None):
+        def correr():
+            inicio = _ahora()
+            corrida = {"inicio": inicio.isoformat(timespec="seconds"), "pid": os.getpid()}
+            if recuperado is not None:
+                corrida["recupera"] = recuperado.isoformat(timespec="seconds")
+            t0 = time.perf_counter()
+            try:
+                fn()
+                corrida["resultado"] = "ok"
+            except Exception as e:
+                corrida["resultado"] = f"error: {e}"
+                print(f"Error job {id_}: {e}")
+                metricas.contar("flota_job_failures_total", job=id_)
+            metricas.observar("flota_job_duration_seconds", time.perf_counter() - t0, job=id_)
+            metricas.volcar()
+            corrida["segundos"] = round((_ahora() - inicio).total_seconds(), 1)
+            with self._lock:
+                registro = self.registro()
+                r = registro.setdefault(id_, {"referencia": corrida["inicio"], "corridas": []})
+                r["corridas"] = (r["corridas"] + [corrida])[-HISTORIAL:]
+                self._guardar(registro)
+        correr.__name__ = id_
+        return correr
+
+    # --- registro ---
+    def registro(self):
+        try:
+            with open(os.path.join(self.carpeta, "corridas.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _guardar(self, registro):
+        storage.escribir_atomico(os.path.join(self.carpeta, "corridas.json"), registro)
+
+    def estado(self):
+        try:
+            with open(os.path.join(self.carpeta, "lider.json"), "r", encoding="utf-8") as f:
+                lider = json.load(f)
+        except (FileNotFoundError, ValueError):
+            lider = None
+        proximos = {}
+        if self._scheduler is not None:
+            for job in self._scheduler.get_jobs():
+                proximos[job.id] = job.next_run_time.isoformat(timespec="seconds") if job.next_run_time else None
+        return {"soy_lider": self.es_lider(), "pid": os.getpid(), "lider": lider,
+                "proximos": proximos, "corridas": self.registro()}
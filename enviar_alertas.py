@@ -3,18 +3,20 @@ import json
 import os
 from dotenv import load_dotenv
 load_dotenv()
-import smtplib
 from email.mime.text import MIMEText 
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 from email.utils import formataddr
 from email.header import Header
+import storage
+import outbox
+import backups
+import tenants
 
 # --- RUTAS ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_FILE = os.path.join(BASE_DIR, "data", "flota_data.json")
-CONFIG_FILE = os.path.join(BASE_DIR, "data", "config.json")
+DATA_DIR = os.environ.get("DATA_DIR") or os.path.join(BASE_DIR, "data")
 
 # --- SMTP ---
 SMTP_CONFIG = {
@@ -24,35 +26,49 @@ SMTP_CONFIG = {
     "PASSWORD": os.environ.get("SMTP_PASSWORD", "")
 }
 
-# --- CARGA ---
-def cargar_datos():
-    if not os.path.exists(DATA_FILE): return []
-    try:
-        with open(DATA_FILE, 'r', encoding='utf-8') as f: return json.load(f)
-    except: return []
+# Los emails no se mandan en línea: se encolan en data/outbox y los despacha
+# el remitente de outbox.py (hilo en el proceso del scheduler, o drenar() al
+# correr este script a mano).
+OUTBOX = outbox.Outbox(os.path.join(DATA_DIR, "outbox"), SMTP_CONFIG)
 
-def cargar_configuracion():
-    config_default = {"diasAviso": 30, "emailAlertas": "datos@semilleroelmanantial.com"}
-    if not os.path.exists(CONFIG_FILE): return config_default
-    try:
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            datos = json.load(f)
-            return datos
-    except: return config_default
-
-def obtener_destinatarios(config):
+# --- CARGA ---
+# Mismo almacén que la app (JSON con journal o SQLite, según STORAGE_BACKEND).
+# Sin `almacen`, el del tenant principal (DATA_DIR); ver tenants.py.
+def cargar_datos(almacen=None):
+    try: return (almacen or storage.obtener_almacen(DATA_DIR)).flota.datos()
+    except storage.ErrorAlmacenamiento as e:
+        print(f"Error leyendo flota: {e}")
+        return []
+
+def cargar_configuracion(almacen=None, email_default="datos@semilleroelmanantial.com"):
+    config_default = {"diasAviso": 30, "emailAlertas": email_default}
+    try: return (almacen or storage.obtener_almacen(DATA_DIR)).config.datos() or config_default
+    except storage.ErrorAlmacenamiento: return config_default
+
+# Los demás tenants no heredan el mail de Semillero: sin emailAlertas no se manda nada.
+def obtener_destinatarios(config, respaldo=("datos@semilleroelmanantial.com",)):
     raw = config.get("emailAlertas", "")
     lista = [e.strip() for e in raw.split(',') if e.strip()]
-    return lista if lista else ["datos@semilleroelmanantial.com"]
+    return lista if lista else list(respaldo)
+
+def _configuracion(tenant):
+    if tenant.id == tenants.PRINCIPAL:
+        config = cargar_configuracion(tenant.almacen)
+        return config, obtener_destinatarios(config)
+    config = cargar_configuracion(tenant.almacen, "")
+    return config, obtener_destinatarios(config, ())
+
+def _etiqueta(tenant):
+    return f" [{tenant.id}]" if tenants.HABILITADO else ""
 
 # --- LÓGICA INTELIGENTE ---
 
-def es_momento_de_avisar(fecha_str, dias_config):
+def es_momento_de_avisar(fecha_str, dias_config, hoy=None):
     """Retorna True solo si es un día clave para molestar al usuario"""
     if not fecha_str: return False, ""
     try:
         venc = datetime.datetime.strptime(fecha_str, "%Y-%m-%d").date()
-        hoy = datetime.date.today()
+        hoy = hoy or datetime.date.today()
         dias_restantes = (venc - hoy).days
 
         # CASO 1: Ya venció (Avisar SIEMPRE)
@@ -88,96 +104,126 @@ def verificar_service(camion):
         return False, ""
     except: return False, ""
 
-def generar_reporte_alertas(dias_aviso):
-    lista = cargar_datos()
-    if not lista: return None
+# Patentes reales de la flota — ignorar cualquier dato de ejemplo
+PATENTES_VALIDAS = {"KAJ995", "NSQ932", "AE681TR", "AE681RY"}
+
+def es_unidad_alertable(c):
+    # Saltar unidades dadas de baja
+    if not c.get('activo', True): return False
+    # Las maquinas (medidor por horas) no tienen patente: se filtran solo por 'activo'.
+    # Los camiones siguen con la lista blanca para ignorar cualquier camion de ejemplo.
+    es_maquina = c.get('tipo_medidor') == 'horas'
+    return es_maquina or c.get('patente', '').upper() in PATENTES_VALIDAS
+
+def _calendario(almacen=None):
+    # Import diferido: calendario_alertas usa las reglas de este módulo.
+    import calendario_alertas
+    return calendario_alertas.obtener(almacen or storage.obtener_almacen(DATA_DIR))
+
+def generar_reporte_alertas(dias_aviso, hoy=None, almacen=None):
+    """Informe de lo que avisa hoy. Sale del calendario precalculado: solo se
+    evalúan las unidades con algo que vence hoy, no toda la flota."""
+    pendientes = _calendario(almacen).pendientes(dias_aviso, hoy)
     alertas_gral = []
-
-    # Patentes reales de la flota — ignorar cualquier dato de ejemplo
-    PATENTES_VALIDAS = {"KAJ995", "NSQ932", "AE681TR", "AE681RY"}
-
-    for c in lista:
-        # Saltar unidades dadas de baja
-        if not c.get('activo', True):
-            continue
-        # Las maquinas (medidor por horas) no tienen patente: se filtran solo por 'activo'.
-        # Los camiones siguen con la lista blanca para ignorar cualquier camion de ejemplo.
-        es_maquina = c.get('tipo_medidor') == 'horas'
-        if not es_maquina and c.get('patente', '').upper() not in PATENTES_VALIDAS:
-            print(f"  IGNORADO (no es flota real): {c.get('patente', '?')}")
-            continue
-        alertas_c = []
-        patente = c.get('patente', 'Unidad')
-        
-        # Service
-        avisar_srv, msg_srv = verificar_service(c)
-        if avisar_srv: alertas_c.append(f"  - Service: {msg_srv}")
-            
-        # Vencimientos
-        vencs = c.get("vencimientos", {})
-        if isinstance(vencs, dict):
-            for tipo, fecha in vencs.items():
-                if not fecha or tipo == 'filtro_comanry': continue 
-                avisar, msg = es_momento_de_avisar(fecha, dias_aviso)
-                if avisar:
-                    alertas_c.append(f"  - {tipo.replace('_',' ').capitalize()}: {msg}")
-        
-        if alertas_c:
-            alertas_gral.append(f"\nUnidad: {patente} ({c.get('descripcion','')})")
-            alertas_gral.extend(alertas_c)
-            
+    for unidad, items in pendientes:
+        alertas_gral.append(f"\nUnidad: {unidad['patente']} ({unidad['descripcion']})")
+        for tipo, msg in items:
+            nombre = "Service" if tipo == "service" else tipo.replace('_',' ').capitalize()
+            alertas_gral.append(f"  - {nombre}: {msg}")
     if not alertas_gral: return None
     return "Informe de Alertas (Semillero):\n==========================\n" + "\n".join(alertas_gral)
 
 # --- ENVÍO ---
 def enviar_email_simple(asunto, cuerpo, dest):
-    if not dest: return
+    """Encola el mail; True si quedó en la cola del outbox."""
+    if not dest: return False
     try:
         msg = MIMEText(cuerpo, 'plain', 'utf-8')
         msg['Subject'] = Header(asunto, 'utf-8')
         msg['From'] = formataddr((str(Header("Gestor Flota", 'utf-8')), SMTP_CONFIG['EMAIL']))
         msg['To'] = ", ".join(dest)
-        server = smtplib.SMTP(SMTP_CONFIG['SERVER'], SMTP_CONFIG['PORT'])
-        server.starttls()
-        server.login(SMTP_CONFIG['EMAIL'], SMTP_CONFIG['PASSWORD'])
-        server.sendmail(SMTP_CONFIG['EMAIL'], dest, msg.as_string())
-        server.quit()
-        print("Alertas enviadas.")
-    except Exception as e: print(f"Error mail: {e}")
+        OUTBOX.encolar(msg, dest)
+        print("Alertas encoladas.")
+        return True
+    except Exception as e:
+        print(f"Error mail: {e}")
+        return False
+
+# Backup: el archivo local lo arma backups.py (comprimido, deduplicado e
+# incremental); el mail es solo un destino opcional más. BACKUP_EMAIL:
+#   manifiesto (default) -> resumen + manifiesto.json
+#   delta                -> además, las partes que cambiaron desde el último completo (.tar)
+#   no                   -> no se manda nada
+BACKUP_EMAIL = os.environ.get("BACKUP_EMAIL", "manifiesto")
+BACKUP_EMAIL_MAX_BYTES = int(os.environ.get("BACKUP_EMAIL_MAX_BYTES", 10 * 1024 * 1024))
+
+def _adjunto(nombre, datos):
+    part = MIMEBase("application", "octet-stream")
+    part.set_payload(datos)
+    encoders.encode_base64(part)
+    part.add_header("Content-Disposition", f"attachment; filename={nombre}")
+    return part
+
+# Los jobs recorren todos los tenants en una pasada (ver tenants.py); un tenant
+# que falla no frena a los demás.
+def respaldo_diario():
+    for t in tenants.REGISTRO.todos():
+        try: backups.respaldar(t.almacen, t.backups)
+        except Exception as e: print(f"Error backup{_etiqueta(t)}: {e}")
 
 def enviar_copia_seguridad():
-    print("--- Backup ---")
-    config = cargar_configuracion()
-    dest = obtener_destinatarios(config)
+    for t in tenants.REGISTRO.todos():
+        _copia_seguridad(t)
+
+def _copia_seguridad(t):
+    print(f"--- Backup{_etiqueta(t)} ---")
+    try:
+        manifiesto = backups.respaldar(t.almacen, t.backups)
+        print(backups.resumen_texto(manifiesto))
+    except Exception as e:
+        print(f"Error backup: {e}")
+        return
+    if BACKUP_EMAIL == "no": return
+    _, dest = _configuracion(t)
+    if not dest: return
     try:
         msg = MIMEMultipart()
         msg['Subject'] = Header(f"Backup Flota - {datetime.date.today()}", 'utf-8')
         msg['From'] = formataddr((str(Header("Gestor Backup", 'utf-8')), SMTP_CONFIG['EMAIL']))
         msg['To'] = ", ".join(dest)
-        msg.attach(MIMEText("Copia de seguridad adjunta.", 'plain'))
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, "rb") as f:
-                part = MIMEBase("application", "octet-stream")
-                part.set_payload(f.read())
-            encoders.encode_base64(part)
-            part.add_header("Content-Disposition", f"attachment; filename=backup_{datetime.date.today()}.json")
-            msg.attach(part)
-            server = smtplib.SMTP(SMTP_CONFIG['SERVER'], SMTP_CONFIG['PORT'])
-            server.starttls()
-            server.login(SMTP_CONFIG['EMAIL'], SMTP_CONFIG['PASSWORD'])
-            server.sendmail(SMTP_CONFIG['EMAIL'], dest, msg.as_string())
-            server.quit()
-            print("Backup enviado.")
+        texto = backups.resumen_texto(manifiesto)
+        adjuntos = [_adjunto(f"{manifiesto['id']}.json", json.dumps(manifiesto, indent=1, ensure_ascii=False).encode('utf-8'))]
+        if BACKUP_EMAIL == "delta":
+            paquete = backups.paquete_delta(manifiesto, t.backups)
+            if len(paquete) <= BACKUP_EMAIL_MAX_BYTES:
+                adjuntos.append(_adjunto(f"{manifiesto['id']}-delta.tar", paquete))
+            else:
+                texto += f"\nEl delta ({len(paquete) // 1024} KB) supera el máximo para mail: queda solo en el servidor."
+        msg.attach(MIMEText(texto, 'plain', 'utf-8'))
+        for a in adjuntos: msg.attach(a)
+        OUTBOX.encolar(msg, dest)
+        print("Backup encolado.")
     except Exception as e: print(f"Error backup: {e}")
 
 def tarea_diaria():
-    print("--- Chequeando Alertas Inteligentes ---")
-    config = cargar_configuracion()
+    for t in tenants.REGISTRO.todos():
+        try: _alertas(t)
+        except Exception as e: print(f"Error alertas{_etiqueta(t)}: {e}")
+
+def _alertas(t):
+    print(f"--- Chequeando Alertas Inteligentes{_etiqueta(t)} ---")
+    config, dest = _configuracion(t)
     dias = int(config.get("diasAviso", 30))
-    dest = obtener_destinatarios(config)
-    reporte = generar_reporte_alertas(dias)
-    if reporte: enviar_email_simple(f"Aviso Flota - {datetime.date.today().strftime('%d/%m')}", reporte, dest)
+    reporte = generar_reporte_alertas(dias, almacen=t.almacen)
+    if reporte:
+        if not enviar_email_simple(f"Aviso Flota - {datetime.date.today().strftime('%d/%m')}", reporte, dest):
+            # Sin encolar no quedó avisado: el calendario no avanza y mañana se repite.
+            print(f"Alertas sin enviar{_etiqueta(t)}: quedan pendientes.")
+            return
     else: print("Hoy no hay alertas importantes.")
+    # Lo de hoy queda avisado: el calendario lo pasa a su próximo hito.
+    _calendario(t.almacen).confirmar()
 
 if __name__ == "__main__":
     tarea_diaria()
+    OUTBOX.drenar()
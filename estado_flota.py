@@ -0,0 +1,237 @@
+"""Estado de cada unidad (OK / WARNING / DANGER) calculado en el server, por lote.
+
+Es la misma lógica que el dashboard tenía en el navegador (checkDate,
+checkService, getWorstState), pero hecha una sola vez para toda la flota y
+cacheada. Se trabaja en dos niveles:
+
+- Columnas: por cada versión de la flota se arma, en una pasada, un arreglo
+  plano con todos los vencimientos (unidad, tipo, fecha como ordinal) y los
+  números del service. Parsear fechas es lo caro y solo se hace cuando cambian
+  los datos.
+- Estados: por cada (versión, día, diasAviso) se restan todos los ordinales
+  contra hoy en un solo recorrido del arreglo, se clasifican y se reduce el
+  peor estado por unidad, junto con los contadores y el histograma a 90 días.
+
+Filtrar y paginar es después un corte sobre listas ya calculadas.
+
+El service pasa además a WARNING si la fecha proyectada por el ritmo de uso
+(`service.proyectado`, ver medidores.py) cae dentro de diasAviso, aunque
+todavía falte más del 10% del intervalo.
+"""
+
+import datetime
+import threading
+from array import array
+
+OK, WARNING, DANGER, ERROR = 0, 1, 2, -1
+NOMBRES = {OK: "OK", WARNING: "WARNING", DANGER: "DANGER", ERROR: "ERROR"}
+HORIZONTE = 90
+_SIN_FECHA = 0  # ordinal imposible: fecha vacía o inválida
+
+_lock = threading.Lock()
+_columnas = {}  # id(flota) -> _Columnas de la última versión vista
+_estados = {}   # id(flota) -> _Estados del último (versión, día, diasAviso)
+
+
+def _num(v):
+    try:
+        n = float(v)
+    except (TypeError, ValueError):
+        return 0
+    return int(n) if n.is_integer() else n
+
+
+def _ordinal(fecha):
+    try:
+        return datetime.date.fromisoformat(fecha).toordinal()
+    except (TypeError, ValueError):
+        return _SIN_FECHA
+
+
+class _Columnas:
+    """Datos de la flota en forma columnar, independientes del día."""
+
+    def __init__(self, unidades):
+        self.unidades = []
+        self.tipo_medidor = []
+        self.activo = []
+        self.proximo_service = array("d")
+        self.umbral_service = array("d")
+        self.km = array("d")
+        self.s_proy = array("l")  # fecha proyectada del próximo service (ordinal)
+        # Un elemento por vencimiento cargado, en orden de flota.
+        self.v_unidad = array("l")
+        self.v_ord = array("l")
+        self.v_tipo = []
+        self.v_fecha = []
+        for i, c in enumerate(unidades):
+            service = c.get("service") or {}
+            intervalo = _num(service.get("intervalo_km", 10000 if not service else 0))
+            self.unidades.append({"id": c.get("id"), "patente": c.get("patente", ""),
+                                  "descripcion": c.get("descripcion", ""), "km_actual": _num(c.get("km_actual", 0))})
+            self.tipo_medidor.append(c.get("tipo_medidor") or "km")
+            self.activo.append(c.get("activo") is not False)
+            self.proximo_service.append(_num(service.get("ultimo_km", 0)) + intervalo)
+            # Mismo redondeo que Math.round en el navegador (no el de banquero de Python).
+            self.umbral_service.append(max(int(intervalo * 0.1 + 0.5), 1))
+            self.km.append(self.unidades[-1]["km_actual"])
+            self.s_proy.append(_ordinal(service.get("proyectado")))
+            vencs = c.get("vencimientos") or {}
+            for tipo, fecha in (vencs.items() if isinstance(vencs, dict) else []):
+                if not fecha:
+                    continue
+                self.v_unidad.append(i)
+                self.v_ord.append(_ordinal(fecha))
+                self.v_tipo.append(tipo)
+                self.v_fecha.append(fecha)
+
+
+class _Estados:
+    """Estados de un día: por vencimiento, por service y el peor por unidad."""
+
+    def __init__(self, col, hoy, dias_aviso):
+        self.columnas = col
+        self.hoy = hoy
+        self.dias_aviso = dias_aviso
+        n = len(col.unidades)
+        hoy_ord = hoy.toordinal()
+
+        # Vencimientos: una resta y una clasificación por elemento, sin objetos intermedios.
+        self.v_dias = [o - hoy_ord for o in col.v_ord]
+        self.v_estado = [ERROR if o == _SIN_FECHA else DANGER if d < 0 else WARNING if d <= dias_aviso else OK
+                         for o, d in zip(col.v_ord, self.v_dias)]
+        # Service: lo que falta hasta el próximo, contra el 10% del intervalo.
+        self.s_falta = [p - k for p, k in zip(col.proximo_service, col.km)]
+        self.s_estado = [DANGER if f < 0 else WARNING if f <= u else OK
+                         for f, u in zip(self.s_falta, col.umbral_service)]
+        # Por ritmo de uso: solo puede subir un OK a WARNING.
+        self.s_proyectado = [e == OK and p != _SIN_FECHA and p - hoy_ord <= dias_aviso
+                             for e, p in zip(self.s_estado, col.s_proy)]
+        self.s_estado = [WARNING if p else e for e, p in zip(self.s_estado, self.s_proyectado)]
+
+        peor = list(self.s_estado)
+        alertas = sum(1 for e, a in zip(self.s_estado, col.activo) if a and e == DANGER)
+        for u, e in zip(col.v_unidad, self.v_estado):
+            if e > peor[u]:
+                peor[u] = e
+            if e == DANGER and col.activo[u]:
+                alertas += 1
+        self.peor = peor
+        self.alertas = alertas
+
+        self.contadores = {}
+        for tipo, est, act in zip(col.tipo_medidor, peor, col.activo):
+            cont = self.contadores.setdefault(tipo, {"total": 0, "danger": 0, "warning": 0, "ok": 0, "inactivas": 0})
+            cont["total"] += 1
+            cont[NOMBRES[est].lower()] += 1
+            if not act:
+                cont["inactivas"] += 1
+
+        self._items = [None] * n
+        self._por_vencer = {}
+
+    def _msg_venc(self, j):
+        e, d = self.v_estado[j], self.v_dias[j]
+        if e == ERROR:
+            return "S/D"
+        if e == DANGER:
+            return f"VENCIDO ({abs(d)} d)"
+        if e == WARNING:
+            return f"Vence en {d} d"
+        return "OK"
+
+    def _msg_service(self, i):
+        e, f = self.s_estado[i], _num(self.s_falta[i])
+        u = "hs" if self.columnas.tipo_medidor[i] == "horas" else "km"
+        if e == DANGER:
+            return f"VENCIDO ({abs(f)} {u})"
+        if self.s_proyectado[i]:
+            return f"Proyectado {datetime.date.fromordinal(self.columnas.s_proy[i]):%d/%m}"
+        if e == WARNING:
+            return f"Falta {f} {u}"
+        return "OK"
+
+    def _armar_items(self):
+        col = self.columnas
+        for i, base in enumerate(col.unidades):
+            self._items[i] = dict(base, tipo_medidor=col.tipo_medidor[i], activo=col.activo[i],
+                                  estado=NOMBRES[self.peor[i]], vencimientos={},
+                                  service={"estado": NOMBRES[self.s_estado[i]], "mensaje": self._msg_service(i)})
+        for j, u in enumerate(col.v_unidad):
+            self._items[u]["vencimientos"][col.v_tipo[j]] = {
+                "fecha": col.v_fecha[j], "dias": self.v_dias[j] if self.v_estado[j] != ERROR else None,
+                "estado": NOMBRES[self.v_estado[j]], "mensaje": self._msg_venc(j)}
+
+    def indices(self, estados=None, tipo_medidor=None, q=None, ids=None):
+        """Posiciones (en orden de flota) de las unidades que pasan los filtros."""
+        col = self.columnas
+        q = (q or "").lower()
+        return [i for i in range(len(col.unidades))
+                if (ids is None or col.unidades[i]["id"] in ids)
+                and (not estados or self.peor[i] in estados)
+                and (not tipo_medidor or col.tipo_medidor[i] == tipo_medidor)
+                and (not q or q in str(col.unidades[i]["patente"]).lower() or q in str(col.unidades[i]["descripcion"]).lower())]
+
+    def items(self, indices):
+        if indices and self._items[indices[0]] is None:
+            self._armar_items()
+        return [self._items[i] for i in indices]
+
+    def por_vencer(self, tipo_medidor=None):
+        """Histograma de días hasta vencer (0..HORIZONTE, más los vencidos) y el detalle para el gráfico."""
+        if tipo_medidor in self._por_vencer:
+            return self._por_vencer[tipo_medidor]
+        col = self.columnas
+        dias = [0] * (HORIZONTE + 1)
+        vencidos = 0
+        detalle = []
+        for j, (u, d, e) in enumerate(zip(col.v_unidad, self.v_dias, self.v_estado)):
+            if e == ERROR or d > HORIZONTE or (tipo_medidor and col.tipo_medidor[u] != tipo_medidor):
+                continue
+            if d < 0:
+                vencidos += 1
+            else:
+                dias[d] += 1
+            detalle.append({"unidad_id": col.unidades[u]["id"], "patente": col.unidades[u]["patente"],
+                            "tipo": col.v_tipo[j], "dias": d, "estado": NOMBRES[e]})
+        detalle.sort(key=lambda v: v["dias"])
+        r = self._por_vencer[tipo_medidor] = ({"vencidos": vencidos, "dias": dias}, detalle)
+        return r
+
+
+def estado_vencimiento(fecha, hoy, dias_aviso):
+    """(días hasta `fecha`, estado) de un vencimiento suelto, con la regla de _Estados.
+
+    Para quien recorre la flota de a una unidad (exportar.py) sin armar las columnas."""
+    o = _ordinal(fecha)
+    if o == _SIN_FECHA:
+        return None, NOMBRES[ERROR]
+    d = o - hoy.toordinal()
+    return d, NOMBRES[DANGER if d < 0 else WARNING if d <= dias_aviso else OK]
+
+
+def calcular(flota, dias_aviso, hoy=None):
+    """Estados de la flota para `hoy`; se recalcula solo si cambian los datos, el día o diasAviso."""
+    hoy = hoy or datetime.date.today()
+    clave = id(flota)
+    version = flota.version()
+    est = _estados.get(clave)
+    if est is not None and est.version == version and est.hoy == hoy and est.dias_aviso == dias_aviso:
+        return est
+    with _lock:
+        col = _columnas.get(clave)
+        if col is None or col.version != version:
+            version, col = flota.leer(_Columnas)
+            col.version = version
+            _columnas[clave] = col
+        est = _Estados(col, hoy, dias_aviso)
+        est.version = col.version
+        _estados[clave] = est
+        return est
+
+
+def olvidar(flota):
+    """Suelta lo calculado para `flota` (tenant descargado, ver tenants.py)."""
+    with _lock:
+        _columnas.pop(id(flota), None)
+        _estados.pop(id(flota), None)
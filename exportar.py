@@ -0,0 +1,330 @@
+"""Exportación de flota, vencimientos, historial y auditoría a CSV o XLSX, en streaming.
+
+La única exportación era el JSON del backup semanal; la oficina armaba las
+planillas a mano desde el dashboard. Ahora GET /api/export/<tipo> (y esta
+misma línea de comandos) generan el archivo a medida que leen:
+
+- Las filas salen de generadores sobre el almacén: Documento.iterar /
+  _Coleccion.iterar de a lotes (el lock o la transacción se toma por lote,
+  así una exportación larga no frena a los que escriben), historial por
+  unidad y la auditoría segmento por segmento (o por páginas en SQLite).
+- El CSV se escribe de a bloques de ~64 KB. El XLSX es un zip que se va
+  comprimiendo al vuelo (entradas con data descriptor, sin volver atrás) con
+  textos inline en vez de tabla de strings compartidos: la memoria no crece
+  con el tamaño del archivo. Pasado el máximo de filas de Excel sigue en
+  otra hoja.
+- Las filas van en el orden del almacén (la flota en su orden, el historial
+  de cada unidad del más viejo al más nuevo): ordenar obligaría a juntarlas.
+
+Filtros: `desde`/`hasta` (AAAA-MM-DD, inclusive) sobre la fecha del
+vencimiento, del evento de historial o el timestamp de auditoría; `activo`
+(true/false) y `tipo_medidor` (km/horas) sobre la unidad. Un filtro que no
+aplica al tipo pedido es un error, no se ignora.
+
+Línea de comandos (almacén de data/, o de otro tenant con --tenant=<id>):
+
+    python exportar.py flota [--formato=xlsx] [--salida=flota.xlsx] [--tenant=<id>]
+    python exportar.py historial --desde=2024-01-01 --hasta=2024-12-31 --activo=true > historial.csv
+"""
+
+import csv
+import datetime
+import io
+import re
+import sys
+import zipfile
+from xml.sax.saxutils import escape
+
+import estado_flota
+
+TIPOS = ("flota", "vencimientos", "historial", "audit")
+FORMATOS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+COLUMNAS = {
+    "flota": ["id", "patente", "descripcion", "tipo_medidor", "activo", "km_actual", "km_fecha",
+              "service_ultimo_km", "service_intervalo_km", "service_proximo", "service_proyectado"],
+    "vencimientos": ["unidad_id", "patente", "descripcion", "tipo_medidor", "activo",
+                     "tipo", "fecha", "dias", "estado"],
+    "historial": ["unidad_id", "patente", "eid", "fecha", "tipo", "detalle"],
+    "audit": ["timestamp", "user", "action", "details"],
+}
+# Qué filtros tiene sentido pedirle a cada tipo.
+FILTROS = {
+    "flota": {"activo", "tipo_medidor"},
+    "vencimientos": {"desde", "hasta", "activo", "tipo_medidor"},
+    "historial": {"desde", "hasta", "activo", "tipo_medidor"},
+    "audit": {"desde", "hasta"},
+}
+
+BLOQUE = 64 * 1024
+FILAS_HOJA = 1048576 - 1  # máximo de Excel, menos el encabezado
+
+
+class ErrorExportacion(Exception):
+    pass
+
+
+class Filtros:
+    def __init__(self, tipo, desde=None, hasta=None, activo=None, tipo_medidor=None):
+        if tipo not in TIPOS:
+            raise ErrorExportacion(f"Tipo inválido: {tipo} ({', '.join(TIPOS)})")
+        pedidos = {"desde": desde, "hasta": hasta, "activo": activo, "tipo_medidor": tipo_medidor}
+        sobran = sorted(k for k, v in pedidos.items() if v not in (None, "") and k not in FILTROS[tipo])
+        if sobran:
+            raise ErrorExportacion(f"{', '.join(sobran)} no aplica a {tipo}")
+        for nombre, fecha in (("desde", desde), ("hasta", hasta)):
+            if fecha:
+                try:
+                    datetime.date.fromisoformat(fecha)
+                except ValueError:
+                    raise ErrorExportacion(f"{nombre} inválido (AAAA-MM-DD)") from None
+        if activo not in (None, "", "true", "false"):
+            raise ErrorExportacion("activo inválido (true o false)")
+        if tipo_medidor not in (None, "", "km", "horas"):
+            raise ErrorExportacion("tipo_medidor inválido (km u horas)")
+        self.tipo = tipo
+        self.desde = desde or None
+        self.hasta = hasta or None
+        self.activo = None if activo in (None, "") else activo == "true"
+        self.tipo_medidor = tipo_medidor or None
+
+    def unidad(self, u):
+        return ((self.activo is None or (u.get("activo") is not False) == self.activo)
+                and (self.tipo_medidor is None or (u.get("tipo_medidor") or "km") == self.tipo_medidor))
+
+    def fecha(self, f):
+        f = str(f or "")[:10]
+        if not f:
+            return not (self.desde or self.hasta)
+        return (self.desde is None or f >= self.desde) and (self.hasta is None or f <= self.hasta)
+
+
+# --- filas ---
+def _flota(almacen, filtros, **_):
+    for u in almacen.flota.iterar():
+        if not filtros.unidad(u):
+            continue
+        s = u.get("service") or {}
+        try:
+            proximo = float(s["ultimo_km"]) + float(s["intervalo_km"])
+            proximo = int(proximo) if proximo.is_integer() else proximo
+        except (KeyError, TypeError, ValueError):
+            proximo = None
+        yield [u.get("id"), u.get("patente", ""), u.get("descripcion", ""), u.get("tipo_medidor") or "km",
+               u.get("activo") is not False, u.get("km_actual"), u.get("km_fecha"),
+               s.get("ultimo_km"), s.get("intervalo_km"), proximo, s.get("proyectado")]
+
+
+def _vencimientos(almacen, filtros, dias_aviso=30, hoy=None, **_):
+    hoy = hoy or datetime.date.today()
+    for u in almacen.flota.iterar():
+        if not filtros.unidad(u):
+            continue
+        vencs = u.get("vencimientos") or {}
+        for tipo, fecha in (vencs.items() if isinstance(vencs, dict) else []):
+            if not fecha or not filtros.fecha(fecha):
+                continue
+            dias, estado = estado_flota.estado_vencimiento(fecha, hoy, dias_aviso)
+            yield [u.get("id"), u.get("patente", ""), u.get("descripcion", ""), u.get("tipo_medidor") or "km",
+                   u.get("activo") is not False, tipo, fecha, dias, estado]
+
+
+def _historial(almacen, filtros, historial=None, **_):
+    # Lo único que se junta es lo de cada unidad que hace falta para filtrar y
+    # la patente: una entrada chica por unidad, no el historial.
+    unidades = {u.get("id"): (filtros.unidad(u), u.get("patente", "")) for u in almacen.flota.iterar()}
+    for uid, e in historial.iterar():
+        pasa, patente = unidades.get(uid, (filtros.activo is None and filtros.tipo_medidor is None, ""))
+        if pasa and filtros.fecha(e.get("fecha")):
+            yield [uid, patente, e.get("eid"), e.get("fecha", ""), e.get("tipo", ""), e.get("detalle", "")]
+
+
+def _audit(almacen, filtros, **_):
+    for e in almacen.auditoria.iterar(filtros.desde, filtros.hasta):
+        yield [e.get("timestamp", ""), e.get("user"), e.get("action"), e.get("details")]
+
+
+_FILAS = {"flota": _flota, "vencimientos": _vencimientos, "historial": _historial, "audit": _audit}
+
+
+def filas(almacen, filtros, **contexto):
+    """Generador de filas (listas en el orden de COLUMNAS[tipo]).
+
+    `contexto`: `historial` (historial.Historial del almacén) para el historial,
+    `dias_aviso` para el estado de los vencimientos."""
+    return _FILAS[filtros.tipo](almacen, filtros, **contexto)
+
+
+# --- CSV ---
+def _celda_csv(v):
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    v = str(v) if not isinstance(v, (int, float)) else v
+    # Que una descripción como "=HYPERLINK(...)" no se abra como fórmula.
+    if isinstance(v, str) and v[:1] in ("=", "+", "-", "@"):
+        return "'" + v
+    return v
+
+
+def csv_bytes(columnas, filas_):
+    """Bloques de bytes del CSV (UTF-8 con BOM, para que Excel respete los acentos)."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    buffer.write("\ufeff")
+    escritor.writerow(columnas)
+    for fila in filas_:
+        escritor.writerow([_celda_csv(v) for v in fila])
+        if buffer.tell() >= BLOQUE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+# --- XLSX ---
+class _Sumidero:
+    """Destino del zip: junta lo comprimido hasta que el generador lo entrega.
+
+    Sin seek() zipfile escribe cada entrada con data descriptor, sin volver
+    atrás a completar tamaños: se puede mandar mientras se escribe."""
+
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+        self.pendientes = 0
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        self._posicion += len(datos)
+        self.pendientes += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b"".join(self._partes)
+        self._partes.clear()
+        self.pendientes = 0
+        return datos
+
+
+_NO_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+
+def _celda_xlsx(v):
+    if v is None:
+        return "<c/>"
+    if isinstance(v, bool):
+        return f'<c t="b"><v>{int(v)}</v></c>'
+    if isinstance(v, (int, float)):
+        return f"<c><v>{v}</v></c>"
+    texto = escape(_NO_XML.sub("", str(v)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila_xlsx(fila):
+    return ("<row>" + "".join(_celda_xlsx(v) for v in fila) + "</row>").encode("utf-8")
+
+
+def xlsx_bytes(columnas, filas_, hoja="datos", filas_por_hoja=FILAS_HOJA):
+    """Bloques de bytes de un .xlsx con las filas en una o más hojas."""
+    sumidero = _Sumidero()
+    libro = zipfile.ZipFile(sumidero, "w", zipfile.ZIP_DEFLATED)
+    hojas = 0
+    encabezado = _fila_xlsx(columnas)
+    filas_ = iter(filas_)
+    siguiente = next(filas_, None)
+    while hojas == 0 or siguiente is not None:
+        hojas += 1
+        with libro.open(f"xl/worksheets/sheet{hojas}.xml", "w") as f:
+            f.write(f'{_XML}<worksheet xmlns="{_NS}"><sheetData>'.encode("utf-8"))
+            f.write(encabezado)
+            n = 0
+            while siguiente is not None and n < filas_por_hoja:
+                f.write(_fila_xlsx(siguiente))
+                n += 1
+                siguiente = next(filas_, None)
+                if sumidero.pendientes >= BLOQUE:
+                    yield sumidero.vaciar()
+            f.write(b"</sheetData></worksheet>")
+    nombres = [hoja if i == 1 else f"{hoja} ({i})" for i in range(1, hojas + 1)]
+    libro.writestr("xl/workbook.xml", (
+        f'{_XML}<workbook xmlns="{_NS}" xmlns:r="{_NS_REL}"><sheets>'
+        + "".join(f'<sheet name="{escape(n)}" sheetId="{i}" r:id="rId{i}"/>' for i, n in enumerate(nombres, 1))
+        + "</sheets></workbook>"))
+    libro.writestr("xl/_rels/workbook.xml.rels", (
+        f'{_XML}<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        + "".join(f'<Relationship Id="rId{i}" Type="{_NS_REL}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+                  for i in range(1, hojas + 1))
+        + "</Relationships>"))
+    libro.writestr("_rels/.rels", (
+        f'{_XML}<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{_NS_REL}/officeDocument" Target="xl/workbook.xml"/></Relationships>'))
+    libro.writestr("[Content_Types].xml", (
+        f'{_XML}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        + "".join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+                  'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                  for i in range(1, hojas + 1))
+        + "</Types>"))
+    libro.close()
+    yield sumidero.vaciar()
+
+
+def exportar(almacen, filtros, formato="csv", **contexto):
+    """Bloques de bytes del archivo de `filtros.tipo` en `formato` (csv o xlsx)."""
+    if formato not in FORMATOS:
+        raise ErrorExportacion(f"Formato inválido: {formato} (csv o xlsx)")
+    datos = filas(almacen, filtros, **contexto)
+    if formato == "xlsx":
+        return xlsx_bytes(COLUMNAS[filtros.tipo], datos, hoja=filtros.tipo)
+    return csv_bytes(COLUMNAS[filtros.tipo], datos)
+
+
+def nombre_archivo(tipo, formato, hoy=None):
+    return f"{tipo}-{(hoy or datetime.date.today()):%Y%m%d}.{formato}"
+
+
+if __name__ == "__main__":
+    import storage
+    import tenants
+
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    opciones = dict(a[2:].partition("=")[::2] for a in sys.argv[1:] if a.startswith("--"))
+    if len(args) != 1:
+        print(__doc__)
+        sys.exit(1)
+    try:
+        filtros = Filtros(args[0], opciones.get("desde"), opciones.get("hasta"),
+                          opciones.get("activo"), opciones.get("tipo_medidor"))
+        salida = opciones.get("salida")
+        formato = opciones.get("formato") or ("xlsx" if salida and salida.lower().endswith(".xlsx") else "csv")
+        tenant = tenants.REGISTRO.obtener(opciones.get("tenant") or None)
+        config = tenant.almacen.config.datos() or {}
+        bloques = exportar(tenant.almacen, filtros, formato, historial=tenant.historial,
+                           dias_aviso=int(config.get("diasAviso", 30)))
+        destino = open(salida, "wb") if salida else sys.stdout.buffer
+        try:
+            for bloque in bloques:
+                destino.write(bloque)
+        finally:
+            if salida:
+                destino.close()
+    except (ErrorExportacion, tenants.TenantDesconocido, storage.ErrorAlmacenamiento) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(2)
+    tenant.almacen.auditoria.registrar("cli", "export", f"{filtros.tipo} ({formato})")
@@ -0,0 +1,134 @@
+"""Historial de cada unidad (services, reparaciones, documentación), fuera de la flota.
+
+Antes era un arreglo `historial` dentro de cada unidad: /api/flota lo mandaba
+entero para toda la flota en cada carga, y agregar un evento reescribía la
+unidad. Ahora vive en su propia colección del almacén (`historial.json` con
+journal, o la tabla `historial` en SQLite), un registro por unidad:
+
+    {"id": <unidad>, "seq": <último eid>, "eventos": [{"eid", "fecha", "tipo", "detalle"}, ...]}
+
+Los eventos van del más nuevo al más viejo y cada uno tiene un `eid` estable
+(creciente por unidad): editar o borrar no depende de la posición, y la
+paginación usa el eid del último evento como cursor.
+
+migrar() saca el `historial` embebido de las unidades que todavía lo tengan
+(datos anteriores o backups viejos restaurados). Un POST de la flota entera
+con historial embebido lo separa antes de guardar y lo suma con importar().
+"""
+
+from collections import Counter
+
+LIMITE = 50
+
+
+def _firma(evento):
+    return (evento.get("fecha", ""), evento.get("tipo", ""), evento.get("detalle", ""))
+
+
+def _evento(eid, evento):
+    return {"eid": eid, "fecha": evento.get("fecha", ""), "tipo": evento.get("tipo", ""),
+            "detalle": evento.get("detalle", "")}
+
+
+class Historial:
+    def __init__(self, doc):
+        self.doc = doc
+
+    def listar(self, uid, limite=LIMITE, cursor=None):
+        """Página de eventos (más nuevos primero) anteriores al eid `cursor`."""
+        registro = self.doc.obtener(uid) or {}
+        eventos = registro.get("eventos", [])
+        if cursor is not None:
+            eventos = [e for e in eventos if e["eid"] < cursor]
+        pagina = eventos[:limite]
+        return {"items": pagina, "total": len(registro.get("eventos", [])),
+                "next_cursor": pagina[-1]["eid"] if len(eventos) > limite else None}
+
+    def agregar(self, uid, evento):
+        with self.doc.escritura():
+            registro = self.doc.obtener(uid) or {"id": uid, "seq": 0, "eventos": []}
+            registro["seq"] += 1
+            nuevo = _evento(registro["seq"], evento)
+            registro["eventos"].insert(0, nuevo)
+            self.doc.poner(registro)
+            return nuevo
+
+    def reemplazar(self, uid, eid, evento):
+        """Devuelve el evento actualizado, o None si no existe."""
+        with self.doc.escritura():
+            registro = self.doc.obtener(uid)
+            for i, e in enumerate(registro["eventos"] if registro else []):
+                if e["eid"] == eid:
+                    registro["eventos"][i] = _evento(eid, evento)
+                    self.doc.poner(registro)
+                    return registro["eventos"][i]
+            return None
+
+    def borrar(self, uid, eid):
+        with self.doc.escritura():
+            registro = self.doc.obtener(uid)
+            eventos = registro["eventos"] if registro else []
+            quedan = [e for e in eventos if e["eid"] != eid]
+            if len(quedan) == len(eventos):
+                return False
+            registro["eventos"] = quedan
+            self.doc.poner(registro)
+            return True
+
+    def iterar(self):
+        """(unidad, evento) de todo el historial, de a una unidad y del más viejo al más nuevo."""
+        for registro in self.doc.iterar():
+            for e in reversed(registro.get("eventos", [])):
+                yield registro["id"], e
+
+    def borrar_unidad(self, uid):
+        self.doc.borrar(uid)
+
+    def conservar(self, ids):
+        """Borra el historial de las unidades que ya no están (los ids se reutilizan)."""
+        ids = set(ids)
+        with self.doc.escritura():
+            for uid in self.doc.claves():
+                if uid not in ids:
+                    self.doc.borrar(uid)
+
+    def importar(self, uid, eventos):
+        """Carga un historial embebido (más nuevo primero); devuelve cuántos eventos agregó.
+
+        Si la unidad ya tiene historial se suman solo los eventos que no están
+        (misma fecha, tipo y detalle): reimportar lo ya migrado no duplica nada
+        y lo nuevo que manda un cliente viejo no se pierde.
+        """
+        with self.doc.escritura():
+            registro = self.doc.obtener(uid) or {"id": uid, "seq": 0, "eventos": []}
+            ya = Counter(_firma(e) for e in registro["eventos"])
+            nuevos = []
+            for e in reversed([e for e in eventos if isinstance(e, dict)]):  # del más viejo al más nuevo
+                firma = _firma(e)
+                if ya[firma]:
+                    ya[firma] -= 1
+                    continue
+                registro["seq"] += 1
+                nuevos.append(_evento(registro["seq"], e))
+            if nuevos:
+                registro["eventos"][:0] = reversed(nuevos)
+                self.doc.poner(registro)
+            return len(nuevos)
+
+
+def migrar(flota, historial):
+    """Pasa a `historial` los arreglos embebidos en las unidades; devuelve cuántas se migraron."""
+    _, pendientes = flota.leer(lambda unidades: [u.get("id") for u in unidades if "historial" in u])
+    if not pendientes:
+        return 0
+    with flota.escritura():
+        unidades = []
+        for uid in pendientes:
+            u = flota.obtener(uid)
+            if u is None or "historial" not in u:
+                continue
+            # Si se cortó entre importar y guardar la unidad, el historial ya está: solo se quita.
+            historial.importar(uid, u.pop("historial") or [])
+            unidades.append(u)
+        flota.poner_varios(unidades)
+    return len(unidades)
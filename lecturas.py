@@ -0,0 +1,281 @@
+"""Carga masiva de lecturas de odómetro / horómetro (exportaciones de GPS y telemetría).
+
+Hasta ahora `km_actual` solo cambiaba a mano desde el detalle de la unidad.
+ingerir() recibe miles de filas `(patente o id, timestamp, lectura)` y las
+aplica de una vez:
+
+- Las filas se leen en streaming (NDJSON o CSV con encabezado) y se agrupan por
+  unidad fuera de cualquier lock: subir el archivo no frena a nadie.
+- Dentro de `flota.escritura()` se ordenan las lecturas de cada unidad por
+  timestamp y se valida que el medidor no retroceda, ni entre ellas ni contra
+  lo guardado. Lo que es anterior a la última lectura ya registrada
+  (`km_fecha`) se ignora: reenviar el mismo archivo no cambia nada.
+- Las unidades afectadas se escriben juntas con `poner_varios` (una línea de
+  journal o una transacción SQLite) y solo en ellas se vuelve a evaluar el
+  service (misma lógica que enviar_alertas.verificar_service).
+- Las lecturas aceptadas van además a la serie de cada unidad (medidores.py),
+  una vez guardada la flota; con ellas se recalcula la fecha proyectada del
+  próximo service.
+- `km_fecha` es el momento de la lectura de `km_actual`, igual que cuando se
+  edita a mano (app.py).
+
+Columnas aceptadas: `id` o `patente`; `timestamp` (o `fecha`, `ts`: ISO 8601
+o segundos epoch); `lectura` (o `km`, `horas`, `valor`).
+
+Línea de comandos (escribe directo en el almacén de data/, o en el de otro
+tenant con --tenant=<id>; ver tenants.py):
+
+    python lecturas.py lecturas.csv [--simular] [--tenant=<id>]
+    zcat export.ndjson.gz | python lecturas.py - [--csv] [--simular]
+"""
+
+import csv
+import datetime
+import io
+import json
+import math
+import os
+import sys
+import time
+
+import enviar_alertas
+import medidores
+import storage
+import tenants
+
+MAX_FILAS = int(os.environ.get("LECTURAS_MAX_FILAS", 1_000_000))
+MAX_ERRORES = int(os.environ.get("LECTURAS_MAX_ERRORES", 100))
+
+_CAMPOS_UNIDAD = ("id", "patente")
+_CAMPOS_TS = ("timestamp", "fecha", "ts")
+_CAMPOS_LECTURA = ("lectura", "km", "horas", "valor")
+
+
+class ErrorIngesta(Exception):
+    pass
+
+
+def _campo(fila, nombres):
+    for n in nombres:
+        v = fila.get(n)
+        if v not in (None, ""):
+            return v
+    return None
+
+
+def _epoch(valor):
+    """Timestamp como segundos epoch; sin zona horaria se toma la hora local."""
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        ts = float(valor)
+    else:
+        texto = str(valor).strip()
+        try:
+            ts = float(texto)
+        except ValueError:
+            ts = datetime.datetime.fromisoformat(texto.replace("Z", "+00:00")).timestamp()
+    if not math.isfinite(ts):
+        raise ValueError(valor)
+    return ts
+
+
+def fecha_iso(ts):
+    """`km_fecha` de una lectura tomada en `ts` (epoch): ISO 8601 con la zona local."""
+    return datetime.datetime.fromtimestamp(ts).astimezone().isoformat(timespec="seconds")
+
+
+def _num(valor):
+    n = float(valor)
+    if not math.isfinite(n) or n < 0:
+        raise ValueError(valor)
+    return int(n) if n.is_integer() else n
+
+
+def medidor_actual(unidad):
+    """`km_actual` de la unidad como número; los datos viejos lo traen como texto ("1500").
+
+    Lo que no se puede leer cuenta como 0, igual que en estado_flota."""
+    try:
+        return _num(unidad.get("km_actual", 0) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def filas(lineas, formato="ndjson"):
+    """(nro de línea, dict) por cada fila; las líneas NDJSON ilegibles vienen como (nro, None)."""
+    if formato == "csv":
+        lector = csv.DictReader(lineas)
+        for fila in lector:
+            yield lector.line_num, {(k or "").strip().lower(): v for k, v in fila.items()}
+        return
+    for n, linea in enumerate(lineas, 1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError:
+            fila = None
+        yield n, fila if isinstance(fila, dict) else None
+
+
+class _Resumen:
+    def __init__(self):
+        self.recibidas = self.aceptadas = self.ignoradas = self.rechazadas = 0
+        self.errores = []
+
+    def error(self, linea, motivo):
+        self.rechazadas += 1
+        if len(self.errores) < MAX_ERRORES:
+            self.errores.append({"linea": linea, "motivo": motivo})
+
+
+def _indice(unidades):
+    """patente (mayúsculas) -> id; las patentes repetidas en la flota quedan con None."""
+    indice = {}
+    for u in unidades:
+        p = str(u.get("patente", "")).strip().upper()
+        if p:
+            indice[p] = None if p in indice else u.get("id")
+    return indice, {u.get("id") for u in unidades}
+
+
+def _agrupar(filas_, indice, ids, resumen):
+    por_unidad = {}
+    for linea, fila in filas_:
+        resumen.recibidas += 1
+        if resumen.recibidas > MAX_FILAS:
+            raise ErrorIngesta(f"Más de {MAX_FILAS} filas en un envío")
+        if fila is None:
+            resumen.error(linea, "fila ilegible")
+            continue
+        try:
+            ts = _epoch(_campo(fila, _CAMPOS_TS))
+        except (TypeError, ValueError, OverflowError, OSError):
+            resumen.error(linea, "timestamp inválido")
+            continue
+        try:
+            valor = _num(_campo(fila, _CAMPOS_LECTURA))
+        except (TypeError, ValueError, OverflowError):
+            resumen.error(linea, "lectura inválida")
+            continue
+        clave = _campo(fila, _CAMPOS_UNIDAD)
+        uid = None
+        if fila.get("id") not in (None, ""):
+            try:
+                uid = int(fila["id"])
+            except (TypeError, ValueError):
+                pass
+            if uid not in ids:
+                uid = None
+        elif clave is not None:
+            uid = indice.get(str(clave).strip().upper())
+        if uid is None:
+            resumen.error(linea, f"unidad desconocida o ambigua: {clave}")
+            continue
+        por_unidad.setdefault(uid, []).append((ts, valor, linea))
+    return por_unidad
+
+
+def ingerir(flota, lineas, formato="ndjson", simular=False, series=None):
+    """Aplica las lecturas de `lineas` a `flota` (y a `series`, un
+    medidores.SeriesMedidor); devuelve el resumen (dict).
+
+    La auditoría la registra quien llama (una sola entrada por envío).
+    """
+    inicio = time.monotonic()
+    resumen = _Resumen()
+    _, (indice, ids) = flota.leer(_indice)
+    por_unidad = _agrupar(filas(lineas, formato), indice, ids, resumen)
+
+    cambios, service, a_series = [], [], []
+    with flota.escritura():
+        for uid, lecturas in por_unidad.items():
+            u = flota.obtener(uid)
+            if u is None:
+                for _, _, linea in lecturas:
+                    resumen.error(linea, f"unidad {uid} eliminada")
+                continue
+            try:
+                ultimo_ts = _epoch(u["km_fecha"]) if u.get("km_fecha") else -math.inf
+            except (TypeError, ValueError, OverflowError):
+                ultimo_ts = -math.inf
+            ultimo = medidor_actual(u)
+            aceptadas = []
+            lecturas.sort()
+            for ts, valor, linea in lecturas:
+                # km_fecha se guarda al segundo: se compara con esa precisión.
+                if math.floor(ts) <= ultimo_ts:
+                    resumen.ignoradas += 1  # ya registrada, o repetida en el mismo envío
+                elif valor < ultimo:
+                    resumen.error(linea, f"{u.get('patente', uid)}: {valor} es menor que {ultimo}")
+                else:
+                    ultimo_ts, ultimo = ts, valor
+                    aceptadas.append((ts, valor))
+            if not aceptadas:
+                continue
+            resumen.aceptadas += len(aceptadas)
+            antes, _ = enviar_alertas.verificar_service(u)
+            u["km_actual"] = ultimo
+            u["km_fecha"] = fecha_iso(ultimo_ts)
+            cambios.append(u)
+            alerta, mensaje = enviar_alertas.verificar_service(u)
+            if alerta:
+                service.append({"id": uid, "patente": u.get("patente", ""), "mensaje": mensaje, "nueva": not antes})
+            if series is not None and not simular:
+                series.proyectar(u, aceptadas)
+                a_series.append((uid, aceptadas))
+        if cambios and not simular:
+            cambios = flota.poner_varios(cambios)
+            # Recién con la flota guardada: si poner_varios falla, la serie no
+            # queda con lecturas que la flota no tiene.
+            for uid, aceptadas in a_series:
+                try:
+                    series.agregar(uid, aceptadas)
+                except OSError as e:
+                    print(f"Error guardando la serie de la unidad {uid}: {e}")
+
+    return {
+        "recibidas": resumen.recibidas,
+        "aceptadas": resumen.aceptadas,
+        "ignoradas": resumen.ignoradas,
+        "rechazadas": resumen.rechazadas,
+        "errores": resumen.errores,
+        "unidades": len(cambios),
+        "service": service,
+        "simulado": simular,
+        "segundos": round(time.monotonic() - inicio, 3),
+    }
+
+
+def detalle_auditoria(r):
+    return (f"{r['aceptadas']} lecturas en {r['unidades']} unidades"
+            f" ({r['ignoradas']} ignoradas, {r['rechazadas']} rechazadas)")
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    opciones = {a for a in sys.argv[1:] if a.startswith("--")}
+    if len(args) != 1:
+        print(__doc__)
+        sys.exit(1)
+    formato = "csv" if "--csv" in opciones or args[0].lower().endswith(".csv") else "ndjson"
+    tenant_id = next((o.split("=", 1)[1] for o in opciones if o.startswith("--tenant=")), None)
+    try:
+        tenant = tenants.REGISTRO.obtener(tenant_id)
+    except tenants.TenantDesconocido as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+    almacen, series = tenant.almacen, tenant.medidores
+    try:
+        if args[0] == "-":
+            resultado = ingerir(almacen.flota, io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline=""),
+                                formato, "--simular" in opciones, series)
+        else:
+            with open(args[0], "r", encoding="utf-8", newline="") as f:
+                resultado = ingerir(almacen.flota, f, formato, "--simular" in opciones, series)
+    except (ErrorIngesta, storage.ErrorAlmacenamiento) as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+    if resultado["unidades"] and not resultado["simulado"]:
+        almacen.auditoria.registrar("cli", "bulk_readings", detalle_auditoria(resultado))
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    sys.exit(3 if resultado["rechazadas"] else 0)
@@ -0,0 +1,225 @@
+"""Serie de lecturas de medidor (km u horas) por unidad y pronóstico del próximo service.
+
+La flota solo guarda el último `km_actual`; para saber a qué ritmo suma cada
+unidad hace falta la historia. Se guarda fuera del documento de la flota, un
+archivo binario por unidad en `data/medidores/<id>.bin`: pares (timestamp,
+valor) de doubles en orden de timestamp. Lo nuevo se agrega al final; una
+lectura anterior a la última (telemetría que llega tarde) se intercala
+reescribiendo el archivo. Leer la serie es un `frombytes` a un `array` y
+separar columnas con un slice, sin parsear nada.
+
+Cada vez que un archivo crece MEDIDORES_COMPACTAR_BYTES desde la última
+compactación se reescribe (atómico) reduciendo lo viejo: más allá de
+MEDIDORES_DETALLE_DIAS queda la última lectura de cada día, y más allá de
+MEDIDORES_SEMANAL_DIAS la última de cada semana. Para el ritmo de uso alcanza
+y el archivo no crece sin límite.
+
+El pronóstico ajusta una recta (mínimos cuadrados) a las lecturas de los
+MEDIDORES_VENTANA_DIAS previos a la última y proyecta el día en que la unidad
+llega a `service.ultimo_km + intervalo_km`. proyectar() lo deja en la unidad
+como `service.proyectado` / `service.tasa_dia`, así el estado de la flota y
+el calendario de alertas lo ven sin leer las series. proyectar() cuenta las
+lecturas nuevas sin escribirlas: quien guarda la unidad las agrega a la
+serie recién cuando la unidad quedó guardada, y la serie no registra
+lecturas que la flota no tiene.
+"""
+
+import bisect
+import datetime
+import math
+import os
+import struct
+import sys
+import time
+from array import array
+
+import storage
+
+COMPACTAR_BYTES = int(os.environ.get("MEDIDORES_COMPACTAR_BYTES", 64 * 1024))
+DETALLE_DIAS = int(os.environ.get("MEDIDORES_DETALLE_DIAS", 90))
+SEMANAL_DIAS = int(os.environ.get("MEDIDORES_SEMANAL_DIAS", 730))
+VENTANA_DIAS = int(os.environ.get("MEDIDORES_VENTANA_DIAS", 60))
+HORIZONTE_DIAS = 5 * 365  # más allá de esto el pronóstico no sirve
+
+_PAR = struct.Struct("<dd")
+_DIA = 86400.0
+
+
+def _reducir(ts, val, paso, hasta):
+    """Última lectura de cada intervalo de `paso` segundos entre las anteriores a `hasta`."""
+    out_ts, out_val = array("d"), array("d")
+    for i in range(len(ts)):
+        if ts[i] < hasta and i + 1 < len(ts) and ts[i + 1] < hasta and ts[i + 1] // paso == ts[i] // paso:
+            continue
+        out_ts.append(ts[i])
+        out_val.append(val[i])
+    return out_ts, out_val
+
+
+def _tasa(ts, val):
+    """Pendiente por día de la recta de mínimos cuadrados; None si no sube o no alcanza."""
+    n = len(ts)
+    if n < 2 or ts[-1] - ts[0] < _DIA:
+        return None
+    mt, mv = sum(ts) / n, sum(val) / n
+    sxx = sum((t - mt) ** 2 for t in ts)
+    sxy = sum((t - mt) * (v - mv) for t, v in zip(ts, val))
+    pendiente = sxy / sxx * _DIA if sxx else 0
+    return pendiente if pendiente > 0 else None
+
+
+class SeriesMedidor:
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        self._bloqueo = storage.BloqueoArchivo(os.path.join(carpeta, ".lock"))
+        self._compactado = {}  # uid -> tamaño que quedó en la última compactación (este proceso)
+
+    def _ruta(self, uid):
+        return os.path.join(self.carpeta, f"{int(uid)}.bin")
+
+    # --- lectura ---
+    def leer(self, uid, desde=None):
+        """(timestamps, valores) como arrays de doubles, en orden; desde `desde` (epoch) si se pide."""
+        try:
+            with open(self._ruta(uid), "rb") as f:
+                crudo = f.read()
+        except FileNotFoundError:
+            return array("d"), array("d")
+        pares = array("d")
+        pares.frombytes(crudo[:len(crudo) - len(crudo) % _PAR.size])  # un append a medias se ignora
+        if sys.byteorder == "big":  # en disco siempre little-endian
+            pares.byteswap()
+        ts, val = pares[0::2], pares[1::2]
+        if desde is not None:
+            i = bisect.bisect_left(ts, desde)
+            ts, val = ts[i:], val[i:]
+        return ts, val
+
+    # --- escritura ---
+    def _escribir(self, uid, ts, val):
+        """Reemplaza la serie entera (atómico); devuelve el tamaño nuevo."""
+        pares = array("d", (x for par in zip(ts, val) for x in par))
+        if sys.byteorder == "big":  # en disco siempre little-endian
+            pares.byteswap()
+        os.makedirs(self.carpeta, exist_ok=True)
+        ruta = self._ruta(uid)
+        tmp = ruta + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(pares.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, ruta)
+        return len(pares) * pares.itemsize
+
+    def agregar(self, uid, puntos):
+        """Agrega (timestamp, valor) a la serie; devuelve cuántos entraron.
+
+        Lo posterior a la última lectura se agrega al final. Lo anterior (p. ej.
+        un export de telemetría que llega después de una edición a mano) se
+        intercala en orden y la serie se reescribe. Un timestamp que ya está
+        no se repite: reenviar el mismo archivo no cambia nada.
+        """
+        with self._bloqueo:
+            ts, val = self.leer(uid)
+            ultimo = ts[-1] if len(ts) else -math.inf
+            nuevos = {}
+            for t, v in puntos:
+                nuevos.setdefault(t, v)
+            al_final = sorted((t, v) for t, v in nuevos.items() if t > ultimo)
+            intercalados = sorted((t, v) for t, v in nuevos.items() if t <= ultimo)
+            if intercalados:
+                existentes = set(ts)
+                intercalados = [(t, v) for t, v in intercalados if t not in existentes]
+            if not al_final and not intercalados:
+                return 0
+            if intercalados:
+                pares = sorted([*zip(ts, val), *intercalados, *al_final])
+                tam = self._escribir(uid, [t for t, _ in pares], [v for _, v in pares])
+            else:
+                os.makedirs(self.carpeta, exist_ok=True)
+                with open(self._ruta(uid), "ab") as f:
+                    f.write(b"".join(_PAR.pack(t, v) for t, v in al_final))
+                    tam = f.tell()
+            # Se compacta recién cuando creció COMPACTAR_BYTES desde la última
+            # compactación: una unidad con mucho detalle reciente (que no se
+            # puede reducir) no se reescribe entera en cada lectura.
+            if tam > self._compactado.get(uid, 0) + COMPACTAR_BYTES:
+                self.compactar(uid)
+            return len(al_final) + len(intercalados)
+
+    def compactar(self, uid, ahora=None):
+        """Reescribe la serie reduciendo lo viejo a una lectura por día / por semana."""
+        ahora = ahora or time.time()
+        with self._bloqueo:
+            ts, val = self.leer(uid)
+            ts, val = _reducir(ts, val, 7 * _DIA, ahora - SEMANAL_DIAS * _DIA)
+            ts, val = _reducir(ts, val, _DIA, ahora - DETALLE_DIAS * _DIA)
+            self._compactado[uid] = self._escribir(uid, ts, val)
+
+    def borrar(self, uid):
+        with self._bloqueo:
+            try:
+                os.remove(self._ruta(uid))
+            except FileNotFoundError:
+                pass
+            self._compactado.pop(uid, None)
+
+    # --- pronóstico ---
+    def _recientes(self, uid, puntos=()):
+        """Las lecturas de los últimos VENTANA_DIAS contados desde la última (no desde hoy),
+        con `puntos` intercalados como lo haría agregar()."""
+        ts, val = self.leer(uid)
+        if puntos:
+            pares = dict(zip(ts, val))
+            for t, v in puntos:
+                pares.setdefault(t, v)
+            orden = sorted(pares)
+            ts, val = array("d", orden), array("d", (pares[t] for t in orden))
+        if not len(ts):
+            return ts, val
+        i = bisect.bisect_left(ts, ts[-1] - VENTANA_DIAS * _DIA)
+        return ts[i:], val[i:]
+
+    def tasa(self, uid):
+        """Ritmo de uso (unidades de medidor por día) en la ventana reciente, o None."""
+        return _tasa(*self._recientes(uid))
+
+    def pronostico(self, unidad, puntos=()):
+        """{"fecha", "tasa_dia"} del próximo service de `unidad`, o None si no hay con qué proyectar.
+
+        `puntos` son lecturas todavía no guardadas que se cuentan como si estuvieran."""
+        service = unidad.get("service") or {}
+        try:
+            objetivo = float(service["ultimo_km"]) + float(service["intervalo_km"])
+            actual = float(unidad.get("km_actual", 0) or 0)
+        except (KeyError, TypeError, ValueError):
+            return None
+        ts, val = self._recientes(unidad.get("id"), puntos)
+        tasa = _tasa(ts, val)
+        if tasa is None:
+            return None
+        dias = max(objetivo - max(val[-1], actual), 0) / tasa
+        if dias > HORIZONTE_DIAS:
+            return None
+        fecha = datetime.date.fromtimestamp(ts[-1] + dias * _DIA)
+        return {"fecha": fecha.isoformat(), "tasa_dia": round(tasa, 1)}
+
+    def proyectar(self, unidad, puntos=()):
+        """Recalcula `service.proyectado` / `service.tasa_dia` de `unidad` contando `puntos`.
+
+        Modifica `unidad` (el registro que se va a guardar) y la devuelve. No
+        escribe la serie: los puntos se agregan con agregar() una vez guardada
+        la unidad.
+        """
+        if unidad.get("id") is None:
+            return unidad
+        service = unidad.get("service")
+        if not isinstance(service, dict):
+            return unidad
+        p = self.pronostico(unidad, puntos)
+        if p:
+            service["proyectado"], service["tasa_dia"] = p["fecha"], p["tasa_dia"]
+        else:
+            service.pop("proyectado", None)
+            service.pop("tasa_dia", None)
+        return unidad
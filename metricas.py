@@ -0,0 +1,245 @@
+"""Métricas en formato Prometheus (GET /metrics): rutas, almacén, Supabase, SMTP y jobs.
+
+Cuando el dashboard anda lento hay que saber dónde se va el tiempo. Cada
+módulo anota lo suyo con observar() / contar() / cronometro():
+
+- app.py: latencia y cantidad de pedidos por ruta, método y status.
+- storage.py / storage_sqlite.py: tiempo y bytes de lectura y escritura por
+  archivo (snapshot, journal, compactación; tablas en SQLite).
+- auth_remote.validar: latencia por resultado (valido, invalido, error...).
+- outbox.py: duración de cada envío SMTP por resultado.
+- coordinador.py: duración de cada job programado y cuántos fallaron.
+
+El costo en el camino caliente es un bisect y un lock por observación. Cada
+worker de gunicorn tiene sus propios contadores: cada METRICAS_INTERVALO
+segundos (en el after_request, sin hilos aparte) los vuelca a
+`data/metricas/<pid>-<id>.json`, y el worker que atiende /metrics suma los de
+todos. Los archivos de workers muertos se acumulan en `muertos.json` para que
+los contadores no bajen cuando gunicorn recicla un worker.
+
+Los valores instantáneos (tamaño de los archivos de datos, largo del log de
+auditoría) los calcula app.py al momento del scrape.
+"""
+
+import bisect
+import contextlib
+import json
+import os
+import secrets
+import threading
+import time
+
+INTERVALO = float(os.environ.get("METRICAS_INTERVALO", 15))
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+FAMILIAS = {
+    "flota_http_request_duration_seconds": ("histogram", "Duración de los pedidos HTTP por ruta, método y status."),
+    "flota_storage_duration_seconds": ("histogram", "Tiempo de lectura/escritura del almacén por archivo."),
+    "flota_storage_bytes_total": ("counter", "Bytes leídos/escritos del almacén por archivo."),
+    "flota_supabase_validar_duration_seconds": ("histogram", "Latencia de auth_remote.validar por resultado."),
+    "flota_smtp_send_duration_seconds": ("histogram", "Duración de cada envío SMTP por resultado."),
+    "flota_job_duration_seconds": ("histogram", "Duración de los jobs programados."),
+    "flota_job_failures_total": ("counter", "Corridas de jobs programados que terminaron con error."),
+}
+
+_lock = threading.Lock()
+_series = {}  # (familia, ((etiqueta, valor), ...)) -> número (counter) | [cuenta por bucket..., +Inf, suma]
+_carpeta = None
+_ultimo_volcado = 0.0
+_id_proceso = secrets.token_hex(4)
+
+
+def _despues_de_fork():
+    # Un hijo (p. ej. gunicorn --preload) no hereda lo contado por el padre.
+    global _id_proceso, _ultimo_volcado, _lock
+    _lock = threading.Lock()
+    _series.clear()
+    _id_proceso = secrets.token_hex(4)
+    _ultimo_volcado = 0.0
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_despues_de_fork)
+
+
+def observar(familia, segundos, **etiquetas):
+    clave = (familia, tuple(sorted(etiquetas.items())))
+    i = bisect.bisect_left(BUCKETS, segundos)
+    with _lock:
+        h = _series.get(clave)
+        if h is None:
+            h = _series[clave] = [0] * (len(BUCKETS) + 1) + [0.0]
+        h[i] += 1
+        h[-1] += segundos
+
+
+def contar(familia, n=1, **etiquetas):
+    clave = (familia, tuple(sorted(etiquetas.items())))
+    with _lock:
+        _series[clave] = _series.get(clave, 0) + n
+
+
+def io(archivo, op, inicio, n):
+    """Una lectura/escritura del almacén: `inicio` es el perf_counter de antes, `n` los bytes."""
+    observar("flota_storage_duration_seconds", time.perf_counter() - inicio, archivo=archivo, op=op)
+    contar("flota_storage_bytes_total", n, archivo=archivo, op=op)
+
+
+@contextlib.contextmanager
+def cronometro(familia, **etiquetas):
+    """Mide el bloque; adentro se pueden cambiar las etiquetas (p. ej. el resultado)."""
+    inicio = time.perf_counter()
+    try:
+        yield etiquetas
+    finally:
+        observar(familia, time.perf_counter() - inicio, **etiquetas)
+
+
+# --- entre procesos ---
+def configurar(carpeta):
+    """Carpeta compartida entre workers; sin esto /metrics muestra solo este proceso."""
+    global _carpeta
+    _carpeta = carpeta
+
+
+def _copia():
+    with _lock:
+        return {k: (list(v) if isinstance(v, list) else v) for k, v in _series.items()}
+
+
+def _serializar(series):
+    return [[f, dict(e), v] for (f, e), v in series.items()]
+
+
+def _deserializar(lista):
+    return {(f, tuple(sorted(e.items()))): v for f, e, v in lista}
+
+
+def _escribir(ruta, contenido):
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(contenido, f, separators=(",", ":"))
+    os.replace(tmp, ruta)
+
+
+def volcar(forzar=False):
+    """Deja los contadores de este proceso en la carpeta compartida (si pasó INTERVALO)."""
+    global _ultimo_volcado
+    ahora = time.monotonic()
+    if _carpeta is None or (not forzar and ahora - _ultimo_volcado < INTERVALO):
+        return
+    _ultimo_volcado = ahora
+    try:
+        os.makedirs(_carpeta, exist_ok=True)
+        _escribir(os.path.join(_carpeta, f"{os.getpid()}-{_id_proceso}.json"),
+                  {"pid": os.getpid(), "series": _serializar(_copia())})
+    except OSError as e:
+        print(f"Error volcando métricas: {e}")
+
+
+def _sumar(total, series):
+    for k, v in series.items():
+        actual = total.get(k)
+        if actual is None:
+            total[k] = list(v) if isinstance(v, list) else v
+        elif isinstance(v, list):
+            total[k] = [a + b for a, b in zip(actual, v)]
+        else:
+            total[k] = actual + v
+    return total
+
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _leer(ruta):
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def agregado():
+    """Series sumadas de todos los workers (vivos y muertos)."""
+    if _carpeta is None:
+        return _copia()
+    import storage  # storage también anota métricas: import diferido
+    volcar(forzar=True)
+    with storage.BloqueoArchivo(os.path.join(_carpeta, ".lock")):
+        archivos = []
+        for n in os.listdir(_carpeta):
+            if n.endswith(".json") and n != "muertos.json":
+                ruta = os.path.join(_carpeta, n)
+                try:
+                    archivos.append((os.path.getmtime(ruta), ruta, int(n.split("-", 1)[0])))
+                except (OSError, ValueError):
+                    continue
+        archivos.sort(reverse=True)
+        ruta_muertos = os.path.join(_carpeta, "muertos.json")
+        muertos = _deserializar((_leer(ruta_muertos) or {}).get("series", []))
+        total, vistos, nuevos_muertos = {}, set(), []
+        for _, ruta, pid in archivos:
+            contenido = _leer(ruta)
+            if contenido is None:
+                continue
+            series = _deserializar(contenido.get("series", []))
+            # Un pid reutilizado (reinicio del contenedor): solo el archivo más nuevo es del proceso vivo.
+            if _vivo(pid) and pid not in vistos:
+                vistos.add(pid)
+                _sumar(total, series)
+            else:
+                _sumar(muertos, series)
+                nuevos_muertos.append(ruta)
+        if nuevos_muertos:
+            _escribir(ruta_muertos, {"series": _serializar(muertos)})
+            for ruta in nuevos_muertos:
+                os.unlink(ruta)
+    return _sumar(total, muertos)
+
+
+# --- formato ---
+def _escapar(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(pares):
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}" if pares else ""
+
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def texto(series, instantaneas=()):
+    """Exposición de texto de Prometheus. `instantaneas`: (nombre, ayuda, [(etiquetas, valor)])."""
+    lineas = []
+    por_familia = {}
+    for (familia, pares), v in sorted(series.items()):
+        por_familia.setdefault(familia, []).append((pares, v))
+    for familia, (tipo, ayuda) in FAMILIAS.items():
+        if familia not in por_familia:
+            continue
+        lineas += [f"# HELP {familia} {ayuda}", f"# TYPE {familia} {tipo}"]
+        for pares, v in por_familia[familia]:
+            if tipo == "counter":
+                lineas.append(f"{familia}{_etiquetas(pares)} {_num(v)}")
+                continue
+            acumulado = 0
+            for limite, n in zip(BUCKETS + ("+Inf",), v[:-1]):
+                acumulado += n
+                lineas.append(f"{familia}_bucket{_etiquetas(pares + (('le', str(limite)),))} {acumulado}")
+            lineas.append(f"{familia}_sum{_etiquetas(pares)} {_num(v[-1])}")
+            lineas.append(f"{familia}_count{_etiquetas(pares)} {acumulado}")
+    for nombre, ayuda, valores in instantaneas:
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} gauge"]
+        for pares, v in valores:
+            lineas.append(f"{nombre}{_etiquetas(tuple(pares.items()))} {_num(v)}")
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,303 @@
+"""Bandeja de salida de emails: cola en disco + remitente en segundo plano.
+
+Antes cada aviso y cada backup abría su propia conexión SMTP (STARTTLS +
+login) dentro del hilo del scheduler, y si el envío fallaba solo quedaba un
+print. Ahora encolar() deja el mensaje ya armado en `data/outbox/pendientes/`
+(un archivo por mensaje, escrito atómico) y vuelve enseguida; el remitente lo
+manda después por una conexión autenticada que se reutiliza mientras haya
+trabajo.
+
+- El nombre del archivo empieza con el instante en que toca (re)intentarlo,
+  así el listado del directorio ya está ordenado y no hay que abrir los
+  archivos para saber cuáles están listos.
+- Para mandar, el mensaje se mueve a `enviando/` (rename atómico): si el
+  proceso muere a mitad, al arrancar vuelve a `pendientes/`.
+- Un error transitorio (conexión, 4xx) reprograma con backoff exponencial;
+  uno permanente (5xx, destinatarios rechazados) o agotar OUTBOX_INTENTOS
+  lo pasa a `muertos/`, de donde se puede reintentar a mano.
+
+SMTP_STARTTLS=false y SMTP_PASSWORD vacío permiten probarlo contra un SMTP
+local de prueba (p. ej. `python -m aiosmtpd -n -l localhost:8025`).
+"""
+
+import json
+import os
+import smtplib
+import threading
+import time
+import uuid
+
+import metricas
+import storage
+
+LOTE = int(os.environ.get("OUTBOX_LOTE", 20))
+INTENTOS = int(os.environ.get("OUTBOX_INTENTOS", 8))
+BACKOFF_BASE = float(os.environ.get("OUTBOX_BACKOFF", 30))
+BACKOFF_MAX = float(os.environ.get("OUTBOX_BACKOFF_MAX", 3600))
+SMTP_INACTIVO = float(os.environ.get("OUTBOX_SMTP_INACTIVO", 60))
+SMTP_TIMEOUT = float(os.environ.get("OUTBOX_SMTP_TIMEOUT", 30))
+STARTTLS = os.environ.get("SMTP_STARTTLS", "true") == "true"
+
+PENDIENTES, ENVIANDO, MUERTOS = "pendientes", "enviando", "muertos"
+
+
+class ErrorPermanente(Exception):
+    """El servidor rechazó el mensaje de forma definitiva: no tiene sentido reintentar."""
+
+
+def _nombre(cuando, id_):
+    return f"{int(cuando * 1000):015d}-{id_}.json"
+
+
+def _cuando(nombre):
+    try:
+        return int(nombre.split("-", 1)[0]) / 1000
+    except ValueError:
+        return 0.0
+
+
+class Outbox:
+    def __init__(self, carpeta, smtp_config):
+        self.carpeta = carpeta
+        self.smtp_config = smtp_config
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._hilo = None
+        self._smtp = None
+        self._smtp_uso = 0.0
+        self._stats = {"encolados": 0, "enviados": 0, "reintentos": 0, "muertos": 0,
+                       "conexiones": 0, "latencia_ms_ultima": None, "latencia_ms_media": None}
+        for sub in (PENDIENTES, ENVIANDO, MUERTOS):
+            os.makedirs(os.path.join(carpeta, sub), exist_ok=True)
+
+    def _ruta(self, sub, nombre=""):
+        return os.path.join(self.carpeta, sub, nombre)
+
+    def _listar(self, sub):
+        try:
+            return sorted(n for n in os.listdir(self._ruta(sub)) if n.endswith(".json"))
+        except FileNotFoundError:
+            return []
+
+    def _recuperar(self):
+        """Lo que quedó en `enviando/` por una caída vuelve a la cola.
+
+        Solo lo hace quien va a mandar (iniciar/drenar): un proceso que solo
+        encola no debe tocar lo que otro está enviando.
+        """
+        for n in self._listar(ENVIANDO):
+            try:
+                os.replace(self._ruta(ENVIANDO, n), self._ruta(PENDIENTES, n))
+            except FileNotFoundError:
+                pass
+
+    # --- cola ---
+    def encolar(self, mensaje, destinatarios, remitente=None):
+        """Deja `mensaje` (email.message.Message) en la cola; devuelve su id."""
+        if not destinatarios:
+            return None
+        id_ = uuid.uuid4().hex[:12]
+        ahora = time.time()
+        storage.escribir_atomico(self._ruta(PENDIENTES, _nombre(ahora, id_)), {
+            "id": id_,
+            "creado": ahora,
+            "intentos": 0,
+            "de": remitente or self.smtp_config["EMAIL"],
+            "para": list(destinatarios),
+            "asunto": str(mensaje.get("Subject", "")),
+            "mensaje": mensaje.as_string(),
+            "ultimo_error": None,
+        }, indent=None)
+        with self._lock:
+            self._stats["encolados"] += 1
+        self._despertar.set()
+        return id_
+
+    def _tomar(self, ahora):
+        """Reclama hasta LOTE mensajes listos (los mueve a `enviando/`)."""
+        lote = []
+        for n in self._listar(PENDIENTES):
+            if _cuando(n) > ahora or len(lote) >= LOTE:
+                break
+            try:
+                os.replace(self._ruta(PENDIENTES, n), self._ruta(ENVIANDO, n))
+            except FileNotFoundError:
+                continue  # lo tomó otro proceso
+            try:
+                with open(self._ruta(ENVIANDO, n), "r", encoding="utf-8") as f:
+                    lote.append((n, json.load(f)))
+            except ValueError:
+                os.replace(self._ruta(ENVIANDO, n), self._ruta(MUERTOS, n))
+        return lote
+
+    # --- SMTP ---
+    def _conexion(self):
+        if self._smtp is not None and time.time() - self._smtp_uso > SMTP_INACTIVO:
+            self._cerrar()
+        if self._smtp is None:
+            cfg = self.smtp_config
+            smtp = smtplib.SMTP(cfg["SERVER"], cfg["PORT"], timeout=SMTP_TIMEOUT)
+            try:
+                if STARTTLS:
+                    smtp.starttls()
+                if cfg.get("PASSWORD"):
+                    smtp.login(cfg["EMAIL"], cfg["PASSWORD"])
+            except BaseException:
+                smtp.close()
+                raise
+            self._smtp = smtp
+            with self._lock:
+                self._stats["conexiones"] += 1
+        return self._smtp
+
+    def _cerrar(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+    def _enviar(self, m):
+        """Manda un mensaje; si la conexión reutilizada se había caído, reconecta una vez."""
+        for intento in (1, 2):
+            smtp = self._conexion()
+            try:
+                rechazados = smtp.sendmail(m["de"], m["para"], m["mensaje"].encode("utf-8"))
+            except smtplib.SMTPRecipientsRefused as e:
+                raise ErrorPermanente(f"destinatarios rechazados: {list(e.recipients)}")
+            except smtplib.SMTPResponseException as e:
+                if 500 <= e.smtp_code < 600 and not isinstance(e, smtplib.SMTPAuthenticationError):
+                    raise ErrorPermanente(f"{e.smtp_code} {e.smtp_error!r}")
+                self._cerrar()
+                raise
+            except (smtplib.SMTPServerDisconnected, OSError):
+                self._cerrar()
+                if intento == 2:
+                    raise
+                continue
+            self._smtp_uso = time.time()
+            if rechazados:
+                print(f"Outbox {m['id']}: rechazados {list(rechazados)}")
+            return
+
+    # --- remitente ---
+    def procesar(self):
+        """Manda un lote de lo que está listo. Devuelve cuántos mensajes se procesaron."""
+        lote = self._tomar(time.time())
+        caida = None  # si no hay servidor, el resto del lote se reprograma sin esperar timeouts
+        for n, m in lote:
+            if caida:
+                self._reprogramar(n, m, caida)
+                continue
+            inicio = time.monotonic()
+            try:
+                self._enviar(m)
+            except ErrorPermanente as e:
+                metricas.observar("flota_smtp_send_duration_seconds", time.monotonic() - inicio, resultado="rechazado")
+                self._descartar(n, m, str(e))
+            except (smtplib.SMTPConnectError, smtplib.SMTPServerDisconnected, OSError) as e:
+                metricas.observar("flota_smtp_send_duration_seconds", time.monotonic() - inicio, resultado="sin_conexion")
+                caida = f"{type(e).__name__}: {e}"
+                self._reprogramar(n, m, caida)
+            except smtplib.SMTPException as e:
+                metricas.observar("flota_smtp_send_duration_seconds", time.monotonic() - inicio, resultado="error")
+                self._reprogramar(n, m, f"{type(e).__name__}: {e}")
+            else:
+                metricas.observar("flota_smtp_send_duration_seconds", time.monotonic() - inicio, resultado="enviado")
+                os.unlink(self._ruta(ENVIANDO, n))
+                ms = (time.monotonic() - inicio) * 1000
+                with self._lock:
+                    s = self._stats
+                    s["enviados"] += 1
+                    s["latencia_ms_ultima"] = round(ms, 1)
+                    s["latencia_ms_media"] = round(ms if s["latencia_ms_media"] is None else 0.8 * s["latencia_ms_media"] + 0.2 * ms, 1)
+        if lote:
+            metricas.volcar()  # el remitente corre en el líder aunque no atienda pedidos
+        return len(lote)
+
+    def _reprogramar(self, n, m, error):
+        m["intentos"] += 1
+        m["ultimo_error"] = error
+        if m["intentos"] >= INTENTOS:
+            return self._descartar(n, m, error)
+        espera = min(BACKOFF_BASE * 2 ** (m["intentos"] - 1), BACKOFF_MAX)
+        storage.escribir_atomico(self._ruta(PENDIENTES, _nombre(time.time() + espera, m["id"])), m, indent=None)
+        os.unlink(self._ruta(ENVIANDO, n))
+        with self._lock:
+            self._stats["reintentos"] += 1
+        print(f"Outbox {m['id']}: {error} (reintento {m['intentos']} en {int(espera)} s)")
+
+    def _descartar(self, n, m, error):
+        m["ultimo_error"] = error
+        storage.escribir_atomico(self._ruta(MUERTOS, n), m, indent=None)
+        os.unlink(self._ruta(ENVIANDO, n))
+        with self._lock:
+            self._stats["muertos"] += 1
+        print(f"Outbox {m['id']}: descartado ({error})")
+
+    def drenar(self, limite=60):
+        """Manda todo lo que está listo, en este hilo (uso desde la línea de comandos)."""
+        fin = time.time() + limite
+        if self._hilo is None:
+            self._recuperar()
+        try:
+            while time.time() < fin and self.procesar():
+                pass
+        finally:
+            self._cerrar()
+
+    def _bucle(self):
+        while True:
+            try:
+                hubo = self.procesar()
+            except Exception as e:  # el hilo no puede morir por un mensaje raro
+                print(f"Error outbox: {e}")
+                hubo = 0
+            if hubo:
+                continue
+            pendientes = self._listar(PENDIENTES)
+            espera = min(max(_cuando(pendientes[0]) - time.time(), 0.1), SMTP_INACTIVO) if pendientes else SMTP_INACTIVO
+            if not self._despertar.wait(espera):
+                if self._smtp is not None and time.time() - self._smtp_uso > SMTP_INACTIVO:
+                    self._cerrar()
+            self._despertar.clear()
+
+    def iniciar(self):
+        """Arranca el remitente en segundo plano (una vez por proceso)."""
+        with self._lock:
+            if self._hilo is None:
+                self._recuperar()
+                self._hilo = threading.Thread(target=self._bucle, name="outbox", daemon=True)
+                self._hilo.start()
+
+    # --- administración ---
+    def reintentar_muertos(self):
+        """Devuelve a la cola todo lo que está en `muertos/`, con los intentos en cero."""
+        cantidad = 0
+        for n in self._listar(MUERTOS):
+            ruta = self._ruta(MUERTOS, n)
+            try:
+                with open(ruta, "r", encoding="utf-8") as f:
+                    m = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            m["intentos"] = 0
+            storage.escribir_atomico(self._ruta(PENDIENTES, _nombre(time.time(), m["id"])), m, indent=None)
+            os.unlink(ruta)
+            cantidad += 1
+        if cantidad:
+            self._despertar.set()
+        return cantidad
+
+    def estadisticas(self):
+        pendientes = self._listar(PENDIENTES)
+        with self._lock:
+            s = dict(self._stats)
+        s.update(pendientes=len(pendientes), enviando=len(self._listar(ENVIANDO)),
+                 en_muertos=len(self._listar(MUERTOS)), conectado=self._smtp is not None,
+                 remitente_activo=self._hilo is not None)
+        if pendientes:
+            s["proximo_en_s"] = round(max(_cuando(pendientes[0]) - time.time(), 0), 1)
+        return s
@@ -0,0 +1,536 @@
+let FLOTA_DATA = []; let CONFIG = { diasAviso: 30 }; let CONFIG_ETAG = null; let USUARIOS_VERSION = {}; let HISTORIAL = null; let selectedTruckId = null;
+let currentFilter = 'all'; let currentTipo = 'km'; let chartsVisible = false; // currentTipo: 'km'=camiones, 'horas'=máquinas
+let chartKm = null; let chartVenc = null;
+// Estados calculados en el server (/api/flota/status): ESTADOS por id de unidad y RESUMEN con contadores y vencimientos a 90 días.
+let ESTADOS = {}; let RESUMEN = null;
+
+// --- DARK MODE ---
+if (localStorage.getItem('darkMode') === 'dark') document.documentElement.classList.add('dark');
+function toggleDarkMode() {
+    const isDark = document.documentElement.classList.toggle('dark');
+    localStorage.setItem('darkMode', isDark ? 'dark' : 'light');
+    updateDarkModeUI();
+    if (chartsVisible) renderCharts();
+}
+function updateDarkModeUI() {
+    const isDark = document.documentElement.classList.contains('dark');
+    document.getElementById('dark-label').textContent = isDark ? 'Modo Claro' : 'Modo Oscuro';
+}
+
+// --- TOAST ---
+function toast(message, type = 'success') {
+    const container = document.getElementById('toast-container');
+    const icons = { success: 'check-circle', error: 'alert-circle', info: 'info' };
+    const t = document.createElement('div');
+    t.className = `toast toast-${type}`;
+    t.innerHTML = `<i data-lucide="${icons[type] || 'info'}" class="w-5 h-5 flex-shrink-0"></i><span>${message}</span>`;
+    container.appendChild(t); lucide.createIcons();
+    setTimeout(() => { t.classList.add('toast-exit'); setTimeout(() => t.remove(), 300); }, 3000);
+}
+
+// --- INIT ---
+window.onload = function() { lucide.createIcons(); cargarTodo(); applyPermissions(); updateDarkModeUI(); };
+function toggleSidebar() { document.getElementById('sidebar').classList.toggle('hidden'); document.getElementById('sidebar').classList.toggle('mobile-menu-open'); }
+function closeModal(id) { document.getElementById(id).classList.add('hidden'); }
+
+function applyPermissions() {
+    if (USER_ROLE !== 'admin') {
+        document.querySelectorAll('.admin-only').forEach(el => el.classList.add('hidden'));
+        document.querySelectorAll('input, textarea, select').forEach(el => { if(el.id !== 'search-input') el.disabled = true; });
+    }
+}
+
+async function cargarTodo() {
+    try {
+        const [resConf, resFlota] = await Promise.all([fetch('/api/config'), fetch('/api/flota')]);
+        if(resConf.ok) { CONFIG_ETAG = resConf.headers.get('ETag'); CONFIG = await resConf.json(); document.getElementById('config-dias').value = CONFIG.diasAviso || 30; document.getElementById('config-email').value = CONFIG.emailAlertas || ''; }
+        let rawData = await resFlota.json();
+        FLOTA_DATA = rawData.map(normalizarUnidad);
+        CAMBIOS_CURSOR = resFlota.headers.get('X-Cambios-Cursor'); escucharCambios();
+        await cargarEstados();
+    } catch (e) { console.error(e); toast('Error cargando datos', 'error'); }
+}
+
+// Con `ids` se piden solo esas unidades (las que cambiaron); los contadores vienen siempre.
+async function cargarEstados(ids) {
+    if (ids && ids.length > 200) ids = undefined;
+    try {
+        const res = await fetch('/api/flota/status' + (ids ? '?ids=' + ids.join(',') : ''));
+        if (res.ok) {
+            RESUMEN = await res.json();
+            if (ids) ids.forEach(id => { delete ESTADOS[id]; }); else ESTADOS = {};
+            RESUMEN.items.forEach(e => { ESTADOS[parseInt(e.id)] = e; });
+        }
+    } catch (e) { console.error(e); }
+    renderDashboard(); updateAlertCount();
+}
+// Tras un cambio local la unidad se evalúa en el navegador hasta que vuelve el estado del server.
+function invalidarEstados(id) {
+    if (id === undefined) ESTADOS = {}; else delete ESTADOS[id];
+    RESUMEN = null;
+    cargarEstados(id === undefined ? undefined : [id]);
+}
+
+const normalizarUnidad = (c) => ({ ...c, id: parseInt(c.id), tipo_medidor: c.tipo_medidor || 'km', service: c.service || { ultimo_fecha: "", ultimo_km: 0, intervalo_km: 10000 }, vencimientos: c.vencimientos || {} });
+
+const reemplazarUnidad = (unidad) => {
+    const u = normalizarUnidad(unidad);
+    const i = FLOTA_DATA.findIndex(x => x.id === u.id);
+    if (i >= 0) FLOTA_DATA[i] = u; else FLOTA_DATA.push(u);
+    invalidarEstados(u.id);
+    return u;
+};
+// --- CAMBIOS EN VIVO ---
+// /api/flota trae el cursor del feed (X-Cambios-Cursor) y /api/changes manda, por SSE, solo las
+// unidades que otro usuario cambió después. Con `reset` (cursor vencido) se recarga todo.
+let CAMBIOS_CURSOR = null; let FEED = null;
+function escucharCambios() {
+    if (FEED) { FEED.close(); FEED = null; }
+    if (!CAMBIOS_CURSOR || !window.EventSource) return;
+    FEED = new EventSource('/api/changes?since=' + encodeURIComponent(CAMBIOS_CURSOR));
+    FEED.addEventListener('cambios', (e) => { CAMBIOS_CURSOR = e.lastEventId; aplicarCambios(JSON.parse(e.data).cambios); });
+    FEED.addEventListener('reset', () => { FEED.close(); FEED = null; cargarTodo(); });
+    // 503 (sin cupo en el server) o sesión vencida: EventSource no reintenta solo.
+    FEED.onerror = () => { if (FEED && FEED.readyState === EventSource.CLOSED) { FEED = null; setTimeout(escucharCambios, 30000); } };
+}
+function aplicarCambios(cambios) {
+    const cambiados = []; let detalle = false;
+    cambios.forEach(({ id, unidad }) => {
+        id = parseInt(id);
+        const i = FLOTA_DATA.findIndex(x => x.id === id);
+        if (!unidad) { if (i < 0) return; FLOTA_DATA.splice(i, 1); }
+        else if (i < 0) FLOTA_DATA.push(normalizarUnidad(unidad));
+        else if ((unidad.version || 0) > (FLOTA_DATA[i].version || 0)) FLOTA_DATA[i] = normalizarUnidad(unidad);
+        else return; // el eco de un cambio propio (ya aplicado con la respuesta)
+        delete ESTADOS[id]; cambiados.push(id);
+        if (id === selectedTruckId) detalle = true;
+    });
+    if (!cambiados.length) return;
+    if (detalle && !document.getElementById('view-detail').classList.contains('hidden')) {
+        if (FLOTA_DATA.some(x => x.id === selectedTruckId)) { toast('Otro usuario modificó esta unidad', 'error'); renderDetailView(); }
+        else { toast('Otro usuario eliminó esta unidad', 'error'); showDashboard(); }
+    }
+    RESUMEN = null; cargarEstados(cambiados);
+}
+
+// Si otro usuario cambió la unidad (409), se muestra la versión del server y no se pisa nada.
+async function conflictoUnidad(res) {
+    const data = await res.json();
+    if (data.unidad) { reemplazarUnidad(data.unidad); if (selectedTruckId === parseInt(data.unidad.id)) renderDetailView(); }
+    toast(data.message || "La unidad cambió, revisá y volvé a intentar", "error");
+}
+
+// Cada acción manda solo el cambio de una unidad, con la versión editada en If-Match;
+// el server devuelve la unidad actualizada.
+async function guardarUnidad(method, url, body) {
+    if(USER_ROLE !== 'admin') { toast("Modo Lectura", "error"); return null; }
+    try {
+        const opts = { method, headers: {'Content-Type':'application/json'} };
+        if (body !== undefined) opts.body = JSON.stringify(body);
+        const m = url.match(/^\/api\/flota\/(\d+)/);
+        const actual = m && FLOTA_DATA.find(x => x.id === parseInt(m[1]));
+        if (actual) opts.headers['If-Match'] = `"${actual.version || 0}"`;
+        const res = await fetch(url, opts);
+        if(res.status === 409) { await conflictoUnidad(res); return null; }
+        if(!res.ok) { toast("Error al guardar", "error"); return null; }
+        const data = await res.json();
+        return reemplazarUnidad(data.unidad);
+    } catch(e) { toast("Error de conexión", "error"); return null; }
+}
+
+// --- STATUS LOGIC ---
+const checkDate = (d) => { if(!d) return {st:'ERROR', msg:'S/D'}; const diff = Math.ceil((new Date(d)-new Date().setHours(0,0,0,0))/86400000); if (diff < 0) return {st:'DANGER', msg: `VENCIDO (${Math.abs(diff)} d)`}; if (diff <= (CONFIG.diasAviso || 30)) return {st:'WARNING', msg: `Vence en ${diff} d`}; return {st:'OK', msg:'OK'}; };
+const abrevUnidad = (c) => (c && c.tipo_medidor === 'horas') ? 'hs' : 'km';
+const checkService = (c) => { const u = abrevUnidad(c); const umbral = Math.max(Math.round((c.service.intervalo_km||0) * 0.1), 1); const diff = (c.service.ultimo_km + c.service.intervalo_km) - c.km_actual; if (diff < 0) return {st:'DANGER', msg: `VENCIDO (${Math.abs(diff)} ${u})`}; if (diff <= umbral) return {st:'WARNING', msg: `Falta ${diff} ${u}`}; const p = c.service.proyectado; if (p && checkDate(p).st !== 'OK') return {st:'WARNING', msg: `Proyectado ${p.slice(8,10)}/${p.slice(5,7)}`}; return {st:'OK', msg:'OK'}; };
+const badgeCls = (s) => s === 'OK' ? 'badge-ok' : s === 'WARNING' ? 'badge-warn' : s === 'DANGER' ? 'badge-danger' : 'bg-gray-100 text-gray-500';
+const txtCls = (s) => s === 'OK' ? 'text-green-600 font-bold' : s === 'WARNING' ? 'text-amber-600 font-bold' : s === 'DANGER' ? 'text-red-600 font-bold' : 'text-gray-400';
+
+// Preferir lo que calculó el server; checkDate/checkService quedan como respaldo.
+const estadoService = (c) => { const e = ESTADOS[c.id]; return e ? { st: e.service.estado, msg: e.service.mensaje } : checkService(c); };
+const estadoVenc = (c, k, v) => { const e = ESTADOS[c.id] && ESTADOS[c.id].vencimientos[k]; return (e && e.fecha === v) ? { st: e.estado, msg: e.mensaje } : checkDate(v); };
+
+function getWorstState(c) {
+    if (ESTADOS[c.id]) return ESTADOS[c.id].estado;
+    const states = [checkService(c).st, ...Object.values(c.vencimientos).filter(v=>v).map(v=>checkDate(v).st)];
+    if (states.includes('DANGER')) return 'DANGER';
+    if (states.includes('WARNING')) return 'WARNING';
+    return 'OK';
+}
+
+// --- FILTERS ---
+function setFilter(f) {
+    currentFilter = f;
+    document.querySelectorAll('.filter-btn[data-filter]').forEach(b => {
+        b.classList.toggle('active', b.dataset.filter === f);
+        if (b.dataset.filter === f) { b.classList.remove('bg-white', 'dark:bg-gray-800', 'text-gray-500', 'dark:text-gray-400'); }
+        else { b.classList.add('bg-white', 'dark:bg-gray-800', 'text-gray-500', 'dark:text-gray-400'); }
+    });
+    renderDashboard();
+}
+
+// --- CHARTS ---
+function toggleCharts() { chartsVisible = !chartsVisible; document.getElementById('charts-section').classList.toggle('hidden', !chartsVisible); if (chartsVisible) renderCharts(); }
+function renderCharts() {
+    const isDark = document.documentElement.classList.contains('dark');
+    const textColor = isDark ? '#9ca3af' : '#6b7280';
+    const gridColor = isDark ? '#374151' : '#f3f4f6';
+    Chart.defaults.color = textColor;
+    // Solo las unidades de la sección activa (camiones u máquinas)
+    const dataSet = FLOTA_DATA.filter(c => (c.tipo_medidor||'km') === currentTipo);
+    const esHoras = currentTipo === 'horas';
+    const titEl = document.getElementById('chart-km-title');
+    if (titEl) titEl.textContent = esHoras ? 'Horas por Unidad' : 'Kilometraje por Unidad';
+    // KM/HS Chart
+    if (chartKm) chartKm.destroy();
+    const kmCtx = document.getElementById('chart-km').getContext('2d');
+    chartKm = new Chart(kmCtx, { type: 'bar', data: { labels: dataSet.map(c => c.patente), datasets: [{ label: esHoras ? 'Horas' : 'Kilómetros', data: dataSet.map(c => c.km_actual), backgroundColor: dataSet.map(c => { const s = getWorstState(c); return s === 'DANGER' ? '#ef4444' : s === 'WARNING' ? '#f59e0b' : '#22c55e'; }), borderRadius: 8, borderSkipped: false }] }, options: { responsive: true, plugins: { legend: { display: false } }, scales: { y: { grid: { color: gridColor }, beginAtZero: true }, x: { grid: { display: false } } } } });
+    // Vencimientos Chart
+    if (chartVenc) chartVenc.destroy();
+    let vencData = [];
+    if (RESUMEN) {
+        const ids = new Set(dataSet.map(c => c.id));
+        vencData = RESUMEN.vencimientos_90.filter(v => ids.has(parseInt(v.unidad_id))).map(v => ({ label: `${v.patente} - ${v.tipo.replace(/_/g,' ')}`, days: v.dias, st: v.estado }));
+    } else {
+        dataSet.forEach(c => { Object.entries(c.vencimientos).forEach(([k,v]) => { if(!v) return; const diff = Math.ceil((new Date(v)-new Date().setHours(0,0,0,0))/86400000); if (diff <= 90) vencData.push({ label: `${c.patente} - ${k.replace(/_/g,' ')}`, days: diff, st: checkDate(v).st }); }); });
+        vencData.sort((a,b) => a.days - b.days);
+    }
+    const vencCtx = document.getElementById('chart-vencimientos').getContext('2d');
+    chartVenc = new Chart(vencCtx, { type: 'bar', data: { labels: vencData.map(v => v.label), datasets: [{ label: 'Días', data: vencData.map(v => v.days), backgroundColor: vencData.map(v => v.st === 'DANGER' ? '#ef4444' : v.st === 'WARNING' ? '#f59e0b' : '#22c55e'), borderRadius: 6, borderSkipped: false }] }, options: { indexAxis: 'y', responsive: true, plugins: { legend: { display: false } }, scales: { x: { grid: { color: gridColor } }, y: { grid: { display: false } } } } });
+}
+
+// --- NOTIFICATION BELL ---
+function updateAlertCount() {
+    let count = 0;
+    if (RESUMEN) count = RESUMEN.alertas;
+    else FLOTA_DATA.filter(c => c.activo !== false).forEach(c => { if (checkService(c).st === 'DANGER') count++; Object.values(c.vencimientos).forEach(v => { if(v && checkDate(v).st === 'DANGER') count++; }); });
+    ['sidebar-alert-badge', 'mobile-alert-badge'].forEach(id => {
+        const el = document.getElementById(id);
+        if (count > 0) { el.classList.remove('hidden'); el.textContent = count > 99 ? '99+' : count; }
+        else { el.classList.add('hidden'); }
+    });
+}
+function toggleNotificationPanel() {
+    const panel = document.getElementById('notif-panel');
+    const overlay = document.getElementById('notif-overlay');
+    const isOpen = panel.classList.contains('open');
+    if (isOpen) { panel.classList.remove('open'); overlay.classList.add('hidden'); }
+    else { panel.classList.add('open'); overlay.classList.remove('hidden'); renderNotifications(); }
+    lucide.createIcons();
+}
+function renderNotifications() {
+    const list = document.getElementById('notification-list');
+    let items = [];
+    FLOTA_DATA.filter(c => c.activo !== false).forEach(c => {
+        const sv = estadoService(c);
+        if (sv.st === 'DANGER' || sv.st === 'WARNING') items.push({ truckId: c.id, patente: c.patente, tipo: 'Service', msg: sv.msg, st: sv.st });
+        Object.entries(c.vencimientos).forEach(([k,v]) => { if(!v) return; const st = estadoVenc(c, k, v); if (st.st === 'DANGER' || st.st === 'WARNING') items.push({ truckId: c.id, patente: c.patente, tipo: k.replace(/_/g,' '), msg: st.msg, st: st.st }); });
+    });
+    items.sort((a,b) => (a.st === 'DANGER' ? 0 : 1) - (b.st === 'DANGER' ? 0 : 1));
+    if (items.length === 0) { list.innerHTML = '<p class="text-gray-400 text-sm text-center py-8">Sin alertas activas</p>'; return; }
+    list.innerHTML = items.map(i => `<div onclick="toggleNotificationPanel();showDetail(${i.truckId})" class="p-3 rounded-xl border ${i.st === 'DANGER' ? 'border-red-200 dark:border-red-800 bg-red-50 dark:bg-red-900/20' : 'border-amber-200 dark:border-amber-800 bg-amber-50 dark:bg-amber-900/20'} cursor-pointer hover:shadow-sm transition-all">
+        <div class="flex justify-between items-start"><span class="font-bold text-sm text-gray-900 dark:text-white">${i.patente}</span><span class="px-2 py-0.5 rounded-md text-[10px] font-bold ${badgeCls(i.st)}">${i.st === 'DANGER' ? 'URGENTE' : 'ATENCIÓN'}</span></div>
+        <p class="text-xs text-gray-500 dark:text-gray-400 mt-1 capitalize">${i.tipo}</p>
+        <p class="text-xs font-medium ${txtCls(i.st)} mt-0.5">${i.msg}</p>
+    </div>`).join('');
+    lucide.createIcons();
+}
+
+// --- DASHBOARD RENDER ---
+function renderDashboard() {
+    const grid = document.getElementById('trucks-grid'); grid.innerHTML = '';
+    const term = document.getElementById('search-input').value.toLowerCase();
+    // Solo las unidades de la sección activa (camiones u máquinas)
+    const delTipo = FLOTA_DATA.filter(c => (c.tipo_medidor||'km') === currentTipo);
+    let att = 0;
+    if (RESUMEN) att = (RESUMEN.contadores[currentTipo] || {}).danger || 0;
+    else delTipo.forEach(c => { if (getWorstState(c) === 'DANGER') att++; });
+    document.getElementById('stat-total').innerText = delTipo.length;
+    document.getElementById('stat-attention').innerText = att;
+    document.getElementById('stat-ok').innerText = delTipo.length - att;
+
+    let filtered = delTipo.filter(c => c.patente.toLowerCase().includes(term) || c.descripcion.toLowerCase().includes(term));
+    if (currentFilter !== 'all') filtered = filtered.filter(c => { const ws = getWorstState(c); return currentFilter === 'danger' ? ws === 'DANGER' : currentFilter === 'warning' ? ws === 'WARNING' : ws === 'OK'; });
+
+    if(filtered.length === 0) { const vacio = delTipo.length === 0 ? (currentTipo === 'horas' ? 'No hay máquinas cargadas todavía' : 'No hay camiones cargados todavía') : 'No se encontraron unidades'; grid.innerHTML = `<div class="col-span-full text-center py-16 text-gray-400 dark:text-gray-500"><i data-lucide="search-x" class="w-12 h-12 mx-auto mb-3 text-gray-300 dark:text-gray-600"></i><p>${vacio}</p></div>`; lucide.createIcons(); return; }
+
+    filtered.forEach(c => {
+        let vHtml = '';
+        Object.entries(c.vencimientos).forEach(([k,v]) => { if(!v) return; const st = estadoVenc(c, k, v); let label = k.replace('filtro_comanry', 'F. Comanry').replace(/_/g,' '); vHtml += `<div class="venc-row flex justify-between items-center py-1.5 px-2 rounded-lg text-xs"><span class="text-gray-500 dark:text-gray-400 capitalize truncate mr-2">${label}</span><span class="px-2 py-0.5 rounded-md text-[10px] font-bold whitespace-nowrap ${badgeCls(st.st)}">${st.msg}</span></div>`; });
+        const sv = estadoService(c);
+        const ws = getWorstState(c);
+        const isActivo = c.activo !== false;
+        const borderColor = !isActivo ? 'border-l-gray-300' : ws === 'DANGER' ? 'border-l-red-500' : ws === 'WARNING' ? 'border-l-amber-400' : 'border-l-green-400';
+        const card = document.createElement('div');
+        card.className = `truck-card bg-white dark:bg-gray-800 rounded-2xl shadow-sm border border-gray-100 dark:border-gray-700 border-l-4 ${borderColor} overflow-hidden cursor-pointer ${!isActivo ? 'opacity-50' : ''}`;
+        card.onclick = () => showDetail(c.id);
+        const inactivoBadge = !isActivo ? '<span class="text-[10px] px-2 py-0.5 rounded-md bg-gray-200 dark:bg-gray-600 text-gray-500 dark:text-gray-400 font-bold">INACTIVO</span>' : '';
+        card.innerHTML = `<div class="p-5"><div class="flex justify-between items-start mb-3"><div><h3 class="font-extrabold text-gray-900 dark:text-white text-lg tracking-tight">${c.patente} ${inactivoBadge}</h3><p class="text-xs text-gray-400 dark:text-gray-500 mt-0.5">${c.descripcion}</p></div><span class="text-[10px] px-2 py-1 rounded-lg bg-gray-100 dark:bg-gray-700 text-gray-400 font-mono">#${c.id}</span></div><div class="flex items-center justify-between mb-3 bg-gray-50 dark:bg-gray-700 rounded-xl px-3 py-2"><div class="flex items-center gap-2"><i data-lucide="gauge" class="w-4 h-4 text-gray-400"></i><span class="text-xs text-gray-500 dark:text-gray-400">${c.tipo_medidor==='horas'?'HS':'KM'}</span></div><span class="font-mono font-bold text-lg text-gray-900 dark:text-white">${formatNumber(c.km_actual)}</span></div><div class="flex items-center justify-between mb-3"><span class="text-xs font-medium text-gray-500 dark:text-gray-400 flex items-center gap-1"><i data-lucide="wrench" class="w-3 h-3"></i>Service</span><span class="px-2.5 py-1 rounded-lg text-xs font-bold ${badgeCls(sv.st)}">${sv.msg}</span></div>${vHtml ? `<div class="border-t border-gray-100 dark:border-gray-700 pt-2 mt-2 space-y-0.5">${vHtml}</div>` : ''}</div><div class="bg-gray-50 dark:bg-gray-700/50 border-t border-gray-100 dark:border-gray-700 px-5 py-2.5 text-center"><span class="text-xs font-bold text-brand-green dark:text-green-400 flex items-center justify-center gap-1">Ver detalles <i data-lucide="arrow-right" class="w-3 h-3"></i></span></div>`;
+        grid.appendChild(card);
+    });
+    lucide.createIcons();
+    if (chartsVisible) renderCharts();
+}
+
+// --- DETAIL VIEW ---
+function renderDetailView() {
+    const c = FLOTA_DATA.find(x => x.id === selectedTruckId);
+    document.getElementById('input-patente').value = c.patente;
+    document.getElementById('input-descripcion').value = c.descripcion;
+    document.getElementById('input-km-actual').value = c.km_actual;
+    document.getElementById('input-intervalo').value = c.service.intervalo_km;
+    // Etiquetas según el medidor (km para camiones, horas para máquinas)
+    const esMaqDet = c.tipo_medidor === 'horas';
+    document.getElementById('label-patente').textContent = esMaqDet ? 'Nombre' : 'Patente';
+    document.getElementById('label-km-detalle').textContent = esMaqDet ? 'Horas' : 'Kilómetros';
+    document.getElementById('label-service-km').textContent = esMaqDet ? 'Horas' : 'Kilómetros';
+    document.getElementById('label-intervalo-detalle').textContent = esMaqDet ? 'Service cada (hs)' : 'Service cada (km)';
+    document.getElementById('input-patente').classList.toggle('uppercase', !esMaqDet);
+    if (HISTORIAL && HISTORIAL.id === c.id) renderHistorial(); else cargarHistorial();
+    const vc = document.getElementById('vencimientos-container'); vc.innerHTML = '';
+    Object.entries(c.vencimientos).forEach(([k, v]) => {
+        const st = estadoVenc(c, k, v);
+        let delBtn = USER_ROLE === 'admin' ? `<button onclick="deleteExpiration('${k}')" class="text-gray-300 hover:text-red-500 transition-colors"><i data-lucide="x" class="w-3 h-3"></i></button>` : '';
+        let label = k.replace('filtro_comanry', 'F. Comanry').replace(/_/g,' ');
+        vc.innerHTML += `<div class="bg-gray-50 dark:bg-gray-700 rounded-xl p-3"><label class="flex justify-between text-[10px] font-bold text-gray-400 uppercase tracking-wider mb-1.5"><div class="flex items-center gap-1.5"><span>${label}</span>${delBtn}</div><span class="px-2 py-0.5 rounded-md ${badgeCls(st.st)}">${st.msg}</span></label><div class="flex gap-2"><input type="date" id="venc-${k}" value="${v}" class="flex-1 border border-gray-200 dark:border-gray-600 rounded-lg px-3 py-1.5 text-xs bg-white dark:bg-gray-600 dark:text-white focus:outline-none focus:ring-2 focus:ring-brand-green-light/30" ${USER_ROLE!=='admin'?'disabled':''}><button onclick="handleGeneralUpdate(event)" class="admin-only bg-white dark:bg-gray-600 border border-gray-200 dark:border-gray-500 px-2 rounded-lg hover:bg-gray-100 dark:hover:bg-gray-500 transition-colors"><i data-lucide="save" class="w-3 h-3 text-gray-500 dark:text-gray-300"></i></button></div></div>`;
+    });
+    const ss = estadoService(c);
+    // Fecha proyectada por el ritmo de uso (medidores.py), si hay lecturas suficientes.
+    const proy = c.service.proyectado ? ` · service ~${c.service.proyectado.split('-').reverse().join('/')} (${formatNumber(c.service.tasa_dia)} ${abrevUnidad(c)}/día)` : '';
+    document.getElementById('status-km-label').innerText = ss.msg + proy;
+    document.getElementById('status-km-label').className = txtCls(ss.st) + ' text-sm';
+    // Toggle activo/inactivo
+    const isActivo = c.activo !== false;
+    const btnToggle = document.getElementById('btn-toggle-activo');
+    if (btnToggle) {
+        if (isActivo) {
+            btnToggle.className = 'bg-amber-500 hover:bg-amber-600 text-white px-4 py-2 rounded-xl text-sm font-medium flex items-center gap-1.5 transition-colors';
+            btnToggle.innerHTML = '<i data-lucide="pause-circle" class="w-4 h-4"></i> Dar de baja';
+        } else {
+            btnToggle.className = 'bg-green-500 hover:bg-green-600 text-white px-4 py-2 rounded-xl text-sm font-medium flex items-center gap-1.5 transition-colors';
+            btnToggle.innerHTML = '<i data-lucide="play-circle" class="w-4 h-4"></i> Reactivar';
+        }
+    }
+    applyPermissions(); lucide.createIcons();
+}
+
+// --- HISTORIAL (se pide aparte y por páginas, solo al abrir el detalle) ---
+async function cargarHistorial(cursor) {
+    const id = selectedTruckId;
+    if (!cursor) HISTORIAL = { id, items: [], next: null, cargando: true };
+    renderHistorial();
+    try {
+        const res = await fetch(`/api/flota/${id}/historial?limit=50` + (cursor ? `&cursor=${cursor}` : ''));
+        if (!res.ok || !HISTORIAL || HISTORIAL.id !== id) return;
+        const data = await res.json();
+        HISTORIAL.items = HISTORIAL.items.concat(data.items);
+        HISTORIAL.next = data.next_cursor;
+    } catch (e) { console.error(e); }
+    if (HISTORIAL && HISTORIAL.id === id) { HISTORIAL.cargando = false; renderHistorial(); }
+}
+function renderHistorial() {
+    const hl = document.getElementById('history-list');
+    if (HISTORIAL.cargando && !HISTORIAL.items.length) { hl.innerHTML = '<p class="p-6 text-gray-300 dark:text-gray-500 text-sm text-center">Cargando…</p>'; return; }
+    hl.innerHTML = HISTORIAL.items.length ? '' : '<p class="p-6 text-gray-300 dark:text-gray-500 text-sm text-center">Sin historial registrado</p>';
+    HISTORIAL.items.forEach(h => {
+        const typeColors = { 'Service': 'bg-green-100 text-green-700 dark:bg-green-900/40 dark:text-green-400', 'Reparación': 'bg-red-100 text-red-700 dark:bg-red-900/40 dark:text-red-400', 'Documentación': 'bg-blue-100 text-blue-700 dark:bg-blue-900/40 dark:text-blue-400' };
+        const typeClass = typeColors[h.tipo] || 'bg-gray-100 text-gray-700 dark:bg-gray-700 dark:text-gray-300';
+        let btns = USER_ROLE === 'admin' ? `<div class="flex gap-1 opacity-0 group-hover:opacity-100 transition-opacity"><button onclick="openHistoryModal(${h.eid})" class="text-gray-400 hover:text-blue-500 p-1"><i data-lucide="pencil" class="w-3.5 h-3.5"></i></button><button onclick="deleteHistoryItem(${h.eid})" class="text-gray-400 hover:text-red-500 p-1"><i data-lucide="trash-2" class="w-3.5 h-3.5"></i></button></div>` : '';
+        hl.innerHTML += `<li class="px-5 py-3 group flex justify-between items-start hover:bg-gray-50 dark:hover:bg-gray-700/50 transition-colors"><div class="flex-1"><div class="flex items-center gap-2 mb-1"><span class="text-[10px] font-bold px-2 py-0.5 rounded-md ${typeClass}">${h.tipo}</span><span class="text-xs text-gray-400">${h.fecha}</span></div><p class="text-sm text-gray-600 dark:text-gray-300">${h.detalle}</p></div>${btns}</li>`;
+    });
+    if (HISTORIAL.next) hl.innerHTML += `<li class="px-5 py-3 text-center"><button onclick="cargarHistorial(${HISTORIAL.next})" class="text-xs font-medium text-brand-green hover:underline">Ver más</button></li>`;
+    lucide.createIcons();
+}
+// Alta (eid -1), edición o baja de un evento; actualiza la lista ya cargada sin volver a pedirla.
+async function guardarEvento(method, eid, body) {
+    if(USER_ROLE !== 'admin') { toast("Modo Lectura", "error"); return false; }
+    const url = `/api/flota/${selectedTruckId}/historial` + (eid === -1 ? '' : `/${eid}`);
+    try {
+        const opts = { method, headers: {'Content-Type':'application/json'} };
+        if (body !== undefined) opts.body = JSON.stringify(body);
+        const res = await fetch(url, opts);
+        if(!res.ok) { toast("Error al guardar", "error"); return false; }
+        const data = await res.json();
+        if (HISTORIAL && HISTORIAL.id === selectedTruckId) {
+            if (method === 'POST') HISTORIAL.items.unshift(data.evento);
+            else if (method === 'PUT') HISTORIAL.items = HISTORIAL.items.map(h => h.eid === data.evento.eid ? data.evento : h);
+            else HISTORIAL.items = HISTORIAL.items.filter(h => h.eid !== eid);
+        }
+        return true;
+    } catch(e) { toast("Error de conexión", "error"); return false; }
+}
+
+// --- HANDLERS ---
+const formatNumber = (n) => new Intl.NumberFormat('es-AR').format(n||0);
+function showDashboard(tipo) {
+    if (tipo) currentTipo = tipo;
+    // Menú activo
+    ['nav-camiones','nav-maquinas'].forEach(id => { const b = document.getElementById(id); if(!b) return; b.classList.remove('bg-white/10','text-white','font-semibold'); b.classList.add('text-white/60'); });
+    const on = document.getElementById(currentTipo === 'horas' ? 'nav-maquinas' : 'nav-camiones');
+    if (on) { on.classList.remove('text-white/60'); on.classList.add('bg-white/10','text-white','font-semibold'); }
+    // Título de la sección
+    document.getElementById('dash-title').textContent = currentTipo === 'horas' ? 'Máquinas y Equipos' : 'Camiones';
+    document.getElementById('dash-subtitle').textContent = currentTipo === 'horas' ? 'Estado de las máquinas (horas de servicio)' : 'Estado general de la flota';
+    document.getElementById('view-dashboard').classList.remove('hidden'); document.getElementById('view-detail').classList.add('hidden'); document.getElementById('view-settings').classList.add('hidden');
+    renderDashboard(); updateAlertCount();
+}
+function showDetail(id) { selectedTruckId = parseInt(id); document.getElementById('view-dashboard').classList.add('hidden'); document.getElementById('view-detail').classList.remove('hidden'); renderDetailView(); }
+function showSettings() { document.getElementById('view-dashboard').classList.add('hidden'); document.getElementById('view-settings').classList.remove('hidden'); loadUsers(); loadAuditLog(); }
+
+async function handleGeneralUpdate(e) {
+    if(e) e.preventDefault();
+    const cambios = { patente: document.getElementById('input-patente').value, descripcion: document.getElementById('input-descripcion').value, service: {}, vencimientos: {} };
+    const kmEl = document.getElementById('input-km-actual');
+    if (kmEl && kmEl.value !== '') cambios.km_actual = parseInt(kmEl.value);
+    const ivEl = document.getElementById('input-intervalo');
+    if (ivEl && ivEl.value !== '') cambios.service.intervalo_km = parseInt(ivEl.value);
+    document.querySelectorAll('input[id^="venc-"]').forEach(i => cambios.vencimientos[i.id.replace('venc-','')] = i.value);
+    if(await guardarUnidad('PATCH', `/api/flota/${selectedTruckId}`, cambios)) { toast("Guardado"); renderDetailView(); }
+}
+async function handleServiceUpdate(e) {
+    e.preventDefault();
+    const f = document.getElementById('input-service-fecha').value;
+    const k = parseInt(document.getElementById('input-service-km').value);
+    if(await guardarUnidad('POST', `/api/flota/${selectedTruckId}/service`, { fecha: f, km: k })) { HISTORIAL = null; toast("Service registrado"); renderDetailView(); }
+}
+async function addCustomExpiration() {
+    const name = document.getElementById('new-venc-name').value.trim().toLowerCase().replace(/\s+/g, '_');
+    const date = document.getElementById('new-venc-date').value;
+    if(!name || !date) { toast("Completar nombre y fecha", "error"); return; }
+    if(await guardarUnidad('PUT', `/api/flota/${selectedTruckId}/vencimientos/${encodeURIComponent(name)}`, { fecha: date })) { document.getElementById('new-venc-name').value=''; document.getElementById('new-venc-date').value=''; toast("Vencimiento agregado"); renderDetailView(); }
+}
+async function deleteExpiration(key) { if(confirm("¿Borrar?")) { if(await guardarUnidad('DELETE', `/api/flota/${selectedTruckId}/vencimientos/${encodeURIComponent(key)}`)) { toast("Eliminado"); renderDetailView(); } } }
+function openHistoryModal(eid=-1) {
+    document.getElementById('modal-history').classList.remove('hidden');
+    document.getElementById('hist-index').value = eid;
+    if(eid >= 0) { const h = HISTORIAL.items.find(x => x.eid === eid); document.getElementById('hist-fecha').value = h.fecha; document.getElementById('hist-tipo').value = h.tipo; document.getElementById('hist-detalle').value = h.detalle; }
+    else { document.getElementById('hist-fecha').value = ''; document.getElementById('hist-tipo').value = ''; document.getElementById('hist-detalle').value = ''; }
+}
+async function handleHistorySubmit(e) {
+    e.preventDefault();
+    const eid = parseInt(document.getElementById('hist-index').value);
+    const item = { fecha: document.getElementById('hist-fecha').value, tipo: document.getElementById('hist-tipo').value, detalle: document.getElementById('hist-detalle').value };
+    if(await guardarEvento(eid === -1 ? 'POST' : 'PUT', eid, item)) { toast(eid === -1 ? "Evento registrado" : "Evento actualizado"); closeModal('modal-history'); renderHistorial(); }
+}
+async function deleteHistoryItem(eid) { if(confirm("¿Borrar?")) { if(await guardarEvento('DELETE', eid)) { toast("Eliminado"); renderHistorial(); } } }
+async function handleNewUnit(e) {
+    e.preventDefault();
+    const esMaquina = currentTipo === 'horas';
+    const rawNombre = document.getElementById('new-patente').value;
+    const nombre = esMaquina ? rawNombre.trim() : rawNombre.toUpperCase();
+    const contador = parseInt(document.getElementById('new-km').value) || 0;
+    const intervalo = esMaquina ? (parseInt(document.getElementById('new-intervalo').value) || 500) : 10000;
+    const nueva = {
+        patente: nombre, descripcion: document.getElementById('new-descripcion').value,
+        km_actual: contador, tipo_medidor: esMaquina ? 'horas' : 'km',
+        // Máquina: arranca con el último service = horas actuales (asumimos al día); camión mantiene el default histórico.
+        service: esMaquina ? { ultimo_km: contador, intervalo_km: intervalo } : { ultimo_km: 0, intervalo_km: 10000 },
+        vencimientos: esMaquina ? { matafuegos: "", bateria: "" } : {},
+        activo: true
+    };
+    if(await guardarUnidad('POST', '/api/flota', nueva)) { toast(esMaquina ? "Máquina creada" : "Unidad creada"); closeModal('modal-new-unit'); showDashboard(currentTipo); }
+}
+async function saveConfig() {
+    // Sin ETag no se sabe sobre qué versión se editó: se recarga en vez de pisar a ciegas.
+    if(!CONFIG_ETAG) { toast("No se pudo leer la configuración actual; se recargó, revisá y guardá de nuevo", "error"); cargarTodo(); return; }
+    CONFIG.diasAviso = parseInt(document.getElementById('config-dias').value);
+    CONFIG.emailAlertas = document.getElementById('config-email').value;
+    const res = await fetch('/api/guardar_config', {method:'POST', headers:{'Content-Type':'application/json', 'If-Match': CONFIG_ETAG}, body:JSON.stringify(CONFIG)});
+    if(res.ok) { CONFIG_ETAG = (await res.json()).etag; toast("Configuración guardada"); invalidarEstados(); }
+    else if(res.status === 409 || res.status === 428) { toast("Otro usuario cambió la configuración; se recargó", "error"); cargarTodo(); }
+    else toast("Error", "error");
+}
+async function toggleActivo() {
+    try {
+        const c = FLOTA_DATA.find(x => x.id === selectedTruckId);
+        const res = await fetch(`/api/toggle_activo/${selectedTruckId}`, { method: 'POST', headers: {'Content-Type':'application/json', 'If-Match': `"${c.version || 0}"`} });
+        if(res.ok) {
+            const data = await res.json();
+            reemplazarUnidad(data.unidad);
+            toast(data.activo ? "Unidad activada" : "Unidad dada de baja");
+            renderDetailView();
+        } else if(res.status === 409) { await conflictoUnidad(res); } else { toast("Error", "error"); }
+    } catch(e) { toast("Error de conexión", "error"); }
+}
+async function deleteTruck() { if(confirm("¿Eliminar esta unidad?")) { if(await guardarUnidad('DELETE', `/api/flota/${selectedTruckId}`)) { FLOTA_DATA = FLOTA_DATA.filter(x => x.id !== selectedTruckId); toast("Unidad eliminada"); showDashboard(); } } }
+function openNewUnitModal() {
+    const esMaquina = currentTipo === 'horas';
+    document.getElementById('modal-new-unit').classList.remove('hidden');
+    document.getElementById('form-new-truck').reset();
+    document.getElementById('new-unit-title').textContent = esMaquina ? 'Nueva Máquina' : 'Nueva Unidad';
+    document.getElementById('label-new-patente').textContent = esMaquina ? 'Nombre' : 'Patente';
+    document.getElementById('label-new-descripcion').textContent = esMaquina ? 'Detalle (opcional)' : 'Descripción';
+    document.getElementById('label-new-km').textContent = esMaquina ? 'Horas actuales' : 'Kilómetros';
+    document.getElementById('new-descripcion').required = !esMaquina;
+    document.getElementById('new-patente').classList.toggle('uppercase', !esMaquina);
+    document.getElementById('wrap-new-intervalo').classList.toggle('hidden', !esMaquina);
+    lucide.createIcons();
+}
+
+// --- USER MANAGEMENT ---
+async function loadUsers() {
+    try { const res = await fetch('/api/users'); if(res.ok) { const users = await res.json(); USUARIOS_VERSION = Object.fromEntries(users.map(u => [u.username, u.version || 0])); renderUsers(users); } } catch(e) {}
+}
+function renderUsers(users) {
+    const list = document.getElementById('users-list');
+    if(!users.length) { list.innerHTML = '<p class="p-6 text-gray-400 text-sm text-center">Sin usuarios</p>'; return; }
+    list.innerHTML = users.map(u => `<div class="px-6 py-3 flex justify-between items-center hover:bg-gray-50 dark:hover:bg-gray-700/50 transition-colors">
+        <div class="flex items-center gap-3"><div class="w-8 h-8 rounded-full ${u.role==='admin'?'bg-brand-green-subtle dark:bg-green-900/30':'bg-gray-100 dark:bg-gray-700'} flex items-center justify-center"><i data-lucide="user" class="w-4 h-4 ${u.role==='admin'?'text-brand-green dark:text-green-400':'text-gray-400'}"></i></div><div><p class="text-sm font-medium text-gray-900 dark:text-white">${u.username}</p><p class="text-[10px] text-gray-400 uppercase">${u.role}</p></div></div>
+        <div class="flex gap-1"><button onclick="openUserModal('${u.username}','${u.role}')" class="text-gray-400 hover:text-blue-500 p-1"><i data-lucide="pencil" class="w-4 h-4"></i></button><button onclick="deleteUser('${u.username}')" class="text-gray-400 hover:text-red-500 p-1"><i data-lucide="trash-2" class="w-4 h-4"></i></button></div>
+    </div>`).join('');
+    lucide.createIcons();
+}
+function openUserModal(username, role) {
+    document.getElementById('modal-user').classList.remove('hidden');
+    const isEdit = !!username;
+    document.getElementById('user-edit-mode').value = isEdit ? username : '';
+    document.getElementById('user-modal-title').innerHTML = `<i data-lucide="${isEdit?'user-cog':'user-plus'}" class="w-5 h-5"></i>${isEdit ? 'Editar Usuario' : 'Nuevo Usuario'}`;
+    document.getElementById('user-username').value = username || '';
+    document.getElementById('user-username').disabled = isEdit;
+    document.getElementById('user-password').value = '';
+    document.getElementById('user-password').required = !isEdit;
+    document.getElementById('user-pw-hint').classList.toggle('hidden', !isEdit);
+    document.getElementById('user-role').value = role || 'lector';
+    lucide.createIcons();
+}
+async function handleUserSubmit(e) {
+    e.preventDefault();
+    const editMode = document.getElementById('user-edit-mode').value;
+    const username = document.getElementById('user-username').value.trim();
+    const password = document.getElementById('user-password').value;
+    const role = document.getElementById('user-role').value;
+    if (editMode) {
+        const body = { role }; if (password) body.password = password;
+        const res = await fetch(`/api/users/${editMode}`, { method: 'PUT', headers: {'Content-Type':'application/json', 'If-Match': `"${USUARIOS_VERSION[editMode] || 0}"`}, body: JSON.stringify(body) });
+        if(res.ok) { toast("Usuario actualizado"); closeModal('modal-user'); loadUsers(); } else { const d = await res.json(); toast(d.message || "Error", "error"); if(res.status === 409) loadUsers(); }
+    } else {
+        const res = await fetch('/api/users', { method: 'POST', headers: {'Content-Type':'application/json'}, body: JSON.stringify({ username, password, role }) });
+        if(res.ok) { toast("Usuario creado"); closeModal('modal-user'); loadUsers(); } else { const d = await res.json(); toast(d.message || "Error", "error"); }
+    }
+}
+async function deleteUser(username) {
+    if(!confirm(`¿Eliminar usuario "${username}"?`)) return;
+    const res = await fetch(`/api/users/${username}`, { method: 'DELETE', headers: {'If-Match': `"${USUARIOS_VERSION[username] || 0}"`} });
+    if(res.ok) { toast("Usuario eliminado"); loadUsers(); } else { const d = await res.json(); toast(d.message || "Error", "error"); if(res.status === 409) loadUsers(); }
+}
+
+// --- AUDIT LOG ---
+async function loadAuditLog(cursor) {
+    try {
+        const res = await fetch('/api/audit_log?limit=100' + (cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''));
+        if(!res.ok) return;
+        const data = await res.json();
+        const logs = data.items;
+        const list = document.getElementById('audit-list');
+        const mas = document.getElementById('audit-mas'); if (mas) mas.remove();
+        if(!cursor && !logs.length) { list.innerHTML = '<p class="p-6 text-gray-400 text-sm text-center">Sin actividad registrada</p>'; return; }
+        const actionIcons = { login: 'log-in', logout: 'log-out', create_truck: 'plus-circle', delete_truck: 'trash-2', update_truck: 'save', register_service: 'wrench', update_config: 'settings', create_user: 'user-plus', update_user: 'user-cog', delete_user: 'user-minus', update_history: 'clock', delete_history: 'trash', add_expiration: 'calendar-plus', delete_expiration: 'calendar-x' };
+        const html = logs.map(l => `<div class="px-5 py-3 flex items-start gap-3 hover:bg-gray-50 dark:hover:bg-gray-700/50 transition-colors">
+            <div class="w-8 h-8 rounded-full bg-gray-100 dark:bg-gray-700 flex items-center justify-center flex-shrink-0 mt-0.5"><i data-lucide="${actionIcons[l.action]||'activity'}" class="w-3.5 h-3.5 text-gray-400"></i></div>
+            <div class="flex-1 min-w-0"><p class="text-sm text-gray-700 dark:text-gray-300"><span class="font-semibold">${l.user}</span> &middot; <span class="text-gray-400 capitalize">${(l.action||'').replace(/_/g,' ')}</span></p><p class="text-xs text-gray-400 truncate">${l.details || ''}</p></div>
+            <span class="text-[10px] text-gray-400 whitespace-nowrap flex-shrink-0">${l.timestamp ? l.timestamp.substring(5) : ''}</span>
+        </div>`).join('');
+        const masHtml = data.next_cursor ? `<button id="audit-mas" onclick="loadAuditLog('${data.next_cursor}')" class="w-full py-3 text-xs text-gray-400 hover:text-gray-600 dark:hover:text-gray-300">Ver más</button>` : '';
+        if (cursor) list.insertAdjacentHTML('beforeend', html + masHtml); else list.innerHTML = html + masHtml;
+        lucide.createIcons();
+    } catch(e) {}
+}
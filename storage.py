@@ -0,0 +1,783 @@
+"""Persistencia de los documentos JSON: snapshot + journal append-only.
+
+Cada documento (flota, config, usuarios, auditoría) sigue viviendo en su .json
+de siempre, que pasa a ser el *snapshot*. Las mutaciones no reescriben ese
+archivo: se agregan como una línea a `<archivo>.journal` (JSON Lines), así que
+guardar cuesta lo que mide el cambio y no lo que mide la flota. Cuando el
+journal crece más que el snapshot se compacta: snapshot nuevo a un temporal,
+fsync, rename atómico y journal vacío. Al abrir (o si otro proceso escribió)
+se reproduce snapshot + cola del journal.
+
+Un crash a mitad de escritura deja como mucho una última línea incompleta en
+el journal, que se descarta al reproducir; el snapshot nunca queda a medias.
+Una línea completa pero ilegible se saltea con un aviso y las siguientes se
+aplican igual: solo se corta la cola sin terminar.
+
+Las escrituras toman además un flock sobre `<archivo>.lock`: con varios
+workers, una lectura-modificación-escritura dentro de `escritura()` no se
+intercala con la de otro proceso. Los registros de flota y usuarios llevan un
+campo `version` que sube con cada cambio (concurrencia optimista: la app
+compara contra If-Match antes de escribir).
+
+La flota lleva además un log de cambios por unidad numerado (RegistroCambios,
+`flota_data.json.cambios`) para el feed de /api/changes (ver cambios.py).
+
+`obtener_almacen(carpeta)` agrupa los documentos de una instalación (flota,
+config, usuarios, historial de las unidades, estado de los jobs, auditoría).
+Con STORAGE_BACKEND=sqlite se usa en cambio la base de storage_sqlite.py, con
+la misma interfaz.
+"""
+
+import bisect
+import contextlib
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+
+import auditoria
+import metricas
+
+try:
+    import fcntl
+except ImportError:  # Windows (desarrollo local): solo el lock entre hilos
+    fcntl = None
+
+BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+
+# El journal se compacta cuando supera al snapshot, con este piso para no
+# reescribir una flota chica en cada cambio.
+COMPACTAR_MIN_BYTES = int(os.environ.get("JOURNAL_COMPACTAR_MIN_BYTES", 256 * 1024))
+# Tamaño del log de cambios de la flota antes de recortar la mitad más vieja.
+CAMBIOS_MAX_BYTES = int(os.environ.get("CAMBIOS_MAX_BYTES", 4 * 1024 * 1024))
+
+
+class ErrorAlmacenamiento(Exception):
+    """El snapshot existe pero no se puede leer: no se pisa con datos vacíos."""
+
+
+class DatosInvalidos(ValueError):
+    """Lo que se quiere guardar no se puede indexar (claves faltantes, repetidas o de otro tipo)."""
+
+
+def validar_coleccion(datos, clave, tipos=(int, str)):
+    """Chequea, antes de escribir en cualquier backend, que `datos` sea una
+    lista de registros con `clave` presente, del tipo esperado y sin repetir."""
+    if not isinstance(datos, list):
+        raise DatosInvalidos("se esperaba una lista de registros")
+    vistas = set()
+    for i, item in enumerate(datos):
+        k = item.get(clave) if isinstance(item, dict) else None
+        if k is None:
+            raise DatosInvalidos(f"registro {i + 1} sin '{clave}'")
+        if isinstance(k, bool) or not isinstance(k, tipos):
+            raise DatosInvalidos(f"registro {i + 1}: '{clave}' inválido ({k!r})")
+        if k in vistas:
+            raise DatosInvalidos(f"'{clave}' repetido: {k!r}")
+        vistas.add(k)
+
+
+def _normalizar_clave(k, tipos):
+    """Ids numéricos guardados como texto ("12") o float (12.0) en datos viejos,
+    pasados a int donde la clave es entera."""
+    if int in tipos and str not in tipos and not isinstance(k, bool):
+        if isinstance(k, float) and k.is_integer():
+            return int(k)
+        if isinstance(k, str) and k.strip().lstrip("-").isdigit():
+            return int(k)
+    return k
+
+
+def reparar_coleccion(datos, clave, tipos=(int, str), asignar=False):
+    """Lo que validar_coleccion() rechaza al escribir, pero leído de disco
+    (datos anteriores a la validación): devuelve (registros, avisos).
+
+    Las claves numéricas en texto se pasan a int. Un registro sin clave válida
+    o con una repetida recibe un id nuevo si `asignar` (ids enteros, como la
+    flota); si no, se deja afuera. Cada arreglo queda en `avisos`: nada se
+    pierde sin que se sepa.
+    """
+    if not isinstance(datos, list):
+        return [], [f"se esperaba una lista de registros, hay {type(datos).__name__}"]
+    avisos, validos, vistas = [], [], set()
+    for i, item in enumerate(datos):
+        if not isinstance(item, dict):
+            avisos.append(f"registro {i + 1} no es un objeto: se descarta")
+            continue
+        k = item.get(clave)
+        n = _normalizar_clave(k, tipos)
+        if n != k or type(n) is not type(k):
+            avisos.append(f"registro {i + 1}: '{clave}' {k!r} pasa a {n!r}")
+            item[clave] = n
+        validos.append(item)
+    siguiente = max((item[clave] for item in validos if type(item.get(clave)) is int), default=0)
+    registros = []
+    for i, item in enumerate(validos):
+        k = item.get(clave)
+        problema = None
+        if k is None:
+            problema = f"sin '{clave}'"
+        elif isinstance(k, bool) or not isinstance(k, tipos):
+            problema = f"'{clave}' inválido ({k!r})"
+        elif k in vistas:
+            problema = f"'{clave}' repetido ({k!r})"
+        if problema:
+            if not asignar:
+                avisos.append(f"registro {problema}: se descarta ({json.dumps(item, ensure_ascii=False)[:200]})")
+                continue
+            siguiente += 1
+            item[clave] = siguiente
+            avisos.append(f"registro {problema}: pasa a '{clave}' {siguiente}")
+        vistas.add(item[clave])
+        registros.append(item)
+    return registros, avisos
+
+
+def _copia(x):
+    # Los documentos son JSON por definición: el round-trip es más rápido que deepcopy.
+    return json.loads(json.dumps(x))
+
+
+def _fsync_dir(ruta):
+    try:
+        fd = os.open(os.path.dirname(ruta), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class BloqueoArchivo:
+    """Lock exclusivo entre procesos (flock sobre `ruta`) y entre hilos; reentrante."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._rlock = threading.RLock()
+        self._fd = None
+        self._pid = None
+        self._nivel = 0
+
+    def __enter__(self):
+        self._rlock.acquire()
+        if self._nivel == 0 and fcntl is not None:
+            try:
+                # Un fd heredado por fork comparte el flock con el padre: cada proceso abre el suyo.
+                if self._fd is None or self._pid != os.getpid():
+                    os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+                    self._fd = os.open(self.ruta, os.O_RDWR | os.O_CREAT, 0o644)
+                    self._pid = os.getpid()
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._rlock.release()
+                raise
+        self._nivel += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._nivel -= 1
+        if self._nivel == 0 and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._rlock.release()
+
+
+def nueva_version(item, anterior):
+    """Copia de `item` con `version` = la de `anterior` + 1, o None si no cambió nada.
+
+    La `version` que traiga `item` se ignora (la decide el almacén), salvo en
+    un alta: un restore o una migración conservan la que tenían los datos.
+    """
+    nuevo = _copia(item)
+    traida = nuevo.pop("version", None)
+    if anterior is not None:
+        base = dict(anterior)
+        base.pop("version", None)
+        if base == nuevo:
+            return None
+        nuevo["version"] = (anterior.get("version") or 0) + 1
+    else:
+        nuevo["version"] = traida if isinstance(traida, int) and not isinstance(traida, bool) and traida > 0 else 1
+    return nuevo
+
+
+def escribir_atomico(ruta, datos, indent=4):
+    """Escribe `datos` como JSON en `ruta` vía temporal + fsync + rename."""
+    carpeta = os.path.dirname(ruta)
+    os.makedirs(carpeta, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(ruta) + ".", suffix=".tmp", dir=carpeta)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(datos, f, indent=indent, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, ruta)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(ruta)
+
+
+class Documento:
+    """Un documento JSON persistido como snapshot + journal.
+
+    Con `clave` (p.ej. 'id' en la flota, 'username' en usuarios) el documento es
+    una lista de registros indexada por ese campo y el journal guarda `put`/`del`
+    por registro. Sin `clave` es un valor opaco y cada cambio es un `set`. Con
+    `versionar`, cada registro escrito lleva su `version` (ver nueva_version).
+    """
+
+    tipos_clave = (int, str)
+    asignar_claves = False  # al cargar, ¿los registros sin clave válida reciben una? (ver reparar_coleccion)
+
+    def __init__(self, ruta, vacio=list, clave=None, versionar=False):
+        self.ruta = ruta
+        self.ruta_journal = ruta + ".journal"
+        self._nombre = os.path.basename(ruta)  # etiqueta en las métricas
+        self.vacio = vacio
+        self.clave = clave
+        self.versionar = versionar
+        self._lock = threading.RLock()
+        self._bloqueo = BloqueoArchivo(ruta + ".lock")
+        self._oyentes = []
+        self._snap_id = None   # identidad del snapshot cargado (inode, mtime, tamaño)
+        self._offset = 0       # bytes del journal ya aplicados
+        self._snap_bytes = 0
+        self._reparado = False
+        self._cargar_todo()
+        if self._reparado:
+            # Lo reparado al cargar queda en un snapshot nuevo: la próxima
+            # lectura (de este u otro proceso) ya no tiene que arreglar nada.
+            try:
+                self.compactar()
+            except OSError as e:
+                print(f"{self.ruta}: no se pudo guardar lo reparado: {e}")
+
+    # --- estado en memoria ---
+    def _reset(self, datos):
+        if self.clave:
+            # Con claves faltantes o repetidas (datos viejos) se perderían
+            # registros al indexar: se reparan y se avisa.
+            items, avisos = reparar_coleccion(datos, self.clave, self.tipos_clave, self.asignar_claves)
+            for aviso in avisos:
+                print(f"{self.ruta}: {aviso}")
+            self._reparado = self._reparado or bool(avisos)
+            self._items = {item[self.clave]: item for item in items}
+            self._datos = None
+        else:
+            self._datos = datos
+        self._notificar("reset", None, None)
+
+    def _aplicar(self, op):
+        tipo = op.get("op")
+        if tipo == "set":
+            self._reset(op["datos"])
+        elif tipo == "put":
+            k = _normalizar_clave(op["k"], self.tipos_clave)
+            self._items[k] = op["v"]
+            self._notificar("put", k, op["v"])
+        elif tipo == "del":
+            k = _normalizar_clave(op["k"], self.tipos_clave)
+            self._items.pop(k, None)
+            self._notificar("del", k, None)
+
+    def _notificar(self, evento, clave, item):
+        for fn in self._oyentes:
+            fn(evento, clave, item)
+
+    def suscribir(self, fn):
+        """`fn(evento, clave, item)` por cada cambio aplicado, propio o leído del journal
+        de otro proceso ('put', 'del' o 'reset'). Corre con el lock del documento
+        tomado: tiene que ser rápida y no volver a llamar al documento."""
+        self._oyentes.append(fn)
+
+    def _estado(self):
+        return list(self._items.values()) if self.clave else self._datos
+
+    # --- lectura de disco ---
+    def _stat_snapshot(self):
+        try:
+            st = os.stat(self.ruta)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _cargar_todo(self):
+        snap_id = self._stat_snapshot()
+        if snap_id is None:
+            datos = self.vacio()
+        else:
+            inicio = time.perf_counter()
+            try:
+                with open(self.ruta, "r", encoding="utf-8") as f:
+                    datos = json.load(f)
+            except ValueError as e:
+                raise ErrorAlmacenamiento(f"{self.ruta} corrupto: {e}") from e
+            metricas.io(self._nombre, "leer", inicio, snap_id[2])
+        self._reset(datos)
+        self._snap_id = snap_id
+        self._snap_bytes = snap_id[2] if snap_id else 0
+        self._offset = 0
+        self._leer_journal()
+
+    def _leer_journal(self):
+        inicio = time.perf_counter()
+        try:
+            with open(self.ruta_journal, "rb") as f:
+                f.seek(self._offset)
+                cola = f.read()
+        except FileNotFoundError:
+            return
+        pos = 0
+        while True:
+            fin = cola.find(b"\n", pos)
+            if fin < 0:
+                break  # línea incompleta (crash a mitad de append): se ignora y la corta el próximo append
+            linea = cola[pos:fin]
+            if linea.strip():
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    registro = None
+                if isinstance(registro, dict):
+                    for op in registro.get("ops", []):
+                        self._aplicar(op)
+                else:
+                    # Una línea completa que no se puede leer no es la cola de un crash:
+                    # se saltea (y se avisa) para no perder ni truncar las que siguen.
+                    print(f"Journal {self.ruta_journal}: línea ilegible en el byte {self._offset + pos}, se saltea")
+            pos = fin + 1
+        self._offset += pos
+        if pos:
+            metricas.io(self._nombre + ".journal", "leer", inicio, pos)
+
+    def _sincronizar(self):
+        """Se pone al día si otro proceso compactó o agregó al journal."""
+        if self._stat_snapshot() != self._snap_id:
+            self._cargar_todo()
+            return
+        try:
+            tam = os.path.getsize(self.ruta_journal)
+        except OSError:
+            tam = 0
+        if tam < self._offset:
+            self._cargar_todo()
+        elif tam > self._offset:
+            self._leer_journal()
+
+    # --- escritura ---
+    def _append(self, ops):
+        if not ops:
+            return
+        inicio = time.perf_counter()
+        linea = (json.dumps({"ops": ops}, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        with open(self.ruta_journal, "ab") as f:
+            if f.tell() != self._offset:
+                # Cola incompleta de un crash anterior: se corta antes de seguir.
+                f.truncate(self._offset)
+            f.write(linea)
+            f.flush()
+            os.fsync(f.fileno())
+        metricas.io(self._nombre + ".journal", "escribir", inicio, len(linea))
+        for op in ops:
+            self._aplicar(op)
+        self._offset += len(linea)
+        if self._offset > max(COMPACTAR_MIN_BYTES, self._snap_bytes):
+            self.compactar()
+
+    def compactar(self):
+        """Vuelca el estado a un snapshot nuevo (atómico) y vacía el journal."""
+        with self.escritura():
+            inicio = time.perf_counter()
+            escribir_atomico(self.ruta, self._estado())
+            # Si se corta acá, reproducir el journal viejo sobre el snapshot nuevo
+            # da el mismo estado: put/del/set son idempotentes en orden.
+            with open(self.ruta_journal, "wb") as f:
+                f.flush()
+                os.fsync(f.fileno())
+            self._snap_id = self._stat_snapshot()
+            self._snap_bytes = self._snap_id[2]
+            self._offset = 0
+            metricas.io(self._nombre, "compactar", inicio, self._snap_bytes)
+
+    def cerrar(self):
+        """Compacta si quedó journal pendiente (antes de soltar el documento)."""
+        try:
+            pendiente = os.path.getsize(self.ruta_journal) > 0
+        except OSError:
+            pendiente = False
+        if pendiente:
+            self.compactar()
+
+    @contextlib.contextmanager
+    def escritura(self):
+        """Sección exclusiva entre hilos y procesos, con el estado al día.
+
+        Para leer-modificar-escribir sin pisar a otro worker: lo que se lee
+        adentro no puede cambiar hasta salir. Es reentrante.
+        """
+        with self._lock, self._bloqueo:
+            self._sincronizar()
+            yield self
+
+    # --- API ---
+    def existe(self):
+        return os.path.exists(self.ruta) or os.path.exists(self.ruta_journal)
+
+    def datos(self):
+        with self._lock:
+            self._sincronizar()
+            return _copia(self._estado())
+
+    def version(self):
+        """Identidad del estado actual: cambia con cada escritura de cualquier proceso."""
+        with self._lock:
+            self._sincronizar()
+            return (self._snap_id, self._offset)
+
+    def leer(self, fn):
+        """Devuelve (version, fn(estado)) sin copiar el estado; `fn` no debe mutarlo."""
+        with self._lock:
+            self._sincronizar()
+            return (self._snap_id, self._offset), fn(self._estado())
+
+    def obtener(self, clave):
+        with self._lock:
+            self._sincronizar()
+            item = self._items.get(clave)
+            return _copia(item) if item is not None else None
+
+    def claves(self):
+        with self._lock:
+            self._sincronizar()
+            return list(self._items)
+
+    def iterar(self, lote=500):
+        """Copias de los registros de a `lote`, sin copiar el documento entero.
+
+        El lock se toma por lote (y cada lote se pone al día con el journal):
+        una exportación larga no frena a los que escriben. Lo que cambie entre
+        lotes puede verse o no, como en una lectura paginada."""
+        with self._lock:
+            self._sincronizar()
+            claves = list(self._items)
+        for i in range(0, len(claves), lote):
+            with self._lock:
+                self._sincronizar()
+                items = [self._items.get(k) for k in claves[i:i + lote]]
+                items = [_copia(x) for x in items if x is not None]
+            yield from items
+
+    def guardar(self, datos):
+        """Reemplaza el documento entero; en colecciones solo se journalean las diferencias.
+
+        En colecciones levanta DatosInvalidos (sin escribir nada) si algún
+        registro no tiene clave válida o la repite."""
+        with self.escritura():
+            if not self.clave:
+                self._append([{"op": "set", "datos": datos}])
+                return
+            validar_coleccion(datos, self.clave, self.tipos_clave)
+            nuevos = {item[self.clave]: item for item in datos}
+            ops = [{"op": "del", "k": k} for k in self._items if k not in nuevos]
+            for k, v in nuevos.items():
+                v = self._nuevo(v, self._items.get(k))
+                if v is not None:
+                    ops.append({"op": "put", "k": k, "v": v})
+            self._append(ops)
+
+    def _nuevo(self, item, anterior):
+        """Lo que se journalea para `item` (None si no cambió)."""
+        if self.versionar:
+            return nueva_version(item, anterior)
+        return _copia(item) if anterior != item else None
+
+    def poner(self, item):
+        """Guarda un registro y devuelve cómo quedó (con su `version` si se versiona)."""
+        with self.escritura():
+            k = item[self.clave]
+            nuevo = self._nuevo(item, self._items.get(k))
+            if nuevo is None:
+                return _copia(self._items[k])
+            self._append([{"op": "put", "k": k, "v": nuevo}])
+            return _copia(nuevo)
+
+    def poner_varios(self, items):
+        """Como poner, pero todos los registros van en una sola línea del journal:
+        o quedan todos o (si se corta a mitad) ninguno."""
+        with self.escritura():
+            ops, guardados = [], []
+            for item in items:
+                k = item[self.clave]
+                nuevo = self._nuevo(item, self._items.get(k))
+                if nuevo is None:
+                    guardados.append(_copia(self._items[k]))
+                    continue
+                ops.append({"op": "put", "k": k, "v": nuevo})
+                guardados.append(_copia(nuevo))
+            self._append(ops)
+            return guardados
+
+    def borrar(self, clave):
+        with self.escritura():
+            if clave in self._items:
+                self._append([{"op": "del", "k": clave}])
+
+
+# --- log de cambios (feed de /api/changes) ---
+# Un cursor es "<época>.<seq>": seq crece de a uno con cada unidad escrita
+# mientras dure la época del log. "0" es "antes de que existiera el log".
+def cursor_cambios(epoca, seq):
+    return f"{epoca}.{seq}" if epoca else "0"
+
+
+def punto_de_partida(cursor, epoca, primero, ultimo):
+    """Desde qué seq responder a `cursor`; None si el cliente tiene que recargar todo
+    (otra época, o cambios que ya se recortaron del log)."""
+    epoca_c, _, seq = (cursor or "").rpartition(".")
+    try:
+        seq = int(seq)
+    except ValueError:
+        return None
+    if not epoca_c:
+        return 0 if seq == 0 and primero in (None, 1) else None
+    if epoca_c != epoca or seq > ultimo or (primero is not None and seq < primero - 1):
+        return None
+    return seq
+
+
+def respuesta_cambios(epoca, desde, ultimo, filas, hay_mas=False):
+    """Lo que devuelve `cambios_desde`, a partir de las filas (seq, clave, valor | None, reset)
+    posteriores a `desde`."""
+    if any(reset for _, _, _, reset in filas):
+        return {"cursor": cursor_cambios(epoca, ultimo), "reset": True}
+    return {"cursor": cursor_cambios(epoca, filas[-1][0] if filas else desde),
+            "cambios": [{"id": k, "unidad": v} for _, k, v, _ in filas], "mas": hay_mas}
+
+
+class RegistroCambios:
+    """Log de cambios por registro de un Documento con clave (`<ruta>.cambios`).
+
+    Primera línea `{"epoca": ...}`; después una línea por escritura con sus
+    cambios numerados, `[[seq, clave, valor | null, reset], ...]` (null =
+    borrado; reset si el documento se reemplazó entero). Se escribe con el
+    lock del documento tomado, así que los seq no se repiten entre procesos.
+    Al pasar de CAMBIOS_MAX_BYTES se reescribe (atómico) con la mitad más nueva,
+    misma época. Si el archivo se borra, el próximo es otra época.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._nombre = os.path.basename(ruta)
+        self._lock = threading.Lock()
+        self._vaciar()
+
+    def _vaciar(self):
+        self._id = None
+        self._offset = 0
+        self._epoca = None
+        self._base = 0  # último seq recortado
+        self._seqs, self._filas = [], []
+
+    def _sincronizar(self):
+        try:
+            st = os.stat(self.ruta)
+        except FileNotFoundError:
+            self._vaciar()
+            return
+        if self._id != (st.st_ino, st.st_dev) or st.st_size < self._offset:
+            self._vaciar()
+            self._id = (st.st_ino, st.st_dev)
+        if st.st_size == self._offset:
+            return
+        inicio = time.perf_counter()
+        with open(self.ruta, "rb") as f:
+            f.seek(self._offset)
+            cola = f.read()
+        pos = 0
+        while True:
+            fin = cola.find(b"\n", pos)
+            if fin < 0:
+                break  # línea a medio escribir: se lee la próxima vez
+            try:
+                linea = json.loads(cola[pos:fin])
+            except ValueError:
+                linea = None
+            if isinstance(linea, dict):
+                self._epoca, self._base = linea.get("epoca"), linea.get("base", 0)
+            elif isinstance(linea, list):
+                for fila in linea:
+                    self._seqs.append(fila[0])
+                    self._filas.append(tuple(fila))
+            pos = fin + 1
+        self._offset += pos
+        metricas.io(self._nombre, "leer", inicio, pos)
+
+    def anotar(self, ops):
+        """Agrega los cambios de `ops` (journal del documento). Con el lock del documento tomado."""
+        with self._lock:
+            self._sincronizar()
+            lineas = []
+            if self._epoca is None:
+                lineas.append({"epoca": secrets.token_hex(4)})
+            ultimo = self._seqs[-1] if self._seqs else self._base
+            filas = []
+            for op in ops:
+                ultimo += 1
+                if op["op"] == "put":
+                    filas.append([ultimo, op["k"], op["v"], False])
+                elif op["op"] == "del":
+                    filas.append([ultimo, op["k"], None, False])
+                else:
+                    filas.append([ultimo, None, None, True])
+            lineas.append(filas)
+            inicio = time.perf_counter()
+            datos = "".join(json.dumps(l, ensure_ascii=False, separators=(",", ":")) + "\n" for l in lineas).encode("utf-8")
+            with open(self.ruta, "ab") as f:
+                f.write(datos)
+                f.flush()
+                os.fsync(f.fileno())
+            metricas.io(self._nombre, "escribir", inicio, len(datos))
+            if self._offset + len(datos) > CAMBIOS_MAX_BYTES:
+                self._recortar()
+
+    def _recortar(self):
+        self._sincronizar()
+        mitad = (len(self._filas) + 1) // 2
+        filas = self._filas[mitad:]
+        tmp = f"{self.ruta}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            # `base`: último seq recortado, para seguir numerando si no queda ninguno.
+            f.write(json.dumps({"epoca": self._epoca, "base": self._filas[mitad - 1][0] if mitad else 0}) + "\n")
+            if filas:
+                f.write(json.dumps([list(x) for x in filas], ensure_ascii=False, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.ruta)
+        self._sincronizar()
+
+    def desde(self, cursor, limite=500):
+        with self._lock:
+            self._sincronizar()
+            ultimo = self._seqs[-1] if self._seqs else self._base
+            primero = self._seqs[0] if self._seqs else (None if not self._base else self._base + 1)
+            actual = cursor_cambios(self._epoca, ultimo)
+            if cursor is None:
+                return {"cursor": actual, "cambios": [], "mas": False}
+            desde = punto_de_partida(cursor, self._epoca, primero, ultimo)
+            if desde is None:
+                return {"cursor": actual, "reset": True}
+            i = bisect.bisect_right(self._seqs, desde)
+            filas = self._filas[i:i + limite]
+            return respuesta_cambios(self._epoca, desde, ultimo, filas, i + limite < len(self._filas))
+
+
+class Flota(Documento):
+    """La flota: registros por 'id', con las búsquedas que usa la app."""
+
+    tipos_clave = (int,)  # como en SQLite (id INTEGER PRIMARY KEY)
+    asignar_claves = True  # una unidad sin id (o con uno repetido) en datos viejos recibe uno nuevo
+
+    def __init__(self, ruta):
+        super().__init__(ruta, list, "id", versionar=True)
+        self._cambios = RegistroCambios(ruta + ".cambios")
+
+    def _append(self, ops):
+        super()._append(ops)
+        if ops:
+            # Después del journal: si se corta en el medio, el cambio está
+            # guardado y el feed lo pierde (el cliente lo ve al recargar).
+            self._cambios.anotar(ops)
+
+    def cursor_cambios(self):
+        """Cursor del último cambio (para acompañar un GET de la flota entera)."""
+        return self._cambios.desde(None)["cursor"]
+
+    def cambios_desde(self, cursor, limite=500):
+        """Unidades escritas después de `cursor`: {"cursor", "cambios": [{"id", "unidad"}], "mas"}
+        o {"cursor", "reset": True} si hay que recargar la flota entera."""
+        return self._cambios.desde(cursor, limite)
+
+    def conservar_patentes(self, validas):
+        """Borra las unidades cuya patente no está en `validas`; devuelve (eliminadas, conservadas)."""
+        validas = {p.upper() for p in validas}
+        with self.escritura():
+            fuera = [k for k, c in self._items.items() if str(c.get("patente", "")).upper() not in validas]
+            self._append([{"op": "del", "k": k} for k in fuera])
+            return len(fuera), len(self._items)
+
+
+_documentos = {}
+_documentos_lock = threading.Lock()
+
+
+def abrir(ruta, vacio=list, clave=None, cls=None, versionar=False):
+    """Devuelve el Documento de `ruta`, compartido dentro del proceso."""
+    ruta = os.path.abspath(ruta)
+    with _documentos_lock:
+        doc = _documentos.get(ruta)
+        if doc is None:
+            doc = _documentos[ruta] = cls(ruta) if cls else Documento(ruta, vacio, clave, versionar)
+        return doc
+
+
+class AlmacenJSON:
+    """Backend por defecto: un .json (+ journal) por documento en `carpeta`."""
+
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        self.flota = abrir(os.path.join(carpeta, "flota_data.json"), cls=Flota)
+        self.config = abrir(os.path.join(carpeta, "config.json"), dict)
+        self.usuarios = abrir(os.path.join(carpeta, "users.json"), list, "username", versionar=True)
+        self.historial = abrir(os.path.join(carpeta, "historial.json"), list, "id")
+        # Estado de los jobs (p. ej. hasta qué día se avisaron las alertas), aparte de la config.
+        self.estado = abrir(os.path.join(carpeta, "estado.json"), dict)
+        self.auditoria = auditoria.AuditLog(os.path.join(carpeta, "audit"),
+                                            legado=os.path.join(carpeta, "audit_log.json"))
+
+    def cerrar(self):
+        for doc in (self.flota, self.config, self.usuarios, self.historial, self.estado):
+            doc.cerrar()
+
+
+_almacenes = {}
+
+
+def obtener_almacen(carpeta, backend=None):
+    """Almacén de la instalación con datos en `carpeta` (uno por proceso)."""
+    backend = backend or BACKEND
+    clave = (os.path.abspath(carpeta), backend)
+    with _documentos_lock:
+        almacen = _almacenes.get(clave)
+    if almacen is None:
+        if backend == "sqlite":
+            import storage_sqlite
+            almacen = storage_sqlite.AlmacenSQLite(os.path.join(carpeta, "flota.db"))
+        else:
+            almacen = AlmacenJSON(carpeta)
+        with _documentos_lock:
+            almacen = _almacenes.setdefault(clave, almacen)
+    return almacen
+
+
+def soltar_almacen(carpeta):
+    """Baja a disco y saca de memoria el almacén de `carpeta` (ver tenants.py).
+
+    Quien siga teniendo una referencia puede seguir usándola: lo que se pierde
+    es la caché del proceso; el próximo obtener_almacen() lo vuelve a leer."""
+    raiz = os.path.abspath(carpeta)
+    with _documentos_lock:
+        almacenes = [_almacenes.pop(k) for k in list(_almacenes) if k[0] == raiz]
+        for ruta in [r for r in _documentos if os.path.dirname(r) == raiz]:
+            del _documentos[ruta]
+    for almacen in almacenes:
+        almacen.cerrar()
+    return almacenes
@@ -0,0 +1,541 @@
+"""Backend SQLite (modo WAL) para flota, config, usuarios y auditoría.
+
+Alternativa a los .json para instalaciones grandes: se activa con
+STORAGE_BACKEND=sqlite y guarda todo en data/flota.db. Cada unidad y cada
+usuario es una fila (el registro completo va como JSON en `datos`), con
+columnas indexadas para las búsquedas: id, patente, username, fechas de
+vencimiento y timestamp de auditoría. El historial de cada unidad es otra
+fila aparte (tabla `historial`): agregar un evento no toca la unidad. Expone
+la misma interfaz que los Documento de storage.py, así que app.py y
+enviar_alertas.py no se enteran de cuál backend está activo.
+
+Migración única desde los .json:
+
+    STORAGE_BACKEND=sqlite python storage_sqlite.py migrar [carpeta_data]
+"""
+
+import contextlib
+import datetime
+import json
+import os
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+
+import metricas
+from storage import (BloqueoArchivo, ErrorAlmacenamiento, cursor_cambios, nueva_version, punto_de_partida,
+                     respuesta_cambios, validar_coleccion)
+
+# Cambios de unidades que se conservan para el feed de /api/changes.
+CAMBIOS_MAX_FILAS = int(os.environ.get("CAMBIOS_MAX_FILAS", 20000))
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS versiones (doc TEXT PRIMARY KEY, n INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS documentos (nombre TEXT PRIMARY KEY, datos TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS unidades (
+    id INTEGER PRIMARY KEY,
+    orden INTEGER NOT NULL,
+    patente TEXT NOT NULL DEFAULT '',
+    datos TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_unidades_patente ON unidades (upper(patente));
+CREATE INDEX IF NOT EXISTS ix_unidades_orden ON unidades (orden);
+CREATE TABLE IF NOT EXISTS vencimientos (
+    unidad_id INTEGER NOT NULL,
+    tipo TEXT NOT NULL,
+    fecha TEXT NOT NULL,
+    PRIMARY KEY (unidad_id, tipo)
+);
+CREATE INDEX IF NOT EXISTS ix_vencimientos_fecha ON vencimientos (fecha);
+CREATE TABLE IF NOT EXISTS cambios (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    unidad_id INTEGER NOT NULL,
+    datos TEXT
+);
+CREATE TABLE IF NOT EXISTS historial (
+    id INTEGER PRIMARY KEY,
+    orden INTEGER NOT NULL,
+    datos TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_historial_orden ON historial (orden);
+CREATE TABLE IF NOT EXISTS usuarios (
+    username TEXT PRIMARY KEY,
+    orden INTEGER NOT NULL,
+    datos TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS auditoria (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    user TEXT,
+    action TEXT,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_auditoria_timestamp ON auditoria (timestamp);
+CREATE INDEX IF NOT EXISTS ix_auditoria_user ON auditoria (user, seq);
+CREATE INDEX IF NOT EXISTS ix_auditoria_action ON auditoria (action, seq);
+"""
+
+
+def _dump(x):
+    return json.dumps(x, ensure_ascii=False, separators=(",", ":"))
+
+
+class _Base:
+    nombre_lock = "doc"
+    tabla = nombre = None
+
+    def __init__(self, db):
+        self._local = threading.local()
+        self.db = db
+        self._bloqueo = BloqueoArchivo(f"{db}.{self.nombre_lock}.lock")
+        self._etiqueta = f"{os.path.basename(db)}:{self.tabla or self.nombre}"  # en las métricas
+
+    @contextlib.contextmanager
+    def escritura(self):
+        """Igual que storage.Documento.escritura: lectura-modificación-escritura
+        exclusiva entre procesos (las transacciones de adentro son las de siempre)."""
+        with self._bloqueo:
+            yield self
+
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.db, timeout=30, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    @contextlib.contextmanager
+    def _tx(self, escritura=True):
+        """Transacción: IMMEDIATE para escribir (un solo escritor), snapshot para leer."""
+        con = self._con()
+        inicio = time.perf_counter()
+        self._local.bytes = 0
+        try:
+            con.execute("BEGIN IMMEDIATE" if escritura else "BEGIN")
+            try:
+                yield con
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            con.execute("COMMIT")
+        except sqlite3.Error as e:
+            raise ErrorAlmacenamiento(f"{self.db}: {e}") from e
+        metricas.io(self._etiqueta, "escribir" if escritura else "leer", inicio, self._local.bytes)
+
+    def _json(self, texto):
+        """json.loads de una columna `datos`, contando los bytes para las métricas."""
+        self._local.bytes += len(texto)
+        return json.loads(texto)
+
+    def _dump(self, x):
+        texto = _dump(x)
+        self._local.bytes += len(texto)
+        return texto
+
+    def _version(self, con, doc):
+        fila = con.execute("SELECT n FROM versiones WHERE doc = ?", (doc,)).fetchone()
+        return fila[0] if fila else 0
+
+    @staticmethod
+    def _subir_version(con, doc):
+        con.execute("INSERT INTO versiones (doc, n) VALUES (?, 1) "
+                    "ON CONFLICT (doc) DO UPDATE SET n = n + 1", (doc,))
+
+
+class _Coleccion(_Base):
+    """Lista de registros con clave, misma interfaz que storage.Documento."""
+
+    tabla = clave_col = None
+    tipos_clave = (int, str)
+
+    def _clave(self, item):
+        return item[self.clave_col]
+
+    def _columnas(self, item):
+        return {}
+
+    def _despues_put(self, con, k, item):
+        pass
+
+    def _despues_del(self, con, k):
+        pass
+
+    def _put(self, con, item):
+        k = self._clave(item)
+        cols = self._columnas(item)
+        existe = con.execute(f"SELECT orden FROM {self.tabla} WHERE {self.clave_col} = ?", (k,)).fetchone()
+        if existe:
+            orden = existe[0]
+        else:
+            orden = con.execute(f"SELECT COALESCE(MAX(orden), 0) + 1 FROM {self.tabla}").fetchone()[0]
+        nombres = [self.clave_col, "orden", "datos", *cols]
+        valores = [k, orden, self._dump(item), *cols.values()]
+        con.execute(f"INSERT OR REPLACE INTO {self.tabla} ({', '.join(nombres)}) "
+                    f"VALUES ({', '.join('?' * len(nombres))})", valores)
+        self._despues_put(con, k, item)
+
+    def _del(self, con, k):
+        con.execute(f"DELETE FROM {self.tabla} WHERE {self.clave_col} = ?", (k,))
+        self._despues_del(con, k)
+
+    def _todos(self, con):
+        return [self._json(d) for (d,) in con.execute(f"SELECT datos FROM {self.tabla} ORDER BY orden")]
+
+    # --- API ---
+    def existe(self):
+        with self._tx(False) as con:
+            return self._version(con, self.tabla) > 0
+
+    def version(self):
+        with self._tx(False) as con:
+            return self._version(con, self.tabla)
+
+    def datos(self):
+        with self._tx(False) as con:
+            return self._todos(con)
+
+    def leer(self, fn):
+        with self._tx(False) as con:
+            return self._version(con, self.tabla), fn(self._todos(con))
+
+    def obtener(self, clave):
+        with self._tx(False) as con:
+            fila = con.execute(f"SELECT datos FROM {self.tabla} WHERE {self.clave_col} = ?", (clave,)).fetchone()
+            return self._json(fila[0]) if fila else None
+
+    def claves(self):
+        with self._tx(False) as con:
+            return [k for (k,) in con.execute(f"SELECT {self.clave_col} FROM {self.tabla} ORDER BY orden")]
+
+    def iterar(self, lote=500):
+        """Los registros en orden, de a `lote` por transacción (como Documento.iterar)."""
+        ultimo = 0
+        while True:
+            with self._tx(False) as con:
+                filas = con.execute(f"SELECT orden, datos FROM {self.tabla} WHERE orden > ? "
+                                    f"ORDER BY orden LIMIT ?", (ultimo, lote)).fetchall()
+                items = [self._json(d) for _, d in filas]
+            if not filas:
+                return
+            yield from items
+            ultimo = filas[-1][0]
+
+    def guardar(self, datos):
+        """Reemplaza la colección; solo se escriben las filas que cambiaron.
+
+        Levanta DatosInvalidos antes de tocar la base, igual que storage.Documento."""
+        validar_coleccion(datos, self.clave_col, self.tipos_clave)
+        with self._tx() as con:
+            actuales = {k: d for k, d in con.execute(f"SELECT {self.clave_col}, datos FROM {self.tabla}")}
+            nuevos = {self._clave(item): item for item in datos}
+            for k in actuales.keys() - nuevos.keys():
+                self._del(con, k)
+            for k, item in nuevos.items():
+                item = nueva_version(item, self._json(actuales[k]) if k in actuales else None)
+                if item is not None:
+                    self._put(con, item)
+            self._subir_version(con, self.tabla)
+
+    def poner(self, item):
+        """Guarda un registro y devuelve cómo quedó, con su `version`."""
+        with self._tx() as con:
+            fila = con.execute(f"SELECT datos FROM {self.tabla} WHERE {self.clave_col} = ?",
+                               (self._clave(item),)).fetchone()
+            anterior = self._json(fila[0]) if fila else None
+            nuevo = nueva_version(item, anterior)
+            if nuevo is None:
+                return anterior
+            self._put(con, nuevo)
+            self._subir_version(con, self.tabla)
+            return nuevo
+
+    def poner_varios(self, items):
+        """Varios registros en una sola transacción; devuelve cómo quedó cada uno."""
+        guardados, cambios = [], False
+        with self._tx() as con:
+            for item in items:
+                fila = con.execute(f"SELECT datos FROM {self.tabla} WHERE {self.clave_col} = ?",
+                                   (self._clave(item),)).fetchone()
+                anterior = self._json(fila[0]) if fila else None
+                nuevo = nueva_version(item, anterior)
+                if nuevo is None:
+                    guardados.append(anterior)
+                    continue
+                self._put(con, nuevo)
+                guardados.append(nuevo)
+                cambios = True
+            if cambios:
+                self._subir_version(con, self.tabla)
+        return guardados
+
+    def borrar(self, clave):
+        with self._tx() as con:
+            self._del(con, clave)
+            self._subir_version(con, self.tabla)
+
+
+class FlotaSQLite(_Coleccion):
+    tabla, clave_col = "unidades", "id"
+    tipos_clave = (int,)
+    nombre_lock = "unidades"
+
+    def _clave(self, item):
+        return int(item["id"])
+
+    def _columnas(self, item):
+        return {"patente": str(item.get("patente", ""))}
+
+    def _despues_put(self, con, k, item):
+        con.execute("DELETE FROM vencimientos WHERE unidad_id = ?", (k,))
+        vencs = item.get("vencimientos") or {}
+        if isinstance(vencs, dict):
+            con.executemany("INSERT INTO vencimientos (unidad_id, tipo, fecha) VALUES (?, ?, ?)",
+                            [(k, t, f) for t, f in vencs.items() if f])
+        self._anotar_cambio(con, k, self._dump(item))
+
+    def _despues_del(self, con, k):
+        con.execute("DELETE FROM vencimientos WHERE unidad_id = ?", (k,))
+        self._anotar_cambio(con, k, None)
+
+    # --- log de cambios (feed de /api/changes), en la misma transacción ---
+    def _anotar_cambio(self, con, k, datos):
+        seq = con.execute("INSERT INTO cambios (unidad_id, datos) VALUES (?, ?)", (k, datos)).lastrowid
+        if seq % 100 == 0:
+            con.execute("DELETE FROM cambios WHERE seq <= ?", (seq - CAMBIOS_MAX_FILAS,))
+
+    def _epoca(self, con):
+        # La época es la base: otra base (restaurada, migrada) invalida los cursores.
+        fila = con.execute("SELECT datos FROM documentos WHERE nombre = 'cambios.epoca'").fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def _limites(self, con):
+        primero, ultimo = con.execute("SELECT MIN(seq), MAX(seq) FROM cambios").fetchone()
+        if ultimo is None:
+            # Vacía: AUTOINCREMENT sigue desde el último seq que se haya usado.
+            fila = con.execute("SELECT seq FROM sqlite_sequence WHERE name = 'cambios'").fetchone()
+            ultimo = fila[0] if fila else 0
+            primero = ultimo + 1 if ultimo else None
+        return primero, ultimo
+
+    def cursor_cambios(self):
+        with self._tx(False) as con:
+            return cursor_cambios(self._epoca(con), self._limites(con)[1])
+
+    def cambios_desde(self, cursor, limite=500):
+        """Misma respuesta que storage.Flota.cambios_desde."""
+        with self._tx(False) as con:
+            epoca = self._epoca(con)
+            primero, ultimo = self._limites(con)
+            if cursor is None:
+                return {"cursor": cursor_cambios(epoca, ultimo), "cambios": [], "mas": False}
+            desde = punto_de_partida(cursor, epoca, primero, ultimo)
+            if desde is None:
+                return {"cursor": cursor_cambios(epoca, ultimo), "reset": True}
+            filas = con.execute("SELECT seq, unidad_id, datos FROM cambios WHERE seq > ? ORDER BY seq LIMIT ?",
+                                (desde, limite + 1)).fetchall()
+            filas = [(seq, k, self._json(d) if d is not None else None, False) for seq, k, d in filas]
+            return respuesta_cambios(epoca, desde, ultimo, filas[:limite], len(filas) > limite)
+
+    def obtener(self, clave):
+        try:
+            return super().obtener(int(clave))
+        except (TypeError, ValueError):
+            return None
+
+    def conservar_patentes(self, validas):
+        validas = sorted({p.upper() for p in validas})
+        with self._tx() as con:
+            marcas = ", ".join("?" * len(validas))
+            fuera = [k for (k,) in con.execute(f"SELECT id FROM unidades WHERE upper(patente) NOT IN ({marcas})", validas)]
+            for k in fuera:
+                self._del(con, k)
+            if fuera:
+                self._subir_version(con, self.tabla)
+            conservadas = con.execute("SELECT COUNT(*) FROM unidades").fetchone()[0]
+        return len(fuera), conservadas
+
+
+class HistorialSQLite(_Coleccion):
+    """Historial por unidad (ver historial.py): una fila por unidad, aparte de la flota."""
+
+    tabla, clave_col = "historial", "id"
+    tipos_clave = (int,)
+    nombre_lock = "historial"
+
+    def _clave(self, item):
+        return int(item["id"])
+
+    def obtener(self, clave):
+        try:
+            return super().obtener(int(clave))
+        except (TypeError, ValueError):
+            return None
+
+
+class UsuariosSQLite(_Coleccion):
+    tabla, clave_col = "usuarios", "username"
+    tipos_clave = (str,)
+    nombre_lock = "usuarios"
+
+
+class ConfigSQLite(_Base):
+    """Documento único (dict) guardado entero: la config es chica."""
+
+    nombre = "config"
+    nombre_lock = "config"
+
+    def existe(self):
+        with self._tx(False) as con:
+            return self._version(con, self.nombre) > 0
+
+    def version(self):
+        with self._tx(False) as con:
+            return self._version(con, self.nombre)
+
+    def _leer(self, con):
+        fila = con.execute("SELECT datos FROM documentos WHERE nombre = ?", (self.nombre,)).fetchone()
+        return self._json(fila[0]) if fila else {}
+
+    def datos(self):
+        with self._tx(False) as con:
+            return self._leer(con)
+
+    def leer(self, fn):
+        with self._tx(False) as con:
+            return self._version(con, self.nombre), fn(self._leer(con))
+
+    def guardar(self, datos):
+        with self._tx() as con:
+            con.execute("INSERT OR REPLACE INTO documentos (nombre, datos) VALUES (?, ?)", (self.nombre, self._dump(datos)))
+            self._subir_version(con, self.nombre)
+
+
+class EstadoSQLite(ConfigSQLite):
+    """Estado de los jobs (storage.AlmacenJSON.estado): otro documento chico, aparte de la config."""
+
+    nombre = "estado"
+    nombre_lock = "estado"
+
+
+class AuditoriaSQLite(_Base):
+    """Misma interfaz que auditoria.AuditLog; el cursor es el `seq` de la fila."""
+
+    tabla = "auditoria"
+
+    def registrar(self, user, action, details=""):
+        entrada = {
+            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "user": user,
+            "action": action,
+            "details": details,
+        }
+        with self._tx() as con:
+            con.execute("INSERT INTO auditoria (timestamp, user, action, details) VALUES (?, ?, ?, ?)",
+                        (entrada["timestamp"], user, action, details))
+        return entrada
+
+    def consultar(self, limite=100, cursor=None, usuario=None, accion=None, desde=None, hasta=None):
+        if hasta and len(hasta) == 10:
+            hasta += " 23:59:59"
+        filtros, args = [], []
+        for cond, valor in (("seq < ?", int(cursor) if cursor and str(cursor).isdigit() else None),
+                            ("user = ?", usuario), ("action = ?", accion),
+                            ("timestamp >= ?", desde), ("timestamp <= ?", hasta)):
+            if valor is not None and valor != "":
+                filtros.append(cond)
+                args.append(valor)
+        where = f"WHERE {' AND '.join(filtros)}" if filtros else ""
+        with self._tx(False) as con:
+            filas = con.execute(f"SELECT seq, timestamp, user, action, details FROM auditoria {where} "
+                                f"ORDER BY seq DESC LIMIT ?", (*args, limite + 1)).fetchall()
+        items = [{"timestamp": t, "user": u, "action": a, "details": d} for _, t, u, a, d in filas[:limite]]
+        siguiente = str(filas[limite - 1][0]) if len(filas) > limite else None
+        return items, siguiente
+
+    def importar(self, eventos):
+        """Carga eventos ya existentes (restore/migración) en una sola transacción."""
+        n = 0
+        with self._tx() as con:
+            for e in eventos:
+                con.execute("INSERT INTO auditoria (timestamp, user, action, details) VALUES (?, ?, ?, ?)",
+                            (e.get("timestamp", ""), e.get("user"), e.get("action"), e.get("details")))
+                n += 1
+        return n
+
+    def contar(self):
+        with self._tx(False) as con:
+            return con.execute("SELECT COUNT(*) FROM auditoria").fetchone()[0]
+
+    def iterar(self, desde=None, hasta=None):
+        if hasta and len(hasta) == 10:
+            hasta += " 23:59:59"
+        ultimo = 0
+        while True:
+            with self._tx(False) as con:
+                filas = con.execute("SELECT seq, timestamp, user, action, details FROM auditoria "
+                                    "WHERE seq > ? AND timestamp >= ? AND timestamp <= ? ORDER BY seq LIMIT 1000",
+                                    (ultimo, desde or "", hasta or "9999")).fetchall()
+            if not filas:
+                return
+            for seq, t, u, a, d in filas:
+                yield {"timestamp": t, "user": u, "action": a, "details": d}
+            ultimo = filas[-1][0]
+
+
+class AlmacenSQLite:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with sqlite3.connect(ruta) as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_ESQUEMA)
+            con.execute("INSERT OR IGNORE INTO documentos (nombre, datos) VALUES ('cambios.epoca', ?)",
+                        (json.dumps(secrets.token_hex(4)),))
+        self.flota = FlotaSQLite(ruta)
+        self.config = ConfigSQLite(ruta)
+        self.usuarios = UsuariosSQLite(ruta)
+        self.historial = HistorialSQLite(ruta)
+        self.estado = EstadoSQLite(ruta)
+        self.auditoria = AuditoriaSQLite(ruta)
+
+    def cerrar(self):
+        """Pasa el WAL a la base (storage.soltar_almacen) para no dejarlo crecer mientras no se usa."""
+        try:
+            with contextlib.closing(sqlite3.connect(self.ruta, timeout=30)) as con:
+                con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error as e:
+            raise ErrorAlmacenamiento(f"{self.ruta}: {e}") from e
+
+
+def migrar_desde_json(carpeta, ruta_db=None):
+    """Copia los .json (snapshot + journal) y el audit log a una base nueva."""
+    import storage
+    origen = storage.AlmacenJSON(carpeta)
+    destino = AlmacenSQLite(ruta_db or os.path.join(carpeta, "flota.db"))
+    if destino.flota.existe() or destino.usuarios.existe() or destino.config.existe():
+        raise ErrorAlmacenamiento(f"{destino.ruta} ya tiene datos; no se migra encima")
+    # Las unidades sin id o con id repetido ya recibieron uno al cargar (storage.reparar_coleccion).
+    flota = origen.flota.datos()
+    destino.flota.guardar(flota)
+    if origen.historial.existe():
+        destino.historial.guardar(origen.historial.datos())
+    if origen.usuarios.existe():
+        destino.usuarios.guardar(origen.usuarios.datos())
+    if origen.config.existe():
+        destino.config.guardar(origen.config.datos())
+    if origen.estado.existe():
+        destino.estado.guardar(origen.estado.datos())
+    eventos = destino.auditoria.importar(origen.auditoria.iterar())
+    return {"unidades": len(flota), "usuarios": len(destino.usuarios.claves()), "auditoria": eventos}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrar":
+        print(__doc__)
+        sys.exit(1)
+    carpeta = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    print(migrar_desde_json(carpeta))
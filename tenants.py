@@ -0,0 +1,218 @@
+"""Varias empresas (tenants) servidas por el mismo proceso.
+
+La tabla `usuarios` compartida del ecosistema ya trae el `tenant_id` de cada
+usuario, pero la app usaba siempre un único data/: cada empresa más era otro
+contenedor con su scheduler y su memoria. Con MULTI_TENANT=true:
+
+- El tenant sale de la sesión: lo fija el login (la fila de Supabase o, para
+  usuarios locales, TENANT_HOSTS "host=tenant,...") y cada pedido usa el
+  almacén, el historial y los medidores de ese tenant.
+- Solo se entra a tenants configurados: el del host en TENANT_HOSTS o, si el
+  host no tiene uno, el principal y los de TENANTS_PERMITIDOS "a,b,...". El
+  login no busca usuarios fuera de esos ni crea carpetas: las de los tenants
+  configurados se crean al arrancar (preparar()).
+- TENANT_ID (el de siempre) sigue usando DATA_DIR tal cual, así una instalación
+  existente no mueve nada; los demás viven en DATA_DIR/tenants/<tenant_id>/,
+  con el mismo formato (y el mismo STORAGE_BACKEND).
+- Los tenants cargados se guardan en un LRU de hasta TENANTS_MAX. El que queda
+  afuera, o el que no se usa hace TENANTS_INACTIVO segundos, se descarga:
+  se compacta su journal (o el WAL en SQLite) y se sueltan sus cachés. El
+  próximo pedido lo vuelve a leer de disco. El tenant principal no se descarga.
+- Los jobs programados (enviar_alertas) recorren todos los tenants en una pasada.
+
+Sin MULTI_TENANT todo pedido usa el tenant principal, como antes.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import auth_remote
+import backups
+import historial
+import medidores
+import storage
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.environ.get("DATA_DIR") or os.path.join(BASE_DIR, "data")
+HABILITADO = os.environ.get("MULTI_TENANT", "false") == "true"
+PRINCIPAL = auth_remote.TENANT_ID
+MAX = int(os.environ.get("TENANTS_MAX", 32))
+INACTIVO = float(os.environ.get("TENANTS_INACTIVO", 600))
+
+# El id termina siendo un nombre de carpeta: nada de '/', '..' ni cosas raras.
+_VALIDO = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+class TenantDesconocido(Exception):
+    pass
+
+
+def _hosts(texto):
+    hosts = {}
+    for par in texto.split(","):
+        host, _, tenant = par.partition("=")
+        if host.strip() and tenant.strip():
+            hosts[host.strip().lower()] = tenant.strip()
+    return hosts
+
+
+HOSTS = _hosts(os.environ.get("TENANT_HOSTS", ""))
+PERMITIDOS = [t.strip() for t in os.environ.get("TENANTS_PERMITIDOS", "").split(",") if t.strip()]
+
+
+def por_host(host):
+    """Tenant de TENANT_HOSTS para `host` (con o sin puerto); None si no está."""
+    return HOSTS.get((host or "").split(":")[0].lower())
+
+
+def candidatos(host):
+    """Tenants a los que se puede entrar desde `host`: el suyo de TENANT_HOSTS
+    o, si no tiene, el principal y los de TENANTS_PERMITIDOS."""
+    if not HABILITADO:
+        return (PRINCIPAL,)
+    propio = por_host(host)
+    if propio:
+        return (propio,)
+    return tuple(dict.fromkeys([PRINCIPAL, *PERMITIDOS]))
+
+
+def configurados():
+    """Todos los tenants declarados en la configuración."""
+    return list(dict.fromkeys([PRINCIPAL, *HOSTS.values(), *PERMITIDOS])) if HABILITADO else [PRINCIPAL]
+
+
+class Tenant:
+    """Lo que la app usa de un tenant: almacén, historial y medidores."""
+
+    def __init__(self, id_, carpeta):
+        self.id = id_
+        self.carpeta = carpeta
+        self.almacen = storage.obtener_almacen(carpeta)
+        self.historial = historial.Historial(self.almacen.historial)
+        self.medidores = medidores.SeriesMedidor(os.path.join(carpeta, "medidores"))
+        # El principal respeta BACKUP_DIR; los demás guardan sus backups adentro.
+        self.backups = backups.CARPETA if id_ == PRINCIPAL else os.path.join(carpeta, "backups")
+        self.usado = time.monotonic()
+        try:
+            historial.migrar(self.almacen.flota, self.historial)
+        except (OSError, storage.ErrorAlmacenamiento) as e:
+            print(f"Error migrando historial ({id_}): {e}")
+
+
+class Registro:
+    def __init__(self, raiz=DATA_DIR, maximo=MAX, inactivo=INACTIVO):
+        self.raiz = raiz
+        self.maximo = maximo
+        self.inactivo = inactivo
+        self._lock = threading.Lock()
+        self._cargados = OrderedDict()  # id -> Tenant, del menos al más reciente
+        self._stats = {"cargas": 0, "descargas": 0}
+
+    def carpeta(self, id_):
+        if id_ == PRINCIPAL:
+            return self.raiz
+        if not _VALIDO.match(id_ or ""):
+            raise TenantDesconocido(f"tenant inválido: {id_!r}")
+        return os.path.join(self.raiz, "tenants", id_)
+
+    def obtener(self, id_=None):
+        """El Tenant `id_` (el principal si es None), cargándolo si hace falta.
+
+        Un tenant sin carpeta es TenantDesconocido: las carpetas las crea
+        preparar(), nunca un pedido."""
+        id_ = id_ or PRINCIPAL
+        ahora = time.monotonic()
+        with self._lock:
+            t = self._cargados.get(id_)
+            if t is not None:
+                self._cargados.move_to_end(id_)
+                t.usado = ahora
+        if t is None:
+            carpeta = self.carpeta(id_)
+            if id_ != PRINCIPAL and not os.path.isdir(carpeta):
+                raise TenantDesconocido(f"tenant sin datos: {id_}")
+            # Fuera del lock: leer una flota grande no frena a los demás tenants.
+            nuevo = Tenant(id_, carpeta)
+            with self._lock:
+                t = self._cargados.setdefault(id_, nuevo)
+                self._cargados.move_to_end(id_)
+                if t is nuevo:
+                    self._stats["cargas"] += 1
+        self._descargar(self._sobrantes(ahora))
+        return t
+
+    def preparar(self, ids=None):
+        """Crea las carpetas de los tenants configurados que todavía no tienen (al arrancar)."""
+        for id_ in configurados() if ids is None else ids:
+            if id_ == PRINCIPAL:
+                continue
+            try:
+                os.makedirs(self.carpeta(id_), exist_ok=True)
+            except (OSError, TenantDesconocido) as e:
+                print(f"Error preparando tenant {id_}: {e}")
+
+    def _sobrantes(self, ahora):
+        """Saca del LRU los que sobran o están inactivos (menos el principal)."""
+        with self._lock:
+            fuera = []
+            for id_, t in list(self._cargados.items()):
+                if id_ == PRINCIPAL:
+                    continue
+                if len(self._cargados) > self.maximo or ahora - t.usado > self.inactivo:
+                    fuera.append(self._cargados.pop(id_))
+            self._stats["descargas"] += len(fuera)
+            return fuera
+
+    def _descargar(self, tenants):
+        # Imports diferidos: estos módulos importan enviar_alertas, que usa este.
+        import cache_http
+        import calendario_alertas
+        import estado_flota
+        for t in tenants:
+            try:
+                storage.soltar_almacen(t.carpeta)
+            except (OSError, storage.ErrorAlmacenamiento) as e:
+                print(f"Error descargando tenant {t.id}: {e}")
+            calendario_alertas.olvidar(t.almacen)
+            estado_flota.olvidar(t.almacen.flota)
+            for doc in (t.almacen.flota, t.almacen.config):
+                cache_http.olvidar(doc)
+
+    def barrer(self):
+        """Descarga los inactivos; obtener() ya lo hace, esto es para los jobs."""
+        self._descargar(self._sobrantes(time.monotonic()))
+
+    def ids(self):
+        """Todos los tenants con datos: el principal y las carpetas de DATA_DIR/tenants."""
+        if not HABILITADO:
+            return [PRINCIPAL]
+        try:
+            otros = sorted(n for n in os.listdir(os.path.join(self.raiz, "tenants"))
+                       if n != PRINCIPAL and _VALIDO.match(n))
+        except FileNotFoundError:
+            otros = []
+        return [PRINCIPAL] + otros
+
+    def todos(self):
+        """Recorre todos los tenants (para los jobs); los que no estaban cargados
+        se cargan de a uno y quedan sujetos al LRU como cualquier otro."""
+        for id_ in self.ids():
+            try:
+                yield self.obtener(id_)
+            except (OSError, storage.ErrorAlmacenamiento, TenantDesconocido) as e:
+                print(f"Error cargando tenant {id_}: {e}")
+
+    def cargados(self):
+        with self._lock:
+            return list(self._cargados.values())
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self._stats, cargados=len(self._cargados), maximo=self.maximo,
+                        inactivo_segundos=self.inactivo, multi_tenant=HABILITADO)
+
+
+REGISTRO = Registro()
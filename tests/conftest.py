@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Los módulos de la app están sueltos en la raíz del repo (no es un paquete).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.py lee esto al importarse: data/ del repo no se toca y el scheduler no arranca.
+os.environ.setdefault("FLASK_SECRET_KEY", "clave-de-prueba-" + "x" * 16)
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="flota-tests-")
+os.environ["SCHEDULER_ENABLED"] = "false"
+
+
+@pytest.fixture
+def backend():
+    """STORAGE_BACKEND del registro; un módulo lo redefine parametrizado para probar los dos."""
+    return "json"
+
+
+@pytest.fixture
+def registro(tmp_path, monkeypatch, backend):
+    """Un registro de tenants con el principal en `tmp_path`: datos nuevos por test."""
+    import storage
+    import tenants
+    monkeypatch.setattr(storage, "BACKEND", backend)
+    reg = tenants.Registro(str(tmp_path / "data"))
+    monkeypatch.setattr(tenants, "REGISTRO", reg)
+    return reg
+
+
+@pytest.fixture
+def almacen(registro):
+    return registro.obtener().almacen
+
+
+@pytest.fixture
+def cliente(registro):
+    """test_client de la app con sesión de admin."""
+    import app
+    c = app.app.test_client()
+    with c.session_transaction() as s:
+        s["usuario_actual"] = "admin"
+        s["rol_usuario"] = "admin"
+    return c
@@ -0,0 +1,108 @@
+"""Adaptador ASGI: carriles, cuerpo del pedido y errores de la app."""
+
+import asyncio
+import json
+
+import pytest
+
+import asgi
+
+
+def _llamar(app_wsgi, monkeypatch, metodo="GET", ruta="/api/flota", cuerpo=b"", mensajes=None, enviados=None):
+    """Corre un pedido por asgi.app con `app_wsgi` adentro; devuelve los mensajes enviados.
+
+    El cliente manda `mensajes` (por defecto el cuerpo entero) y después se
+    queda conectado: receive() espera para siempre, como un cliente real."""
+    monkeypatch.setattr(asgi, "app_wsgi", app_wsgi)
+    if mensajes is None:
+        mensajes = [{"type": "http.request", "body": cuerpo, "more_body": False}]
+    scope = {"type": "http", "method": metodo, "path": ruta, "query_string": b"",
+             "headers": [(b"content-length", str(len(cuerpo)).encode())]}
+    enviados = [] if enviados is None else enviados
+
+    async def correr():
+        cola = asyncio.Queue()
+        for m in mensajes:
+            cola.put_nowait(m)
+
+        async def send(m):
+            enviados.append(m)
+
+        await asyncio.wait_for(asgi.app(scope, cola.get, send), timeout=5)
+
+    asyncio.run(correr())
+    return enviados
+
+
+def _respuesta(enviados):
+    inicio = enviados[0]
+    assert inicio["type"] == "http.response.start"
+    return inicio["status"], b"".join(m.get("body", b"") for m in enviados[1:])
+
+
+def test_carriles():
+    assert asgi.carril("GET", "/api/flota") == "rapido"
+    assert asgi.carril("POST", "/api/flota") == "lento"
+    assert asgi.carril("GET", "/api/export/flota.csv") == "lento"
+    assert asgi.carril("GET", "/api/changes") == "feed"
+
+
+def test_carril_lleno_responde_503(monkeypatch):
+    c = asgi.CARRILES["rapido"]
+    monkeypatch.setattr(c, "pendientes", c.max_pendientes)
+    enviados = _llamar(lambda environ, start: [b"no llega"], monkeypatch)
+    status, cuerpo = _respuesta(enviados)
+    assert status == 503
+    assert dict(enviados[0]["headers"])[b"retry-after"] == b"2"
+    assert json.loads(cuerpo)["status"] == "error"
+
+
+def test_read_sin_tamano_termina_en_content_length(monkeypatch):
+    def eco(environ, start):
+        datos = environ["wsgi.input"].read()
+        start("200 OK", [("Content-Type", "text/plain")])
+        return [datos]
+    # El cuerpo llega en dos mensajes y el cliente no manda nada más.
+    enviados = _llamar(eco, monkeypatch, "POST", cuerpo=b"hola mundo", mensajes=[
+        {"type": "http.request", "body": b"hola ", "more_body": True},
+        {"type": "http.request", "body": b"mundo", "more_body": True},
+    ])
+    assert _respuesta(enviados) == (200, b"hola mundo")
+
+
+def test_error_antes_de_responder_es_500(monkeypatch):
+    def falla(environ, start):
+        start("200 OK", [("Content-Type", "text/plain")])
+        def cuerpo():
+            raise ValueError("se rompió")
+            yield b""
+        return cuerpo()
+    status, cuerpo = _respuesta(_llamar(falla, monkeypatch))
+    assert status == 500
+    assert json.loads(cuerpo) == {"status": "error", "message": "Error interno"}
+
+
+def test_sin_start_response_es_500(monkeypatch):
+    assert _respuesta(_llamar(lambda environ, start: [b"x"], monkeypatch))[0] == 500
+
+
+def test_error_a_mitad_de_la_respuesta_corta_la_conexion(monkeypatch):
+    def falla(environ, start):
+        start("200 OK", [("Content-Type", "text/plain")])
+        def cuerpo():
+            yield b"primera parte"
+            raise ValueError("se rompió")
+        return cuerpo()
+    enviados = []
+    with pytest.raises(ValueError):
+        _llamar(falla, monkeypatch, enviados=enviados)
+    assert [m.get("body") for m in enviados[1:]] == [b"primera parte"]
+    # Nunca se manda un more_body=False que haga parecer completa la respuesta.
+    assert not any(m["type"] == "http.response.body" and not m.get("more_body") for m in enviados)
+
+
+def test_app_flask_por_asgi(registro, monkeypatch):
+    import app
+    status, cuerpo = _respuesta(_llamar(app.app, monkeypatch))
+    assert status == 401  # sin sesión
+    assert json.loads(cuerpo) == {"error": "No autorizado"}
@@ -0,0 +1,73 @@
+"""Auditoría paginada por cursor, del más nuevo al más viejo."""
+
+import json
+import os
+
+import pytest
+
+import auditoria
+import storage
+
+
+def _eventos(n, mes):
+    return [{"timestamp": f"2026-{mes:02d}-{d + 1:02d} 10:00:00", "user": "ana" if d % 2 else "beto",
+             "action": "Editar", "details": f"{mes}-{d + 1}"} for d in range(n)]
+
+
+def _segmento(carpeta, stem, eventos):
+    os.makedirs(carpeta, exist_ok=True)
+    with open(os.path.join(carpeta, stem + ".jsonl"), "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(e) + "\n" for e in eventos)
+
+
+def _todas(consultar, limite, **filtros):
+    paginas, cursor = [], None
+    while True:
+        items, cursor = consultar(limite, cursor, **filtros)
+        paginas.append([e["details"] for e in items])
+        if cursor is None:
+            return paginas
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def log(request, tmp_path):
+    almacen = storage.obtener_almacen(str(tmp_path), request.param)
+    if request.param == "json":
+        _segmento(almacen.auditoria.carpeta, "audit-20260101000000", _eventos(5, 1))
+        _segmento(almacen.auditoria.carpeta, "audit-20260201000000", _eventos(5, 2))
+    else:
+        almacen.auditoria.importar(_eventos(5, 1) + _eventos(5, 2))
+    return almacen.auditoria
+
+
+def test_paginas_sin_huecos_ni_repetidos(log):
+    paginas = _todas(log.consultar, 4)
+    assert [len(p) for p in paginas] == [4, 4, 2]
+    todos = [d for p in paginas for d in p]
+    assert todos == [f"{m}-{d}" for m in (2, 1) for d in range(5, 0, -1)]
+
+
+def test_filtros_por_usuario_y_fechas(log):
+    paginas = _todas(log.consultar, 2, usuario="ana", desde="2026-01-03", hasta="2026-02-02")
+    assert [d for p in paginas for d in p] == ["2-2", "1-4"]
+
+
+def test_el_cursor_sigue_valiendo_si_el_segmento_se_comprime(tmp_path, monkeypatch):
+    log = auditoria.AuditLog(str(tmp_path / "audit"))
+    _segmento(log.carpeta, "audit-20260101000000", _eventos(5, 1))
+    items, cursor = log.consultar(2)
+    assert [e["details"] for e in items] == ["1-5", "1-4"]
+    monkeypatch.setattr(auditoria, "COMPRIMIR", True)
+    log._rotar("audit-20260101000000")
+    assert os.listdir(log.carpeta) == ["audit-20260101000000.jsonl.gz"]
+    items, cursor = log.consultar(10, cursor)
+    assert ([e["details"] for e in items], cursor) == (["1-3", "1-2", "1-1"], None)
+
+
+def test_api_audit_log(cliente, almacen):
+    _segmento(almacen.auditoria.carpeta, "audit-20260101000000", _eventos(3, 1))
+    r = cliente.get("/api/audit_log?limit=2").json
+    assert [e["details"] for e in r["items"]] == ["1-3", "1-2"]
+    r = cliente.get(f"/api/audit_log?limit=2&cursor={r['next_cursor']}").json
+    assert ([e["details"] for e in r["items"]], r["next_cursor"]) == (["1-1"], None)
+    assert cliente.get("/api/audit_log?limit=x").status_code == 400
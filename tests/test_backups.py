@@ -0,0 +1,68 @@
+"""Backups locales: ida y vuelta, y auditoría de meses cerrados sin releer."""
+
+import datetime
+
+import pytest
+
+import backups
+import storage
+
+EVENTOS = [{"timestamp": f"2026-0{m}-15 10:00:00", "user": "admin", "action": "Editar", "details": str(m)}
+           for m in (1, 2, 3)]
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def origen(request, tmp_path):
+    almacen = storage.obtener_almacen(str(tmp_path / "data"), request.param)
+    almacen.flota.guardar([{"id": 1, "patente": "AA123BB", "km_actual": 100},
+                           {"id": 2, "patente": "CC456DD", "vencimientos": {"vtv": "2026-05-01"}}])
+    almacen.config.guardar({"diasAviso": 15, "emailAlertas": "a@example.com"})
+    almacen.auditoria.importar(EVENTOS)
+    almacen.backend = request.param
+    return almacen
+
+
+def _restaurado(tmp_path, origen, id_, nombre):
+    carpeta = str(tmp_path / "backups")
+    destino = str(tmp_path / nombre)
+    resumen = backups.restaurar(id_, destino, carpeta, origen.backend)
+    return resumen, storage.obtener_almacen(destino, origen.backend)
+
+
+def test_respaldar_y_restaurar_ida_y_vuelta(tmp_path, origen):
+    carpeta = str(tmp_path / "backups")
+    m = backups.respaldar(origen, carpeta, datetime.datetime(2026, 3, 20, 3, 0))
+    assert m["tipo"] == "completo"
+    assert {"auditoria/2026-01", "auditoria/2026-02", "auditoria/2026-03"} <= set(m["entradas"])
+    resumen, copia = _restaurado(tmp_path, origen, m["id"], "restaurado")
+    assert (resumen["flota"], resumen["auditoria"]) == (2, 3)
+    assert copia.flota.datos() == origen.flota.datos()
+    assert copia.config.datos() == origen.config.datos()
+    assert list(copia.auditoria.iterar()) == EVENTOS
+    with pytest.raises(backups.ErrorBackup):
+        backups.restaurar(m["id"], str(tmp_path / "restaurado"), carpeta)  # nunca sobre una carpeta con datos
+
+
+def test_meses_cerrados_se_reusan_sin_leer_el_log(tmp_path, origen, monkeypatch):
+    monkeypatch.setattr(backups, "COMPLETO_DIAS", 30)
+    carpeta = str(tmp_path / "backups")
+    primero = backups.respaldar(origen, carpeta, datetime.datetime(2026, 3, 20, 3, 0))
+    origen.auditoria.importar([{"timestamp": "2026-03-25 09:00:00", "user": "admin",
+                                "action": "Editar", "details": "tarde"}])
+    desdes = []
+    iterar = origen.auditoria.iterar
+    monkeypatch.setattr(origen.auditoria, "iterar", lambda desde=None, hasta=None: (
+        desdes.append(desde), iterar(desde=desde, hasta=hasta))[1])
+    segundo = backups.respaldar(origen, carpeta, datetime.datetime(2026, 4, 2, 3, 0))
+    # Enero y febrero ya estaban cerrados en el primer backup; marzo no, y se vuelve a leer.
+    assert desdes == ["2026-03"]
+    for mes in ("2026-01", "2026-02"):
+        assert segundo["entradas"][f"auditoria/{mes}"] == primero["entradas"][f"auditoria/{mes}"]
+    assert segundo["delta"] == ["auditoria/2026-03"]
+    _, copia = _restaurado(tmp_path, origen, segundo["id"], "restaurado")
+    assert [e["details"] for e in copia.auditoria.iterar()] == ["1", "2", "3", "tarde"]
+
+
+def test_mes_siguiente():
+    assert backups._mes_siguiente("2026-03") == "2026-04"
+    assert backups._mes_siguiente("2026-12") == "2027-01"
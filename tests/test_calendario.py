@@ -0,0 +1,72 @@
+"""Calendario de alertas: qué se avisa cada día y qué queda ya avisado."""
+
+import datetime
+
+import pytest
+
+import calendario_alertas
+import storage
+import storage_sqlite
+
+DIAS = 30  # primer aviso de la config; después 15 y 7
+HOY = datetime.date(2026, 3, 1)
+
+
+def _maquina(id_, vence, **campos):
+    # Las máquinas (medidor por horas) no pasan por la lista blanca de patentes.
+    return {"id": id_, "patente": f"M{id_}", "tipo_medidor": "horas",
+            "vencimientos": {"vtv": vence.isoformat()}, **campos}
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def almacen_de(request, tmp_path):
+    return storage.obtener_almacen(str(tmp_path), request.param)
+
+
+def _tipos(pendientes):
+    return [(r["id"], [t for t, _ in items]) for r, items in pendientes]
+
+
+def test_avisa_en_los_hitos_y_confirmar_pasa_al_siguiente(almacen_de):
+    almacen_de.flota.guardar([_maquina(1, HOY + datetime.timedelta(days=7)),
+                              _maquina(2, HOY + datetime.timedelta(days=20))])
+    cal = calendario_alertas.Calendario(almacen_de.flota, almacen_de.estado)
+    assert _tipos(cal.pendientes(DIAS, HOY)) == [(1, ["vtv"])]
+    cal.confirmar(HOY)
+    assert cal.pendientes(DIAS, HOY) == []
+    assert cal.pendientes(DIAS, HOY + datetime.timedelta(days=1)) == []
+    # La 1 ya está en zona roja; la 2 llega a su hito de 15 días.
+    assert _tipos(cal.pendientes(DIAS, HOY + datetime.timedelta(days=5))) == [(1, ["vtv"]), (2, ["vtv"])]
+
+
+def test_lo_confirmado_no_se_repite_en_otro_proceso(almacen_de):
+    almacen_de.flota.guardar([_maquina(1, HOY + datetime.timedelta(days=7))])
+    cal = calendario_alertas.Calendario(almacen_de.flota, almacen_de.estado)
+    assert cal.pendientes(DIAS, HOY)
+    cal.confirmar(HOY)
+    assert almacen_de.estado.datos()[calendario_alertas.AVISADO_HASTA] == HOY.isoformat()
+    # Otro worker, o el mismo después de reiniciar: arranca con el índice vacío.
+    otro = calendario_alertas.Calendario(almacen_de.flota, almacen_de.estado)
+    assert otro.pendientes(DIAS, HOY) == []
+    # Y uno que ya estaba armado se entera en la próxima consulta.
+    ya_armado = calendario_alertas.Calendario(almacen_de.flota, almacen_de.estado)
+    almacen_de.estado.guardar({})
+    assert ya_armado.pendientes(DIAS, HOY)
+    cal.confirmar(HOY)
+    assert ya_armado.pendientes(DIAS, HOY) == []
+
+
+def test_sqlite_sigue_el_log_de_cambios_sin_reconstruir(tmp_path, monkeypatch):
+    almacen = storage_sqlite.AlmacenSQLite(str(tmp_path / "flota.db"))
+    almacen.flota.guardar([_maquina(1, HOY + datetime.timedelta(days=60)),
+                           _maquina(2, HOY + datetime.timedelta(days=60))])
+    cal = calendario_alertas.Calendario(almacen.flota, almacen.estado)
+    assert cal.pendientes(DIAS, HOY) == []
+    reconstrucciones = []
+    original = cal._reconstruir
+    monkeypatch.setattr(cal, "_reconstruir", lambda: (reconstrucciones.append(1), original()))
+    almacen.flota.poner(_maquina(2, HOY + datetime.timedelta(days=7)))
+    assert _tipos(cal.pendientes(DIAS, HOY)) == [(2, ["vtv"])]
+    almacen.flota.borrar(2)
+    assert cal.pendientes(DIAS, HOY) == []
+    assert reconstrucciones == []
@@ -0,0 +1,70 @@
+"""Feed de cambios de la flota (/api/changes): long-poll y SSE desde un cursor."""
+
+import json
+import threading
+import time
+
+import pytest
+
+import cambios
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request):
+    return request.param
+
+
+@pytest.fixture(autouse=True)
+def sondeo_rapido(monkeypatch):
+    monkeypatch.setattr(cambios, "SONDEO", 0.02)
+
+
+def _cursor(cliente, almacen):
+    almacen.flota.guardar([{"id": 1, "patente": "AA123BB", "km_actual": 100}])
+    return cliente.get("/api/flota").headers["X-Cambios-Cursor"]
+
+
+def test_trae_solo_lo_posterior_al_cursor(cliente, almacen):
+    cursor = _cursor(cliente, almacen)
+    almacen.flota.poner({"id": 2, "patente": "CC456DD"})
+    almacen.flota.borrar(1)
+    r = cliente.get(f"/api/changes?since={cursor}").json
+    assert [(c["id"], c["unidad"] and c["unidad"]["patente"]) for c in r["cambios"]] == [(2, "CC456DD"), (1, None)]
+    assert r["cursor"] != cursor
+
+
+def test_long_poll_despierta_con_el_cambio(cliente, almacen):
+    cursor = _cursor(cliente, almacen)
+    threading.Timer(0.2, lambda: almacen.flota.poner({"id": 1, "patente": "AA123BB", "km_actual": 200})).start()
+    inicio = time.monotonic()
+    r = cliente.get(f"/api/changes?since={cursor}").json
+    assert time.monotonic() - inicio < 5
+    assert [c["unidad"]["km_actual"] for c in r["cambios"]] == [200]
+
+
+def test_cursor_de_otra_epoca_es_reset(cliente, almacen):
+    _cursor(cliente, almacen)
+    assert cliente.get("/api/changes?since=otra.1").json["reset"] is True
+
+
+def test_sin_cupo_es_503(cliente, almacen, monkeypatch):
+    cursor = _cursor(cliente, almacen)
+    monkeypatch.setattr(cambios, "MAX_CONEXIONES", 0)
+    r = cliente.get(f"/api/changes?since={cursor}")
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "30"
+
+
+def test_sse_manda_el_cursor_como_id_y_libera_el_cupo(cliente, almacen):
+    cursor = _cursor(cliente, almacen)
+    almacen.flota.poner({"id": 2, "patente": "CC456DD"})
+    flujo = cambios.eventos(almacen.flota, cursor, segundos=0.1)
+    try:
+        texto = "".join(flujo)
+    finally:
+        flujo.close()
+    assert cambios.VIGIA.estadisticas()["conexiones"] == 0
+    evento = texto.split("\n\n")[1].split("\n")
+    assert evento[0] == "event: cambios"
+    assert evento[1] == f"id: {almacen.flota.cursor_cambios()}"
+    assert [c["id"] for c in json.loads(evento[2][len("data: "):])["cambios"]] == [2]
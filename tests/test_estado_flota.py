@@ -0,0 +1,46 @@
+"""Estado por unidad calculado en el server (/api/flota/status)."""
+
+import datetime
+
+import estado_flota
+
+HOY = datetime.date.today()
+
+
+def _dias(n):
+    return (HOY + datetime.timedelta(days=n)).isoformat()
+
+
+def _flota(almacen):
+    almacen.flota.guardar([
+        {"id": 1, "patente": "AA123BB", "km_actual": 1000, "vencimientos": {"vtv": _dias(-2)}},
+        {"id": 2, "patente": "CC456DD", "km_actual": 9500, "service": {"ultimo_km": 0, "intervalo_km": 10000}},
+        {"id": 3, "patente": "EE789FF", "km_actual": 100, "vencimientos": {"seguro": _dias(200)}},
+        {"id": 4, "patente": "M1", "tipo_medidor": "horas", "vencimientos": {"matafuego": "sin fecha"}},
+    ])
+
+
+def test_columnas_clasifican_como_el_navegador(almacen):
+    _flota(almacen)
+    est = estado_flota.calcular(almacen.flota, 30)
+    items = {u["id"]: u for u in est.items(est.indices())}
+    assert items[1]["estado"] == "DANGER"
+    assert items[1]["vencimientos"]["vtv"] == {"fecha": _dias(-2), "dias": -2, "estado": "DANGER",
+                                               "mensaje": "VENCIDO (2 d)"}
+    assert items[2]["service"] == {"estado": "WARNING", "mensaje": "Falta 500 km"}
+    assert items[3]["estado"] == "OK"
+    assert items[4]["vencimientos"]["matafuego"]["estado"] == "ERROR"
+    assert est.contadores["km"] == {"total": 3, "danger": 1, "warning": 1, "ok": 1, "inactivas": 0}
+    assert est.alertas == 1
+    # Misma versión, día y diasAviso: no se recalcula.
+    assert estado_flota.calcular(almacen.flota, 30) is est
+
+
+def test_status_filtra_y_trae_solo_las_unidades_pedidas(cliente, almacen):
+    _flota(almacen)
+    r = cliente.get("/api/flota/status?estado=danger,warning").json
+    assert [u["id"] for u in r["items"]] == [1, 2]
+    r = cliente.get("/api/flota/status?ids=3,2,99").json
+    assert [u["id"] for u in r["items"]] == [2, 3]
+    assert r["contadores"]["km"]["total"] == 3  # los contadores son de toda la flota
+    assert cliente.get("/api/flota/status?ids=x").status_code == 400
@@ -0,0 +1,92 @@
+"""Exportación a CSV/XLSX en streaming (/api/export/<tipo>)."""
+
+import csv
+import datetime
+import io
+import itertools
+import zipfile
+from xml.etree import ElementTree
+
+import exportar
+
+NS = {"x": exportar._NS}
+
+
+def _flota(almacen):
+    almacen.flota.guardar([
+        {"id": 1, "patente": "AA123BB", "descripcion": "=HYPERLINK(\"x\")", "km_actual": 1000,
+         "service": {"ultimo_km": 0, "intervalo_km": 10000}, "vencimientos": {"vtv": "2026-03-01"}},
+        {"id": 2, "patente": "CC456DD", "activo": False, "vencimientos": {"vtv": "2026-06-01", "seguro": "2026-01-10"}},
+    ])
+
+
+def _csv(r):
+    texto = r.get_data(as_text=True)
+    assert texto.startswith("\ufeff")
+    return list(csv.reader(io.StringIO(texto[1:])))
+
+
+def test_flota_csv(cliente, almacen):
+    _flota(almacen)
+    r = cliente.get("/api/export/flota")
+    assert r.status_code == 200
+    assert r.headers["Content-Disposition"].startswith('attachment; filename="flota-')
+    filas = _csv(r)
+    assert filas[0] == exportar.COLUMNAS["flota"]
+    assert filas[1][:3] == ["1", "AA123BB", "'=HYPERLINK(\"x\")"]  # no se abre como fórmula
+    assert filas[1][9] == "10000"
+    assert [f[0] for f in _csv(cliente.get("/api/export/flota?activo=false"))[1:]] == ["2"]
+
+
+def test_vencimientos_filtrados_por_fecha(cliente, almacen):
+    _flota(almacen)
+    filas = _csv(cliente.get("/api/export/vencimientos?desde=2026-02-01&hasta=2026-12-31"))
+    assert [(f[0], f[5], f[6]) for f in filas[1:]] == [("1", "vtv", "2026-03-01"), ("2", "vtv", "2026-06-01")]
+
+
+def test_filtros_y_formatos_invalidos_son_400(cliente, almacen):
+    assert cliente.get("/api/export/flota?desde=2026-01-01").status_code == 400
+    assert cliente.get("/api/export/otra").status_code == 400
+    assert cliente.get("/api/export/flota?formato=pdf").status_code == 400
+    assert cliente.get("/api/export/historial?desde=ayer").json["status"] == "error"
+
+
+def test_audit_solo_admin(cliente, almacen):
+    with cliente.session_transaction() as s:
+        s["rol_usuario"] = "lector"
+    assert cliente.get("/api/export/audit").status_code == 403
+    assert cliente.get("/api/export/flota").status_code == 200
+
+
+def test_csv_sale_de_a_bloques_sin_juntar_las_filas(monkeypatch):
+    monkeypatch.setattr(exportar, "BLOQUE", 1024)
+    leidas = itertools.count()
+    filas = ([next(leidas), "x" * 50] for _ in range(100000))
+    bloques = exportar.csv_bytes(["n", "texto"], filas)
+    assert len(next(bloques)) >= 1024
+    assert next(leidas) < 100  # solo se leyó lo del primer bloque
+
+
+def test_xlsx_parte_en_hojas(almacen):
+    filas = ([i, f"fila {i}", i % 2 == 0, None] for i in range(5))
+    datos = b"".join(exportar.xlsx_bytes(["n", "texto", "par", "vacio"], filas, hoja="flota", filas_por_hoja=2))
+    with zipfile.ZipFile(io.BytesIO(datos)) as z:
+        hojas = sorted(n for n in z.namelist() if n.startswith("xl/worksheets/"))
+        assert hojas == [f"xl/worksheets/sheet{i}.xml" for i in (1, 2, 3)]
+        libro = ElementTree.fromstring(z.read("xl/workbook.xml"))
+        assert [h.get("name") for h in libro.iterfind(".//x:sheet", NS)] == ["flota", "flota (2)", "flota (3)"]
+        hoja = ElementTree.fromstring(z.read("xl/worksheets/sheet3.xml"))
+        filas_xml = hoja.findall(".//x:row", NS)
+        assert len(filas_xml) == 2  # encabezado + la fila 4
+        assert [c.findtext(".//x:t", namespaces=NS) or c.findtext("x:v", namespaces=NS)
+                for c in filas_xml[1]] == ["4", "fila 4", "1", None]
+
+
+def test_historial_por_la_api(cliente, almacen, registro):
+    _flota(almacen)
+    h = registro.obtener().historial
+    h.agregar(1, {"fecha": "2026-01-05", "tipo": "Service", "detalle": "a"})
+    h.agregar(2, {"fecha": "2026-02-05", "tipo": "Service", "detalle": "b"})
+    filas = _csv(cliente.get("/api/export/historial?activo=true"))
+    assert [(f[0], f[1], f[5]) for f in filas[1:]] == [("1", "AA123BB", "a")]
+    assert exportar.nombre_archivo("historial", "csv", datetime.date(2026, 3, 1)) == "historial-20260301.csv"
@@ -0,0 +1,69 @@
+"""Historial por unidad, fuera de la flota."""
+
+import historial
+
+
+def _etag(cliente):
+    return cliente.get("/api/flota").headers["ETag"]
+
+
+def test_paginacion_por_eid(cliente, almacen, registro):
+    almacen.flota.guardar([{"id": 1, "patente": "AA123BB"}])
+    h = registro.obtener().historial
+    for i in range(5):
+        h.agregar(1, {"fecha": f"2026-01-0{i + 1}", "tipo": "Service", "detalle": str(i)})
+    r = cliente.get("/api/flota/1/historial?limit=2").json
+    assert ([e["eid"] for e in r["items"]], r["total"]) == ([5, 4], 5)
+    r = cliente.get(f"/api/flota/1/historial?limit=2&cursor={r['next_cursor']}").json
+    assert [e["eid"] for e in r["items"]] == [3, 2]
+
+
+def test_importar_suma_lo_nuevo_sin_duplicar(almacen):
+    h = historial.Historial(almacen.historial)
+    viejo = [{"fecha": "2026-01-02", "tipo": "Service", "detalle": "b"},
+             {"fecha": "2026-01-01", "tipo": "Service", "detalle": "a"}]
+    assert h.importar(1, viejo) == 2
+    assert h.importar(1, viejo) == 0
+    nuevo = [{"fecha": "2026-01-03", "tipo": "Reparación", "detalle": "c"}] + viejo
+    assert h.importar(1, nuevo) == 1
+    items = h.listar(1)["items"]
+    assert [(e["eid"], e["detalle"]) for e in items] == [(3, "c"), (2, "b"), (1, "a")]
+
+
+def test_guardar_flota_con_historial_embebido(cliente, almacen, registro):
+    almacen.flota.guardar([{"id": 1, "patente": "AA123BB"}])
+    version = almacen.flota.obtener(1)["version"]
+    registro.obtener().historial.agregar(1, {"fecha": "2026-01-01", "tipo": "Service", "detalle": "a"})
+    cursor = almacen.flota.cursor_cambios()
+    flota = [{"id": 1, "patente": "AA123BB", "version": version, "historial": [
+        {"fecha": "2026-02-01", "tipo": "Service", "detalle": "b"},
+        {"fecha": "2026-01-01", "tipo": "Service", "detalle": "a"}]}]
+    r = cliente.post("/api/guardar_flota", json=flota, headers={"If-Match": _etag(cliente)})
+    assert r.status_code == 200
+    # La unidad no cambió: ni versión nueva ni entrada en el feed.
+    assert almacen.flota.obtener(1)["version"] == version
+    assert "historial" not in almacen.flota.obtener(1)
+    assert almacen.flota.cambios_desde(cursor)["cambios"] == []
+    # El evento nuevo se sumó; el que ya estaba no se duplicó.
+    assert [e["detalle"] for e in cliente.get("/api/flota/1/historial").json["items"]] == ["b", "a"]
+
+
+def test_historial_embebido_que_no_es_lista(cliente, almacen):
+    almacen.flota.guardar([{"id": 1, "patente": "AA123BB"}])
+    r = cliente.post("/api/guardar_flota", json=[{"id": 1, "patente": "AA123BB", "historial": "x"}],
+                     headers={"If-Match": _etag(cliente)})
+    assert r.status_code == 400
+    assert r.json["status"] == "error"
+
+
+def test_service_se_anota_solo_si_se_guardo(cliente, almacen):
+    almacen.flota.guardar([{"id": 1, "patente": "AA123BB", "km_actual": 10}])
+    version = almacen.flota.obtener(1)["version"]
+    r = cliente.post("/api/flota/1/service", json={"km": 500, "fecha": "2026-01-01"},
+                     headers={"If-Match": f'"{version + 1}"'})
+    assert r.status_code == 409
+    assert cliente.get("/api/flota/1/historial").json["total"] == 0
+    r = cliente.post("/api/flota/1/service", json={"km": 500, "fecha": "2026-01-01"},
+                     headers={"If-Match": f'"{version}"'})
+    assert r.status_code == 200
+    assert cliente.get("/api/flota/1/historial").json["items"][0]["detalle"] == "Service a 500 km"
@@ -0,0 +1,103 @@
+"""Carga masiva de lecturas de medidor."""
+
+import json
+import time
+
+import pytest
+
+import lecturas
+import storage
+
+DIA = 86400.0
+
+
+def _flota(almacen):
+    almacen.flota.guardar([
+        {"id": 1, "patente": "AA123BB", "km_actual": 1000, "service": {"ultimo_km": 0, "intervalo_km": 10000}},
+        {"id": 2, "patente": "CC456DD", "km_actual": 5000},
+    ])
+
+
+def _ndjson(*filas):
+    return [json.dumps(f) + "\n" for f in filas]
+
+
+def test_ingerir_valida_agrupa_y_escribe_serie(registro, almacen):
+    _flota(almacen)
+    series = registro.obtener().medidores
+    ahora = time.time()
+    r = lecturas.ingerir(almacen.flota, _ndjson(
+        {"patente": "aa123bb", "timestamp": ahora - DIA, "km": 1200},
+        {"id": 1, "timestamp": ahora, "km": 1500},
+        {"patente": "CC456DD", "timestamp": ahora, "km": 100},   # retrocede
+        {"patente": "ZZ999ZZ", "timestamp": ahora, "km": 1},     # no existe
+    ), series=series)
+    assert (r["recibidas"], r["aceptadas"], r["rechazadas"], r["unidades"]) == (4, 2, 2, 1)
+    u = almacen.flota.obtener(1)
+    assert u["km_actual"] == 1500
+    assert u["km_fecha"] == lecturas.fecha_iso(ahora)
+    assert u["service"]["tasa_dia"] == 300
+    assert list(series.leer(1)[1]) == [1200, 1500]
+    assert almacen.flota.obtener(2)["km_actual"] == 5000
+
+
+def test_reenviar_el_mismo_archivo_no_cambia_nada(registro, almacen):
+    _flota(almacen)
+    series = registro.obtener().medidores
+    filas = _ndjson({"id": 1, "timestamp": time.time(), "km": 1500})
+    lecturas.ingerir(almacen.flota, filas, series=series)
+    version = almacen.flota.obtener(1)["version"]
+    r = lecturas.ingerir(almacen.flota, filas, series=series)
+    assert (r["aceptadas"], r["ignoradas"], r["unidades"]) == (0, 1, 0)
+    assert almacen.flota.obtener(1)["version"] == version
+    assert len(series.leer(1)[0]) == 1
+
+
+def test_simular_no_escribe(registro, almacen):
+    _flota(almacen)
+    series = registro.obtener().medidores
+    r = lecturas.ingerir(almacen.flota, _ndjson({"id": 1, "timestamp": time.time(), "km": 1500}),
+                         simular=True, series=series)
+    assert (r["aceptadas"], r["simulado"]) == (1, True)
+    assert almacen.flota.obtener(1)["km_actual"] == 1000
+    assert len(series.leer(1)[0]) == 0
+
+
+def test_si_falla_guardar_la_flota_la_serie_no_cambia(registro, almacen, monkeypatch):
+    _flota(almacen)
+    series = registro.obtener().medidores
+    def falla(self, items):
+        raise OSError("disco lleno")
+    monkeypatch.setattr(storage.Flota, "poner_varios", falla)
+    with pytest.raises(OSError):
+        lecturas.ingerir(almacen.flota, _ndjson({"id": 1, "timestamp": time.time(), "km": 1500}), series=series)
+    assert len(series.leer(1)[0]) == 0
+
+
+def test_csv_por_la_api(cliente, almacen):
+    _flota(almacen)
+    cuerpo = "patente,fecha,km\nAA123BB,2026-01-01T10:00:00,1100\nCC456DD,2026-01-01T10:00:00,5100\n"
+    r = cliente.post("/api/flota/lecturas", data=cuerpo, content_type="text/csv")
+    assert r.status_code == 200
+    assert (r.json["aceptadas"], r.json["unidades"]) == (2, 2)
+    assert almacen.flota.obtener(2)["km_actual"] == 5100
+
+
+def test_editar_km_a_mano_deja_km_fecha(cliente, almacen):
+    _flota(almacen)
+    version = almacen.flota.obtener(2)["version"]
+    antes = time.time()
+    r = cliente.patch("/api/flota/2", json={"km_actual": 6000}, headers={"If-Match": f'"{version}"'})
+    assert r.status_code == 200
+    # Una lectura de telemetría anterior a la edición ya no pisa el valor cargado a mano.
+    r = lecturas.ingerir(almacen.flota, _ndjson({"id": 2, "timestamp": antes - 60, "km": 5500}))
+    assert (r["aceptadas"], r["ignoradas"]) == (0, 1)
+    assert almacen.flota.obtener(2)["km_fecha"] >= lecturas.fecha_iso(antes - 1)
+
+
+def test_km_actual_viejo_en_texto(almacen):
+    almacen.flota.guardar([{"id": 1, "patente": "AA123BB", "km_actual": "1000"}])
+    r = lecturas.ingerir(almacen.flota, _ndjson({"id": 1, "timestamp": time.time(), "km": 900},
+                                                {"id": 1, "timestamp": time.time() + 1, "km": 1100}))
+    assert (r["aceptadas"], r["rechazadas"]) == (1, 1)
+    assert almacen.flota.obtener(1)["km_actual"] == 1100
@@ -0,0 +1,47 @@
+"""Login local (users.json del tenant) cuando Supabase no valida."""
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import storage
+
+
+@pytest.fixture
+def anonimo(cliente, monkeypatch):
+    monkeypatch.delenv("SUPABASE_URL", raising=False)
+    with cliente.session_transaction() as s:
+        s.clear()
+    return cliente
+
+
+def _login(cliente, password="secreta"):
+    return cliente.post("/login", data={"username": "ana", "password": password})
+
+
+def test_login_local(anonimo, almacen):
+    almacen.usuarios.guardar([{"username": "ana", "role": "admin",
+                               "password_hash": generate_password_hash("secreta")}])
+    assert _login(anonimo, "otra").status_code == 200
+    assert _login(anonimo).status_code == 302
+
+
+@pytest.mark.parametrize("usuario", [
+    {"username": "ana", "role": "admin", "password_hash": "basura"},
+    {"username": "ana", "role": "admin", "password_hash": None},
+    {"username": "ana", "role": "admin"},
+])
+def test_hash_corrupto_es_un_ingreso_fallido(anonimo, almacen, usuario):
+    almacen.usuarios.guardar([usuario])
+    r = _login(anonimo)
+    assert r.status_code == 200
+    assert "incorrectos" in r.get_data(as_text=True)
+
+
+def test_store_ilegible_es_un_ingreso_fallido(anonimo, almacen, monkeypatch):
+    almacen.usuarios.guardar([{"username": "ana", "role": "admin",
+                               "password_hash": generate_password_hash("secreta")}])
+    def falla(self, fn):
+        raise storage.ErrorAlmacenamiento("users.json ilegible")
+    monkeypatch.setattr(storage.Documento, "leer", falla)
+    monkeypatch.setattr(storage.Documento, "version", lambda self: -1)
+    assert _login(anonimo).status_code == 200
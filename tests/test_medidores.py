@@ -0,0 +1,92 @@
+"""Series de medidor y pronóstico del próximo service."""
+
+import os
+import time
+
+import medidores
+import storage
+
+DIA = 86400.0
+
+
+def test_agregar_intercala_y_no_repite(tmp_path):
+    series = medidores.SeriesMedidor(str(tmp_path))
+    assert series.agregar(1, [(10.0, 100), (30.0, 300)]) == 2
+    # Una lectura que llega tarde se intercala; la repetida no entra.
+    assert series.agregar(1, [(20.0, 200), (30.0, 999)]) == 1
+    ts, val = series.leer(1)
+    assert list(ts) == [10.0, 20.0, 30.0]
+    assert list(val) == [100, 200, 300]
+
+
+def test_compacta_cada_compactar_bytes_y_no_en_cada_append(tmp_path, monkeypatch):
+    monkeypatch.setattr(medidores, "COMPACTAR_BYTES", 1024)
+    series = medidores.SeriesMedidor(str(tmp_path))
+    llamadas = []
+    original = series.compactar
+    monkeypatch.setattr(series, "compactar", lambda uid: (llamadas.append(uid), original(uid)))
+    ahora = time.time()
+    for i in range(500):  # detalle reciente: no se puede reducir
+        series.agregar(1, [(ahora - 500 + i, i)])
+    assert 0 < len(llamadas) < 20
+    assert len(series.leer(1)[0]) == 500
+
+
+def _unidad(km, ultimo_km=0, intervalo_km=10000):
+    return {"id": 1, "km_actual": km, "service": {"ultimo_km": ultimo_km, "intervalo_km": intervalo_km}}
+
+
+def test_pronostico_a_ritmo_constante(tmp_path):
+    series = medidores.SeriesMedidor(str(tmp_path))
+    inicio = time.time() - 10 * DIA
+    series.agregar(1, [(inicio + d * DIA, 1000 + 100 * d) for d in range(11)])
+    p = series.pronostico(_unidad(2000))
+    assert p["tasa_dia"] == 100
+    # Faltan 8000 km a 100 por día desde la última lectura.
+    esperado = time.strftime("%Y-%m-%d", time.localtime(inicio + 10 * DIA + 80 * DIA))
+    assert p["fecha"] == esperado
+
+
+def test_proyectar_cuenta_los_puntos_sin_escribirlos(tmp_path):
+    series = medidores.SeriesMedidor(str(tmp_path))
+    ahora = time.time()
+    series.agregar(1, [(ahora - 2 * DIA, 1000)])
+    unidad = series.proyectar(_unidad(1400), [(ahora, 1400)])
+    assert unidad["service"]["tasa_dia"] == 200
+    assert len(series.leer(1)[0]) == 1  # la serie no cambió
+    # Sin la lectura nueva no hay ritmo: se limpia lo proyectado.
+    assert "proyectado" not in series.proyectar(_unidad(1000))["service"]
+
+
+def _poner_unidad(almacen, **campos):
+    almacen.flota.guardar([{"id": 1, "patente": "AA123BB", "km_actual": 1000,
+                            "service": {"ultimo_km": 0, "intervalo_km": 10000}, **campos}])
+    return almacen.flota.obtener(1)["version"]
+
+
+def test_editar_km_escribe_la_serie_despues_de_guardar(cliente, almacen, registro):
+    version = _poner_unidad(almacen)
+    r = cliente.patch("/api/flota/1", json={"km_actual": 1500}, headers={"If-Match": f'"{version}"'})
+    assert r.status_code == 200
+    ts, val = registro.obtener().medidores.leer(1)
+    assert list(val) == [1500]
+
+
+def test_si_falla_guardar_la_unidad_la_serie_no_cambia(cliente, almacen, registro, monkeypatch):
+    version = _poner_unidad(almacen)
+    def falla(self, item):
+        raise OSError("disco lleno")
+    monkeypatch.setattr(storage.Flota, "poner", falla)
+    r = cliente.patch("/api/flota/1", json={"km_actual": 1500}, headers={"If-Match": f'"{version}"'})
+    assert r.status_code == 500
+    assert len(registro.obtener().medidores.leer(1)[0]) == 0
+
+
+def test_editar_otros_campos_no_toca_serie_ni_pronostico(cliente, almacen, registro, monkeypatch):
+    version = _poner_unidad(almacen)
+    tocados = []
+    monkeypatch.setattr(medidores.SeriesMedidor, "leer", lambda self, *a, **k: tocados.append(a))
+    r = cliente.patch("/api/flota/1", json={"descripcion": "Tractor"}, headers={"If-Match": f'"{version}"'})
+    assert r.status_code == 200
+    assert tocados == []
+    assert not os.path.exists(os.path.join(registro.obtener().medidores.carpeta, "1.bin"))
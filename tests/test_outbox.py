@@ -0,0 +1,129 @@
+"""Outbox contra un SMTP local (aiosmtpd): envío, reintentos y muertos."""
+
+import socket
+from email.mime.text import MIMEText
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+import outbox
+
+
+class Servidor:
+    """Handler de aiosmtpd: contesta con las respuestas de `respuestas` en orden
+    (después, 250) y guarda lo que acepta."""
+
+    def __init__(self, respuestas=()):
+        self.respuestas = list(respuestas)
+        self.recibidos = []
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.respuestas:
+            return self.respuestas.pop(0)
+        self.recibidos.append(envelope)
+        return "250 OK"
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp():
+    servidor = Servidor()
+    controller = aiosmtpd_controller.Controller(servidor, hostname="127.0.0.1", port=_puerto_libre())
+    controller.start()
+    yield servidor, controller.port
+    controller.stop()
+
+
+@pytest.fixture
+def bandeja(tmp_path, smtp, monkeypatch):
+    monkeypatch.setattr(outbox, "STARTTLS", False)
+    monkeypatch.setattr(outbox, "BACKOFF_BASE", 0)
+    monkeypatch.setattr(outbox, "INTENTOS", 3)
+    _, puerto = smtp
+    caja = outbox.Outbox(str(tmp_path / "outbox"), {
+        "SERVER": "127.0.0.1", "PORT": puerto, "EMAIL": "flota@example.com", "PASSWORD": ""})
+    yield caja
+    caja._cerrar()
+
+
+def _mensaje(asunto="Aviso"):
+    msg = MIMEText("cuerpo", "plain", "utf-8")
+    msg["Subject"] = asunto
+    return msg
+
+
+def test_envia_y_reutiliza_la_conexion(bandeja, smtp):
+    servidor, _ = smtp
+    for i in range(3):
+        bandeja.encolar(_mensaje(f"Aviso {i}"), ["a@example.com"])
+    bandeja.drenar(limite=10)
+    assert [e.rcpt_tos for e in servidor.recibidos] == [["a@example.com"]] * 3
+    s = bandeja.estadisticas()
+    assert (s["enviados"], s["pendientes"], s["en_muertos"], s["conexiones"]) == (3, 0, 0, 1)
+
+
+def test_error_transitorio_reintenta(bandeja, smtp):
+    servidor, _ = smtp
+    servidor.respuestas = ["451 Probá más tarde"]
+    bandeja.encolar(_mensaje(), ["a@example.com"])
+    assert bandeja.procesar() == 1
+    s = bandeja.estadisticas()
+    assert (s["enviados"], s["reintentos"], s["pendientes"]) == (0, 1, 1)
+    # Con backoff 0 el reintento ya está listo: el segundo intento sale.
+    bandeja.drenar(limite=10)
+    assert len(servidor.recibidos) == 1
+    assert bandeja.estadisticas()["pendientes"] == 0
+
+
+def test_agotar_intentos_lo_pasa_a_muertos(bandeja, smtp):
+    servidor, _ = smtp
+    servidor.respuestas = ["421 Ocupado"] * outbox.INTENTOS
+    bandeja.encolar(_mensaje(), ["a@example.com"])
+    bandeja.drenar(limite=10)
+    s = bandeja.estadisticas()
+    assert (s["enviados"], s["muertos"], s["en_muertos"], s["pendientes"]) == (0, 1, 1, 0)
+    assert servidor.recibidos == []
+    # Reintentado a mano vuelve a la cola con los intentos en cero y sale.
+    assert bandeja.reintentar_muertos() == 1
+    bandeja.drenar(limite=10)
+    assert len(servidor.recibidos) == 1
+    assert bandeja.estadisticas()["en_muertos"] == 0
+
+
+def test_error_permanente_no_reintenta(bandeja, smtp):
+    servidor, _ = smtp
+    servidor.respuestas = ["554 Rechazado"]
+    bandeja.encolar(_mensaje(), ["a@example.com"])
+    bandeja.drenar(limite=10)
+    s = bandeja.estadisticas()
+    assert (s["reintentos"], s["muertos"], s["en_muertos"]) == (0, 1, 1)
+
+
+def test_sin_servidor_reprograma_todo_el_lote(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox, "STARTTLS", False)
+    monkeypatch.setattr(outbox, "BACKOFF_BASE", 60)
+    caja = outbox.Outbox(str(tmp_path / "outbox"), {
+        "SERVER": "127.0.0.1", "PORT": _puerto_libre(), "EMAIL": "flota@example.com", "PASSWORD": ""})
+    for i in range(3):
+        caja.encolar(_mensaje(f"Aviso {i}"), ["a@example.com"])
+    assert caja.procesar() == 3
+    s = caja.estadisticas()
+    assert (s["reintentos"], s["pendientes"], s["enviando"], s["en_muertos"]) == (3, 3, 0, 0)
+    assert s["proximo_en_s"] > 30
+
+
+def test_recupera_lo_que_quedo_enviando(bandeja, smtp):
+    servidor, _ = smtp
+    bandeja.encolar(_mensaje(), ["a@example.com"])
+    # Un proceso que murió a mitad de envío deja el mensaje en enviando/.
+    bandeja._tomar(float("inf"))
+    assert bandeja.estadisticas()["enviando"] == 1
+    bandeja.drenar(limite=10)
+    assert len(servidor.recibidos) == 1
+    assert bandeja.estadisticas()["enviando"] == 0
@@ -0,0 +1,151 @@
+"""Documento: snapshot + journal, reproducción y compactación."""
+
+import json
+import os
+
+import pytest
+
+import storage
+
+
+def _abrir(tmp_path, **kw):
+    # Documento directo (no storage.abrir): cada instancia hace de un proceso aparte.
+    kw.setdefault("clave", "id")
+    return storage.Documento(str(tmp_path / "flota_data.json"), **kw)
+
+
+def _ordenados(datos):
+    return sorted(datos, key=lambda x: x["id"])
+
+
+def test_journal_y_reapertura(tmp_path):
+    doc = _abrir(tmp_path)
+    doc.guardar([{"id": 1, "patente": "A"}, {"id": 2, "patente": "B"}])
+    doc.poner({"id": 3, "patente": "C"})
+    doc.poner({"id": 1, "patente": "A2"})
+    doc.borrar(2)
+    # Nada se compactó todavía: el snapshot no existe y todo está en el journal.
+    assert not os.path.exists(doc.ruta)
+    assert os.path.getsize(doc.ruta_journal) > 0
+    esperado = [{"id": 1, "patente": "A2"}, {"id": 3, "patente": "C"}]
+    assert _ordenados(doc.datos()) == esperado
+    assert _ordenados(_abrir(tmp_path).datos()) == esperado
+
+
+def test_compactar_da_el_mismo_estado(tmp_path):
+    doc = _abrir(tmp_path)
+    doc.guardar([{"id": i, "km_actual": i * 10} for i in range(1, 6)])
+    doc.poner({"id": 2, "km_actual": 999})
+    doc.borrar(5)
+    antes = _ordenados(doc.datos())
+    doc.compactar()
+    assert os.path.getsize(doc.ruta_journal) == 0
+    with open(doc.ruta, encoding="utf-8") as f:
+        assert _ordenados(json.load(f)) == antes
+    assert _ordenados(_abrir(tmp_path).datos()) == antes
+    # Después de compactar se sigue journaleando sobre el snapshot nuevo.
+    doc.poner({"id": 6, "km_actual": 60})
+    assert _ordenados(_abrir(tmp_path).datos()) == antes + [{"id": 6, "km_actual": 60}]
+
+
+def test_compacta_solo_cuando_el_journal_supera_el_umbral(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "COMPACTAR_MIN_BYTES", 2048)
+    doc = _abrir(tmp_path)
+    for i in range(200):
+        doc.poner({"id": i % 10, "km_actual": i})
+    # Compactó en algún momento y el journal quedó por debajo del umbral.
+    assert os.path.exists(doc.ruta)
+    assert os.path.getsize(doc.ruta_journal) <= max(2048, os.path.getsize(doc.ruta))
+    esperado = [{"id": k, "km_actual": 190 + k} for k in range(10)]
+    assert _ordenados(doc.datos()) == esperado
+    assert _ordenados(_abrir(tmp_path).datos()) == esperado
+
+
+def test_linea_incompleta_se_descarta(tmp_path):
+    doc = _abrir(tmp_path)
+    doc.poner({"id": 1, "patente": "A"})
+    # Crash a mitad de append: queda media línea al final del journal.
+    with open(doc.ruta_journal, "ab") as f:
+        f.write(b'{"ops":[{"op":"put","k":2,"v":{"id":2')
+    otro = _abrir(tmp_path)
+    assert otro.datos() == [{"id": 1, "patente": "A"}]
+    # La próxima escritura corta la cola rota antes de agregar.
+    otro.poner({"id": 3, "patente": "C"})
+    assert _ordenados(_abrir(tmp_path).datos()) == [{"id": 1, "patente": "A"}, {"id": 3, "patente": "C"}]
+
+
+def test_linea_corrupta_en_el_medio_no_trunca_las_siguientes(tmp_path, capsys):
+    doc = _abrir(tmp_path)
+    for i in range(1, 4):
+        doc.poner({"id": i, "patente": f"P{i}"})
+    # Se rompe la segunda línea (la del id 2) sin tocar el largo ni los \n.
+    with open(doc.ruta_journal, "rb") as f:
+        lineas = f.read().split(b"\n")
+    lineas[1] = b"x" * len(lineas[1])
+    with open(doc.ruta_journal, "wb") as f:
+        f.write(b"\n".join(lineas))
+    otro = _abrir(tmp_path)
+    assert _ordenados(otro.datos()) == [{"id": 1, "patente": "P1"}, {"id": 3, "patente": "P3"}]
+    assert "ilegible" in capsys.readouterr().out
+    otro.poner({"id": 4, "patente": "P4"})
+    # El append no cortó nada: la línea 3 sigue en el journal.
+    assert _ordenados(_abrir(tmp_path).datos()) == [
+        {"id": 1, "patente": "P1"}, {"id": 3, "patente": "P3"}, {"id": 4, "patente": "P4"}]
+
+
+def test_otro_proceso_ve_los_cambios(tmp_path):
+    a, b = _abrir(tmp_path), _abrir(tmp_path)
+    a.poner({"id": 1, "patente": "A"})
+    assert b.obtener(1) == {"id": 1, "patente": "A"}
+    b.compactar()
+    a.poner({"id": 2, "patente": "B"})
+    assert _ordenados(b.datos()) == [{"id": 1, "patente": "A"}, {"id": 2, "patente": "B"}]
+
+
+def test_versionar(tmp_path):
+    doc = _abrir(tmp_path, versionar=True)
+    v1 = doc.poner({"id": 1, "patente": "A"})["version"]
+    assert doc.poner({"id": 1, "patente": "A", "version": v1})["version"] == v1  # sin cambios
+    assert doc.poner({"id": 1, "patente": "B", "version": v1})["version"] != v1
+
+
+@pytest.mark.parametrize("datos", [
+    [{"patente": "sin id"}],
+    [{"id": 1}, {"id": 1}],
+    [{"id": True}],
+    {"id": 1},
+])
+def test_guardar_rechaza_claves_invalidas_sin_escribir(tmp_path, datos):
+    doc = _abrir(tmp_path)
+    doc.poner({"id": 1, "patente": "A"})
+    tam = os.path.getsize(doc.ruta_journal)
+    with pytest.raises(storage.DatosInvalidos):
+        doc.guardar(datos)
+    assert os.path.getsize(doc.ruta_journal) == tam
+    assert doc.datos() == [{"id": 1, "patente": "A"}]
+
+
+def test_flota_vieja_con_ids_faltantes_repetidos_o_en_texto(tmp_path, capsys):
+    ruta = tmp_path / "flota_data.json"
+    ruta.write_text(json.dumps([
+        {"id": 1, "patente": "A"}, {"patente": "B"}, {"id": 1, "patente": "C"}, {"id": "7", "patente": "D"},
+    ]), encoding="utf-8")
+    flota = storage.Flota(str(ruta))
+    patentes = {u["patente"]: u["id"] for u in flota.datos()}
+    assert patentes == {"A": 1, "D": 7, "B": 8, "C": 9}
+    assert capsys.readouterr().out.count("flota_data.json") == 3
+    # Lo reparado quedó en el snapshot: al volver a abrir no hay nada que arreglar.
+    assert sorted(u["id"] for u in json.loads(ruta.read_text(encoding="utf-8"))) == [1, 7, 8, 9]
+    storage.Flota(str(ruta))
+    assert capsys.readouterr().out == ""
+    # Y un guardado completo con esos ids ya no es un 400.
+    flota.guardar(flota.datos())
+
+
+def test_coleccion_sin_asignar_descarta_y_avisa(tmp_path, capsys):
+    ruta = tmp_path / "users.json"
+    ruta.write_text(json.dumps([{"username": "ana"}, {"role": "admin"}, {"username": "ana", "role": "x"}]),
+                    encoding="utf-8")
+    doc = storage.Documento(str(ruta), list, "username")
+    assert doc.datos() == [{"username": "ana"}]
+    assert capsys.readouterr().out.count("se descarta") == 2
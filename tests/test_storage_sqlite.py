@@ -0,0 +1,60 @@
+"""Backend SQLite: misma interfaz que los documentos JSON, con búsquedas por clave."""
+
+import pytest
+
+import storage
+import storage_sqlite
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request):
+    return request.param
+
+
+def test_el_registro_usa_el_backend_configurado(almacen, backend):
+    assert isinstance(almacen, storage_sqlite.AlmacenSQLite if backend == "sqlite" else storage.AlmacenJSON)
+
+
+def test_guardar_solo_versiona_lo_que_cambio(almacen):
+    almacen.flota.guardar([{"id": 1, "patente": "A"}, {"id": 2, "patente": "B"}])
+    version = almacen.flota.version()
+    almacen.flota.guardar([{"id": 1, "patente": "A"}, {"id": 2, "patente": "B2"}, {"id": 3, "patente": "C"}])
+    assert almacen.flota.version() != version
+    assert almacen.flota.obtener(1)["version"] == 1
+    assert (almacen.flota.obtener(2)["version"], almacen.flota.obtener(3)["version"]) == (2, 1)
+    almacen.flota.borrar(1)
+    assert almacen.flota.obtener(1) is None
+    assert [u["patente"] for u in almacen.flota.datos()] == ["B2", "C"]
+
+
+def test_datos_invalidos_no_tocan_nada(almacen):
+    almacen.flota.guardar([{"id": 1, "patente": "A"}])
+    with pytest.raises(storage.DatosInvalidos):
+        almacen.flota.guardar([{"id": 1, "patente": "A"}, {"id": 1, "patente": "B"}])
+    assert [u["patente"] for u in almacen.flota.datos()] == ["A"]
+
+
+def test_usuarios_por_nombre_y_config(almacen):
+    almacen.usuarios.guardar([{"username": "ana", "role": "admin"}, {"username": "beto", "role": "lector"}])
+    assert almacen.usuarios.obtener("beto")["role"] == "lector"
+    assert almacen.usuarios.obtener("nadie") is None
+    almacen.config.guardar({"diasAviso": 15})
+    assert almacen.config.datos() == {"diasAviso": 15}
+
+
+def test_migrar_desde_json(tmp_path):
+    origen = storage.AlmacenJSON(str(tmp_path))
+    origen.flota.guardar([{"id": 1, "patente": "A"}, {"id": 2, "patente": "B"}])
+    origen.usuarios.guardar([{"username": "ana", "role": "admin"}])
+    origen.config.guardar({"diasAviso": 15})
+    origen.estado.guardar({"alertas_avisadas_hasta": "2026-01-01"})
+    origen.auditoria.importar([{"timestamp": "2026-01-01 10:00:00", "user": "ana", "action": "login", "details": ""}])
+    origen.cerrar()
+    assert storage_sqlite.migrar_desde_json(str(tmp_path)) == {"unidades": 2, "usuarios": 1, "auditoria": 1}
+    db = storage_sqlite.AlmacenSQLite(str(tmp_path / "flota.db"))
+    assert [u["patente"] for u in db.flota.datos()] == ["A", "B"]
+    assert db.config.datos() == {"diasAviso": 15}
+    assert db.estado.datos() == {"alertas_avisadas_hasta": "2026-01-01"}
+    assert db.auditoria.consultar(10)[0][0]["user"] == "ana"
+    with pytest.raises(storage.ErrorAlmacenamiento):
+        storage_sqlite.migrar_desde_json(str(tmp_path))  # nunca encima de una base con datos
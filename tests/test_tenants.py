@@ -0,0 +1,97 @@
+"""Varios tenants en un proceso: carpetas, LRU y login acotado a los configurados."""
+
+import hashlib
+import os
+
+import pytest
+
+import auth_remote
+import tenants
+
+
+@pytest.fixture
+def multi(registro, monkeypatch):
+    monkeypatch.setattr(tenants, "HABILITADO", True)
+    monkeypatch.setattr(tenants, "HOSTS", {})
+    monkeypatch.setattr(tenants, "PERMITIDOS", [])
+    return registro
+
+
+def test_tenant_sin_carpeta_no_se_crea(multi):
+    with pytest.raises(tenants.TenantDesconocido):
+        multi.obtener("otra")
+    assert not os.path.exists(multi.carpeta("otra"))
+    with pytest.raises(tenants.TenantDesconocido):
+        multi.carpeta("../afuera")
+
+
+def test_preparar_crea_los_configurados(multi, monkeypatch):
+    monkeypatch.setattr(tenants, "HOSTS", {"a.example.com": "empresa-a"})
+    monkeypatch.setattr(tenants, "PERMITIDOS", ["empresa-b"])
+    multi.preparar()
+    assert multi.obtener("empresa-a").id == "empresa-a"
+    assert multi.obtener("empresa-b").id == "empresa-b"
+
+
+def test_lru_descarga_el_menos_usado(multi):
+    multi.maximo = 2
+    multi.preparar(["a", "b"])
+    multi.obtener()  # el principal no se descarga nunca
+    multi.obtener("a")
+    multi.obtener("b")
+    assert {t.id for t in multi.cargados()} == {tenants.PRINCIPAL, "b"}
+    assert multi.estadisticas()["descargas"] == 1
+
+
+def test_candidatos(multi, monkeypatch):
+    monkeypatch.setattr(tenants, "HOSTS", {"a.example.com": "empresa-a"})
+    monkeypatch.setattr(tenants, "PERMITIDOS", ["empresa-b"])
+    assert tenants.candidatos("a.example.com:8080") == ("empresa-a",)
+    assert tenants.candidatos("otro.example.com") == (tenants.PRINCIPAL, "empresa-b")
+
+
+def _supabase(monkeypatch, filas):
+    monkeypatch.setenv("SUPABASE_URL", "http://supabase.invalid")
+    monkeypatch.setenv("SUPABASE_SERVICE_KEY", "clave")
+    buscados = []
+    def buscar(email, tenant):
+        buscados.append(tenant)
+        return [dict(f, password_hash=hashlib.sha256(b"secreta").hexdigest(), rol="admin") for f in filas]
+    monkeypatch.setattr(auth_remote, "_buscar_filas", buscar)
+    return buscados
+
+
+def _login(cliente):
+    return cliente.post("/login", data={"username": "ana@example.com", "password": "secreta"})
+
+
+def test_login_de_un_tenant_no_configurado_no_entra_ni_crea_carpeta(multi, cliente, monkeypatch):
+    buscados = _supabase(monkeypatch, [{"email": "ana@example.com", "tenant_id": "intrusa"}])
+    with cliente.session_transaction() as s:
+        s.clear()
+    r = _login(cliente)
+    assert r.status_code == 200  # vuelve al formulario
+    assert buscados == [(tenants.PRINCIPAL,)]
+    assert not os.path.exists(multi.carpeta("intrusa"))
+    with cliente.session_transaction() as s:
+        assert "usuario_actual" not in s
+
+
+def test_login_de_un_tenant_permitido(multi, cliente, monkeypatch):
+    monkeypatch.setattr(tenants, "PERMITIDOS", ["empresa-b"])
+    multi.preparar()
+    _supabase(monkeypatch, [{"email": "ana@example.com", "tenant_id": "empresa-b"}])
+    r = _login(cliente)
+    assert r.status_code == 302
+    with cliente.session_transaction() as s:
+        assert s["tenant"] == "empresa-b"
+
+
+def test_login_por_host_no_mira_otros_tenants(multi, cliente, monkeypatch):
+    monkeypatch.setattr(tenants, "HOSTS", {"a.example.com": "empresa-a"})
+    multi.preparar()
+    buscados = _supabase(monkeypatch, [{"email": "ana@example.com", "tenant_id": "empresa-b"}])
+    r = cliente.post("/login", data={"username": "ana@example.com", "password": "secreta"},
+                     base_url="http://a.example.com")
+    assert r.status_code == 200
+    assert buscados == [("empresa-a",)]
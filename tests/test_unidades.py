@@ -0,0 +1,78 @@
+"""Edición por unidad con concurrencia optimista (If-Match contra `version`), en los dos backends."""
+
+import json
+
+import pytest
+
+import storage_sqlite
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request):
+    return request.param
+
+
+def _unidad(almacen):
+    almacen.flota.guardar([{"id": 1, "patente": "AA123BB", "km_actual": 100}])
+    return almacen.flota.obtener(1)["version"]
+
+
+def test_patch_sin_if_match_es_428(cliente, almacen):
+    _unidad(almacen)
+    r = cliente.patch("/api/flota/1", json={"descripcion": "x"})
+    assert r.status_code == 428
+    assert r.json["status"] == "error"
+
+
+def test_patch_con_version_vieja_es_409_y_no_escribe(cliente, almacen):
+    version = _unidad(almacen)
+    r = cliente.patch("/api/flota/1", json={"descripcion": "x"}, headers={"If-Match": f'"{version}"'})
+    assert r.status_code == 200
+    assert r.headers["ETag"] == f'"{r.json["unidad"]["version"]}"'
+    # Otro usuario editó con la versión que ya no está.
+    r = cliente.patch("/api/flota/1", json={"descripcion": "y"}, headers={"If-Match": f'"{version}"'})
+    assert r.status_code == 409
+    assert r.json["unidad"]["descripcion"] == "x"
+    assert almacen.flota.obtener(1)["descripcion"] == "x"
+
+
+def test_guardar_flota_entera_con_etag_viejo_es_409(cliente, almacen):
+    _unidad(almacen)
+    etag = cliente.get("/api/flota").headers["ETag"]
+    flota = [{"id": 1, "patente": "AA123BB", "km_actual": 200}]
+    assert cliente.post("/api/guardar_flota", json=flota, headers={"If-Match": etag}).status_code == 200
+    assert cliente.post("/api/guardar_flota", json=flota, headers={"If-Match": etag}).status_code == 409
+    assert cliente.post("/api/guardar_flota", json=flota).status_code == 428
+
+
+def test_guardar_flota_con_ids_repetidos_es_400(cliente, almacen):
+    _unidad(almacen)
+    etag = cliente.get("/api/flota").headers["ETag"]
+    r = cliente.post("/api/guardar_flota", json=[{"id": 1, "patente": "A"}, {"id": 1, "patente": "B"}],
+                     headers={"If-Match": etag})
+    assert r.status_code == 400
+    assert "repetido" in r.json["message"]
+    assert almacen.flota.obtener(1)["patente"] == "AA123BB"
+
+
+def test_migrar_a_sqlite_no_pierde_unidades_viejas(tmp_path):
+    (tmp_path / "flota_data.json").write_text(json.dumps([
+        {"id": 1, "patente": "A"}, {"patente": "B"}, {"id": 1, "patente": "C"}]), encoding="utf-8")
+    resultado = storage_sqlite.migrar_desde_json(str(tmp_path))
+    assert resultado["unidades"] == 3
+    db = storage_sqlite.AlmacenSQLite(str(tmp_path / "flota.db"))
+    assert sorted(u["patente"] for u in db.flota.datos()) == ["A", "B", "C"]
+
+
+def test_service_sobre_km_actual_viejo_en_texto(cliente, almacen):
+    almacen.flota.guardar([{"id": 1, "patente": "AA123BB", "km_actual": "1500"}])
+    version = almacen.flota.obtener(1)["version"]
+    r = cliente.post("/api/flota/1/service", json={"km": 1200, "fecha": "2026-01-01"},
+                     headers={"If-Match": f'"{version}"'})
+    assert r.status_code == 200
+    # 1200 no supera al medidor (1500 guardado como texto): solo cambia el último service.
+    assert r.json["unidad"]["km_actual"] == "1500"
+    assert r.json["unidad"]["service"]["ultimo_km"] == 1200
+    r = cliente.post("/api/flota/1/service", json={"km": 2000, "fecha": "2026-02-01"},
+                     headers={"If-Match": f'"{version + 1}"'})
+    assert r.json["unidad"]["km_actual"] == 2000